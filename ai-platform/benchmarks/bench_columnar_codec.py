@@ -0,0 +1,107 @@
+"""
+Compare the JSON and columnar (msgpack) encodings of query results.
+
+Builds Chroma-shaped results the way vector-db returns them and measures,
+per 100 results, what each hop pays: the retriever merging the answers of
+several shards into a top-k, and the orchestrator decoding the retriever's
+response into documents. Also reports payload sizes.
+
+Usage:
+    python benchmarks/bench_columnar_codec.py --shards 4 --results 100 --repeat 2000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from shared.codec.columnar import ColumnarResults
+
+WORDS = (
+    "service request latency index shard replica query document collection "
+    "token model cache vector embedding batch stream gateway worker queue"
+).split()
+
+
+def chroma_result(n_results, shard, rng):
+    ids = [f"doc_{shard}_{i}_chunk_{rng.randrange(50)}" for i in range(n_results)]
+    return {
+        "ids": [ids],
+        "documents": [[" ".join(rng.choice(WORDS) for _ in range(80)) for _ in ids]],
+        "metadatas": [[{"source": f"file_{rng.randrange(100)}.txt", "chunk_id": i, "id": doc_id} for i, doc_id in enumerate(ids)]],
+        "distances": [sorted(rng.random() for _ in ids)],
+    }
+
+
+def json_merge(payloads, k):
+    candidates = []
+    for payload in payloads:
+        result = json.loads(payload)
+        for i in range(len(result["ids"][0])):
+            candidates.append({
+                "id": result["ids"][0][i],
+                "text": result["documents"][0][i],
+                "metadata": result["metadatas"][0][i],
+                "distance": result["distances"][0][i]
+            })
+    return sorted(candidates, key=lambda doc: doc["distance"])[:k]
+
+
+def columnar_merge(payloads, k):
+    merged = ColumnarResults.concat([ColumnarResults.decode(payload) for payload in payloads])
+    return merged.to_documents(merged.top_k(k))
+
+
+def time_per_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--results", type=int, default=100, help="results per shard and returned top-k")
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = [chroma_result(args.results, shard, rng) for shard in range(args.shards)]
+    json_payloads = [json.dumps(result).encode() for result in results]
+    columnar_payloads = [ColumnarResults.from_chroma(result).encode() for result in results]
+
+    assert [d["id"] for d in json_merge(json_payloads, args.results)] == \
+        [d["id"] for d in columnar_merge(columnar_payloads, args.results)]
+
+    top_k = json_merge(json_payloads, args.results)
+    json_response = json.dumps({"documents": top_k}).encode()
+    columnar_response = ColumnarResults.from_documents(top_k).encode()
+
+    scale = 100 / args.results
+    rows = [
+        ("retriever merge",
+         time_per_call(lambda: json_merge(json_payloads, args.results), args.repeat),
+         time_per_call(lambda: columnar_merge(columnar_payloads, args.results), args.repeat)),
+        ("orchestrator decode",
+         time_per_call(lambda: json.loads(json_response)["documents"], args.repeat),
+         time_per_call(lambda: ColumnarResults.decode(columnar_response).to_documents(), args.repeat)),
+        ("columns only (no dicts)",
+         time_per_call(lambda: json.loads(json_response), args.repeat),
+         time_per_call(lambda: ColumnarResults.decode(columnar_response), args.repeat)),
+    ]
+
+    print(f"{args.shards} shards x {args.results} results, cost per 100 results")
+    print(f"{'step':<26}{'json us':>10}{'columnar us':>14}{'speedup':>10}")
+    for name, json_us, columnar_us in rows:
+        print(f"{name:<26}{json_us * scale:>10.1f}{columnar_us * scale:>14.1f}{json_us / columnar_us:>9.2f}x")
+    print(f"shard payload bytes: json {len(json_payloads[0])}, columnar {len(columnar_payloads[0])}")
+    print(f"response payload bytes: json {len(json_response)}, columnar {len(columnar_response)}")
+
+
+if __name__ == "__main__":
+    main()
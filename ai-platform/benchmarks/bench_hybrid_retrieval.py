@@ -0,0 +1,101 @@
+"""
+Compare dense, lexical (BM25) and hybrid retrieval in vector-db.
+
+Builds a synthetic corpus in which every document carries a unique
+identifier, then queries for those identifiers the way a user looking up an
+error code or ticket number would. Reports latency percentiles and hit
+quality (hit rate at k and mean reciprocal rank) per mode.
+
+Usage:
+    python benchmarks/bench_hybrid_retrieval.py --documents 5000 --queries 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "vector-db"))
+
+from chroma_client import ChromaClient
+
+WORDS = (
+    "service request latency index shard replica query document collection "
+    "token model cache vector embedding batch stream gateway worker queue "
+    "timeout retry failure deploy config metric alert storage network node"
+).split()
+
+
+def build_corpus(n_documents, seed):
+    rng = random.Random(seed)
+    documents, ids, identifiers = [], [], []
+    for i in range(n_documents):
+        identifier = f"ERR-{rng.randrange(10**6):06d}-{i}"
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120)))
+        documents.append(f"{words}. Incident {identifier} was resolved. {words[:200]}")
+        ids.append(f"doc_{i}")
+        identifiers.append(identifier)
+    return documents, ids, identifiers
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    documents, ids, identifiers = build_corpus(args.documents, args.seed)
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        client = ChromaClient(persist_directory=persist_directory)
+        client.initialize()
+
+        start_time = time.perf_counter()
+        for start in range(0, len(documents), 1000):
+            client.add_documents(
+                "bench-hybrid",
+                documents[start:start + 1000],
+                metadatas=[{"source": "bench"} for _ in documents[start:start + 1000]],
+                ids=ids[start:start + 1000]
+            )
+        print(f"Ingested {len(documents)} documents in {time.perf_counter() - start_time:.1f}s")
+
+        rng = random.Random(args.seed + 1)
+        targets = rng.sample(range(len(documents)), min(args.queries, len(documents)))
+
+        print(f"{'mode':<8} {'p50 ms':>8} {'p95 ms':>8} {'hit@k':>7} {'mrr':>7}")
+        for mode in ("dense", "lexical", "hybrid"):
+            # Warm up the index and the embedding model
+            client.query("bench-hybrid", "warmup", args.n_results, mode=mode)
+
+            latencies, hits, reciprocal_ranks = [], 0, []
+            for target in targets:
+                query = f"what happened in incident {identifiers[target]}"
+                start_time = time.perf_counter()
+                result = client.query("bench-hybrid", query, args.n_results, mode=mode)
+                latencies.append((time.perf_counter() - start_time) * 1000)
+
+                returned = result["ids"][0]
+                if ids[target] in returned:
+                    hits += 1
+                    reciprocal_ranks.append(1 / (returned.index(ids[target]) + 1))
+                else:
+                    reciprocal_ranks.append(0.0)
+
+            print(
+                f"{mode:<8} {statistics.median(latencies):>8.2f} {percentile(latencies, 0.95):>8.2f} "
+                f"{hits / len(targets):>7.3f} {statistics.mean(reciprocal_ranks):>7.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Measure batch ingestion throughput against a local stub vector-db.
+
+Starts a stub of vector-db's POST /documents on localhost that charges a
+fixed cost per request (HTTP handling, running concurrently) plus an
+embedding cost per chunk (serialized, as one embedding model would be), and
+ingests the same synthetic batch three ways:
+
+- sequential: what DataIngestion.process_batch used to do, one document at a
+  time with a new HTTP client and one /documents request per document
+- pooled: the same, but over the pooled client, to separate the cost of
+  creating a client per request from the cost of serial round trips
+- pipelined: the current process_batch, splitting documents concurrently and
+  packing chunks of many documents into requests kept in flight over a
+  pooled client
+
+Usage:
+    python benchmarks/bench_ingestion.py --documents 2000 --request-ms 5 --embed-ms-per-chunk 0.2
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "data-ingestion"))
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+
+from ingestion import DataIngestion
+
+WORDS = (
+    "service request latency index shard replica query document collection "
+    "token model cache vector embedding batch stream gateway worker queue "
+    "timeout retry failure deploy config metric alert storage network node"
+).split()
+
+
+def make_documents(n_documents, seed):
+    rng = random.Random(seed)
+    documents = []
+    for i in range(n_documents):
+        paragraphs = [
+            ". ".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))) for _ in range(rng.randint(2, 6))) + "."
+            for _ in range(rng.randint(1, 8))
+        ]
+        documents.append({"text": "\n\n".join(paragraphs), "metadata": {"id": f"doc_{i}", "source": "bench"}})
+    return documents
+
+
+def make_stub(request_ms, embed_ms_per_chunk, stats):
+    app = FastAPI()
+    embed_lock = asyncio.Lock()
+
+    @app.post("/documents")
+    async def add_documents(request: Request):
+        body = await request.json()
+        chunks = len(body["documents"])
+        await asyncio.sleep(request_ms / 1000)
+        async with embed_lock:
+            await asyncio.sleep(chunks * embed_ms_per_chunk / 1000)
+        stats["requests"] += 1
+        stats["chunks"] += chunks
+        return {"message": f"Added {chunks} documents"}
+
+    return app
+
+
+def start_server(app):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+async def ingest_sequential(ingestion, documents):
+    for document in documents:
+        chunks = ingestion._prepare_chunks(document["text"], document["metadata"])
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{ingestion.vector_db_url}/documents",
+                json={"documents": chunks, "collection_name": "bench"}
+            )
+            response.raise_for_status()
+
+
+async def ingest_pooled(ingestion, documents):
+    try:
+        for document in documents:
+            result = await ingestion.process_document(document["text"], document["metadata"], "bench")
+            assert result["success"], result
+    finally:
+        await ingestion.aclose()
+
+
+async def ingest_pipelined(ingestion, documents):
+    try:
+        result = await ingestion.process_batch(documents, "bench")
+        assert result["success"], result
+    finally:
+        await ingestion.aclose()
+
+
+def measure(name, ingest, ingestion, documents, stats):
+    stats.update(requests=0, chunks=0)
+    start = time.perf_counter()
+    asyncio.run(ingest(ingestion, documents))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12}{elapsed:>10.2f}{len(documents) / elapsed:>12.0f}{stats['chunks'] / elapsed:>12.0f}{stats['requests']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--request-ms", type=float, default=5.0, help="fixed cost of a /documents request")
+    parser.add_argument("--embed-ms-per-chunk", type=float, default=0.2, help="serialized embedding cost per chunk")
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--request-max-chunks", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    documents = make_documents(args.documents, args.seed)
+    stats = {}
+    server, thread, url = start_server(make_stub(args.request_ms, args.embed_ms_per_chunk, stats))
+    try:
+        ingestion = DataIngestion(
+            vector_db_url=url,
+            chunk_size=1000,
+            chunk_overlap=200,
+            max_in_flight=args.max_in_flight,
+            request_max_chunks=args.request_max_chunks
+        )
+        print(f"{args.documents} documents, {args.request_ms} ms per request, {args.embed_ms_per_chunk} ms per chunk")
+        print(f"{'mode':<12}{'seconds':>10}{'docs/s':>12}{'chunks/s':>12}{'requests':>10}")
+        measure("sequential", ingest_sequential, ingestion, documents, stats)
+        measure("pooled", ingest_pooled, ingestion, documents, stats)
+        measure("pipelined", ingest_pipelined, ingestion, documents, stats)
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Measure text-gen latency on RAG prompts with and without the prefix cache.
+
+Renders the orchestrator's RAG template around one retrieved context and
+asks a series of different questions about it, the way follow-up questions
+over the same documents reach text-gen. Each configuration generates the
+answers one after the other through the batch scheduler and reports time to
+first token and total latency; with the cache on, every question after the
+first resumes from the keys and values of the shared instruction and context.
+
+The model is a randomly initialised GPT-2 with the dimensions of distilgpt2
+and a word-level tokenizer, so no weights have to be downloaded; timings
+depend on the shapes, not on the weights.
+
+Usage:
+    python benchmarks/bench_prefix_cache.py --context-words 600 --questions 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../services/text-gen"))
+
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+from prefix_cache import PrefixCache
+from scheduler import BatchScheduler
+
+WORDS = (
+    "service request latency index shard replica query document collection "
+    "token model cache vector embedding batch stream gateway worker queue "
+    "answer the following question based on provided context what how why "
+    "is are does do which when where"
+).split()
+
+# Same layout as RAG_TEMPLATE in services/rag-orchestrator/prompts.py
+TEMPLATE = """
+        Answer the following question based on the provided context.
+
+        Context:
+        {context}
+
+        Question: {question}
+
+        Answer:
+        """
+
+
+def make_tokenizer():
+    vocab = {word: i for i, word in enumerate(dict.fromkeys(["<eos>", "<unk>", ":", "?", "."] + WORDS))}
+    tokenizer = Tokenizer(models.WordLevel(vocab=vocab, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.decoder = decoders.WordPiece(prefix="##")
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<eos>", unk_token="<unk>", pad_token="<eos>")
+
+
+def make_model(vocab_size):
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=vocab_size, n_positions=1024, n_embd=768, n_layer=6, n_head=12,
+                        bos_token_id=0, eos_token_id=0)
+    return GPT2LMHeadModel(config).eval()
+
+
+def make_prompts(context_words, questions, rng):
+    context = "\n        ".join(
+        " ".join(rng.choice(WORDS) for _ in range(50)) + " ."
+        for _ in range(max(1, context_words // 50))
+    )
+    return [
+        TEMPLATE.format(context=context, question=" ".join(rng.choice(WORDS) for _ in range(8)) + " ?")
+        for _ in range(questions)
+    ]
+
+
+async def run(scheduler, prompts, max_new_tokens):
+    ttfts, latencies, texts = [], [], []
+    for prompt in prompts:
+        start = time.perf_counter()
+        request = scheduler.submit(prompt, max_new_tokens=max_new_tokens, temperature=0)
+        pieces = []
+        async for piece in request.stream():
+            if not pieces:
+                ttfts.append((time.perf_counter() - start) * 1000)
+            pieces.append(piece)
+        latencies.append((time.perf_counter() - start) * 1000)
+        texts.append("".join(pieces))
+    return ttfts, latencies, texts
+
+
+def measure(model, tokenizer, prompts, max_new_tokens, prefix_cache):
+    scheduler = BatchScheduler(model, tokenizer, prefix_cache=prefix_cache)
+    scheduler.start()
+    try:
+        return asyncio.run(run(scheduler, prompts, max_new_tokens))
+    finally:
+        scheduler.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--context-words", type=int, default=600)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--max-new-tokens", type=int, default=16)
+    parser.add_argument("--block-size", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    tokenizer = make_tokenizer()
+    model = make_model(len(tokenizer))
+    prompts = make_prompts(args.context_words, args.questions, random.Random(args.seed))
+    prompt_tokens = len(tokenizer(prompts[0])["input_ids"])
+
+    # Warm up the model so the first measured prompt isn't slower for other reasons
+    measure(model, tokenizer, prompts[:1], 1, None)
+
+    off_ttft, off_latency, off_texts = measure(model, tokenizer, prompts, args.max_new_tokens, None)
+    cache = PrefixCache(block_size=args.block_size)
+    on_ttft, on_latency, on_texts = measure(model, tokenizer, prompts, args.max_new_tokens, cache)
+    assert off_texts == on_texts, "prefix cache changed the generated text"
+
+    print(f"{args.questions} questions, {prompt_tokens} prompt tokens, {args.max_new_tokens} new tokens")
+    print(f"{'prefix cache':<22}{'ttft p50 ms':>12}{'latency p50 ms':>16}")
+    print(f"{'off':<22}{statistics.median(off_ttft):>12.1f}{statistics.median(off_latency):>16.1f}")
+    print(f"{'on (cold, 1st)':<22}{on_ttft[0]:>12.1f}{on_latency[0]:>16.1f}")
+    print(f"{'on (warm, rest)':<22}{statistics.median(on_ttft[1:]):>12.1f}{statistics.median(on_latency[1:]):>16.1f}")
+    stats = cache.stats()
+    print(f"hit rate {stats['hit_rate']}, prompt tokens reused {stats['token_hit_rate']:.0%}, "
+          f"{stats['blocks']} blocks, {stats['bytes'] / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
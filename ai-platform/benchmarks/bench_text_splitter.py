@@ -0,0 +1,209 @@
+"""
+Measure TextSplitter throughput and peak memory on documents of 1 MB to 1 GB.
+
+Every document is a 1 MB block of synthetic paragraphs repeated to the
+requested size, and is split these ways:
+
+- legacy: what TextSplitter.split_text used to do, copying every paragraph
+  and sentence into new strings and building all chunks before the overlap
+  was applied
+- split_text: the current split_text, slicing chunks out of the document by
+  offset
+- iter_chunks: the lazy generator behind split_text, consuming one chunk at
+  a time the way ingestion does
+- split_stream: the streaming splitter fed 1 MB blocks as they are produced,
+  so the whole document is never held in memory
+- tokens: TokenSplitter's iter_chunks, chunking by tokens of --tokenizer
+  (a tiktoken encoding or Hugging Face tokenizer, which has to be
+  downloadable or cached)
+
+Each run happens in a fresh process so peak RSS is its own; the character
+modes must agree on the number of chunks and characters of a document.
+
+Usage:
+    python benchmarks/bench_text_splitter.py --sizes 1,10,100 --chunk-size 1000 --chunk-overlap 200
+"""
+import argparse
+import json
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "data-ingestion"))
+
+from text_splitter import TextSplitter
+from token_splitter import TokenSplitter
+
+MODES = ["legacy", "split_text", "iter_chunks", "split_stream", "tokens"]
+
+BLOCK_SIZE = 1024 * 1024
+
+WORDS = (
+    "service request latency index shard replica query document collection "
+    "token model cache vector embedding batch stream gateway worker queue "
+    "timeout retry failure deploy config metric alert storage network node"
+).split()
+
+
+def make_block(seed):
+    """A 1 MB block of paragraphs of 1 to 12 sentences, ending with a paragraph break."""
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+    while size < BLOCK_SIZE:
+        paragraph = " ".join(
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 30))).capitalize() + "."
+            for _ in range(rng.randint(1, 12))
+        )
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs) + "\n\n"
+
+
+def legacy_split_text(text, chunk_size, chunk_overlap):
+    """The splitter before offsets, kept here to compare against."""
+    if not text or len(text.strip()) == 0:
+        return []
+    text = re.sub(r'\r\n', '\n', text)
+    text = re.sub(r'\r', '\n', text)
+
+    def split_paragraph(paragraph):
+        chunks, current_chunk, current_length = [], [], 0
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if len(sentence) > chunk_size:
+                chunks.extend(sentence[i:i + chunk_size] for i in range(0, len(sentence), chunk_size))
+            elif current_length + len(sentence) + (1 if current_chunk else 0) <= chunk_size:
+                if current_chunk:
+                    current_chunk.append(' ')
+                current_chunk.append(sentence)
+                current_length += len(sentence) + (1 if current_chunk else 0)
+            else:
+                if current_chunk:
+                    chunks.append(''.join(current_chunk))
+                current_chunk, current_length = [sentence], len(sentence)
+        if current_chunk:
+            chunks.append(''.join(current_chunk))
+        return chunks
+
+    chunks, current_chunk, current_length = [], [], 0
+    for paragraph in text.split('\n\n'):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) > chunk_size:
+            for chunk in split_paragraph(paragraph):
+                if current_length + len(chunk) + (1 if current_chunk else 0) <= chunk_size:
+                    if current_chunk:
+                        current_chunk.append('\n\n')
+                    current_chunk.append(chunk)
+                    current_length += len(chunk) + (2 if current_chunk else 0)
+                else:
+                    if current_chunk:
+                        chunks.append(''.join(current_chunk))
+                    current_chunk, current_length = [chunk], len(chunk)
+        elif current_length + len(paragraph) + (2 if current_chunk else 0) <= chunk_size:
+            if current_chunk:
+                current_chunk.append('\n\n')
+            current_chunk.append(paragraph)
+            current_length += len(paragraph) + (2 if current_chunk else 0)
+        else:
+            if current_chunk:
+                chunks.append(''.join(current_chunk))
+            current_chunk, current_length = [paragraph], len(paragraph)
+    if current_chunk:
+        chunks.append(''.join(current_chunk))
+
+    if chunk_overlap > 0 and len(chunks) > 1:
+        result = [chunks[0]]
+        for previous, current in zip(chunks, chunks[1:]):
+            overlap_size = min(chunk_overlap, len(previous))
+            result.append(previous[-overlap_size:] + current[:chunk_size - overlap_size])
+        chunks = result
+    return chunks
+
+
+def run(mode, size_mb, args):
+    """Split one document in this process and report timing, output size and peak RSS."""
+    block = make_block(args.seed)
+    splitter = TextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    if mode == "tokens":
+        splitter = TokenSplitter(chunk_tokens=args.chunk_tokens, chunk_overlap=args.chunk_token_overlap,
+                                 encoding_name=args.tokenizer)
+        # Load the tokenizer before timing
+        splitter.count_tokens([block[:100]])
+    if mode == "split_stream":
+        chunks = splitter.split_stream(block for _ in range(size_mb))
+    else:
+        text = block * size_mb
+
+    start = time.perf_counter()
+    if mode == "legacy":
+        chunks = legacy_split_text(text, args.chunk_size, args.chunk_overlap)
+    elif mode == "split_text":
+        chunks = splitter.split_text(text)
+    elif mode in ("iter_chunks", "tokens"):
+        chunks = (chunk for chunk, _, _, _ in splitter.iter_chunks(text))
+    count = characters = 0
+    for chunk in chunks:
+        count += 1
+        characters += len(chunk)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "seconds": elapsed,
+        "chunks": count,
+        "characters": characters,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,10,100", help="document sizes in MB, up to 1000")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--chunk-tokens", type=int, default=254)
+    parser.add_argument("--chunk-token-overlap", type=int, default=32)
+    parser.add_argument("--tokenizer", default="cl100k_base")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--run", nargs=2, metavar=("MODE", "SIZE_MB"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run(args.run[0], int(args.run[1]), args)))
+        return
+
+    print(f"chunk_size {args.chunk_size}, chunk_overlap {args.chunk_overlap}; "
+          f"chunk_tokens {args.chunk_tokens}, chunk_token_overlap {args.chunk_token_overlap} ({args.tokenizer})")
+    print(f"{'size MB':>8}  {'mode':<14}{'seconds':>10}{'MB/s':>10}{'chunks':>12}{'peak RSS MB':>14}")
+    for size_mb in [int(size) for size in args.sizes.split(",")]:
+        outputs = set()
+        for mode in args.modes.split(","):
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", mode, str(size_mb),
+                 "--chunk-size", str(args.chunk_size), "--chunk-overlap", str(args.chunk_overlap),
+                 "--chunk-tokens", str(args.chunk_tokens), "--chunk-token-overlap", str(args.chunk_token_overlap),
+                 "--tokenizer", args.tokenizer, "--seed", str(args.seed)],
+                capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                print(f"{size_mb:>8}  {mode:<14}failed: {completed.stderr.strip().splitlines()[-1:]}")
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            if mode != "tokens":
+                outputs.add((result["chunks"], result["characters"]))
+            print(f"{size_mb:>8}  {mode:<14}{result['seconds']:>10.2f}{size_mb / result['seconds']:>10.1f}"
+                  f"{result['chunks']:>12}{result['peak_rss_mb']:>14.0f}")
+        assert len(outputs) <= 1, f"modes disagree on the chunks of the {size_mb} MB document"
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 import httpx
 from fastapi import FastAPI, Request, Depends, HTTPException, status
+from fastapi.responses import Response, StreamingResponse, JSONResponse
+from starlette.background import BackgroundTask
 import os
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
@@ -46,6 +48,24 @@ async def generate_proxy(request: Request):
         response = await client.get(f"{TEXT_GEN_SERVICE_URL}/generate", params=request.query_params)
         return response.json()
 
+@app.post("/generate", dependencies=[Depends(get_api_key)])
+@limiter.limit("5/minute")
+async def generate_post_proxy(request: Request):
+    # Takes max_new_tokens and temperature in the body; 429/503 from text-gen are passed through
+    data = await request.json()
+    async with httpx.AsyncClient(timeout=None) as client:
+        response = await client.post(f"{TEXT_GEN_SERVICE_URL}/generate", json=data)
+        return JSONResponse(content=response.json(), status_code=response.status_code, headers={
+            key: value for key, value in response.headers.items() if key.lower() == "retry-after"
+        })
+
+@app.post("/generate/stream", dependencies=[Depends(get_api_key)])
+@limiter.limit("5/minute")
+async def generate_stream_proxy(request: Request):
+    # Server-sent events, relayed token by token
+    data = await request.json()
+    return await stream_upstream("POST", f"{TEXT_GEN_SERVICE_URL}/generate/stream", json=data)
+
 @app.post("/analyze", dependencies=[Depends(get_api_key)])
 @limiter.limit("10/minute")
 async def sentiment_proxy(request: Request):
@@ -54,6 +74,14 @@ async def sentiment_proxy(request: Request):
         response = await client.post(f"{SENTIMENT_SERVICE_URL}/analyze", json=data)
         return response.json()
 
+@app.post("/analyze/batch", dependencies=[Depends(get_api_key)])
+@limiter.limit("10/minute")
+async def sentiment_batch_proxy(request: Request):
+    data = await request.json()
+    async with httpx.AsyncClient(timeout=None) as client:
+        response = await client.post(f"{SENTIMENT_SERVICE_URL}/analyze/batch", json=data)
+        return response.json()
+
 @app.post("/generate-embedding", dependencies=[Depends(get_api_key)])
 @limiter.limit("10/minute")
 async def embeddings_proxy(request: Request):
@@ -85,6 +113,43 @@ async def vector_db_get_collection_proxy(collection_name: str, request: Request)
         response = await client.get(f"{VECTOR_DB_SERVICE_URL}/collections/{collection_name}")
         return response.json()
 
+async def stream_upstream(method: str, url: str, **kwargs) -> Response:
+    # Relay the upstream body chunk by chunk as it arrives, without buffering it
+    client = httpx.AsyncClient(timeout=None)
+    upstream_request = client.build_request(method, url, **kwargs)
+    try:
+        response = await client.send(upstream_request, stream=True)
+    except httpx.HTTPError as e:
+        await client.aclose()
+        # Refused or unreachable means the service is down; anything else failed on the way
+        status_code = status.HTTP_503_SERVICE_UNAVAILABLE if isinstance(e, httpx.ConnectError) else status.HTTP_502_BAD_GATEWAY
+        return JSONResponse(content={"detail": f"Upstream service error: {str(e)}"}, status_code=status_code)
+    except BaseException:
+        await client.aclose()
+        raise
+
+    async def close_upstream():
+        await response.aclose()
+        await client.aclose()
+
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        media_type=response.headers.get("content-type"),
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(close_upstream)
+    )
+
+@app.get("/vector-db/collections/{collection_name}/scan", dependencies=[Depends(get_api_key)])
+@limiter.limit("10/minute")
+async def vector_db_scan_collection_proxy(collection_name: str, request: Request):
+    # Scans can be arbitrarily large, so relay the NDJSON stream without buffering it
+    return await stream_upstream(
+        "GET",
+        f"{VECTOR_DB_SERVICE_URL}/collections/{collection_name}/scan",
+        params=request.query_params
+    )
+
 @app.delete("/vector-db/collections/{collection_name}", dependencies=[Depends(get_api_key)])
 @limiter.limit("5/minute")
 async def vector_db_delete_collection_proxy(collection_name: str, request: Request):
@@ -92,6 +157,22 @@ async def vector_db_delete_collection_proxy(collection_name: str, request: Reque
         response = await client.delete(f"{VECTOR_DB_SERVICE_URL}/collections/{collection_name}")
         return response.json()
 
+@app.post("/vector-db/collections/{collection_name}/documents/delete", dependencies=[Depends(get_api_key)])
+@limiter.limit("10/minute")
+async def vector_db_delete_documents_proxy(collection_name: str, request: Request):
+    data = await request.json()
+    async with httpx.AsyncClient() as client:
+        response = await client.post(f"{VECTOR_DB_SERVICE_URL}/collections/{collection_name}/documents/delete", json=data)
+        return response.json()
+
+@app.put("/vector-db/collections/{collection_name}/ttl", dependencies=[Depends(get_api_key)])
+@limiter.limit("10/minute")
+async def vector_db_set_ttl_proxy(collection_name: str, request: Request):
+    data = await request.json()
+    async with httpx.AsyncClient() as client:
+        response = await client.put(f"{VECTOR_DB_SERVICE_URL}/collections/{collection_name}/ttl", json=data)
+        return response.json()
+
 @app.post("/vector-db/documents", dependencies=[Depends(get_api_key)])
 @limiter.limit("20/minute")
 async def vector_db_add_documents_proxy(request: Request):
@@ -140,6 +221,20 @@ async def rag_proxy(request: Request):
         response = await client.post(f"{RAG_ORCHESTRATOR_SERVICE_URL}/rag", json=data)
         return response.json()
 
+@app.post("/rag/stream", dependencies=[Depends(get_api_key)])
+@limiter.limit("20/minute")
+async def rag_stream_proxy(request: Request):
+    # Server-sent events: the retrieved documents first, then the answer token by token
+    data = await request.json()
+    return await stream_upstream("POST", f"{RAG_ORCHESTRATOR_SERVICE_URL}/rag/stream", json=data)
+
+@app.post("/rag/batch", dependencies=[Depends(get_api_key)])
+@limiter.limit("5/minute")
+async def rag_batch_proxy(request: Request):
+    # NDJSON, one line per query as it completes; batches can run for a long time
+    data = await request.json()
+    return await stream_upstream("POST", f"{RAG_ORCHESTRATOR_SERVICE_URL}/rag/batch", json=data)
+
 @app.get("/rag/collections", dependencies=[Depends(get_api_key)])
 @limiter.limit("20/minute")
 async def rag_list_collections_proxy(request: Request):
@@ -173,18 +268,13 @@ async def ingest_batch_proxy(request: Request):
 @app.post("/upload", dependencies=[Depends(get_api_key)])
 @limiter.limit("5/minute")
 async def upload_file_proxy(request: Request):
-    # This is a multipart form, so we need to forward it as is
-    form_data = await request.form()
-    
-    async with httpx.AsyncClient() as client:
-        # Forward the multipart form data
+    # Relay the multipart body as it arrives instead of buffering the whole file;
+    # data-ingestion parses the form and reads the file in blocks
+    async with httpx.AsyncClient(timeout=None) as client:
         response = await client.post(
             f"{DATA_INGESTION_SERVICE_URL}/upload",
-            files={"file": (form_data["file"].filename, await form_data["file"].read(), form_data["file"].content_type)},
-            data={
-                "collection_name": form_data["collection_name"],
-                "metadata": form_data.get("metadata", "{}")
-            }
+            content=request.stream(),
+            headers={"content-type": request.headers.get("content-type", "")}
         )
         return response.json()
 
@@ -205,6 +295,14 @@ async def async_batch_ingest_proxy(request: Request):
         response = await client.post(f"{ASYNC_PROCESSOR_SERVICE_URL}/async-batch-ingest", json=data)
         return response.json()
 
+@app.post("/async-sentiment-scoring", dependencies=[Depends(get_api_key)])
+@limiter.limit("10/minute")
+async def async_sentiment_scoring_proxy(request: Request):
+    data = await request.json()
+    async with httpx.AsyncClient() as client:
+        response = await client.post(f"{ASYNC_PROCESSOR_SERVICE_URL}/async-sentiment-scoring", json=data)
+        return response.json()
+
 @app.get("/task/{task_id}", dependencies=[Depends(get_api_key)])
 @limiter.limit("60/minute")
 async def task_status_proxy(task_id: str, request: Request):
@@ -1,10 +1,13 @@
 from fastapi.testclient import TestClient
+import httpx
+import socket
 import sys
 import os
 
 # Add the parent directory to the path so we can import main
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import main
 from main import app
 
 client = TestClient(app)
@@ -13,3 +16,27 @@ def test_read_health():
     response = client.get("/health")
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
+
+
+def test_stream_returns_503_and_closes_the_client_when_the_upstream_is_down(monkeypatch):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    monkeypatch.setattr(main, "RAG_ORCHESTRATOR_SERVICE_URL", f"http://127.0.0.1:{port}")
+    closed = []
+    aclose = httpx.AsyncClient.aclose
+
+    async def record_aclose(self):
+        closed.append(self)
+        await aclose(self)
+    monkeypatch.setattr(httpx.AsyncClient, "aclose", record_aclose)
+
+    response = client.post(
+        "/rag/batch",
+        json={"queries": ["q"], "collection_name": "docs"},
+        headers={"X-API-Key": main.API_KEY}
+    )
+
+    assert response.status_code == 503
+    assert "detail" in response.json()
+    assert len(closed) == 1
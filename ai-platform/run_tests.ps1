@@ -10,11 +10,11 @@ Set-Location -Path gateway
 python -m pytest tests/ -v
 Set-Location -Path ..
 
-# Test text-gen service (when tests are added)
+# Test text-gen service
 Write-Host "Testing text-gen service..." -ForegroundColor Cyan
-# Set-Location -Path services/text-gen
-# python -m pytest tests/ -v
-# Set-Location -Path ../..
+Set-Location -Path services/text-gen
+python -m pytest tests/ -v
+Set-Location -Path ../..
 
 # Test sentiment-analyzer service (when tests are added)
 Write-Host "Testing sentiment-analyzer service..." -ForegroundColor Cyan
@@ -28,4 +28,34 @@ Write-Host "Testing embeddings-service service..." -ForegroundColor Cyan
 # python -m pytest tests/ -v
 # Set-Location -Path ../..
 
+# Test vector-db service
+Write-Host "Testing vector-db service..." -ForegroundColor Cyan
+Set-Location -Path services/vector-db
+python -m pytest tests/ -v
+Set-Location -Path ../..
+
+# Test retriever service
+Write-Host "Testing retriever service..." -ForegroundColor Cyan
+Set-Location -Path services/retriever
+python -m pytest tests/ -v
+Set-Location -Path ../..
+
+# Test rag-orchestrator service
+Write-Host "Testing rag-orchestrator service..." -ForegroundColor Cyan
+Set-Location -Path services/rag-orchestrator
+python -m pytest tests/ -v
+Set-Location -Path ../..
+
+# Test data-ingestion service
+Write-Host "Testing data-ingestion service..." -ForegroundColor Cyan
+Set-Location -Path services/data-ingestion
+python -m pytest tests/ -v
+Set-Location -Path ../..
+
+# Test async-processor service
+Write-Host "Testing async-processor service..." -ForegroundColor Cyan
+Set-Location -Path services/async-processor
+python -m pytest tests/ -v
+Set-Location -Path ../..
+
 Write-Host "All tests completed successfully!" -ForegroundColor Green
@@ -11,11 +11,11 @@ cd gateway
 python -m pytest tests/ -v
 cd ..
 
-# Test text-gen service (when tests are added)
+# Test text-gen service
 echo "Testing text-gen service..."
-# cd services/text-gen
-# python -m pytest tests/ -v
-# cd ../..
+cd services/text-gen
+python -m pytest tests/ -v
+cd ../..
 
 # Test sentiment-analyzer service (when tests are added)
 echo "Testing sentiment-analyzer service..."
@@ -29,4 +29,34 @@ echo "Testing embeddings-service service..."
 # python -m pytest tests/ -v
 # cd ../..
 
+# Test vector-db service
+echo "Testing vector-db service..."
+cd services/vector-db
+python -m pytest tests/ -v
+cd ../..
+
+# Test retriever service
+echo "Testing retriever service..."
+cd services/retriever
+python -m pytest tests/ -v
+cd ../..
+
+# Test rag-orchestrator service
+echo "Testing rag-orchestrator service..."
+cd services/rag-orchestrator
+python -m pytest tests/ -v
+cd ../..
+
+# Test data-ingestion service
+echo "Testing data-ingestion service..."
+cd services/data-ingestion
+python -m pytest tests/ -v
+cd ../..
+
+# Test async-processor service
+echo "Testing async-processor service..."
+cd services/async-processor
+python -m pytest tests/ -v
+cd ../..
+
 echo "All tests completed successfully!"
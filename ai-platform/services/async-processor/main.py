@@ -5,7 +5,7 @@ import os
 import sys
 
 # Import the worker
-from worker import process_rag_query, ingest_document_batch, check_task_status, celery_app
+from worker import process_rag_query, ingest_document_batch, score_collection_sentiment, check_task_status, celery_app
 
 app = FastAPI()
 
@@ -23,6 +23,12 @@ class BatchInput(BaseModel):
     documents: List[DocumentInput]
     collection_name: str
 
+class SentimentJobRequest(BaseModel):
+    collection_name: str
+    model: Optional[str] = None
+    page_size: int = 256
+    restart: bool = False
+
 class TaskStatusRequest(BaseModel):
     task_id: str
 
@@ -81,6 +87,32 @@ async def submit_batch_ingest(batch: BatchInput):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/async-sentiment-scoring")
+async def submit_sentiment_scoring(request: SentimentJobRequest):
+    """
+    Submit a job that scores the sentiment of every chunk in a collection.
+    
+    Submitting it again for the same collection and model resumes an
+    interrupted job from its last checkpoint, unless restart is set.
+    """
+    if request.page_size < 1 or request.page_size > 10000:
+        raise HTTPException(status_code=400, detail="page_size must be between 1 and 10000")
+    try:
+        task = score_collection_sentiment.delay(
+            collection_name=request.collection_name,
+            model=request.model,
+            page_size=request.page_size,
+            restart=request.restart
+        )
+        
+        return {
+            "task_id": task.id,
+            "status": "submitted",
+            "message": f"Sentiment scoring of collection '{request.collection_name}' submitted"
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/task/{task_id}")
 async def get_task_status(task_id: str):
     """
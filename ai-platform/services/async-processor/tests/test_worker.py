@@ -0,0 +1,143 @@
+import json
+import os
+import sys
+
+import httpx
+import pytest
+
+# Add the parent directory to the path so we can import the worker
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import worker
+from worker import score_collection_sentiment, sentiment_checkpoint_key
+
+
+class FakeRedis:
+    """Keeps the checkpoints in a dict."""
+
+    def __init__(self):
+        self.values = {}
+        self.history = []
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+        self.history.append(json.loads(value))
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+class FakeServices:
+    """Answers the vector-db scan and metadata endpoints and the batched sentiment endpoint."""
+
+    def __init__(self, texts, fail_metadata_writes=0):
+        self.chunks = {f"chunk_{i}": {"text": text, "metadata": {"id": "doc"}} for i, text in enumerate(texts)}
+        self.fail_metadata_writes = fail_metadata_writes
+        self.scored = []
+        self.metadata_writes = []
+
+    def handler(self, request):
+        path = request.url.path
+        if path == "/collections/docs":
+            return httpx.Response(200, json={"name": "docs", "count": len(self.chunks)})
+        if path == "/collections/docs/scan":
+            offset = int(request.url.params.get("cursor") or 0)
+            page_size = int(request.url.params["page_size"])
+            ids = sorted(self.chunks)[offset:offset + page_size]
+            lines = [{"id": chunk_id, "text": self.chunks[chunk_id]["text"], "metadata": self.chunks[chunk_id]["metadata"]}
+                     for chunk_id in ids]
+            next_cursor = str(offset + len(ids)) if len(ids) == page_size and offset + len(ids) < len(self.chunks) else None
+            lines.append({"next_cursor": next_cursor})
+            return httpx.Response(200, text="\n".join(json.dumps(line) for line in lines))
+        body = json.loads(request.content)
+        if path == "/analyze/batch":
+            self.scored.append(body["texts"])
+            return httpx.Response(200, json={"results": [
+                {"label": "POSITIVE" if "good" in text else "NEGATIVE", "score": 0.9} for text in body["texts"]
+            ]})
+        if path == "/collections/docs/documents/metadata":
+            if self.fail_metadata_writes:
+                self.fail_metadata_writes -= 1
+                return httpx.Response(503, json={"detail": "unavailable"})
+            self.metadata_writes.append([update["id"] for update in body["updates"]])
+            for update in body["updates"]:
+                self.chunks[update["id"]]["metadata"].update(update["metadata"])
+            return httpx.Response(200, json={"updated": len(body["updates"]), "missing": []})
+        return httpx.Response(404)
+
+
+@pytest.fixture
+def services(monkeypatch):
+    def install(texts, fail_metadata_writes=0):
+        fake = FakeServices(texts, fail_metadata_writes)
+        store = FakeRedis()
+        monkeypatch.setattr(worker, "_checkpoint_store", store)
+        monkeypatch.setattr(worker, "VECTOR_DB_URL", "http://vector-db")
+        monkeypatch.setattr(worker, "SENTIMENT_URL", "http://sentiment")
+        client = httpx.Client
+        monkeypatch.setattr(worker.httpx, "Client",
+                            lambda **kwargs: client(transport=httpx.MockTransport(fake.handler)))
+        # Progress would be stored in the Redis result backend
+        monkeypatch.setattr(score_collection_sentiment, "update_state", lambda **kwargs: None)
+        return fake, store
+    return install
+
+
+def test_every_page_is_scored_and_written_back_in_one_bulk_update(services):
+    fake, store = services(["good day", "bad day", "good food", "", "bad food"])
+
+    result = score_collection_sentiment.apply(args=("docs",), kwargs={"page_size": 2}).get()
+
+    assert result["result"] == {"collection_name": "docs", "scored": 4, "resumed": False}
+    # Chunks without text are neither scored nor written
+    assert fake.scored == [["good day", "bad day"], ["good food"], ["bad food"]]
+    assert fake.metadata_writes == [["chunk_0", "chunk_1"], ["chunk_2"], ["chunk_4"]]
+    assert fake.chunks["chunk_0"]["metadata"] == {"id": "doc", "sentiment_label": "POSITIVE", "sentiment_score": 0.9}
+    assert fake.chunks["chunk_4"]["metadata"]["sentiment_label"] == "NEGATIVE"
+    assert "sentiment_label" not in fake.chunks["chunk_3"]["metadata"]
+    assert [checkpoint["scored"] for checkpoint in store.history] == [2, 3, 4]
+    assert store.values == {}
+
+
+def test_a_failed_job_is_retried_from_its_checkpoint(services, monkeypatch):
+    fake, store = services([f"text {i}" for i in range(6)])
+    # Fail the write of the second page once
+    original_handler = fake.handler
+    pages = []
+
+    def handler(request):
+        if request.url.path.endswith("/documents/metadata"):
+            pages.append(request)
+            if len(pages) == 2:
+                return httpx.Response(503, json={"detail": "unavailable"})
+        return original_handler(request)
+
+    monkeypatch.setattr(fake, "handler", handler)
+    monkeypatch.setattr(worker, "SENTIMENT_RETRY_DELAY", 0)
+
+    result = score_collection_sentiment.apply(args=("docs",), kwargs={"page_size": 2, "restart": True}).get()
+
+    assert result["result"]["scored"] == 6
+    assert result["result"]["resumed"] is True
+    # The first page was scored once, the failed one again
+    assert fake.scored == [["text 0", "text 1"], ["text 2", "text 3"], ["text 2", "text 3"], ["text 4", "text 5"]]
+    assert all("sentiment_label" in chunk["metadata"] for chunk in fake.chunks.values())
+    assert store.values == {}
+
+
+def test_a_job_fails_once_its_retries_are_used_up(services, monkeypatch):
+    fake, store = services([f"text {i}" for i in range(4)], fail_metadata_writes=100)
+    monkeypatch.setattr(worker, "SENTIMENT_RETRY_DELAY", 0)
+    monkeypatch.setattr(score_collection_sentiment, "max_retries", 2)
+    store.set(sentiment_checkpoint_key("docs", None), json.dumps({"cursor": "2", "scored": 2}))
+
+    result = score_collection_sentiment.apply(args=("docs",), kwargs={"page_size": 2})
+
+    assert result.failed()
+    assert "503 Service Unavailable" in str(result.result)
+    # Every attempt resumed from the checkpoint, which is kept for the next run
+    assert fake.scored == [["text 2", "text 3"]] * 3
+    assert json.loads(store.values[sentiment_checkpoint_key("docs", None)]) == {"cursor": "2", "scored": 2}
@@ -2,6 +2,7 @@ import os
 import httpx
 import logging
 import json
+import redis
 from celery import Celery
 from typing import Dict, Any, List, Optional
 
@@ -28,6 +29,54 @@ celery_app.conf.update(
 # Service URLs
 RAG_ORCHESTRATOR_URL = os.getenv("RAG_ORCHESTRATOR_SERVICE_URL", "http://rag-orchestrator:8000")
 DATA_INGESTION_URL = os.getenv("DATA_INGESTION_SERVICE_URL", "http://data-ingestion:8000")
+VECTOR_DB_URL = os.getenv("VECTOR_DB_SERVICE_URL", "http://vector-db:8000")
+SENTIMENT_URL = os.getenv("SENTIMENT_SERVICE_URL", "http://sentiment-analyzer:8000")
+
+# Seconds the scan position of an interrupted sentiment job is kept for resuming it
+SENTIMENT_CHECKPOINT_TTL = int(os.getenv("SENTIMENT_CHECKPOINT_TTL", str(7 * 24 * 3600)))
+
+# Times a failed sentiment job is retried from its checkpoint, and seconds between attempts
+SENTIMENT_MAX_RETRIES = int(os.getenv("SENTIMENT_MAX_RETRIES", "5"))
+SENTIMENT_RETRY_DELAY = int(os.getenv("SENTIMENT_RETRY_DELAY", "30"))
+
+_checkpoint_store = None
+
+def checkpoint_store():
+    """Redis client for job checkpoints, created on first use."""
+    global _checkpoint_store
+    if _checkpoint_store is None:
+        _checkpoint_store = redis.Redis.from_url(REDIS_URL)
+    return _checkpoint_store
+
+def sentiment_checkpoint_key(collection_name: str, model: Optional[str]) -> str:
+    return f"sentiment_job:{collection_name}:{model or 'default'}"
+
+def read_scan_page(client: httpx.Client, collection_name: str, cursor: Optional[str], page_size: int):
+    """
+    Fetch one page of a vector-db collection scan.
+    
+    Returns:
+        The records of the page and the cursor of the next one, None at the end
+    """
+    params = {"page_size": page_size, "limit": page_size}
+    if cursor:
+        params["cursor"] = cursor
+    response = client.get(f"{VECTOR_DB_URL}/collections/{collection_name}/scan", params=params)
+    response.raise_for_status()
+    
+    records = []
+    next_cursor = None
+    for line in response.text.splitlines():
+        if not line:
+            continue
+        item = json.loads(line)
+        if "error" in item:
+            raise RuntimeError(f"Scan failed: {item['error']}")
+        if "next_cursor" in item:
+            next_cursor = item["next_cursor"]
+        else:
+            records.append(item)
+    return records, next_cursor
 
 @celery_app.task(name="process_rag_query", bind=True)
 def process_rag_query(self, query: str, collection_name: str, n_results: int = 5) -> Dict[str, Any]:
@@ -105,6 +154,102 @@ def ingest_document_batch(self, documents: List[Dict[str, Any]], collection_name
         logger.error(f"Error ingesting documents: {str(e)}")
         return {"success": False, "error": str(e)}
 
+@celery_app.task(name="score_collection_sentiment", bind=True, acks_late=True, max_retries=SENTIMENT_MAX_RETRIES)
+def score_collection_sentiment(self, collection_name: str, model: Optional[str] = None, page_size: int = 256,
+                               restart: bool = False) -> Dict[str, Any]:
+    """
+    Score the sentiment of every chunk in a collection and store it as chunk metadata.
+    
+    The collection is scanned page by page; each page is scored with one call
+    to the batched sentiment endpoint and written back with one bulk metadata
+    update (`sentiment_label`, `sentiment_score`). After every page the scan
+    cursor is checkpointed in Redis and the task reports PROGRESS. A job that
+    fails is retried, resuming from the last page, and fails once its retries
+    are used up; one whose worker dies is redelivered or resumed by running
+    it again for the same collection and model.
+    
+    Args:
+        collection_name: The collection to score
+        model: Sentiment model to use, or None for the service's default
+        page_size: Number of chunks scored per page
+        restart: Whether to ignore a checkpoint and start from the beginning
+        
+    Returns:
+        Result of the job, with the number of chunks scored
+    """
+    checkpoint_key = sentiment_checkpoint_key(collection_name, model)
+    state = {"cursor": None, "scored": 0}
+    try:
+        store = checkpoint_store()
+        if restart:
+            store.delete(checkpoint_key)
+        checkpoint = store.get(checkpoint_key)
+        resumed = checkpoint is not None
+        if resumed:
+            state = json.loads(checkpoint)
+            logger.info(f"Resuming sentiment scoring of '{collection_name}' after {state['scored']} chunks")
+        else:
+            logger.info(f"Scoring sentiment of collection '{collection_name}'")
+        
+        with httpx.Client(timeout=300) as client:
+            response = client.get(f"{VECTOR_DB_URL}/collections/{collection_name}")
+            response.raise_for_status()
+            total = response.json().get("count")
+            
+            while True:
+                records, next_cursor = read_scan_page(client, collection_name, state["cursor"], page_size)
+                records = [record for record in records if record.get("text")]
+                
+                if records:
+                    response = client.post(
+                        f"{SENTIMENT_URL}/analyze/batch",
+                        json={"texts": [record["text"] for record in records], "model": model}
+                    )
+                    response.raise_for_status()
+                    results = response.json()["results"]
+                    
+                    response = client.post(
+                        f"{VECTOR_DB_URL}/collections/{collection_name}/documents/metadata",
+                        json={"updates": [
+                            {
+                                "id": record["id"],
+                                "metadata": {"sentiment_label": result["label"], "sentiment_score": float(result["score"])}
+                            }
+                            for record, result in zip(records, results)
+                        ]}
+                    )
+                    response.raise_for_status()
+                
+                # Only move the checkpoint once the page's scores are stored
+                state = {"cursor": next_cursor, "scored": state["scored"] + len(records)}
+                store.set(checkpoint_key, json.dumps(state), ex=SENTIMENT_CHECKPOINT_TTL)
+                self.update_state(state="PROGRESS", meta={
+                    "collection_name": collection_name,
+                    "scored": state["scored"],
+                    "total": total
+                })
+                
+                if next_cursor is None:
+                    break
+        
+        store.delete(checkpoint_key)
+        logger.info(f"Scored sentiment of {state['scored']} chunks in collection '{collection_name}'")
+        return {"success": True, "result": {
+            "collection_name": collection_name,
+            "scored": state["scored"],
+            "resumed": resumed
+        }}
+    
+    except Exception as e:
+        logger.error(f"Error scoring sentiment of collection '{collection_name}' after {state['scored']} chunks: {str(e)}")
+        # The retry resumes from the checkpoint, even if this run was asked to restart
+        raise self.retry(
+            exc=e,
+            args=(collection_name,),
+            kwargs={"model": model, "page_size": page_size, "restart": False},
+            countdown=SENTIMENT_RETRY_DELAY
+        )
+
 @celery_app.task(name="check_task_status", bind=True)
 def check_task_status(self, task_id: str) -> Dict[str, Any]:
     """
@@ -126,6 +271,14 @@ def check_task_status(self, task_id: str) -> Dict[str, Any]:
                 "status": "pending",
                 "result": None
             }
+        elif task.state in ('STARTED', 'PROGRESS', 'RETRY'):
+            # Long-running jobs report their progress in the task's meta
+            return {
+                "task_id": task_id,
+                "status": "running",
+                "result": None,
+                "progress": task.info if isinstance(task.info, dict) else None
+            }
         elif task.state == 'FAILURE':
             return {
                 "task_id": task_id,
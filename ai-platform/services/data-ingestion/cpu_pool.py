@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Dict, Any, Tuple, Union
+
+logger = logging.getLogger("ai_platform.data_ingestion")
+
+# What crosses between processes: the UTF-8 bytes themselves, or the name and
+# size of a shared memory block holding them
+Payload = Union[bytes, Tuple[str, int]]
+
+# Bytes copied into shared memory at a time, so a thread copying a large
+# document hands the GIL back to the event loop in between
+COPY_BLOCK_SIZE = 1024 * 1024
+
+# The splitter of a worker process, set up once when the worker starts
+_splitter = None
+
+
+def _init_worker(splitter):
+    global _splitter
+    _splitter = splitter
+
+
+def _ready() -> bool:
+    return _splitter is not None
+
+
+def _write(data: bytes, shared_memory_min_bytes: int) -> Payload:
+    """Put bytes in a new shared memory block if they are large enough to be worth it."""
+    if not data or len(data) < shared_memory_min_bytes:
+        return data
+    try:
+        block = shared_memory.SharedMemory(create=True, size=len(data))
+    except OSError as e:
+        logger.warning(f"Sending {len(data)} bytes through a pipe, no shared memory: {str(e)}")
+        return data
+    try:
+        view = memoryview(data)
+        for start in range(0, len(data), COPY_BLOCK_SIZE):
+            block.buf[start:start + COPY_BLOCK_SIZE] = view[start:start + COPY_BLOCK_SIZE]
+        view.release()
+    finally:
+        block.close()
+    return block.name, len(data)
+
+
+def _read(payload: Payload) -> str:
+    """Decode a payload, releasing its shared memory block."""
+    if isinstance(payload, bytes):
+        return payload.decode("utf-8")
+    name, size = payload
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return str(block.buf[:size], "utf-8")
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _split(payload: Payload, shared_memory_min_bytes: int) -> Tuple[Payload, List[Tuple[int, int, int, int]]]:
+    """
+    Decode, normalize and split a document in a worker process.
+
+    Returns:
+        The text of all chunks one after the other, and for every chunk its
+        length and the offsets `iter_chunks` gives it
+    """
+    text = _read(payload)
+    spans = []
+    texts = []
+    for chunk, start_offset, end_offset, overlap_chars in _splitter.iter_chunks(text):
+        texts.append(chunk)
+        spans.append((len(chunk), start_offset, end_offset, overlap_chars))
+    return _write("".join(texts).encode("utf-8"), shared_memory_min_bytes), spans
+
+
+class SplitPool:
+    """
+    Splits documents in a pool of worker processes.
+    
+    Splitting is pure Python, so in a thread it still holds the GIL the event
+    loop needs, and a large document stalls every request of the service. In
+    the pool it runs on other cores. Documents are sent to a worker as UTF-8,
+    and decoded, normalized and split there; the chunks come back as one
+    text with the lengths and offsets of the chunks in it. Payloads from
+    `shared_memory_min_bytes` up travel through shared memory rather than
+    being pickled through a pipe.
+    """
+    
+    def __init__(self, splitter, workers: int = 2, shared_memory_min_bytes: int = 1024 * 1024):
+        """
+        Initialize the pool; worker processes are started on first use.
+        
+        Args:
+            splitter: TextSplitter or TokenSplitter every worker gets a copy of
+            workers: Number of worker processes
+            shared_memory_min_bytes: Size from which a payload goes through shared memory
+        """
+        self.workers = workers
+        self.shared_memory_min_bytes = shared_memory_min_bytes
+        # Workers are spawned rather than forked from a process running an event loop and threads
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(splitter,)
+        )
+        self.documents = 0
+        self.in_flight = 0
+        self.shared_memory_transfers = 0
+        self._lock = threading.Lock()
+        logger.info(f"SplitPool initialized with {workers} worker processes")
+    
+    async def start(self):
+        """Start the worker processes ahead of the first document, off the event loop."""
+        def start_workers():
+            for future in [self.executor.submit(_ready) for _ in range(self.workers)]:
+                future.result()
+        await asyncio.to_thread(start_workers)
+    
+    async def split(self, text: str) -> List[Tuple[str, int, int, int]]:
+        """
+        Split a document in a worker process.
+        
+        Args:
+            text: The document text
+        
+        Returns:
+            The tuples `iter_chunks` yields for the document
+        """
+        write = asyncio.ensure_future(asyncio.to_thread(lambda: _write(text.encode("utf-8"), self.shared_memory_min_bytes)))
+        try:
+            payload = await asyncio.shield(write)
+        except asyncio.CancelledError:
+            write.add_done_callback(lambda done: done.cancelled() or done.exception() or self._release(done.result()))
+            raise
+        with self._lock:
+            self.in_flight += 1
+            self.shared_memory_transfers += not isinstance(payload, bytes)
+        try:
+            try:
+                future = asyncio.get_running_loop().run_in_executor(
+                    self.executor, _split, payload, self.shared_memory_min_bytes
+                )
+            except Exception:
+                self._release(payload)
+                raise
+            try:
+                result, spans = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The worker may still attach to the block, so it is freed once the worker is done
+                future.add_done_callback(lambda done: self._discard(done, payload))
+                raise
+            except Exception:
+                self._release(payload)
+                raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        
+        with self._lock:
+            self.documents += 1
+            self.shared_memory_transfers += not isinstance(result, bytes)
+        # Cutting up the chunks is a Python loop, so it yields to the event loop from a thread
+        return await asyncio.to_thread(self._chunks, result, spans)
+    
+    @staticmethod
+    def _chunks(result: Payload, spans: List[Tuple[int, int, int, int]]) -> List[Tuple[str, int, int, int]]:
+        """Cut the text a worker returned into its chunks."""
+        text = _read(result)
+        chunks = []
+        position = 0
+        for length, start_offset, end_offset, overlap_chars in spans:
+            chunks.append((text[position:position + length], start_offset, end_offset, overlap_chars))
+            position += length
+        return chunks
+    
+    @staticmethod
+    def _release(payload: Payload):
+        """Free the shared memory block of a payload the worker didn't get to."""
+        if isinstance(payload, bytes):
+            return
+        try:
+            block = shared_memory.SharedMemory(name=payload[0])
+        except FileNotFoundError:
+            return
+        block.close()
+        block.unlink()
+    
+    @classmethod
+    def _discard(cls, future, payload: Payload):
+        """Free the blocks of a split nobody waits for any more."""
+        if future.cancelled() or future.exception() is not None:
+            cls._release(payload)
+            return
+        result, _ = future.result()
+        cls._release(result)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Worker count, documents split, splits in progress and payloads sent through shared memory"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "documents": self.documents,
+                "in_flight": self.in_flight,
+                "shared_memory_transfers": self.shared_memory_transfers
+            }
+    
+    def close(self):
+        """Stop the worker processes."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
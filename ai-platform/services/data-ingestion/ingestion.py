@@ -1,19 +1,50 @@
 import httpx
+import codecs
+import itertools
+import json
 import logging
 import os
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 import uuid
 import asyncio
 from text_splitter import TextSplitter
+from cpu_pool import SplitPool
+from manifest import content_hash, metadata_hash
 
 logger = logging.getLogger("ai_platform.data_ingestion")
 
+# Seconds a collection's TTL, looked up in the vector database, is reused for
+COLLECTION_TTL_CACHE_SECONDS = 60
+
 class DataIngestion:
     """
     A class to handle document ingestion into the vector database.
+    
+    Batches go through a pipeline: documents are split a few at a time off
+    the event loop, their chunks are packed across documents into
+    `/documents` requests bounded in chunks and bytes, and several of those
+    requests are kept in flight over one pooled HTTP client.
+    
+    With `cpu_workers`, documents of `pool_min_chars` characters or more are
+    split in a pool of worker processes, on other cores than the event
+    loop's; smaller ones, and uploads, which are split as they stream in,
+    are split in worker threads.
+    
+    With a `manifest`, documents with an `id` in their metadata are
+    re-ingested incrementally: a document that didn't change is skipped
+    without being split, and of one that did, only chunks with new text are
+    embedded and added. Chunks whose text is unchanged but moved only get
+    their metadata updated, and chunks no longer in the document are
+    deleted. Chunk IDs of such documents are derived from the chunks' text.
+    In a collection with a TTL, the chunks kept are stamped as ingested
+    again, and any that expired already are stored again.
     """
     
-    def __init__(self, vector_db_url=None, chunk_size=1000, chunk_overlap=200):
+    def __init__(self, vector_db_url=None, chunk_size=1000, chunk_overlap=200, split_concurrency=4,
+                 max_in_flight=4, request_max_chunks=256, request_max_bytes=4 * 1024 * 1024,
+                 request_timeout=120.0, text_splitter=None, cpu_workers=0,
+                 shared_memory_min_bytes=1024 * 1024, pool_min_chars=64 * 1024, manifest=None):
         """
         Initialize the data ingestion service.
         
@@ -21,11 +52,64 @@ class DataIngestion:
             vector_db_url: URL of the vector database service
             chunk_size: Maximum size of each chunk in characters
             chunk_overlap: Number of characters to overlap between chunks
+            split_concurrency: Number of documents of a batch split at the same time
+            max_in_flight: Number of `/documents` requests of a batch sent at the same time
+            request_max_chunks: Maximum number of chunks per `/documents` request
+            request_max_bytes: Approximate maximum JSON size of a `/documents` request
+            request_timeout: Seconds to wait for the vector database, which embeds the chunks
+            text_splitter: Splitter to use instead of a TextSplitter of `chunk_size` characters,
+                such as a TokenSplitter
+            cpu_workers: Number of worker processes documents are split in; 0 splits them in threads
+            shared_memory_min_bytes: Size from which documents and their chunks pass between
+                processes through shared memory
+            pool_min_chars: Length from which a document is split in a worker process
+            manifest: FingerprintManifest documents with an ID are re-ingested incrementally against
         """
         self.vector_db_url = vector_db_url or os.getenv("VECTOR_DB_SERVICE_URL", "http://vector-db:8000")
-        self.text_splitter = TextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.text_splitter = text_splitter or TextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.split_concurrency = split_concurrency
+        self.max_in_flight = max_in_flight
+        self.request_max_chunks = request_max_chunks
+        self.request_max_bytes = request_max_bytes
+        self.request_timeout = request_timeout
+        self.pool_min_chars = pool_min_chars
+        self.split_pool = SplitPool(self.text_splitter, cpu_workers, shared_memory_min_bytes) if cpu_workers > 0 else None
+        self.manifest = manifest
+        self._collection_ttls = {}
+        # What the chunks of a document depend on besides the document, so changing it re-splits documents
+        self.splitter_signature = json.dumps({
+            "splitter": type(self.text_splitter).__name__,
+            **{
+                name: getattr(self.text_splitter, name)
+                for name in ("chunk_size", "chunk_tokens", "chunk_overlap", "encoding_name")
+                if hasattr(self.text_splitter, name)
+            }
+        }, sort_keys=True)
+        self._client = None
         logger.info(f"DataIngestion initialized with vector DB URL: {self.vector_db_url}")
     
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The pooled HTTP client for the vector database, created on first use."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.request_timeout,
+                limits=httpx.Limits(max_connections=max(self.max_in_flight * 2, 10), max_keepalive_connections=self.max_in_flight * 2)
+            )
+        return self._client
+    
+    async def aclose(self):
+        """
+        Close the pooled HTTP client, stop the worker processes and close the manifest.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self.split_pool is not None:
+            await asyncio.to_thread(self.split_pool.close)
+        if self.manifest is not None:
+            self.manifest.close()
+    
     async def create_collection(self, collection_name: str) -> Dict[str, Any]:
         """
         Create a new collection in the vector database.
@@ -37,25 +121,25 @@ class DataIngestion:
             Result of the operation
         """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.vector_db_url}/collections",
-                    json={"collection_name": collection_name}
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Error creating collection: {response.text}")
-                    return {"success": False, "error": response.text}
-                
-                result = response.json()
-                logger.info(f"Created collection: {collection_name}")
-                return {"success": True, "result": result}
-                
+            response = await self.client.post(
+                f"{self.vector_db_url}/collections",
+                json={"collection_name": collection_name}
+            )
+            
+            if response.status_code != 200:
+                logger.error(f"Error creating collection: {response.text}")
+                return {"success": False, "error": response.text}
+            
+            result = response.json()
+            logger.info(f"Created collection: {collection_name}")
+            return {"success": True, "result": result}
+            
         except Exception as e:
             logger.error(f"Error creating collection: {str(e)}")
             return {"success": False, "error": str(e)}
     
-    async def process_document(self, text: str, metadata: Dict[str, Any], collection_name: str) -> Dict[str, Any]:
+    async def process_document(self, text: str, metadata: Dict[str, Any], collection_name: str,
+                               force: bool = False) -> Dict[str, Any]:
         """
         Process a document and add it to the vector database.
         
@@ -63,83 +147,639 @@ class DataIngestion:
             text: The document text
             metadata: Metadata for the document
             collection_name: Name of the collection to add the document to
+            force: Store a document tracked in the manifest in full, replacing whatever is stored under its ID
             
         Returns:
-            Result of the operation
+            Result of the operation; for a document tracked in the manifest, its
+            number of chunks and how many were skipped, updated, upserted and deleted
         """
         try:
-            # Split the text into chunks
-            chunks = self.text_splitter.split_text(text)
+            if self._is_tracked(metadata):
+                return await self._update_document(text, metadata, collection_name, force)
+            
+            documents = await self._split_document(text, metadata)
             
-            if not chunks:
+            if not documents:
                 logger.warning("No chunks were created from the document")
                 return {"success": False, "error": "No chunks were created from the document"}
             
-            # Prepare documents for the vector database
-            documents = []
-            
-            for i, chunk in enumerate(chunks):
-                # Generate a unique ID for each chunk
-                doc_id = f"{metadata.get('id', str(uuid.uuid4()))}_chunk_{i}"
-                
-                # Create metadata for each chunk
-                chunk_metadata = {
-                    **metadata,
-                    "chunk_id": i,
-                    "chunk_count": len(chunks)
-                }
-                
-                documents.append({
-                    "text": chunk,
-                    "metadata": chunk_metadata,
-                    "id": doc_id
-                })
-            
             # Add documents to the vector database
             result = await self._add_documents(documents, collection_name)
             
-            logger.info(f"Processed document with {len(chunks)} chunks")
+            logger.info(f"Processed document with {len(documents)} chunks")
             return result
             
         except Exception as e:
             logger.error(f"Error processing document: {str(e)}")
             return {"success": False, "error": str(e)}
     
-    async def process_batch(self, documents: List[Dict[str, Any]], collection_name: str) -> Dict[str, Any]:
+    def _prepare_chunks(self, text: str, metadata: Dict[str, Any], content_ids: bool = False) -> List[Dict[str, Any]]:
+        """
+        Split a document and build the vector database records of its chunks.
+        
+        Args:
+            text: The document text
+            metadata: Metadata for the document
+            content_ids: Derive the chunk IDs from the chunks' text rather than their position
+            
+        Returns:
+            Records with text, metadata and ID, one per chunk
+        """
+        return self._chunk_records(list(self.text_splitter.iter_chunks(text)), metadata, content_ids)
+    
+    async def _split_document(self, text: str, metadata: Dict[str, Any], content_ids: bool = False) -> List[Dict[str, Any]]:
+        """
+        Split a document off the event loop and build the records of its chunks.
+        
+        Args:
+            text: The document text
+            metadata: Metadata for the document
+            content_ids: Derive the chunk IDs from the chunks' text rather than their position
+            
+        Returns:
+            Records with text, metadata and ID, one per chunk
+        """
+        if self.split_pool is None or len(text) < self.pool_min_chars:
+            return await asyncio.to_thread(self._prepare_chunks, text, metadata, content_ids)
+        chunks = await self.split_pool.split(text)
+        return await asyncio.to_thread(self._chunk_records, chunks, metadata, content_ids)
+    
+    def _chunk_records(self, chunks: List[Tuple[str, int, int, int]], metadata: Dict[str, Any],
+                       content_ids: bool = False) -> List[Dict[str, Any]]:
+        """
+        Build the vector database records of a document's chunks.
+        
+        Args:
+            chunks: The tuples `iter_chunks` yields for the document
+            metadata: Metadata for the document
+            content_ids: Derive the chunk IDs from the chunks' text rather than their position
+            
+        Returns:
+            Records with text, metadata and ID, one per chunk
+        """
+        # Chunks of a document share its ID, or a generated one if it has none
+        document_id = metadata.get('id', str(uuid.uuid4()))
+        occurrences = {}
+        
+        documents = []
+        for i, (chunk, start_offset, end_offset, overlap_chars) in enumerate(chunks):
+            chunk_key = i
+            if content_ids:
+                # The same text repeated in a document gets a numbered ID for every repetition
+                chunk_key = content_hash(chunk)
+                occurrences[chunk_key] = occurrences.get(chunk_key, 0) + 1
+                if occurrences[chunk_key] > 1:
+                    chunk_key = f"{chunk_key}_{occurrences[chunk_key] - 1}"
+            documents.append({
+                "text": chunk,
+                "metadata": {
+                    **metadata,
+                    "chunk_id": i,
+                    "chunk_count": len(chunks),
+                    **self._offset_metadata(start_offset, end_offset, overlap_chars)
+                },
+                "id": f"{document_id}_chunk_{chunk_key}"
+            })
+        return documents
+    
+    @staticmethod
+    def _offset_metadata(start_offset: int, end_offset: int, overlap_chars: int) -> Dict[str, Any]:
+        """
+        Metadata placing a chunk in its document, so neighbouring chunks can be joined exactly.
+        
+        Args:
+            start_offset: Offset in the document of the text the chunk adds
+            end_offset: Offset in the document where that text ends
+            overlap_chars: Number of leading characters repeating the previous chunk
+        """
+        return {"start_offset": start_offset, "end_offset": end_offset, "overlap_chars": overlap_chars}
+    
+    def _is_tracked(self, metadata: Dict[str, Any]) -> bool:
+        """Whether a document is re-ingested incrementally, which takes a manifest and an ID."""
+        return self.manifest is not None and metadata.get('id') is not None
+    
+    def _fingerprint(self, text: str, metadata: Dict[str, Any]) -> str:
+        """Fingerprint of a document: its text, its metadata and the splitter settings."""
+        return content_hash(self.splitter_signature, json.dumps(metadata, sort_keys=True, default=str), text)
+    
+    async def _plan_update(self, text: str, metadata: Dict[str, Any], collection_name: str,
+                           force: bool = False) -> Dict[str, Any]:
+        """
+        Work out what storing a tracked document changes in the vector database.
+        
+        A document whose fingerprint is in the manifest is unchanged and isn't
+        split; in a collection with a TTL its chunks are stamped as ingested
+        now, and if some of them are no longer stored, having expired or been
+        deleted, it is replaced instead. Otherwise its chunks are compared with those in the manifest:
+        chunks with new text are added, chunks whose metadata changed (their
+        position, or the document's metadata) are updated, and chunks that
+        are gone are deleted. A document the manifest doesn't know, or whose
+        metadata lost keys, which updates can't remove, is replaced: whatever
+        is stored under its ID is deleted and all its chunks are added.
+        
+        Args:
+            text: The document text
+            metadata: Metadata for the document
+            collection_name: Name of the collection
+            force: Replace the document even if the manifest knows it
+            
+        Returns:
+            The plan: the document's ID, fingerprint, metadata keys and chunk
+            metadata hashes, the chunks kept and those of them whose metadata
+            changed, the chunks to add, the metadata updates, the chunk IDs
+            to delete, whether to replace the document, and its number of
+            chunks and of those skipped, updated and deleted
+        """
+        document_id = str(metadata['id'])
+        
+        def look_up():
+            known = None if force else self.manifest.document(collection_name, document_id)
+            return self._fingerprint(text, metadata), known
+        
+        fingerprint, known = await asyncio.to_thread(look_up)
+        plan = {
+            "document_id": document_id,
+            "fingerprint": fingerprint,
+            "metadata_keys": list(metadata),
+            "hashes": {},
+            "kept": {},
+            "changed": set(),
+            "add": [],
+            "updates": [],
+            "delete": [],
+            "replace": False,
+            "chunks": 0,
+            "skipped": 0,
+            "updated": 0,
+            "deleted": 0
+        }
+        if known is not None and known["fingerprint"] == fingerprint:
+            # The chunks may be gone even though the manifest has them, e.g. the
+            # collection was recreated, so they are probed for; without a TTL the
+            # updates carry no fields and only check that the chunks exist
+            stamp = {"ingested_at": time.time()} if await self._collection_expires(collection_name) else {}
+            missing = await self._update_metadata(
+                [{"id": chunk_id, "metadata": stamp} for chunk_id in known["chunks"]],
+                collection_name
+            )
+            if not missing:
+                plan["chunks"] = plan["skipped"] = len(known["chunks"])
+                return plan
+            logger.info(f"{len(missing)} chunks of document {document_id} are missing, storing it again")
+            known = None
+        
+        records = await self._split_document(text, metadata, content_ids=True)
+        if not records:
+            return plan
+        plan["hashes"] = {record["id"]: metadata_hash(record["metadata"]) for record in records}
+        plan["chunks"] = len(records)
+        if known is None or set(known["metadata_keys"]) - set(metadata):
+            plan["add"] = records
+            plan["replace"] = True
+            return plan
+        
+        for record in records:
+            known_hash = known["chunks"].get(record["id"])
+            if known_hash is None:
+                plan["add"].append(record)
+                continue
+            plan["skipped"] += 1
+            plan["kept"][record["id"]] = record
+            if known_hash != plan["hashes"][record["id"]]:
+                plan["changed"].add(record["id"])
+        plan["updated"] = len(plan["changed"])
+        
+        # Kept chunks are stamped as ingested now, so they don't expire while the manifest says they're stored
+        stamp = {"ingested_at": time.time()} if plan["kept"] and await self._collection_expires(collection_name) else {}
+        for chunk_id, record in plan["kept"].items():
+            if chunk_id in plan["changed"]:
+                plan["updates"].append({"id": chunk_id, "metadata": {**record["metadata"], **stamp}})
+            elif stamp:
+                plan["updates"].append({"id": chunk_id, "metadata": stamp})
+        plan["delete"] = [chunk_id for chunk_id in known["chunks"] if chunk_id not in plan["hashes"]]
+        plan["deleted"] = len(plan["delete"])
+        return plan
+    
+    async def _replace_document(self, metadata: Dict[str, Any], collection_name: str) -> int:
+        """
+        Delete everything stored under a document's ID before its chunks are added again.
+        
+        The document is dropped from the manifest first, so if storing it
+        fails it is replaced again the next time.
+        
+        Returns:
+            Number of chunks deleted
+        """
+        await asyncio.to_thread(self.manifest.forget, collection_name, str(metadata['id']))
+        response = await self.client.post(
+            f"{self.vector_db_url}/collections/{collection_name}/documents/delete",
+            json={"where": {"id": metadata['id']}}
+        )
+        response.raise_for_status()
+        return response.json().get("deleted", 0)
+    
+    async def _collection_expires(self, collection_name: str) -> bool:
+        """
+        Whether the documents of a collection expire, going by its TTL in the vector database.
+        
+        The TTL is looked up at most every COLLECTION_TTL_CACHE_SECONDS. If
+        it can't be, documents are taken to expire, which only costs
+        stamping the chunks kept.
+        """
+        cached = self._collection_ttls.get(collection_name)
+        if cached is not None and time.monotonic() - cached[1] < COLLECTION_TTL_CACHE_SECONDS:
+            return cached[0]
+        try:
+            response = await self.client.get(f"{self.vector_db_url}/collections/{collection_name}")
+            response.raise_for_status()
+            expires = bool(response.json().get("ttl_seconds"))
+        except Exception as e:
+            logger.warning(f"Could not look up the TTL of collection {collection_name}: {str(e)}")
+            return True
+        self._collection_ttls[collection_name] = (expires, time.monotonic())
+        return expires
+    
+    async def _update_metadata(self, updates: List[Dict[str, Any]], collection_name: str) -> List[str]:
+        """
+        Merge metadata into chunks, `request_max_chunks` at a time.
+        
+        Returns:
+            The IDs of the chunks that aren't in the collection
+        """
+        missing = []
+        for start in range(0, len(updates), self.request_max_chunks):
+            response = await self.client.post(
+                f"{self.vector_db_url}/collections/{collection_name}/documents/metadata",
+                json={"updates": updates[start:start + self.request_max_chunks]}
+            )
+            response.raise_for_status()
+            missing.extend(response.json().get("missing") or [])
+        return missing
+    
+    async def _finish_update(self, plan: Dict[str, Any], collection_name: str):
+        """
+        Apply the metadata updates and deletions of a plan once its chunks are added,
+        then record the document in the manifest.
+        
+        Kept chunks that turn out to be missing, having expired or been
+        deleted behind the manifest's back, are added again.
+        """
+        if not plan["hashes"]:
+            return
+        missing = await self._update_metadata(plan["updates"], collection_name)
+        if missing:
+            logger.info(f"{len(missing)} chunks of document {plan['document_id']} were missing, adding them again")
+            records = [plan["kept"][chunk_id] for chunk_id in missing]
+            for start in range(0, len(records), self.request_max_chunks):
+                result = await self._add_documents(records[start:start + self.request_max_chunks], collection_name)
+                if not result["success"]:
+                    raise RuntimeError(result["error"])
+            plan["add"].extend(records)
+            plan["skipped"] -= len(records)
+            plan["updated"] = len(plan["changed"] - set(missing))
+        for start in range(0, len(plan["delete"]), self.request_max_chunks):
+            response = await self.client.post(
+                f"{self.vector_db_url}/collections/{collection_name}/documents/delete",
+                json={"ids": plan["delete"][start:start + self.request_max_chunks]}
+            )
+            response.raise_for_status()
+        await asyncio.to_thread(
+            self.manifest.save, collection_name, plan["document_id"], plan["fingerprint"],
+            plan["metadata_keys"], plan["hashes"]
+        )
+    
+    @staticmethod
+    def _update_counts(plan: Dict[str, Any]) -> Dict[str, Any]:
+        """Number of chunks of a tracked document, and of those skipped, updated, upserted and deleted."""
+        return {
+            "chunks": plan["chunks"],
+            "skipped": plan["skipped"],
+            "updated": plan["updated"],
+            "upserted": len(plan["add"]),
+            "deleted": plan["deleted"]
+        }
+    
+    async def _update_document(self, text: str, metadata: Dict[str, Any], collection_name: str,
+                               force: bool = False) -> Dict[str, Any]:
+        """
+        Store a document tracked in the manifest, changing only what changed.
+        
+        Args:
+            text: The document text
+            metadata: Metadata for the document
+            collection_name: Name of the collection
+            force: Replace the document even if the manifest knows it
+            
+        Returns:
+            Result of the operation, with the number of chunks skipped, updated, upserted and deleted
+        """
+        plan = await self._plan_update(text, metadata, collection_name, force)
+        if plan["chunks"] == 0:
+            logger.warning("No chunks were created from the document")
+            return {"success": False, "error": "No chunks were created from the document"}
+        
+        if plan["replace"]:
+            plan["deleted"] = await self._replace_document(metadata, collection_name)
+        if plan["add"]:
+            result = await self._add_documents(plan["add"], collection_name)
+            if not result["success"]:
+                return result
+        await self._finish_update(plan, collection_name)
+        
+        counts = self._update_counts(plan)
+        logger.info(f"Processed document {plan['document_id']}: {counts['skipped']} of {counts['chunks']} chunks skipped, "
+                    f"{counts['upserted']} upserted, {counts['deleted']} deleted")
+        return {"success": True, "result": {"message": f"Processed document {plan['document_id']}", **counts}}
+    
+    async def process_batch(self, documents: List[Dict[str, Any]], collection_name: str,
+                            force: bool = False) -> Dict[str, Any]:
         """
         Process a batch of documents and add them to the vector database.
         
+        Up to `split_concurrency` documents are split at a time, in worker
+        processes or threads. As documents finish splitting, their chunks are packed into
+        `/documents` requests of at most `request_max_chunks` chunks and
+        `request_max_bytes` bytes, so one request usually carries chunks of
+        many documents. Up to `max_in_flight` requests are sent at a time;
+        splitting waits while that many are outstanding, which bounds the
+        memory held by a large batch.
+        
+        Of documents tracked in the manifest only chunks with new text are
+        packed into requests; their metadata updates and deletions follow
+        once all requests are done, and the manifest is updated after them.
+        
         Args:
             documents: List of documents with text and metadata
             collection_name: Name of the collection to add the documents to
+            force: Store documents tracked in the manifest in full
             
         Returns:
-            Result of the operation
+            Result of the operation, with a result per document in the order
+            of `documents`: whether it was stored, its number of chunks and
+            the error if it wasn't, and for tracked documents how many chunks
+            were skipped, updated, upserted and deleted; `skipped` is the
+            number of chunks of the batch that weren't embedded again
         """
+        results = [{"success": True, "chunks": 0} for _ in documents]
+        split_semaphore = asyncio.Semaphore(self.split_concurrency)
+        send_semaphore = asyncio.Semaphore(self.max_in_flight)
+        sends = []
+        splits = set()
+        plans: Dict[int, Dict[str, Any]] = {}
+        pending: List[Tuple[int, Dict[str, Any]]] = []
+        pending_bytes = 0
+        request_count = 0
+        
+        def fail(index: int, error: str):
+            results[index]["success"] = False
+            results[index].setdefault("error", error)
+        
+        async def split(index: int, document: Dict[str, Any]):
+            async with split_semaphore:
+                metadata = document.get("metadata", {})
+                try:
+                    if not self._is_tracked(metadata):
+                        return index, await self._split_document(document["text"], metadata), None, None
+                    plan = await self._plan_update(document["text"], metadata, collection_name, force)
+                    if plan["replace"]:
+                        plan["deleted"] = await self._replace_document(metadata, collection_name)
+                    return index, plan["add"], plan, None
+                except Exception as e:
+                    return index, [], None, str(e)
+        
+        async def send(request: List[Tuple[int, Dict[str, Any]]]):
+            try:
+                result = await self._add_documents([chunk for _, chunk in request], collection_name)
+                if not result["success"]:
+                    for index in {index for index, _ in request}:
+                        fail(index, result["error"])
+            finally:
+                send_semaphore.release()
+        
+        async def finish(index: int, plan: Dict[str, Any]):
+            async with send_semaphore:
+                try:
+                    await self._finish_update(plan, collection_name)
+                    results[index].update(self._update_counts(plan))
+                except Exception as e:
+                    fail(index, str(e))
+        
+        async def flush():
+            nonlocal pending, pending_bytes, request_count
+            if not pending:
+                return
+            # Wait for a free slot before taking on more work
+            await send_semaphore.acquire()
+            sends.append(asyncio.create_task(send(pending)))
+            request_count += 1
+            pending, pending_bytes = [], 0
+        
         try:
-            results = []
-            
-            # Process each document
-            for doc in documents:
-                result = await self.process_document(
-                    text=doc["text"],
-                    metadata=doc.get("metadata", {}),
-                    collection_name=collection_name
-                )
-                results.append(result)
+            remaining = iter(enumerate(documents))
+            while True:
+                for index, document in remaining:
+                    splits.add(asyncio.create_task(split(index, document)))
+                    if len(splits) >= self.split_concurrency:
+                        break
+                if not splits:
+                    break
+                
+                done, splits = await asyncio.wait(splits, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index, chunks, plan, error = task.result()
+                    if error is not None:
+                        fail(index, error)
+                        continue
+                    if plan is not None:
+                        results[index].update(self._update_counts(plan))
+                        plans[index] = plan
+                    else:
+                        results[index]["chunks"] = len(chunks)
+                    if results[index]["chunks"] == 0:
+                        fail(index, "No chunks were created from the document")
+                        continue
+                    
+                    for chunk in chunks:
+                        size = len(json.dumps(chunk))
+                        if pending and (len(pending) >= self.request_max_chunks or pending_bytes + size > self.request_max_bytes):
+                            await flush()
+                        pending.append((index, chunk))
+                        pending_bytes += size
             
-            # Check if all documents were processed successfully
-            success = all(result["success"] for result in results)
+            await flush()
+            await asyncio.gather(*sends)
+            await asyncio.gather(*(finish(index, plan) for index, plan in plans.items() if results[index]["success"]))
+        except Exception as e:
+            logger.error(f"Error processing batch: {str(e)}")
+            return {"success": False, "error": str(e), "results": results}
+        finally:
+            for task in list(splits) + sends:
+                task.cancel()
+        
+        success = all(result["success"] for result in results)
+        failed = sum(1 for result in results if not result["success"])
+        skipped = sum(result.get("skipped", 0) for result in results if result["success"])
+        logger.info(f"Processed batch of {len(documents)} documents in {request_count} requests, {failed} failed, "
+                    f"{skipped} chunks skipped")
+        return {
+            "success": success,
+            "results": results,
+            "requests": request_count,
+            "skipped": skipped
+        }
+    
+    async def process_stream(self, blocks: AsyncIterator[bytes], metadata: Dict[str, Any], collection_name: str,
+                             encoding: str = "utf-8") -> Dict[str, Any]:
+        """
+        Process a document that arrives as a stream of bytes, such as a large upload.
+        
+        The bytes are decoded incrementally, so a character split between two
+        blocks is decoded once both have arrived, and split into chunks as
+        they come in a worker thread. Chunks are packed into `/documents`
+        requests like in `process_batch`, and each request is sent as soon as
+        it is full, with up to `max_in_flight` outstanding; reading waits while
+        that many are, so memory stays bounded by the block size and the
+        requests in flight rather than the size of the document.
+        
+        The number of chunks is only known at the end, so `chunk_count` is
+        added to the chunks' metadata once they are all stored.
+        
+        Streamed documents are stored in full under positional chunk IDs. A
+        document tracked in the manifest is replaced: what earlier ingestions
+        stored under its ID is deleted before the stream is read, and it is
+        dropped from the manifest, so the next time it is ingested it
+        replaces what the stream stored.
+        
+        Args:
+            blocks: The document's bytes, in blocks
+            metadata: Metadata for the document
+            collection_name: Name of the collection to add the document to
+            encoding: Encoding of the document
             
-            logger.info(f"Processed batch of {len(documents)} documents, success: {success}")
-            return {
-                "success": success,
-                "results": results
-            }
+        Returns:
+            Result of the operation, with the number of chunks and of `/documents` requests
+        """
+        loop = asyncio.get_running_loop()
+        document_id = metadata.get('id', str(uuid.uuid4()))
+        if self._is_tracked(metadata):
+            try:
+                await self._replace_document(metadata, collection_name)
+            except Exception as e:
+                logger.error(f"Error replacing document {document_id}: {str(e)}")
+                return {"success": False, "error": str(e), "chunks": 0}
+        send_semaphore = asyncio.Semaphore(self.max_in_flight)
+        sends = []
+        errors = []
+        pending: List[Dict[str, Any]] = []
+        pending_bytes = 0
+        chunk_count = 0
+        request_count = 0
+        
+        async def next_block():
+            try:
+                return await blocks.__anext__()
+            except StopAsyncIteration:
+                return None
+        
+        def texts():
+            # Runs in a worker thread, pulling blocks from the event loop as the splitter needs them
+            decoder = codecs.getincrementaldecoder(encoding)()
+            while True:
+                block = asyncio.run_coroutine_threadsafe(next_block(), loop).result()
+                if block is None:
+                    break
+                yield decoder.decode(block)
+            yield decoder.decode(b"", final=True)
+        
+        chunks = self.text_splitter.iter_stream_chunks(texts())
+        
+        async def send(request: List[Dict[str, Any]]):
+            try:
+                result = await self._add_documents(request, collection_name)
+                if not result["success"]:
+                    errors.append(result["error"])
+            finally:
+                send_semaphore.release()
+        
+        async def flush():
+            nonlocal pending, pending_bytes, request_count
+            if not pending:
+                return
+            # Wait for a free slot before reading on
+            await send_semaphore.acquire()
+            sends.append(asyncio.create_task(send(pending)))
+            request_count += 1
+            pending, pending_bytes = [], 0
+        
+        try:
+            while not errors:
+                chunks_read = await asyncio.to_thread(lambda: list(itertools.islice(chunks, self.request_max_chunks)))
+                if not chunks_read:
+                    break
+                
+                for text, start_offset, end_offset, overlap_chars in chunks_read:
+                    chunk = {
+                        "text": text,
+                        "metadata": {
+                            **metadata,
+                            "chunk_id": chunk_count,
+                            **self._offset_metadata(start_offset, end_offset, overlap_chars)
+                        },
+                        "id": f"{document_id}_chunk_{chunk_count}"
+                    }
+                    chunk_count += 1
+                    size = len(json.dumps(chunk))
+                    if pending and (len(pending) >= self.request_max_chunks or pending_bytes + size > self.request_max_bytes):
+                        await flush()
+                    pending.append(chunk)
+                    pending_bytes += size
             
+            if not errors:
+                await flush()
+            await asyncio.gather(*sends)
         except Exception as e:
-            logger.error(f"Error processing batch: {str(e)}")
-            return {"success": False, "error": str(e)}
+            logger.error(f"Error processing document stream: {str(e)}")
+            return {"success": False, "error": str(e), "chunks": chunk_count}
+        finally:
+            for task in sends:
+                task.cancel()
+            try:
+                await asyncio.to_thread(chunks.close)
+            except ValueError:
+                # Still running in a worker thread after a cancellation; it stops with the upload
+                pass
+        
+        if errors:
+            return {"success": False, "error": errors[0], "chunks": chunk_count}
+        if chunk_count == 0:
+            logger.warning("No chunks were created from the document")
+            return {"success": False, "error": "No chunks were created from the document"}
+        
+        await self._set_chunk_count(document_id, chunk_count, collection_name)
+        logger.info(f"Processed document stream with {chunk_count} chunks in {request_count} requests")
+        return {"success": True, "chunks": chunk_count, "requests": request_count}
+    
+    async def _set_chunk_count(self, document_id: str, chunk_count: int, collection_name: str):
+        """
+        Add the number of chunks to the metadata of a streamed document's chunks.
+        
+        Only metadata changes, so nothing is embedded again. A failure is
+        logged and otherwise ignored, since the chunks themselves are stored.
+        """
+        for start in range(0, chunk_count, self.request_max_chunks):
+            updates = [
+                {"id": f"{document_id}_chunk_{i}", "metadata": {"chunk_count": chunk_count}}
+                for i in range(start, min(start + self.request_max_chunks, chunk_count))
+            ]
+            try:
+                response = await self.client.post(
+                    f"{self.vector_db_url}/collections/{collection_name}/documents/metadata",
+                    json={"updates": updates}
+                )
+                response.raise_for_status()
+            except Exception as e:
+                logger.warning(f"Could not set chunk_count of document {document_id}: {str(e)}")
+                return
     
     async def _add_documents(self, documents: List[Dict[str, Any]], collection_name: str) -> Dict[str, Any]:
         """
@@ -167,20 +807,19 @@ class DataIngestion:
             }
             
             # Add documents to the vector database
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.vector_db_url}/documents",
-                    json=formatted_docs
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Error adding documents to vector DB: {response.text}")
-                    return {"success": False, "error": response.text}
-                
-                result = response.json()
-                logger.info(f"Added {len(documents)} documents to collection: {collection_name}")
-                return {"success": True, "result": result}
-                
+            response = await self.client.post(
+                f"{self.vector_db_url}/documents",
+                json=formatted_docs
+            )
+            
+            if response.status_code != 200:
+                logger.error(f"Error adding documents to vector DB: {response.text}")
+                return {"success": False, "error": response.text}
+            
+            result = response.json()
+            logger.info(f"Added {len(documents)} documents to collection: {collection_name}")
+            return {"success": True, "result": result}
+            
         except Exception as e:
             logger.error(f"Error adding documents to vector DB: {str(e)}")
             return {"success": False, "error": str(e)}
@@ -0,0 +1,71 @@
+import asyncio
+from collections import deque
+from typing import Dict, Any, Optional
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop runs a callback that is due.
+    
+    A task sleeps for `interval` seconds over and over; how much longer than
+    that each sleep takes is time the loop spent on something else without
+    yielding, which every request on the loop waits for too.
+    """
+    
+    def __init__(self, interval: float = 0.1, window: int = 1000):
+        """
+        Initialize the monitor.
+        
+        Args:
+            interval: Seconds between measurements
+            window: Number of most recent measurements the summary is computed over
+        """
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.total_count = 0
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Start measuring on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self):
+        """Stop measuring."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval) * 1000)
+            self.total_count += 1
+    
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize the lag over the window.
+        
+        Returns:
+            Total measurement count and the mean, p50, p99 and max lag of the window, in milliseconds
+        """
+        samples = sorted(self.samples)
+        if not samples:
+            return {"count": self.total_count}
+        
+        def percentile(fraction):
+            return round(samples[min(len(samples) - 1, int(fraction * len(samples)))], 1)
+        
+        return {
+            "count": self.total_count,
+            "mean_ms": round(sum(samples) / len(samples), 1),
+            "p50_ms": percentile(0.50),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(samples[-1], 1)
+        }
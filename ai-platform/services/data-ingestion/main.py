@@ -1,5 +1,6 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 from typing import List, Dict, Any, Optional
 import os
 import sys
@@ -17,14 +18,72 @@ except ImportError:
     logger.addHandler(handler)
 
 from ingestion import DataIngestion
+from loop_lag import LoopLagMonitor
+from manifest import FingerprintManifest
 from text_splitter import TextSplitter
-
-app = FastAPI()
+from token_splitter import TokenSplitter
 
 # Initialize the data ingestion service
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
-ingestion_service = DataIngestion(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+# Chunks are measured in "characters" (CHUNK_SIZE, CHUNK_OVERLAP) or in
+# "tokens" of CHUNK_TOKENIZER, a tiktoken encoding or Hugging Face tokenizer;
+# the default budget is what all-MiniLM-L6-v2 embeds, 256 tokens less two
+# special ones
+CHUNK_UNIT = os.getenv("CHUNK_UNIT", "characters")
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "254"))
+CHUNK_TOKEN_OVERLAP = int(os.getenv("CHUNK_TOKEN_OVERLAP", "32"))
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "sentence-transformers/all-MiniLM-L6-v2")
+if CHUNK_UNIT not in ("characters", "tokens"):
+    raise ValueError(f"CHUNK_UNIT must be 'characters' or 'tokens', not {CHUNK_UNIT!r}")
+
+text_splitter = None
+if CHUNK_UNIT == "tokens":
+    text_splitter = TokenSplitter(
+        chunk_tokens=CHUNK_TOKENS,
+        chunk_overlap=CHUNK_TOKEN_OVERLAP,
+        encoding_name=CHUNK_TOKENIZER
+    )
+
+# Fingerprints of the documents stored, so documents with an "id" in their
+# metadata are re-ingested incrementally; empty stores every chunk every time
+INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "ingest_manifest.sqlite3")
+
+ingestion_service = DataIngestion(
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP,
+    text_splitter=text_splitter,
+    split_concurrency=int(os.getenv("INGEST_SPLIT_CONCURRENCY", "4")),
+    max_in_flight=int(os.getenv("INGEST_MAX_IN_FLIGHT", "4")),
+    request_max_chunks=int(os.getenv("INGEST_REQUEST_MAX_CHUNKS", "256")),
+    request_max_bytes=int(os.getenv("INGEST_REQUEST_MAX_BYTES", str(4 * 1024 * 1024))),
+    request_timeout=float(os.getenv("INGEST_REQUEST_TIMEOUT", "120")),
+    # Worker processes for splitting documents off the event loop (0 splits them in threads),
+    # the document length from which they're used, and the payload size from which
+    # documents and chunks pass to and from them through shared memory
+    cpu_workers=int(os.getenv("INGEST_CPU_WORKERS", "2")),
+    pool_min_chars=int(os.getenv("INGEST_POOL_MIN_CHARS", str(64 * 1024))),
+    shared_memory_min_bytes=int(os.getenv("INGEST_SHARED_MEMORY_MIN_BYTES", str(1024 * 1024))),
+    manifest=FingerprintManifest(INGEST_MANIFEST_PATH) if INGEST_MANIFEST_PATH else None
+)
+
+# How late the event loop runs what is due, which requests wait for as well
+loop_lag = LoopLagMonitor()
+
+# Bytes of an upload read at a time; an upload is split and stored as it is read
+UPLOAD_BLOCK_SIZE = int(os.getenv("UPLOAD_BLOCK_SIZE", str(1024 * 1024)))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_lag.start()
+    if ingestion_service.split_pool is not None:
+        await ingestion_service.split_pool.start()
+    yield
+    await loop_lag.stop()
+    await ingestion_service.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # Define data models
 class DocumentInput(BaseModel):
@@ -34,6 +93,7 @@ class DocumentInput(BaseModel):
 class BatchInput(BaseModel):
     documents: List[DocumentInput]
     collection_name: str
+    force: bool = False
 
 class CollectionInput(BaseModel):
     collection_name: str
@@ -43,6 +103,19 @@ def read_health():
     """Health check endpoint"""
     return {"status": "ok"}
 
+@app.get("/stats")
+def read_stats():
+    """
+    Event loop lag, split worker process and manifest statistics.
+    """
+    split_pool = ingestion_service.split_pool
+    manifest = ingestion_service.manifest
+    return {
+        "event_loop_lag": loop_lag.summary(),
+        "split_pool": split_pool.stats() if split_pool is not None else None,
+        "manifest": manifest.stats() if manifest is not None else None
+    }
+
 @app.post("/collections")
 async def create_collection(collection_input: CollectionInput):
     """
@@ -58,15 +131,20 @@ async def create_collection(collection_input: CollectionInput):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/ingest")
-async def ingest_document(document: DocumentInput, collection_name: str):
+async def ingest_document(document: DocumentInput, collection_name: str, force: bool = False):
     """
     Ingest a single document into the vector database.
+    
+    A document with an "id" in its metadata is re-ingested incrementally,
+    and the response counts its chunks skipped, updated, upserted and
+    deleted; `force` stores it in full.
     """
     try:
         result = await ingestion_service.process_document(
             text=document.text,
             metadata=document.metadata,
-            collection_name=collection_name
+            collection_name=collection_name,
+            force=force
         )
         
         if not result["success"]:
@@ -81,19 +159,35 @@ async def ingest_document(document: DocumentInput, collection_name: str):
 async def ingest_batch(batch: BatchInput):
     """
     Ingest a batch of documents into the vector database.
+    
+    Fails only if no document could be stored; otherwise the response lists
+    the result of every document, in order, with the error of those that failed,
+    and the number of chunks that weren't embedded again.
     """
     try:
         documents = [{"text": doc.text, "metadata": doc.metadata} for doc in batch.documents]
         
         result = await ingestion_service.process_batch(
             documents=documents,
-            collection_name=batch.collection_name
+            collection_name=batch.collection_name,
+            force=batch.force
         )
         
-        if not result["success"]:
-            raise HTTPException(status_code=500, detail=result.get("error", "Batch processing failed"))
+        results = result.get("results", [])
+        processed = sum(1 for document_result in results if document_result["success"])
+        if "error" in result or (batch.documents and processed == 0):
+            errors = [document_result.get("error") for document_result in results if not document_result["success"]]
+            raise HTTPException(status_code=500, detail=result.get("error") or (errors[0] if errors else "Batch processing failed"))
             
-        return {"message": f"Successfully processed {len(batch.documents)} documents"}
+        return {
+            "message": f"Successfully processed {processed} of {len(batch.documents)} documents",
+            "processed": processed,
+            "failed": len(batch.documents) - processed,
+            "skipped": result.get("skipped", 0),
+            "results": results
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error ingesting batch: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -106,12 +200,11 @@ async def upload_file(
 ):
     """
     Upload a text file and ingest its content into the vector database.
+    
+    The file is read in blocks of UPLOAD_BLOCK_SIZE bytes and its chunks are
+    stored as they fill requests, so large files never sit in memory whole.
     """
     try:
-        # Read file content
-        content = await file.read()
-        text = content.decode("utf-8")
-        
         # Parse metadata
         try:
             metadata_dict = json.loads(metadata)
@@ -122,9 +215,16 @@ async def upload_file(
         metadata_dict["filename"] = file.filename
         metadata_dict["content_type"] = file.content_type
         
-        # Process the document
-        result = await ingestion_service.process_document(
-            text=text,
+        async def read_blocks():
+            while True:
+                block = await file.read(UPLOAD_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+        
+        # Process the document as it is read
+        result = await ingestion_service.process_stream(
+            blocks=read_blocks(),
             metadata=metadata_dict,
             collection_name=collection_name
         )
@@ -132,7 +232,7 @@ async def upload_file(
         if not result["success"]:
             raise HTTPException(status_code=500, detail=result["error"])
             
-        return {"message": f"Successfully processed file: {file.filename}"}
+        return {"message": f"Successfully processed file: {file.filename}", "chunks": result["chunks"]}
     except Exception as e:
         logger.error(f"Error uploading file: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
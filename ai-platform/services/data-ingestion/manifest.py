@@ -0,0 +1,149 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger("ai_platform.data_ingestion")
+
+
+def content_hash(*parts: str) -> str:
+    """A short SHA-256 of some strings, enough to tell the chunks of a document apart."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+def metadata_hash(metadata: Dict[str, Any]) -> str:
+    """A short SHA-256 of a metadata dictionary, independent of key order."""
+    return content_hash(json.dumps(metadata, sort_keys=True, default=str))
+
+
+class FingerprintManifest:
+    """
+    Fingerprints of the documents stored in the vector database, so re-ingesting them is incremental.
+    
+    For every document with a stable ID, per collection, the manifest keeps
+    a fingerprint of the whole document (its text, its metadata and the
+    splitter settings), the keys of its metadata and, for every chunk, its
+    ID and a hash of its metadata. Chunk IDs are derived from the chunks'
+    text, so a chunk whose text didn't change keeps its ID and embedding
+    when the document is re-ingested.
+    
+    The manifest only knows what data-ingestion stored. Chunks that expire
+    by TTL are noticed when the chunks kept are stamped on re-ingestion;
+    documents deleted in the vector database by other means, such as a
+    dropped collection, have to be re-ingested with `force` to be stored
+    again.
+    """
+    
+    def __init__(self, path: str):
+        """
+        Open the manifest, creating it if it doesn't exist yet.
+        
+        Args:
+            path: Path of the SQLite database file
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "collection TEXT NOT NULL, document_id TEXT NOT NULL, fingerprint TEXT NOT NULL, "
+                "metadata_keys TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (collection, document_id))"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "collection TEXT NOT NULL, document_id TEXT NOT NULL, chunk_id TEXT NOT NULL, "
+                "metadata_hash TEXT NOT NULL, "
+                "PRIMARY KEY (collection, document_id, chunk_id))"
+            )
+        logger.info(f"FingerprintManifest opened at {path}")
+    
+    def document(self, collection_name: str, document_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get what the manifest knows about a document.
+        
+        Args:
+            collection_name: Name of the collection
+            document_id: ID of the document
+        
+        Returns:
+            The document's fingerprint, metadata keys and chunks (their
+            metadata hashes by chunk ID), or None if it isn't known
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT fingerprint, metadata_keys FROM documents WHERE collection = ? AND document_id = ?",
+                (collection_name, document_id)
+            ).fetchone()
+            if row is None:
+                return None
+            chunks = dict(self._connection.execute(
+                "SELECT chunk_id, metadata_hash FROM chunks WHERE collection = ? AND document_id = ?",
+                (collection_name, document_id)
+            ))
+        return {"fingerprint": row[0], "metadata_keys": json.loads(row[1]), "chunks": chunks}
+    
+    def save(self, collection_name: str, document_id: str, fingerprint: str, metadata_keys: List[str],
+             chunks: Dict[str, str]):
+        """
+        Record a document as stored, replacing what was known about it.
+        
+        Args:
+            collection_name: Name of the collection
+            document_id: ID of the document
+            fingerprint: Fingerprint of the document
+            metadata_keys: Keys of the document's metadata
+            chunks: Metadata hashes of the document's chunks, by chunk ID
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)",
+                (collection_name, document_id, fingerprint, json.dumps(sorted(metadata_keys)), time.time())
+            )
+            self._connection.execute(
+                "DELETE FROM chunks WHERE collection = ? AND document_id = ?",
+                (collection_name, document_id)
+            )
+            self._connection.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                [(collection_name, document_id, chunk_id, hash_) for chunk_id, hash_ in chunks.items()]
+            )
+    
+    def forget(self, collection_name: str, document_id: str):
+        """
+        Drop a document from the manifest, so it is stored in full the next time.
+        
+        Args:
+            collection_name: Name of the collection
+            document_id: ID of the document
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM documents WHERE collection = ? AND document_id = ?",
+                (collection_name, document_id)
+            )
+            self._connection.execute(
+                "DELETE FROM chunks WHERE collection = ? AND document_id = ?",
+                (collection_name, document_id)
+            )
+    
+    def stats(self) -> Dict[str, Any]:
+        """Number of documents and chunks in the manifest"""
+        with self._lock:
+            documents = self._connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            chunks = self._connection.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        return {"documents": documents, "chunks": chunks}
+    
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,67 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+# Add the parent directory to the path so we can import the ingestion service
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingestion import DataIngestion
+from loop_lag import LoopLagMonitor
+
+
+def test_documents_split_in_worker_processes_match_splitting_in_place():
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content)["documents"])
+        return httpx.Response(200, json={"message": "ok"})
+
+    # Every document goes to a worker, and through shared memory both ways
+    ingestion = DataIngestion(vector_db_url="http://vector-db", chunk_size=100, chunk_overlap=20,
+                              cpu_workers=1, pool_min_chars=0, shared_memory_min_bytes=1)
+    ingestion._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    documents = [
+        {"text": "\r\n\r\n".join(f"Paragraph {p} of document {i}, café and 日本語 included." for p in range(6)), "metadata": {"id": f"doc{i}"}}
+        for i in range(3)
+    ]
+
+    async def run():
+        await ingestion.split_pool.start()
+        try:
+            return await ingestion.process_batch(documents, "docs")
+        finally:
+            await ingestion.aclose()
+
+    result = asyncio.run(run())
+
+    stored = sorted((chunk for request in requests for chunk in request), key=lambda chunk: chunk["id"])
+    expected = sorted(
+        (chunk for document in documents for chunk in ingestion._prepare_chunks(document["text"], document["metadata"])),
+        key=lambda chunk: chunk["id"]
+    )
+    assert result["success"]
+    assert stored == expected
+    assert ingestion.split_pool.stats()["documents"] == 3
+    assert ingestion.split_pool.stats()["shared_memory_transfers"] == 6
+
+
+def test_loop_lag_monitor_sees_a_blocked_event_loop():
+    monitor = LoopLagMonitor(interval=0.01)
+
+    async def run():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        # Holds the event loop like splitting a large document in place would
+        time.sleep(0.2)
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+
+    asyncio.run(run())
+
+    summary = monitor.summary()
+    assert summary["count"] >= 3
+    assert summary["max_ms"] >= 150
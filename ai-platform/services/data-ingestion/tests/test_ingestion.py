@@ -0,0 +1,97 @@
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+# Add the parent directory to the path so we can import the ingestion service
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingestion import DataIngestion
+
+
+def make_ingestion(handler, **kwargs):
+    """A DataIngestion whose pooled client is answered by `handler` instead of vector-db."""
+    ingestion = DataIngestion(vector_db_url="http://vector-db", chunk_size=100, chunk_overlap=20, **kwargs)
+    ingestion._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return ingestion
+
+
+def make_documents(count):
+    return [
+        {"text": "\n\n".join(f"Paragraph {p} of document {i} has a few words in it." for p in range(4)), "metadata": {"id": f"doc{i}"}}
+        for i in range(count)
+    ]
+
+
+def test_chunks_of_many_documents_share_bounded_requests():
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content)["documents"])
+        return httpx.Response(200, json={"message": "ok"})
+
+    ingestion = make_ingestion(handler, request_max_chunks=5, max_in_flight=2)
+    documents = make_documents(10)
+    result = asyncio.run(ingestion.process_batch(documents, "docs"))
+
+    stored = [chunk for request in requests for chunk in request]
+    expected = [chunk for document in documents for chunk in ingestion._prepare_chunks(document["text"], document["metadata"])]
+    assert result["success"]
+    assert all(len(request) <= 5 for request in requests)
+    assert len(requests) == result["requests"] < len(documents)
+    assert sorted(chunk["id"] for chunk in stored) == sorted(chunk["id"] for chunk in expected)
+    assert [document_result["chunks"] for document_result in result["results"]] == [2] * 10
+
+
+def test_failed_request_fails_only_the_documents_it_carried():
+    def handler(request):
+        chunks = json.loads(request.content)["documents"]
+        if any(chunk["metadata"]["id"] == "doc3" for chunk in chunks):
+            return httpx.Response(500, text="embedding failed")
+        return httpx.Response(200, json={"message": "ok"})
+
+    ingestion = make_ingestion(handler, request_max_chunks=2, split_concurrency=1)
+    documents = make_documents(5) + [{"text": "   ", "metadata": {"id": "empty"}}]
+    result = asyncio.run(ingestion.process_batch(documents, "docs"))
+
+    assert not result["success"]
+    assert [document_result["success"] for document_result in result["results"]] == [True, True, True, False, True, False]
+    assert result["results"][3]["error"] == "embedding failed"
+    assert result["results"][5]["error"] == "No chunks were created from the document"
+
+
+def test_streamed_document_is_decoded_across_blocks_and_flushed_as_it_fills():
+    requests = []
+    updates = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        if request.url.path.endswith("/metadata"):
+            updates.extend(body["updates"])
+        else:
+            requests.append(body["documents"])
+        return httpx.Response(200, json={"message": "ok"})
+
+    ingestion = make_ingestion(handler, request_max_chunks=3)
+    text = "\r\n\r\n".join(f"Paragraphe {p} : déjà vu, naïve café ünïcödé." for p in range(20))
+    data = text.encode("utf-8")
+
+    async def blocks():
+        # Seven-byte blocks split most of the two-byte characters
+        for start in range(0, len(data), 7):
+            yield data[start:start + 7]
+
+    result = asyncio.run(ingestion.process_stream(blocks(), {"id": "big"}, "docs"))
+
+    expected = ingestion._prepare_chunks(text, {"id": "big"})
+    stored = [chunk for request in requests for chunk in request]
+    assert result["success"]
+    assert result["chunks"] == len(expected) == len(stored)
+    assert all(len(request) <= 3 for request in requests)
+    assert [chunk["text"] for chunk in stored] == [chunk["text"] for chunk in expected]
+    assert [chunk["id"] for chunk in stored] == [chunk["id"] for chunk in expected]
+    # chunk_count is added once the number of chunks is known
+    assert sorted(update["id"] for update in updates) == sorted(chunk["id"] for chunk in expected)
+    assert {update["metadata"]["chunk_count"] for update in updates} == {len(expected)}
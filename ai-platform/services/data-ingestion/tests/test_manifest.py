@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+# Add the parent directory to the path so we can import the ingestion service
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingestion import DataIngestion
+from manifest import FingerprintManifest
+
+
+class FakeVectorDB:
+    """Keeps chunks in a dict and answers the vector-db endpoints data-ingestion calls."""
+
+    def __init__(self, ttl_seconds=None):
+        self.chunks = {}
+        self.embedded = 0
+        self.requests = []
+        self.ttl_seconds = ttl_seconds
+
+    def handler(self, request):
+        self.requests.append(request.url.path)
+        if request.method == "GET":
+            return httpx.Response(200, json={"name": "docs", "ttl_seconds": self.ttl_seconds})
+        body = json.loads(request.content)
+        if request.url.path == "/documents":
+            for chunk in body["documents"]:
+                # Like vector-db, adding an existing ID replaces it
+                self.chunks[chunk["id"]] = {"text": chunk["text"], "metadata": chunk["metadata"]}
+                self.embedded += 1
+            return httpx.Response(200, json={"message": "ok"})
+        if request.url.path.endswith("/documents/metadata"):
+            missing = [update["id"] for update in body["updates"] if update["id"] not in self.chunks]
+            for update in body["updates"]:
+                if update["id"] in self.chunks:
+                    self.chunks[update["id"]]["metadata"].update(update["metadata"])
+            return httpx.Response(200, json={"updated": len(body["updates"]) - len(missing), "missing": missing})
+        deleted = [
+            chunk_id for chunk_id, chunk in self.chunks.items()
+            if (body.get("ids") is None or chunk_id in body["ids"])
+            and all(chunk["metadata"].get(key) == value for key, value in (body.get("where") or {}).items())
+        ]
+        for chunk_id in deleted:
+            del self.chunks[chunk_id]
+        return httpx.Response(200, json={"deleted": len(deleted)})
+
+
+def make_ingestion(vector_db, manifest_path):
+    ingestion = DataIngestion(vector_db_url="http://vector-db", chunk_size=100, chunk_overlap=20,
+                              manifest=FingerprintManifest(str(manifest_path)))
+    ingestion._client = httpx.AsyncClient(transport=httpx.MockTransport(vector_db.handler))
+    return ingestion
+
+
+def paragraphs(numbers, edited=()):
+    """Paragraphs a chunk long, so every paragraph starts a chunk overlapping the end of the previous one."""
+    return "\n\n".join(
+        f"Paragraph {p} is {'rewritten entirely, with other words' if p in edited else 'about the same thing as it always was'}, on and on."
+        for p in numbers
+    )
+
+
+def test_re_ingesting_a_document_only_embeds_and_deletes_what_changed(tmp_path):
+    vector_db = FakeVectorDB()
+    # Left behind by an ingestion before the manifest, under positional IDs
+    vector_db.chunks["doc_chunk_0"] = {"text": "old", "metadata": {"id": "doc"}}
+    ingestion = make_ingestion(vector_db, tmp_path / "manifest.sqlite3")
+    metadata = {"id": "doc", "source": "wiki"}
+
+    first = asyncio.run(ingestion.process_document(paragraphs(range(10)), metadata, "docs"))
+    chunks = first["result"]["chunks"]
+    assert first["result"]["upserted"] == chunks == vector_db.embedded
+    assert first["result"]["deleted"] == 1
+    assert "doc_chunk_0" not in vector_db.chunks
+
+    vector_db.requests.clear()
+    again = asyncio.run(ingestion.process_document(paragraphs(range(10)), metadata, "docs"))
+    assert again["result"]["skipped"] == chunks
+    # Only the collection's TTL was looked up and the chunks checked for
+    assert vector_db.requests == ["/collections/docs", "/collections/docs/documents/metadata"]
+    assert vector_db.embedded == chunks
+
+    # A paragraph inserted at the start, one rewritten and the last removed
+    text = paragraphs([-1] + list(range(9)), edited={5})
+    result = asyncio.run(ingestion.process_document(text, metadata, "docs"))["result"]
+
+    expected = {
+        chunk["id"]: {"text": chunk["text"], "metadata": chunk["metadata"]}
+        for chunk in ingestion._prepare_chunks(text, metadata, content_ids=True)
+    }
+    assert vector_db.chunks == expected
+    # New are the inserted paragraph, the one rewritten, and the two overlapping them
+    assert result == {"message": "Processed document doc", "chunks": 10, "skipped": 6, "updated": 6,
+                      "upserted": 4, "deleted": 4}
+    assert vector_db.embedded == chunks + 4
+
+
+def test_batch_re_sync_skips_unchanged_documents_and_force_stores_them_again(tmp_path):
+    vector_db = FakeVectorDB()
+    ingestion = make_ingestion(vector_db, tmp_path / "manifest.sqlite3")
+    documents = [{"text": paragraphs(range(4)), "metadata": {"id": f"doc{i}", "tag": "a"}} for i in range(5)]
+
+    first = asyncio.run(ingestion.process_batch(documents, "docs"))
+    chunks = sum(document_result["chunks"] for document_result in first["results"])
+    assert first["success"] and first["skipped"] == 0
+
+    documents[2] = {"text": paragraphs(range(4), edited={0}), "metadata": {"id": "doc2", "tag": "a"}}
+    # A metadata key going away can't be merged away, so the document is stored again
+    documents[4] = {"text": paragraphs(range(4)), "metadata": {"id": "doc4"}}
+    embedded = vector_db.embedded
+    result = asyncio.run(ingestion.process_batch(documents, "docs"))
+
+    assert result["success"]
+    assert [document_result["upserted"] for document_result in result["results"]] == [0, 0, 2, 0, 4]
+    assert result["skipped"] == chunks - 6
+    assert result["requests"] == 1
+    assert vector_db.embedded == embedded + 6
+    assert all("tag" not in chunk["metadata"] for chunk_id, chunk in vector_db.chunks.items() if chunk_id.startswith("doc4_"))
+    assert len(vector_db.chunks) == chunks
+
+    forced = asyncio.run(ingestion.process_batch(documents[:1], "docs", force=True))
+    assert forced["results"][0]["upserted"] == forced["results"][0]["deleted"] == 4
+    assert ingestion.manifest.stats() == {"documents": 5, "chunks": chunks}
+
+
+def test_uploading_a_tracked_document_replaces_what_was_ingested(tmp_path):
+    vector_db = FakeVectorDB()
+    ingestion = make_ingestion(vector_db, tmp_path / "manifest.sqlite3")
+    metadata = {"id": "doc"}
+    asyncio.run(ingestion.process_document(paragraphs(range(10)), metadata, "docs"))
+    text = paragraphs(range(10), edited={5})
+
+    async def blocks():
+        data = text.encode("utf-8")
+        for start in range(0, len(data), 64):
+            yield data[start:start + 64]
+
+    result = asyncio.run(ingestion.process_stream(blocks(), metadata, "docs"))
+
+    assert result["chunks"] == 10
+    assert sorted(vector_db.chunks) == sorted(f"doc_chunk_{i}" for i in range(10))
+    assert [chunk["text"] for chunk in vector_db.chunks.values()] == [chunk["text"] for chunk in ingestion._prepare_chunks(text, metadata)]
+    assert ingestion.manifest.document("docs", "doc") is None
+
+    # The next ingestion replaces what the upload stored
+    asyncio.run(ingestion.process_document(text, metadata, "docs"))
+    assert sorted(vector_db.chunks) == sorted(chunk["id"] for chunk in ingestion._prepare_chunks(text, metadata, content_ids=True))
+
+
+def test_unchanged_documents_whose_chunks_were_lost_are_stored_again(tmp_path):
+    vector_db = FakeVectorDB()
+    ingestion = make_ingestion(vector_db, tmp_path / "manifest.sqlite3")
+    documents = [{"text": paragraphs(range(4)), "metadata": {"id": f"doc{i}"}} for i in range(2)]
+    first = asyncio.run(ingestion.process_batch(documents, "docs"))
+    stored = dict(vector_db.chunks)
+
+    # The collection was dropped and recreated behind the manifest's back
+    vector_db.chunks.clear()
+    result = asyncio.run(ingestion.process_batch(documents, "docs"))
+
+    assert result["success"]
+    assert result["skipped"] == 0
+    assert [document_result["upserted"] for document_result in result["results"]] == [
+        document_result["chunks"] for document_result in first["results"]
+    ]
+    assert vector_db.chunks == stored
+
+
+def test_kept_chunks_are_stamped_in_a_collection_with_a_ttl_and_expired_ones_stored_again(tmp_path):
+    vector_db = FakeVectorDB(ttl_seconds=3600)
+    ingestion = make_ingestion(vector_db, tmp_path / "manifest.sqlite3")
+    metadata = {"id": "doc"}
+    asyncio.run(ingestion.process_document(paragraphs(range(10)), metadata, "docs"))
+
+    again = asyncio.run(ingestion.process_document(paragraphs(range(10)), metadata, "docs"))["result"]
+    assert again["skipped"] == 10 and again["upserted"] == 0
+    assert all("ingested_at" in chunk["metadata"] for chunk in vector_db.chunks.values())
+
+    # Expired while the manifest still lists them
+    for chunk_id in list(vector_db.chunks)[:3]:
+        del vector_db.chunks[chunk_id]
+    restored = asyncio.run(ingestion.process_document(paragraphs(range(10)), metadata, "docs"))["result"]
+    assert restored["upserted"] == 10 and restored["deleted"] == 7
+    assert len(vector_db.chunks) == 10
+
+    for chunk_id in list(vector_db.chunks)[:2]:
+        del vector_db.chunks[chunk_id]
+    text = paragraphs(range(10), edited={9})
+    changed = asyncio.run(ingestion.process_document(text, metadata, "docs"))["result"]
+    assert changed["upserted"] == 1 + 2 and changed["skipped"] == 7
+    assert sorted(vector_db.chunks) == sorted(chunk["id"] for chunk in ingestion._prepare_chunks(text, metadata, content_ids=True))
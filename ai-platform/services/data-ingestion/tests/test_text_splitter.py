@@ -0,0 +1,76 @@
+import json
+import os
+import random
+import re
+import sys
+
+# Add the parent directory to the path so we can import the text splitter
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_splitter import TextSplitter
+
+# Chunks the splitter produced before it worked on offsets, for a mixed corpus
+GOLDEN_CHUNKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden_chunks.json")
+
+PIECES = ["word", "Hello", "é", "日本", ".", "!", "?", " ", "  ", "\n", "\n\n", "\r\n", "\r", "\r\n\r\n", "\t", ". ", "x" * 40, "y" * 130]
+
+
+def random_blocks(text, rng):
+    """Cut text at random places, including inside CRLFs and blank lines."""
+    start = 0
+    while start < len(text):
+        end = start + rng.choice([1, 2, 3, 7, 50, 500])
+        yield text[start:end]
+        start = end
+
+
+def test_chunks_match_the_golden_corpus():
+    with open(GOLDEN_CHUNKS, encoding="utf-8") as f:
+        golden = json.load(f)
+
+    for case in golden["cases"]:
+        splitter = TextSplitter(chunk_size=case["chunk_size"], chunk_overlap=case["chunk_overlap"])
+        for document, chunks in zip(golden["documents"], case["chunks"]):
+            assert splitter.split_text(document) == chunks
+            assert list(splitter.split_stream(random_blocks(document, random.Random(0)))) == chunks
+
+
+def test_offsets_locate_the_text_each_chunk_adds():
+    rng = random.Random(1)
+    words = ["alpha", "beta", "gamma", "delta"]
+    paragraphs = [
+        " ".join(" ".join(rng.choice(words) for _ in range(rng.randint(2, 8))) + "." for _ in range(rng.randint(1, 12)))
+        for _ in range(40)
+    ]
+    text = "\r\n\r\n".join(paragraphs)
+    normalized = text.replace("\r\n", "\n")
+    splitter = TextSplitter(chunk_size=120, chunk_overlap=30)
+
+    chunks = list(splitter.iter_chunks(text))
+
+    assert [chunk for chunk, _, _, _ in chunks] == splitter.split_text(text)
+    assert [offsets for _, *offsets in chunks] == [offsets for _, *offsets in splitter.iter_stream_chunks(iter([text]))]
+    for i, (chunk, start, end, overlap_chars) in enumerate(chunks):
+        # Separators are dropped where the overlap meets the chunk, so compare without whitespace
+        assert re.sub(r"\s", "", chunk[overlap_chars:]) == re.sub(r"\s", "", normalized[start:end])
+        if i:
+            assert chunks[i - 1][0].endswith(chunk[:overlap_chars])
+            assert start >= chunks[i - 1][2]
+
+
+def test_split_stream_matches_split_text_for_any_blocks():
+    rng = random.Random(0)
+    for _ in range(2000):
+        text = "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 120)))
+        chunk_size = rng.choice([10, 30, 60, 100, 1000])
+        splitter = TextSplitter(chunk_size=chunk_size, chunk_overlap=rng.choice([0, 5]) if chunk_size > 10 else 0)
+
+        assert list(splitter.split_stream(random_blocks(text, rng))) == splitter.split_text(text)
+
+
+def test_split_stream_cuts_long_sentences_before_they_end():
+    splitter = TextSplitter(chunk_size=10, chunk_overlap=0)
+    chunks = splitter.split_stream(iter(["a" * 25, "b" * 1000]))
+
+    # The first slices of the never-ending sentence come out without reading all of it
+    assert [next(chunks), next(chunks)] == ["a" * 10, "a" * 10]
@@ -0,0 +1,60 @@
+import os
+import random
+import re
+import sys
+
+# Add the parent directory to the path so we can import the token splitter
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from token_splitter import TokenSplitter
+
+
+class WordEncoding:
+    """Counts words and punctuation as tokens, so no encoding has to be downloaded."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode_ordinary_batch(self, texts):
+        self.calls += 1
+        return [re.findall(r"\w+|[^\w\s]", text) for text in texts]
+
+
+def test_chunks_fit_the_budget_and_overlap_by_whole_sentences():
+    text = "One two three. Four five six seven.\r\n\r\nEight nine. Ten eleven twelve thirteen fourteen."
+    encoding = WordEncoding()
+    splitter = TokenSplitter(chunk_tokens=10, chunk_overlap=5, encoding=encoding)
+
+    chunks = list(splitter.iter_chunks(text))
+
+    assert [chunk for chunk, _, _, _ in chunks] == [
+        "One two three. Four five six seven.",
+        "Four five six seven.\n\nEight nine.",
+        "Eight nine. Ten eleven twelve thirteen fourteen.",
+    ]
+    normalized = text.replace("\r\n", "\n")
+    # Chunks are slices of the document, and the offsets point at what they add
+    assert [normalized[start:end] for _, start, end, _ in chunks] == [
+        "One two three. Four five six seven.", "Eight nine.", "Ten eleven twelve thirteen fourteen."
+    ]
+    assert [overlap for _, _, _, overlap in chunks] == [0, len("Four five six seven."), len("Eight nine.")]
+    # All sentences were counted in one batch
+    assert encoding.calls == 1
+
+
+def test_long_sentences_are_cut_between_words_and_streams_match():
+    rng = random.Random(0)
+    words = ["alpha", "beta", "gamma", "delta", "epsilon"]
+    text = "\n\n".join(
+        " ".join(" ".join(rng.choice(words) for _ in range(rng.randint(1, 40))) + "." for _ in range(rng.randint(1, 6)))
+        for _ in range(50)
+    ) + " " + "x" * 100
+    splitter = TokenSplitter(chunk_tokens=12, chunk_overlap=3, encoding=WordEncoding())
+
+    chunks = list(splitter.iter_chunks(text))
+
+    assert all(splitter.count_tokens([chunk])[0] <= 12 for chunk, _, _, _ in chunks)
+    covered = "".join(text[start:end] for _, start, end, _ in chunks)
+    assert re.sub(r"\s", "", covered) == re.sub(r"\s", "", text)
+    blocks = (text[i:i + 7] for i in range(0, len(text), 7))
+    assert list(splitter.iter_stream_chunks(blocks)) == chunks
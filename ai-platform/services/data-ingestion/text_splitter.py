@@ -1,12 +1,78 @@
 import re
 import logging
-from typing import List, Dict, Any, Optional
+from itertools import islice
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
 
 logger = logging.getLogger("ai_platform.data_ingestion")
 
+# Where a paragraph is cut into sentences: the whitespace (group 1) after
+# sentence punctuation. Matching the punctuation instead of looking behind
+# for it lets the regex engine skip ahead to candidates, several times faster.
+SENTENCE_BREAK = re.compile(r'[.!?](\s+)')
+NON_SPACE = re.compile(r'\S')
+
+# A chunk is built from parts: (separator, start, end, text), where the
+# separator goes before the document text from `start` to `end`, except in
+# the first part of a chunk. `text` is that text for streamed documents and
+# None when the document is at hand, so nothing is copied out of it until a
+# chunk is assembled.
+Part = Tuple[str, int, int, Optional[str]]
+
+def paragraph_fragments(blocks: Iterable[str]) -> Iterator[Optional[Tuple[int, str]]]:
+    """
+    Normalize line breaks across blocks and find the paragraph boundaries.
+    
+    A trailing carriage return or newline of a block is held back until
+    the next block shows whether it is part of a CRLF or a blank line.
+    
+    Yields:
+        (offset, text) pieces of paragraph text, and None at the end of
+        each paragraph
+    """
+    carry = ""
+    pending_cr = False
+    position = 0
+    for block in blocks:
+        if not block:
+            continue
+        if pending_cr:
+            block = "\r" + block
+        pending_cr = block.endswith("\r")
+        if pending_cr:
+            block = block[:-1]
+        
+        parts = (carry + block.replace("\r\n", "\n").replace("\r", "\n")).split("\n\n")
+        for part in parts[:-1]:
+            if part:
+                yield position, part
+            yield None
+            position += len(part) + 2
+        
+        carry = "\n" if parts[-1].endswith("\n") else ""
+        last = parts[-1][:-1] if carry else parts[-1]
+        if last:
+            yield position, last
+            position += len(last)
+    
+    parts = (carry + ("\n" if pending_cr else "")).split("\n\n")
+    for part in parts[:-1]:
+        if part:
+            yield position, part
+        yield None
+        position += len(part) + 2
+    if parts[-1]:
+        yield position, parts[-1]
+    yield None
+
 class TextSplitter:
     """
     A class to split text into chunks of appropriate size for embedding.
+    
+    Chunks are worked out as spans of the document: paragraphs and
+    sentences are found by scanning it in place, packed by their offsets,
+    and a chunk's text is only assembled once it is complete. Every chunk
+    comes with the offsets of the text it adds, so neighbouring chunks can
+    be put back together without guessing at their overlap.
     """
     
     def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
@@ -31,146 +97,473 @@ class TextSplitter:
         Returns:
             List of text chunks
         """
-        if not text or len(text.strip()) == 0:
+        if not text or NON_SPACE.search(text) is None:
             return []
         
-        # Normalize line breaks
-        text = re.sub(r'\r\n', '\n', text)
-        text = re.sub(r'\r', '\n', text)
+        return [chunk for chunk, _, _, _ in self.iter_chunks(text)]
+    
+    def iter_chunks(self, text: str) -> Iterator[Tuple[str, int, int, int]]:
+        """
+        Split text into chunks lazily, with their place in the text.
+        
+        Offsets count characters of the text with its line breaks normalized
+        to "\n", which is the text itself unless it has carriage returns.
+        
+        Args:
+            text: The text to split
+            
+        Yields:
+            (chunk, start_offset, end_offset, overlap_chars): the first
+            `overlap_chars` characters of the chunk repeat the end of the
+            previous chunk, and the rest is the text from `start_offset` to
+            `end_offset`, with the whitespace between paragraphs and between
+            the sentences of a long paragraph normalized. A sentence too long
+            for a chunk is cut up ahead of the shorter sentences before it,
+            so chunks of such a paragraph span the text they were taken from
+            but can have it out of order.
+        """
+        if "\r" in text:
+            # Normalize line breaks
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        
+        count = 0
+        for chunk in self._chunks(self._paragraph_items(text), text):
+            count += 1
+            yield chunk
+        logger.info(f"Split text into {count} chunks")
+    
+    def split_stream(self, blocks: Iterable[str]) -> Iterator[str]:
+        """
+        Split text that arrives in blocks, yielding chunks as soon as they are complete.
+        
+        Gives exactly the chunks `split_text` gives for the concatenated
+        blocks, but only holds on to the paragraph or sentence in progress, so
+        memory stays bounded by the chunk size and the block size however long
+        the text is. Line breaks and paragraph boundaries that straddle two
+        blocks are handled; a paragraph too long for one chunk is cut into
+        sentences while it streams in.
+        
+        Args:
+            blocks: The text, in blocks of any size
+            
+        Yields:
+            Text chunks
+        """
+        for chunk, _, _, _ in self.iter_stream_chunks(blocks):
+            yield chunk
+    
+    def iter_stream_chunks(self, blocks: Iterable[str]) -> Iterator[Tuple[str, int, int, int]]:
+        """
+        Like `split_stream`, with the place of each chunk in the text as in `iter_chunks`.
+        
+        Args:
+            blocks: The text, in blocks of any size
+            
+        Yields:
+            (chunk, start_offset, end_offset, overlap_chars)
+        """
+        count = 0
+        for chunk in self._chunks(self._stream_paragraph_items(blocks), None):
+            count += 1
+            yield chunk
+        logger.info(f"Split text stream into {count} chunks")
+    
+    def _chunks(self, items: Iterable[Tuple[str, List[Part], int]], source: Optional[str]) -> Iterator[Tuple[str, int, int, int]]:
+        """
+        Pack paragraphs into chunks, apply the overlap and assemble the chunk texts.
+        
+        The overlap is the end of the previous chunk before its own overlap
+        was added, and a chunk is cut to make room for it; the overlap can
+        therefore repeat text the previous chunk lost to that cut, which
+        isn't counted in `overlap_chars`.
+        
+        Args:
+            items: Paragraph items, from `_paragraph_items` or `_stream_paragraph_items`
+            source: The document, for parts without text
+            
+        Yields:
+            (chunk, start_offset, end_offset, overlap_chars)
+        """
+        previous = None
+        for parts, ordered in self._pack_paragraphs(items):
+            content = self._text(parts, source)
+            if previous is None or self.chunk_overlap <= 0:
+                # First chunk remains as is
+                start_offset, end_offset = self._head_extent(parts, len(content), len(content), ordered)
+                yield content, start_offset, end_offset, 0
+                previous = parts, content, len(content)
+                continue
+            
+            previous_parts, previous_content, previous_kept = previous
+            
+            # Calculate how much text to take from the end of the previous chunk
+            overlap_size = min(self.chunk_overlap, len(previous_content))
+            overlap_start = len(previous_content) - overlap_size
+            
+            # Ensure we don't exceed chunk_size
+            available_size = self.chunk_size - overlap_size
+            current_chunk = content[:available_size] if available_size < len(content) else content
+            
+            # The part of the overlap the previous chunk kept; the rest of the chunk is new text
+            repeated = max(0, previous_kept - overlap_start)
+            tail = self._tail_extent(previous_parts, overlap_size - repeated)
+            head = self._head_extent(parts, len(current_chunk), len(content), ordered)
+            if tail is None:
+                start_offset, end_offset = head or self._head_extent(parts, len(content), len(content), ordered)
+            elif head is None:
+                start_offset, end_offset = tail
+            else:
+                start_offset, end_offset = min(tail[0], head[0]), max(tail[1], head[1])
+            
+            yield previous_content[overlap_start:] + current_chunk, start_offset, end_offset, repeated
+            previous = parts, content, len(current_chunk)
+    
+    @staticmethod
+    def _text(parts: List[Part], source: Optional[str]) -> str:
+        """
+        Assemble the text of a chunk.
+        """
+        _, start, end, text = parts[0]
+        pieces = [source[start:end] if text is None else text]
+        pieces += [separator + (source[start:end] if text is None else text) for separator, start, end, text in islice(parts, 1, None)]
+        return ''.join(pieces)
+    
+    @staticmethod
+    def _head_extent(parts: List[Part], count: int, length: int, ordered: bool) -> Optional[Tuple[int, int]]:
+        """
+        Document offsets of the text behind the first `count` characters of a chunk.
+        
+        Args:
+            parts: Parts of the chunk
+            count: Number of characters
+            length: Length of the text of the chunk
+            ordered: Whether the parts are in document order, in which case
+                only the parts cut off at the end are looked at
+        
+        Returns:
+            The first and last offset of that text, or None if the characters
+            are all separators
+        """
+        if ordered:
+            if count <= 0:
+                return None
+            drop = length - count
+            position = 0
+            for separator, start, end, _ in reversed(parts):
+                if position + end - start > drop:
+                    return parts[0][1], end - max(0, drop - position)
+                position += end - start + len(separator)
+            return None
+        
+        low = high = None
+        position = -len(parts[0][0])
+        for separator, start, end, _ in parts:
+            position += len(separator)
+            if position >= count:
+                break
+            if end - start > count - position:
+                end = start + count - position
+            if low is None:
+                low, high = start, end
+            else:
+                if start < low:
+                    low = start
+                if end > high:
+                    high = end
+            position += end - start
+        return (low, high) if low is not None else None
+    
+    @staticmethod
+    def _tail_extent(parts: List[Part], count: int) -> Optional[Tuple[int, int]]:
+        """
+        Document offsets of the text behind the last `count` characters of a chunk.
+        
+        Returns:
+            The first and last offset of that text, or None if the characters
+            are all separators
+        """
+        low = high = None
+        position = 0
+        for separator, start, end, _ in reversed(parts):
+            if position >= count:
+                break
+            if end - start > count - position:
+                start = end - (count - position)
+            if low is None:
+                low, high = start, end
+            else:
+                if start < low:
+                    low = start
+                if end > high:
+                    high = end
+            position += end - start + len(separator)
+        return (low, high) if low is not None else None
+    
+    @staticmethod
+    def _strip(text: str, start: int, end: int) -> Tuple[int, int]:
+        """
+        Bounds of the text from `start` to `end` without its leading and trailing whitespace.
+        """
+        match = NON_SPACE.search(text, start, end)
+        if match is None:
+            return start, start
+        return match.start(), TextSplitter._rstrip(text, match.start(), end)
+    
+    @staticmethod
+    def _rstrip(text: str, start: int, end: int) -> int:
+        """
+        End of the text from `start` to `end` without its trailing whitespace.
+        """
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        return end
+    
+    def _paragraph_items(self, text: str) -> Iterator[Tuple[str, List[Part], int]]:
+        """
+        Find the paragraphs of a text, which are separated by blank lines.
+        
+        Yields:
+            Items from `_paragraph`
+        """
+        # The same as `_paragraph` for each paragraph, inlined as most paragraphs are short
+        chunk_size = self.chunk_size
+        start = 0
+        while True:
+            stop = text.find('\n\n', start)
+            end = len(text) if stop == -1 else stop
+            if start < end and (text[start].isspace() or text[end - 1].isspace()):
+                start, end = self._strip(text, start, end)
+            
+            if end - start > chunk_size:
+                for parts, length in self._pack_sentences(self._sentence_items(text, start, end)):
+                    yield "piece", parts, length
+            elif start < end:
+                yield "paragraph", [('\n\n', start, end, None)], end - start
+            
+            if stop == -1:
+                return
+            start = stop + 2
+    
+    def _paragraph(self, text: str, start: int, end: int) -> Iterator[Tuple[str, List[Part], int]]:
+        """
+        Turn a paragraph into packing items.
+        
+        Yields:
+            ("paragraph", parts, length) for a paragraph that fits in a
+            chunk, or ("piece", parts, length) for each sentence chunk of one
+            that doesn't
+        """
+        start, end = self._strip(text, start, end)
+        if start == end:
+            return
+        
+        # If a single paragraph is too long, split it by sentences
+        if end - start > self.chunk_size:
+            for parts, length in self._pack_sentences(self._sentence_items(text, start, end)):
+                yield "piece", parts, length
+        else:
+            yield "paragraph", [('\n\n', start, end, None)], end - start
+    
+    def _pack_paragraphs(self, items: Iterable[Tuple[str, List[Part], int]]) -> Iterator[Tuple[List[Part], bool]]:
+        """
+        Pack paragraphs, and sentence chunks of long paragraphs, into chunks.
         
-        # First try to split by paragraphs
-        paragraphs = text.split('\n\n')
-        chunks = []
+        Args:
+            items: Paragraph items
+            
+        Yields:
+            Parts of chunks before overlap, and whether they are in document
+            order, which they aren't when slices of a long sentence went out
+            ahead of the sentences before it
+        """
         current_chunk = []
         current_length = 0
+        ordered = True
         
         # Process each paragraph
-        for paragraph in paragraphs:
-            paragraph = paragraph.strip()
-            if not paragraph:
-                continue
-                
-            paragraph_length = len(paragraph)
-            
-            # If a single paragraph is too long, split it by sentences
-            if paragraph_length > self.chunk_size:
-                paragraph_chunks = self._split_paragraph(paragraph)
-                for chunk in paragraph_chunks:
-                    if current_length + len(chunk) + (1 if current_chunk else 0) <= self.chunk_size:
-                        if current_chunk:
-                            current_chunk.append('\n\n')
-                        current_chunk.append(chunk)
-                        current_length += len(chunk) + (2 if current_chunk else 0)
-                    else:
-                        if current_chunk:
-                            chunks.append(''.join(current_chunk))
-                        current_chunk = [chunk]
-                        current_length = len(chunk)
+        for kind, parts, length in items:
+            # Add paragraph to current chunk if it fits
+            if current_length + length + ((1 if kind == "piece" else 2) if current_chunk else 0) <= self.chunk_size:
+                if kind == "piece" and current_chunk:
+                    ordered = ordered and parts[0][1] >= current_chunk[-1][2]
+                current_chunk.extend(parts)
+                current_length += length + 2
             else:
-                # Add paragraph to current chunk if it fits
-                if current_length + paragraph_length + (2 if current_chunk else 0) <= self.chunk_size:
-                    if current_chunk:
-                        current_chunk.append('\n\n')
-                    current_chunk.append(paragraph)
-                    current_length += paragraph_length + (2 if current_chunk else 0)
-                else:
-                    # Finish current chunk and start a new one
-                    if current_chunk:
-                        chunks.append(''.join(current_chunk))
-                    current_chunk = [paragraph]
-                    current_length = paragraph_length
+                # Finish current chunk and start a new one
+                if current_chunk:
+                    yield current_chunk, ordered
+                current_chunk = parts
+                current_length = length
+                ordered = True
         
         # Add the last chunk if it's not empty
         if current_chunk:
-            chunks.append(''.join(current_chunk))
-        
-        # Apply overlap if needed
-        if self.chunk_overlap > 0 and len(chunks) > 1:
-            chunks = self._apply_overlap(chunks)
+            yield current_chunk, ordered
+    
+    def _sentence_items(self, text: str, start: int, end: int) -> Iterator[Tuple[str, int, int, Optional[str]]]:
+        """
+        Split a paragraph into sentences by common punctuation.
         
-        logger.info(f"Split text into {len(chunks)} chunks")
-        return chunks
+        Yields:
+            Items from `_sentence_slices`
+        """
+        chunk_size = self.chunk_size
+        for match in SENTENCE_BREAK.finditer(text, start, end):
+            stop = match.start(1)
+            if stop - start > chunk_size:
+                yield from self._sentence_slices(start, stop, None, False)
+            else:
+                yield "sentence", start, stop, None
+            start = match.end(1)
+        yield from self._sentence_slices(start, end, None, False)
     
-    def _split_paragraph(self, paragraph: str) -> List[str]:
+    def _sentence_slices(self, start: int, end: int, text: Optional[str], sliced: bool) -> Iterator[Tuple[str, int, int, Optional[str]]]:
         """
-        Split a paragraph into smaller chunks by sentences.
+        Yield a sentence, or its slices if it is too long or was already being sliced.
         
-        Args:
-            paragraph: The paragraph to split
-            
-        Returns:
-            List of sentence chunks
+        Yields:
+            ("sentence", start, end, text) for a sentence that fits in a
+            chunk, or ("slice", start, end, text) for each chunk-sized slice
+            of one that doesn't
+        """
+        if start == end:
+            return
+        
+        # If a single sentence is too long, split it by character count
+        if sliced or end - start > self.chunk_size:
+            for i in range(start, end, self.chunk_size):
+                piece = text[i - start:i - start + self.chunk_size] if text is not None else None
+                yield "slice", i, min(i + self.chunk_size, end), piece
+        else:
+            yield "sentence", start, end, text
+    
+    def _pack_sentences(self, items: Iterable[Tuple[str, int, int, Optional[str]]]) -> Iterator[Tuple[List[Part], int]]:
         """
-        # Simple sentence splitting by common punctuation
-        sentences = re.split(r'(?<=[.!?])\s+', paragraph)
+        Pack sentences into chunks; slices of long sentences are chunks on their own.
         
-        chunks = []
+        As before, slices go out as soon as they are seen, ahead of the
+        sentences still being packed.
+        
+        Yields:
+            The parts of each chunk and the length of its text
+        """
         current_chunk = []
         current_length = 0
+        text_length = 0
         
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
+        for kind, start, end, text in items:
+            if kind == "slice":
+                yield [('\n\n', start, end, text)], end - start
                 continue
-                
-            sentence_length = len(sentence)
             
-            # If a single sentence is too long, split it by character count
-            if sentence_length > self.chunk_size:
-                sentence_chunks = [sentence[i:i+self.chunk_size] for i in range(0, len(sentence), self.chunk_size)]
-                chunks.extend(sentence_chunks)
-            else:
-                # Add sentence to current chunk if it fits
-                if current_length + sentence_length + (1 if current_chunk else 0) <= self.chunk_size:
-                    if current_chunk:
-                        current_chunk.append(' ')
-                    current_chunk.append(sentence)
-                    current_length += sentence_length + (1 if current_chunk else 0)
+            # Add sentence to current chunk if it fits
+            if current_length + end - start + (1 if current_chunk else 0) <= self.chunk_size:
+                if current_chunk:
+                    current_chunk.append((' ', start, end, text))
+                    text_length += end - start + 1
                 else:
-                    # Finish current chunk and start a new one
-                    if current_chunk:
-                        chunks.append(''.join(current_chunk))
-                    current_chunk = [sentence]
-                    current_length = sentence_length
+                    current_chunk.append(('\n\n', start, end, text))
+                    text_length = end - start
+                current_length += end - start + 1
+            else:
+                # Finish current chunk and start a new one
+                if current_chunk:
+                    yield current_chunk, text_length
+                current_chunk = [('\n\n', start, end, text)]
+                current_length = text_length = end - start
         
         # Add the last chunk if it's not empty
         if current_chunk:
-            chunks.append(''.join(current_chunk))
-            
-        return chunks
+            yield current_chunk, text_length
     
-    def _apply_overlap(self, chunks: List[str]) -> List[str]:
+    def _stream_paragraph_items(self, blocks: Iterable[str]) -> Iterator[Tuple[str, List[Part], int]]:
         """
-        Apply overlap between chunks.
+        Streaming counterpart of `_paragraph_items`.
         
-        Args:
-            chunks: List of text chunks
-            
-        Returns:
-            List of overlapping text chunks
+        A paragraph is buffered until it either ends or is certain to be too
+        long for a chunk; from then on it is split into sentences as it
+        streams in instead of being held whole.
         """
-        if len(chunks) <= 1:
-            return chunks
+        fragments = paragraph_fragments(blocks)
+        buffer = ""
+        buffer_start = 0
+        for fragment in fragments:
+            if fragment is None:
+                for kind, parts, length in self._paragraph(buffer, 0, len(buffer)):
+                    yield kind, [(separator, buffer_start + start, buffer_start + end, buffer[start:end])
+                                 for separator, start, end, _ in parts], length
+                buffer = ""
+                continue
             
-        result = []
-        for i in range(len(chunks)):
-            if i == 0:
-                # First chunk remains as is
-                result.append(chunks[i])
+            position, text = fragment
+            if not buffer:
+                # Leading whitespace is stripped from paragraphs, so don't keep it
+                buffer = text.lstrip()
+                buffer_start = position + len(text) - len(buffer)
             else:
-                # For subsequent chunks, try to include overlap from previous chunk
-                prev_chunk = chunks[i-1]
-                current_chunk = chunks[i]
-                
-                # Calculate how much text to take from the end of the previous chunk
-                overlap_size = min(self.chunk_overlap, len(prev_chunk))
-                overlap_text = prev_chunk[-overlap_size:]
-                
-                # Ensure we don't exceed chunk_size
-                available_size = self.chunk_size - overlap_size
-                if available_size < len(current_chunk):
-                    current_chunk = current_chunk[:available_size]
-                    
-                result.append(overlap_text + current_chunk)
+                buffer += text
+            
+            if self._rstrip(buffer, 0, len(buffer)) > self.chunk_size:
+                def paragraph_text():
+                    yield buffer_start, buffer
+                    for rest in fragments:
+                        if rest is None:
+                            return
+                        yield rest
                 
-        return result
+                for parts, length in self._pack_sentences(self._stream_sentence_items(paragraph_text())):
+                    yield "piece", parts, length
+                buffer = ""
+    
+    def _stream_sentence_items(self, fragments: Iterable[Tuple[int, str]]) -> Iterator[Tuple[str, int, int, Optional[str]]]:
+        """
+        Streaming counterpart of `_sentence_items` for a paragraph arriving in pieces.
+        
+        A sentence break is only taken once text follows it, since the
+        whitespace could continue in the next piece. Slices of a sentence
+        known to be too long are yielded as soon as they are complete.
+        """
+        buffer = ""
+        base = 0
+        start = 0
+        sliced = False
+        for position, fragment in fragments:
+            if not buffer:
+                base = position
+            buffer += fragment
+            
+            # From the character before the sentence, whose punctuation may end the previous one
+            for match in SENTENCE_BREAK.finditer(buffer, max(start - 1, 0)):
+                if match.end(1) == len(buffer):
+                    break
+                yield from self._buffered_sentence(buffer, base, start, match.start(1), sliced)
+                start = match.end(1)
+                sliced = False
+            
+            end = self._rstrip(buffer, start, len(buffer))
+            if sliced or end - start > self.chunk_size:
+                while start + self.chunk_size <= end:
+                    yield "slice", base + start, base + start + self.chunk_size, buffer[start:start + self.chunk_size]
+                    start += self.chunk_size
+                    sliced = True
+            
+            # Drop what has been yielded, keeping the character before the sentence
+            if start > 1:
+                buffer = buffer[start - 1:]
+                base += start - 1
+                start = 1
+        
+        yield from self._buffered_sentence(buffer, base, start, len(buffer), sliced)
+    
+    def _buffered_sentence(self, buffer: str, base: int, start: int, end: int, sliced: bool) -> Iterator[Tuple[str, int, int, Optional[str]]]:
+        """
+        Yield the sentence from `start` to `end` of a streaming buffer that starts at document offset `base`.
+        
+        The rest of a sentence that is being sliced keeps its leading
+        whitespace, which is inside the sentence.
+        """
+        if sliced:
+            end = self._rstrip(buffer, start, end)
+        else:
+            start, end = self._strip(buffer, start, end)
+        yield from self._sentence_slices(base + start, base + end, buffer[start:end], sliced)
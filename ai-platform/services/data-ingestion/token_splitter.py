@@ -0,0 +1,351 @@
+import re
+import logging
+from functools import lru_cache
+from itertools import islice
+from typing import List, Optional, Iterable, Iterator, Tuple
+
+from text_splitter import SENTENCE_BREAK, paragraph_fragments
+
+logger = logging.getLogger("ai_platform.data_ingestion")
+
+WORD = re.compile(r'\S+')
+
+# Characters of a paragraph held while waiting for a sentence to end; past
+# this the text is cut at a word instead
+MAX_SENTENCE_CHARS = 64 * 1024
+
+# A sentence is packed as a unit: (start, end, tokens, text), where `text` is
+# the document text from `start` to `end` preceded by the whitespace since
+# the previous unit, so a chunk is an exact slice of the document.
+Unit = Tuple[int, int, int, str]
+
+
+@lru_cache(maxsize=8)
+def get_encoding(name: str):
+    """
+    Load a tokenizer once per process.
+
+    Args:
+        name: Name of a tiktoken encoding (e.g. "cl100k_base"), or of a
+            Hugging Face tokenizer (e.g. "sentence-transformers/all-MiniLM-L6-v2")
+
+    Returns:
+        The encoding
+    """
+    import tiktoken
+    if name in tiktoken.list_encoding_names():
+        return TiktokenEncoding(tiktoken.get_encoding(name))
+    return HuggingFaceEncoding(name)
+
+
+class TiktokenEncoding:
+    """
+    A tiktoken encoding that encodes a batch of sentences in the calling thread.
+    
+    tiktoken's own batch call hands every text to a thread pool, which costs
+    more than encoding a sentence does (about three times as long overall).
+    """
+    
+    def __init__(self, encoding):
+        """
+        Wrap an encoding.
+        
+        Args:
+            encoding: The tiktoken encoding
+        """
+        self.encoding = encoding
+        self.name = encoding.name
+    
+    def encode_ordinary_batch(self, texts: List[str]) -> List[List[int]]:
+        """Token IDs of several texts, without special tokens"""
+        encode = self.encoding.encode_ordinary
+        return [encode(text) for text in texts]
+
+
+class HuggingFaceEncoding:
+    """
+    A Hugging Face tokenizer behind the part of tiktoken's interface the splitter uses.
+    
+    This is how the embedding model counts: all-MiniLM-L6-v2 truncates its
+    input at 256 of its word pieces.
+    """
+    
+    def __init__(self, name: str):
+        """
+        Load the tokenizer.
+        
+        Args:
+            name: Name of the tokenizer on the Hugging Face hub, or a local path to one
+        """
+        from tokenizers import Tokenizer
+        self.name = name
+        self.tokenizer = Tokenizer.from_pretrained(name)
+        # Texts are counted whole, as they'll be stored
+        self.tokenizer.no_truncation()
+        self.tokenizer.no_padding()
+    
+    def encode_ordinary_batch(self, texts: List[str]) -> List[List[int]]:
+        """Token IDs of several texts, without special tokens"""
+        return [encoding.ids for encoding in self.tokenizer.encode_batch(texts, add_special_tokens=False)]
+
+
+class TokenSplitter:
+    """
+    Splits text into chunks that fit a token budget, on sentence boundaries.
+    
+    Sentences are found the way TextSplitter finds them, counted in batches,
+    and packed into chunks of at most `chunk_tokens` tokens. The overlap is
+    made of whole sentences from the end of the previous chunk, as many as
+    fit in `chunk_overlap` tokens. A sentence too long for a chunk is cut
+    between words, and a word too long for one into pieces.
+    
+    Each sentence is counted with the whitespace before it taken as a single
+    space, or a paragraph break, so a chunk's count is the sum of its
+    sentences'. For word piece tokenizers that is exact; byte pair encodings
+    may merge a token or so differently where sentences meet.
+    
+    Chunks are slices of the document with line breaks normalized, and come
+    with the same offsets as TextSplitter's.
+    """
+    
+    def __init__(self, chunk_tokens: int = 254, chunk_overlap: int = 32,
+                 encoding_name: str = "sentence-transformers/all-MiniLM-L6-v2", encoding=None,
+                 batch_size: int = 512):
+        """
+        Initialize the token splitter.
+        
+        Args:
+            chunk_tokens: Maximum number of tokens of each chunk
+            chunk_overlap: Maximum number of tokens of a chunk repeating the previous one
+            encoding_name: tiktoken encoding or Hugging Face tokenizer used to count tokens
+            encoding: Encoding to use instead of loading `encoding_name`
+            batch_size: Number of sentences counted in one call to the tokenizer
+        """
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.encoding_name = encoding_name
+        self.batch_size = batch_size
+        self._encoding = encoding
+        # Pieces of a word too long for a chunk; no character is more than 4 tokens
+        self.piece_chars = max(1, (chunk_tokens - 1) // 4)
+        logger.info(f"TokenSplitter initialized with chunk_tokens={chunk_tokens}, chunk_overlap={chunk_overlap} ({encoding_name})")
+    
+    @property
+    def encoding(self):
+        """The encoding, loaded on first use."""
+        if self._encoding is None:
+            self._encoding = get_encoding(self.encoding_name)
+        return self._encoding
+    
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        Count the tokens of several texts in one batch.
+        
+        Args:
+            texts: The texts
+        
+        Returns:
+            Token count of each text
+        """
+        return [len(tokens) for tokens in self.encoding.encode_ordinary_batch(texts)]
+    
+    def split_text(self, text: str) -> List[str]:
+        """
+        Split text into chunks.
+        
+        Args:
+            text: The text to split
+        
+        Returns:
+            List of text chunks
+        """
+        return [chunk for chunk, _, _, _ in self.iter_chunks(text)]
+    
+    def iter_chunks(self, text: str) -> Iterator[Tuple[str, int, int, int]]:
+        """
+        Split text into chunks lazily, with their offsets.
+        
+        Args:
+            text: The text to split
+        
+        Yields:
+            (chunk, start_offset, end_offset, overlap_chars), where the offsets
+            are those of the text the chunk adds in the text with line breaks
+            normalized, and the first `overlap_chars` characters of the chunk
+            repeat the end of the previous one
+        """
+        count = 0
+        for chunk in self._chunks(self._units(paragraph_fragments([text]))):
+            count += 1
+            yield chunk
+        logger.info(f"Split text into {count} chunks")
+    
+    def split_stream(self, blocks: Iterable[str]) -> Iterator[str]:
+        """
+        Split text arriving in blocks into chunks as it is read.
+        
+        Args:
+            blocks: Consecutive pieces of the text, cut anywhere
+        
+        Yields:
+            The same chunks `split_text` returns for the whole text
+        """
+        for chunk, _, _, _ in self.iter_stream_chunks(blocks):
+            yield chunk
+    
+    def iter_stream_chunks(self, blocks: Iterable[str]) -> Iterator[Tuple[str, int, int, int]]:
+        """
+        Split text arriving in blocks into chunks as it is read, with their offsets.
+        
+        Only the sentences of the chunk being packed and of one batch are held.
+        
+        Yields:
+            The same tuples `iter_chunks` yields for the whole text
+        """
+        count = 0
+        for chunk in self._chunks(self._units(paragraph_fragments(blocks))):
+            count += 1
+            yield chunk
+        logger.info(f"Split text stream into {count} chunks")
+    
+    def _chunks(self, units: Iterable[Unit]) -> Iterator[Tuple[str, int, int, int]]:
+        """Pack units into chunks within the token budget."""
+        chunk: List[Unit] = []
+        total = 0
+        # Units of the chunk before this index repeat the previous chunk
+        carried = 0
+        for unit in units:
+            tokens = unit[2]
+            if len(chunk) > carried and total + tokens > self.chunk_tokens:
+                yield self._assemble(chunk, carried)
+                
+                # Carry whole sentences from the end, leaving room for the next one
+                carried = 0
+                kept = 0
+                for carried_unit in reversed(chunk):
+                    if kept + carried_unit[2] > self.chunk_overlap or kept + carried_unit[2] + tokens > self.chunk_tokens:
+                        break
+                    kept += carried_unit[2]
+                    carried += 1
+                chunk = chunk[len(chunk) - carried:] if carried else []
+                total = kept
+            chunk.append(unit)
+            total += tokens
+        
+        if len(chunk) > carried:
+            yield self._assemble(chunk, carried)
+    
+    @staticmethod
+    def _assemble(chunk: List[Unit], carried: int) -> Tuple[str, int, int, int]:
+        """Turn packed units into a chunk and its offsets."""
+        first_start, first_end, _, first_text = chunk[0]
+        text = first_text[len(first_text) - (first_end - first_start):] + "".join(unit[3] for unit in chunk[1:])
+        # A chunk is a slice of the document, so offsets measure its text
+        overlap_chars = chunk[carried - 1][1] - first_start if carried else 0
+        return text, chunk[carried][0], chunk[-1][1], overlap_chars
+    
+    def _units(self, fragments: Iterable[Optional[Tuple[int, str]]]) -> Iterator[Unit]:
+        """
+        Cut paragraph text into sentences and count their tokens in batches.
+        
+        Sentences over the budget are cut further by `_long_units`.
+        """
+        sentences = self._sentences(fragments)
+        while True:
+            batch = list(islice(sentences, self.batch_size))
+            if not batch:
+                return
+            counts = self.count_tokens([separator + text[len(text) - (end - start):] for start, end, separator, text in batch])
+            for (start, end, separator, text), tokens in zip(batch, counts):
+                if tokens <= self.chunk_tokens:
+                    yield start, end, tokens, text
+                else:
+                    yield from self._long_units(start, end, separator, text)
+    
+    def _sentences(self, fragments: Iterable[Optional[Tuple[int, str]]]) -> Iterator[Tuple[int, int, str, str]]:
+        """
+        Find the sentences of the paragraphs.
+        
+        Yields:
+            (start, end, separator, text) of each sentence, where `separator`
+            is how the whitespace before it is counted and `text` is the
+            sentence preceded by that whitespace
+        """
+        gap = ""
+        separator = ""
+        buffer = ""
+        buffer_start = 0
+        for fragment in fragments:
+            if fragment is None:
+                gap, separator = yield from self._run(buffer, buffer_start, gap, separator)
+                buffer = ""
+                gap += "\n\n"
+                if separator:
+                    separator = "\n\n"
+                continue
+            
+            position, text = fragment
+            if not buffer:
+                buffer_start = position
+            buffer += text
+            if len(buffer) <= MAX_SENTENCE_CHARS:
+                continue
+            
+            # Keep only the last sentence, which may go on in the next fragment,
+            # or the last word of a sentence that goes on for too long
+            cut = 0
+            for match in SENTENCE_BREAK.finditer(buffer):
+                cut = match.end(1)
+            if not cut:
+                words = [match.start() for match in WORD.finditer(buffer)]
+                cut = words[-1] if len(words) > 1 else len(buffer)
+            gap, separator = yield from self._run(buffer[:cut], buffer_start, gap, separator)
+            buffer = buffer[cut:]
+            buffer_start += cut
+    
+    @staticmethod
+    def _run(text: str, base: int, gap: str, separator: str):
+        """
+        Yield the sentences of a run of paragraph text starting at offset `base`.
+        
+        Args:
+            text: The paragraph text
+            base: Offset of the text in the document
+            gap: Whitespace since the last sentence before the run
+            separator: How that whitespace is counted
+        
+        Returns:
+            The whitespace since the last sentence and how it is counted, after the run
+        """
+        last = 0
+        position = 0
+        for end in [match.start(1) for match in SENTENCE_BREAK.finditer(text)] + [len(text)]:
+            match = WORD.search(text, position, end)
+            if match is not None:
+                end = len(text[:end].rstrip())
+                yield base + match.start(), base + end, separator, gap + text[last:end]
+                last = end
+                gap = ""
+                separator = " "
+            position = end
+        return gap + text[last:], separator
+    
+    def _long_units(self, start: int, end: int, separator: str, text: str) -> Iterator[Unit]:
+        """Cut a sentence over the budget between words, and words over it into pieces."""
+        sentence = text[len(text) - (end - start):]
+        gap = text[:len(text) - (end - start)]
+        words = list(WORD.finditer(sentence))
+        counts = self.count_tokens([(separator if i == 0 else " ") + word.group() for i, word in enumerate(words)])
+        last = 0
+        for i, (word, tokens) in enumerate(zip(words, counts)):
+            word_separator = separator if i == 0 else " "
+            word_gap = (gap if i == 0 else "") + sentence[last:word.start()]
+            last = word.end()
+            if tokens <= self.chunk_tokens:
+                yield start + word.start(), start + word.end(), tokens, word_gap + word.group()
+                continue
+            pieces = [(j, word.group()[j:j + self.piece_chars]) for j in range(0, len(word.group()), self.piece_chars)]
+            piece_counts = self.count_tokens([(word_separator if j == 0 else "") + piece for j, piece in pieces])
+            for (j, piece), piece_tokens in zip(pieces, piece_counts):
+                piece_start = start + word.start() + j
+                yield piece_start, piece_start + len(piece), piece_tokens, (word_gap if j == 0 else "") + piece
@@ -1,17 +1,70 @@
-from fastapi import FastAPI
-from sentence_transformers import SentenceTransformer
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import os
+import sys
+
+# Make the shared libraries importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+from shared.startup.profile import StartupProfile
+from shared.startup.warmup import parse_sequence_lengths, run_warmup
+
+logger = logging.getLogger("ai_platform.embeddings_service")
+
+# Created before the heavy imports so the cold start report covers them
+startup_profile = StartupProfile()
+
+with startup_profile.phase("import"):
+    from sentence_transformers import SentenceTransformer
 
 class TextInput(BaseModel):
     text: str
 
-app = FastAPI()
+# Input lengths in tokens the model is run on before the service reports ready
+WARMUP_SEQUENCE_LENGTHS = os.getenv("WARMUP_SEQUENCE_LENGTHS", "16,128,256")
+
+# The sentence transformer model, loaded in the background once the server is up
+model = None
+
+def initialize():
+    """Load and warm up the model, run off the event loop"""
+    global model
+    try:
+        with startup_profile.phase("weight_load"):
+            loaded = SentenceTransformer('all-MiniLM-L6-v2')
 
-# Load the sentence transformer model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+        # "the" is a single token, so a text of n of them is n tokens long
+        run_warmup(
+            lambda length: loaded.encode(" ".join(["the"] * length)),
+            parse_sequence_lengths(WARMUP_SEQUENCE_LENGTHS, loaded.max_seq_length),
+            profile=startup_profile
+        )
+
+        model = loaded
+        startup_profile.mark_ready()
+        logger.info(f"embeddings-service ready, cold start report: {startup_profile.report()}")
+    except Exception as e:
+        startup_profile.mark_failed(e)
+        logger.error(f"Error initializing embeddings-service: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Don't block the server on loading the model so /health answers immediately
+    startup_task = asyncio.get_running_loop().run_in_executor(None, initialize)
+
+    yield
+
+    await startup_task
+
+app = FastAPI(lifespan=lifespan)
 
 @app.post("/generate-embedding")
 def generate_embedding(data: TextInput):
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model is still loading", headers={"Retry-After": "5"})
     # Generate the embedding
     embedding = model.encode(data.text)
     # Convert numpy array to list for JSON serialization
@@ -19,4 +72,13 @@ def generate_embedding(data: TextInput):
 
 @app.get("/health")
 def read_root():
+    """Liveness check endpoint"""
     return {"status": "ok"}
+
+@app.get("/ready")
+def read_ready():
+    """Readiness check endpoint, with the cold start report"""
+    report = startup_profile.report()
+    if not startup_profile.ready:
+        return JSONResponse(status_code=503, content=report)
+    return report
@@ -0,0 +1,168 @@
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger("ai_platform.rag_orchestrator")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so trivially different spellings share a cache entry.
+    
+    Args:
+        query: The query text
+    
+    Returns:
+        The query lowercased, with runs of whitespace collapsed
+    """
+    return " ".join(query.lower().split())
+
+
+class AnswerCache:
+    """
+    Caches generated answers so repeated questions skip text generation.
+    
+    An answer is only reused when the normalized query, the version of the
+    collection and the set of retrieved chunks are all the same, so any write
+    to the collection or any change in what retrieval returns is a miss. A
+    bounded in-memory LRU is checked first; an optional Redis tier shares
+    answers between orchestrator replicas and survives restarts.
+    """
+    
+    def __init__(self, capacity: int = 1024, ttl: float = 3600.0, redis_url: Optional[str] = None,
+                 key_prefix: str = "rag:answer:"):
+        """
+        Initialize the cache.
+        
+        Args:
+            capacity: Maximum number of answers kept in memory
+            ttl: Seconds an answer stays valid
+            redis_url: URL of the Redis server for the shared tier, or None for memory only
+            key_prefix: Prefix of the Redis keys
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.redis_url = redis_url
+        self.key_prefix = key_prefix
+        
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._redis = None
+        
+        self.memory_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        
+        logger.info(f"AnswerCache initialized with capacity {capacity}, TTL {ttl}s, Redis tier {'on' if redis_url else 'off'}")
+    
+    @property
+    def redis(self):
+        """The Redis client of the shared tier, created on first use."""
+        if self._redis is None and self.redis_url:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.redis_url)
+        return self._redis
+    
+    def make_key(self, query: str, collection_name: str, collection_version: Optional[str],
+                 chunk_ids: List[str], variant: str = "answer") -> Optional[str]:
+        """
+        Build the cache key of a question.
+        
+        Args:
+            query: The query text
+            collection_name: The collection the documents were retrieved from
+            collection_version: Version of the collection reported by retrieval
+            chunk_ids: IDs of the retrieved chunks
+            variant: Kind of answer, for answers that are produced differently
+        
+        Returns:
+            The key, or None if the collection version is unknown and the
+            answer must not be cached
+        """
+        if collection_version is None:
+            return None
+        
+        chunks = hashlib.sha256("\n".join(sorted(chunk_ids)).encode("utf-8")).hexdigest()
+        parts = [variant, normalize_query(query), collection_name, collection_version, chunks]
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+    
+    async def get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Look up an answer.
+        
+        Args:
+            key: Key built with `make_key`
+        
+        Returns:
+            The cached entry, or None on a miss
+        """
+        if key is None:
+            return None
+        
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return value
+            del self._entries[key]
+        
+        if self.redis is not None:
+            try:
+                payload = await self.redis.get(self.key_prefix + key)
+                if payload is not None:
+                    value = json.loads(payload)
+                    self._remember(key, value)
+                    self.redis_hits += 1
+                    return value
+            except Exception as e:
+                logger.warning(f"Answer cache Redis lookup failed: {str(e)}")
+        
+        self.misses += 1
+        return None
+    
+    async def set(self, key: Optional[str], value: Dict[str, Any]):
+        """
+        Store an answer in every tier.
+        
+        Args:
+            key: Key built with `make_key`; nothing is stored if it is None
+            value: JSON-serializable entry to cache
+        """
+        if key is None:
+            return
+        
+        self._remember(key, value)
+        
+        if self.redis is not None:
+            try:
+                await self.redis.set(self.key_prefix + key, json.dumps(value), ex=max(1, int(self.ttl)))
+            except Exception as e:
+                logger.warning(f"Answer cache Redis store failed: {str(e)}")
+    
+    def _remember(self, key: str, value: Dict[str, Any]):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+        
+        Returns:
+            Dictionary with the hits per tier, misses, hit rate and number of entries in memory
+        """
+        hits = self.memory_hits + self.redis_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "redis": bool(self.redis_url)
+        }
@@ -0,0 +1,132 @@
+import logging
+from typing import List, Dict, Any, Tuple
+
+logger = logging.getLogger("ai_platform.rag_orchestrator")
+
+
+class ChunkMerger:
+    """
+    Stitches neighbouring chunks of the same source document back together.
+    
+    The data ingestion splitter prepends the tail of the previous chunk to
+    every chunk, so when retrieval returns consecutive chunks of a document
+    the prompt would repeat that text. Chunks are grouped by their source
+    document (`metadata.id`), runs of consecutive `chunk_id`s are joined with
+    the repeated text removed, and the resulting spans are ordered by the best
+    distance among their chunks.
+    
+    Chunks ingested with offsets record in `overlap_chars` how much of their
+    start repeats the previous chunk, so that text is cut exactly; for older
+    chunks it is found by matching the end of the previous chunk.
+    """
+    
+    def __init__(self, chunk_overlap: int = 200):
+        """
+        Initialize the merger.
+        
+        Args:
+            chunk_overlap: Overlap the documents were split with (CHUNK_OVERLAP of data ingestion)
+        """
+        self.chunk_overlap = chunk_overlap
+    
+    def _overlap_length(self, previous: str, current: str) -> int:
+        """
+        Find how much of the start of a chunk repeats the end of the previous one.
+        
+        The splitter cuts chunks that grow past the chunk size after the
+        overlap is added, so the previous chunk may end partway into the
+        repeated text; the longest match, rather than exactly `chunk_overlap`
+        characters, is removed.
+        
+        Args:
+            previous: Text of the previous chunk
+            current: Text of the chunk that follows it
+        
+        Returns:
+            Length of the longest suffix of `previous` that is a prefix of
+            `current`, up to the configured overlap
+        """
+        for length in range(min(self.chunk_overlap, len(previous), len(current)), 0, -1):
+            if previous.endswith(current[:length]):
+                return length
+        return 0
+    
+    @staticmethod
+    def _distance(doc: Dict[str, Any]) -> float:
+        """Distance used for ordering; documents without one go last."""
+        return doc["distance"] if doc.get("distance") is not None else float("inf")
+    
+    def _stitch(self, run: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Join a run of consecutive chunks into one span.
+        
+        Args:
+            run: Chunks of one document with consecutive chunk IDs, in order
+        
+        Returns:
+            A document for the whole span
+        """
+        if len(run) == 1:
+            return run[0]
+        
+        text = run[0]["text"]
+        for previous, current in zip(run, run[1:]):
+            overlap = current["metadata"].get("overlap_chars")
+            if not isinstance(overlap, int):
+                overlap = self._overlap_length(previous["text"], current["text"])
+            text += current["text"][overlap:]
+        
+        span = {
+            "id": run[0]["id"],
+            "text": text,
+            "metadata": {
+                **run[0]["metadata"],
+                "chunk_ids": [doc["metadata"]["chunk_id"] for doc in run]
+            },
+            "distance": min(run, key=self._distance).get("distance")
+        }
+        # The span covers the document text between the offsets of its chunks
+        if all(isinstance(doc["metadata"].get("start_offset"), int) for doc in run):
+            span["metadata"]["start_offset"] = min(doc["metadata"]["start_offset"] for doc in run)
+            span["metadata"]["end_offset"] = max(doc["metadata"]["end_offset"] for doc in run)
+        if any("score" in doc for doc in run):
+            span["score"] = max(doc.get("score", 0.0) for doc in run)
+        return span
+    
+    def merge(self, documents: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Merge retrieved chunks that are neighbours in their source document.
+        
+        Chunks without a source document ID or chunk ID are passed through.
+        
+        Args:
+            documents: Retrieved documents with text, metadata and distance
+        
+        Returns:
+            The merged documents ordered by best distance, and the number of
+            chunks that were folded into a neighbour
+        """
+        groups: Dict[Any, Dict[int, Dict[str, Any]]] = {}
+        spans = []
+        for doc in documents:
+            metadata = doc.get("metadata") or {}
+            if metadata.get("id") is None or not isinstance(metadata.get("chunk_id"), int):
+                spans.append(doc)
+                continue
+            # A chunk that comes back twice is only used once
+            groups.setdefault((doc.get("collection"), metadata["id"]), {}).setdefault(metadata["chunk_id"], doc)
+        
+        for chunks in groups.values():
+            run = []
+            for chunk_id in sorted(chunks):
+                if run and chunk_id != run[-1]["metadata"]["chunk_id"] + 1:
+                    spans.append(self._stitch(run))
+                    run = []
+                run.append(chunks[chunk_id])
+            spans.append(self._stitch(run))
+        
+        spans.sort(key=self._distance)
+        merged_count = len(documents) - len(spans)
+        if merged_count:
+            logger.info(f"Merged {merged_count} neighbouring chunks into {len(spans)} spans")
+        return spans, merged_count
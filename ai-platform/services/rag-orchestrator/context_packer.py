@@ -0,0 +1,131 @@
+import re
+import logging
+from functools import lru_cache
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger("ai_platform.rag_orchestrator")
+
+# Sentence ends at ., ! or ? followed by whitespace
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+@lru_cache(maxsize=8)
+def get_encoding(name: str):
+    """
+    Load a tiktoken encoding once per process.
+    
+    Args:
+        name: Name of the tiktoken encoding (e.g. "gpt2", which matches distilgpt2)
+    
+    Returns:
+        The encoding
+    """
+    import tiktoken
+    return tiktoken.get_encoding(name)
+
+
+class ContextPacker:
+    """
+    Fits retrieved documents into a token budget for the prompt.
+    
+    Documents are taken best-ranked first. The first one that doesn't fit is
+    trimmed at a sentence boundary to fill what is left of the budget, and
+    anything after that is dropped.
+    """
+    
+    def __init__(self, token_budget: int = 512, encoding_name: str = "gpt2", encoding=None):
+        """
+        Initialize the packer.
+        
+        Args:
+            token_budget: Maximum number of context tokens in the prompt
+            encoding_name: tiktoken encoding used to count tokens
+            encoding: Encoding to use instead of loading `encoding_name`
+        """
+        self.token_budget = token_budget
+        self.encoding_name = encoding_name
+        self._encoding = encoding
+        
+        logger.info(f"ContextPacker initialized with a budget of {token_budget} tokens ({encoding_name})")
+    
+    @property
+    def encoding(self):
+        """The tiktoken encoding, loaded on first use."""
+        if self._encoding is None:
+            self._encoding = get_encoding(self.encoding_name)
+        return self._encoding
+    
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        Count the tokens of several texts in one batch.
+        
+        Args:
+            texts: The texts
+        
+        Returns:
+            Token count of each text
+        """
+        return [len(tokens) for tokens in self.encoding.encode_ordinary_batch(texts)]
+    
+    def _trim(self, text: str, budget: int):
+        """
+        Keep the longest run of leading sentences that fits a budget.
+        
+        Returns:
+            The trimmed text and its token count; empty if not even the first sentence fits
+        """
+        sentences = SENTENCE_BOUNDARY.split(text)
+        # Sentences are counted with their leading space, as they appear once joined
+        token_counts = self.count_tokens([(" " if i else "") + sentence for i, sentence in enumerate(sentences)])
+        
+        kept, used = [], 0
+        for sentence, tokens in zip(sentences, token_counts):
+            if used + tokens > budget:
+                break
+            kept.append(sentence)
+            used += tokens
+        return " ".join(kept), used
+    
+    def pack(self, documents: List[Dict[str, Any]], token_budget: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Select and trim documents so their text fits the token budget.
+        
+        Args:
+            documents: Retrieved documents with text and distance
+            token_budget: Budget to use instead of the configured one
+        
+        Returns:
+            Dictionary with the packed "documents" (best first, trimmed ones
+            flagged with "truncated"), the "context_tokens" they use and the
+            number of "documents_dropped"
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        ranked = sorted(
+            documents,
+            key=lambda doc: doc["distance"] if doc.get("distance") is not None else float("inf")
+        )
+        token_counts = self.count_tokens([doc.get("text") or "" for doc in ranked])
+        
+        packed, used = [], 0
+        for doc, tokens in zip(ranked, token_counts):
+            remaining = budget - used
+            if tokens <= remaining:
+                packed.append(doc)
+                used += tokens
+                continue
+            
+            text, tokens = self._trim(doc.get("text") or "", remaining)
+            if text:
+                packed.append({**doc, "text": text, "truncated": True})
+                used += tokens
+            break
+        
+        dropped = len(documents) - len(packed)
+        if dropped:
+            logger.info(f"Packed {len(packed)} documents into {used}/{budget} tokens, dropped {dropped}")
+        
+        return {
+            "documents": packed,
+            "context_tokens": used,
+            "documents_dropped": dropped
+        }
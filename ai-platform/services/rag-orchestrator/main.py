@@ -1,6 +1,8 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
+import json
 import os
 import sys
 
@@ -28,6 +30,11 @@ class RAGRequest(BaseModel):
     collection_name: str
     n_results: int = 5
 
+class RAGBatchRequest(BaseModel):
+    queries: List[str]
+    collection_name: str
+    n_results: int = 5
+
 @app.get("/health")
 def read_health():
     """Health check endpoint"""
@@ -49,6 +56,50 @@ async def process_rag_query(request: RAGRequest):
         logger.error(f"Error processing RAG query: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/rag/stream")
+async def stream_rag_query(request: RAGRequest):
+    """
+    Process a query through the RAG pipeline and stream the answer as server-sent events.
+    """
+    return StreamingResponse(
+        orchestrator.stream_query(
+            query=request.query,
+            collection_name=request.collection_name,
+            n_results=request.n_results
+        ),
+        media_type="text/event-stream",
+        # Tell proxies not to buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/rag/batch")
+async def process_rag_batch(request: RAGBatchRequest):
+    """
+    Process many queries through the RAG pipeline and stream the results as NDJSON.
+    
+    Each line is the result of one query, with its "index" in the request, and
+    lines are sent in the order the queries complete.
+    """
+    async def generate():
+        async for result in orchestrator.process_batch(
+            queries=request.queries,
+            collection_name=request.collection_name,
+            n_results=request.n_results
+        ):
+            yield json.dumps(result) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.get("/stats")
+def read_stats():
+    """
+    Time-to-first-token statistics of streamed queries and answer cache statistics.
+    """
+    return {
+        "ttft": orchestrator.ttft_tracker.summary(),
+        "answer_cache": orchestrator.answer_cache.stats() if orchestrator.answer_cache is not None else None
+    }
+
 @app.get("/collections")
 async def list_collections():
     """
@@ -1,11 +1,22 @@
 import httpx
+import asyncio
 import logging
 import os
-from typing import List, Dict, Any, Optional
-import jinja2
+import time
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Tuple
+from shared.codec.columnar import ColumnarResults, CONTENT_TYPE as COLUMNAR_CONTENT_TYPE
+from shared.metrics.latency import LatencyTracker
+from shared.streaming.sse import format_event, iter_events
+from prompts import PromptRegistry
+from context_packer import ContextPacker
+from chunk_merger import ChunkMerger
+from answer_cache import AnswerCache
 
 logger = logging.getLogger("ai_platform.rag_orchestrator")
 
+# Statuses text-gen answers when its queue is full or a deadline can't be met
+OVERLOADED_STATUSES = (429, 503)
+
 class RAGOrchestrator:
     """
     A class to orchestrate the Retrieval-Augmented Generation process.
@@ -22,13 +33,45 @@ class RAGOrchestrator:
         self.retriever_url = retriever_url or os.getenv("RETRIEVER_SERVICE_URL", "http://retriever:8000")
         self.text_gen_url = text_gen_url or os.getenv("TEXT_GEN_SERVICE_URL", "http://text-gen:8000")
         
-        # Initialize template environment for prompt construction
-        self.template_env = jinja2.Environment(
-            autoescape=True,
-            trim_blocks=True,
-            lstrip_blocks=True
+        # Prompt templates are compiled once, here
+        self.prompts = PromptRegistry()
+        
+        # Neighbouring chunks of a document are stitched back together without
+        # their overlap; this has to match the overlap data ingestion splits with
+        self.chunk_merger = ChunkMerger(chunk_overlap=int(os.getenv("CHUNK_OVERLAP", "200")))
+        
+        # Retrieved context is packed into a token budget before it goes into the prompt
+        self.context_packer = ContextPacker(
+            token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "512")),
+            encoding_name=os.getenv("CONTEXT_TOKEN_ENCODING", "gpt2")
         )
         
+        # Time from receiving a streaming query to relaying its first token
+        self.ttft_tracker = LatencyTracker()
+        
+        # Answers are reused while the question, the collection version and
+        # the retrieved chunks stay the same
+        self.answer_cache = None
+        if os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true":
+            self.answer_cache = AnswerCache(
+                capacity=int(os.getenv("ANSWER_CACHE_SIZE", "1024")),
+                ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+                redis_url=os.getenv("ANSWER_CACHE_REDIS_URL") or None
+            )
+        
+        # Batch queries are processed in groups of this many, and only this many
+        # groups are in flight at once so interactive queries still get through
+        self.batch_size = int(os.getenv("RAG_BATCH_SIZE", "16"))
+        self.batch_concurrency = int(os.getenv("RAG_BATCH_CONCURRENCY", "2"))
+        self._batch_semaphore = None
+        self._batch_semaphore_loop = None
+        
+        # A batch text-gen turned away because it was overloaded is sent again
+        # up to this many times, waiting as long as its Retry-After asks but
+        # never more than this many seconds
+        self.generate_retries = int(os.getenv("RAG_GENERATE_RETRIES", "3"))
+        self.generate_max_backoff = float(os.getenv("RAG_GENERATE_MAX_BACKOFF", "10"))
+        
         logger.info(f"RAG Orchestrator initialized with retriever URL: {self.retriever_url} and text-gen URL: {self.text_gen_url}")
     
     async def retrieve_documents(self, query: str, collection_name: str, n_results: int = 5) -> List[Dict[str, Any]]:
@@ -43,6 +86,22 @@ class RAGOrchestrator:
         Returns:
             List of retrieved documents
         """
+        return (await self.retrieve(query, collection_name, n_results))["documents"]
+    
+    async def retrieve(self, query: str, collection_name: str, n_results: int = 5) -> Dict[str, Any]:
+        """
+        Retrieve relevant documents for a query, along with the collection version.
+        
+        Args:
+            query: The query text
+            collection_name: The name of the collection to query
+            n_results: Number of results to return
+            
+        Returns:
+            Dictionary with the retrieved "documents" and the "collection_version"
+            they were read at (None if unknown)
+        """
+        empty = {"documents": [], "collection_version": None}
         try:
             async with httpx.AsyncClient() as client:
                 response = await client.post(
@@ -51,19 +110,30 @@ class RAGOrchestrator:
                         "query": query,
                         "collection_name": collection_name,
                         "n_results": n_results
-                    }
+                    },
+                    headers={"Accept": f"{COLUMNAR_CONTENT_TYPE}, application/json"}
                 )
                 
                 if response.status_code != 200:
                     logger.error(f"Error retrieving documents: {response.text}")
-                    return []
+                    return empty
+                
+                if response.headers.get("content-type", "").startswith(COLUMNAR_CONTENT_TYPE):
+                    columns = ColumnarResults.decode(response.content)
+                    return {
+                        "documents": columns.to_documents(),
+                        "collection_version": columns.extra.get("collection_version")
+                    }
                 
                 result = response.json()
-                return result.get("documents", [])
+                return {
+                    "documents": result.get("documents", []),
+                    "collection_version": result.get("collection_version")
+                }
                 
         except Exception as e:
             logger.error(f"Error retrieving documents: {str(e)}")
-            return []
+            return empty
     
     def construct_prompt(self, query: str, documents: List[Dict[str, Any]]) -> str:
         """
@@ -76,24 +146,7 @@ class RAGOrchestrator:
         Returns:
             A formatted prompt string
         """
-        # Simple prompt template
-        template_str = """
-        Answer the following question based on the provided context.
-        
-        Context:
-        {% for doc in documents %}
-        {{ doc.text }}
-        {% endfor %}
-        
-        Question: {{ query }}
-        
-        Answer:
-        """
-        
-        template = self.template_env.from_string(template_str)
-        prompt = template.render(query=query, documents=documents)
-        
-        return prompt.strip()
+        return self.prompts.render("rag", query=query, documents=documents)
     
     async def generate_text(self, prompt: str) -> str:
         """
@@ -105,23 +158,32 @@ class RAGOrchestrator:
         Returns:
             Generated text
         """
+        return (await self._generate(prompt))[0]
+    
+    async def _generate(self, prompt: str) -> Tuple[str, bool]:
+        """
+        Generate text, telling whether it worked so error messages aren't cached.
+        
+        Returns:
+            The generated text or an error message, and True if generation succeeded
+        """
         try:
             async with httpx.AsyncClient() as client:
-                response = await client.get(
+                response = await client.post(
                     f"{self.text_gen_url}/generate",
-                    params={"text": prompt}
+                    json={"text": prompt}
                 )
                 
                 if response.status_code != 200:
                     logger.error(f"Error generating text: {response.text}")
-                    return "Error generating response."
+                    return "Error generating response.", False
                 
                 result = response.json()
-                return result.get("generated_text", "No text generated.")
+                return result.get("generated_text", "No text generated."), True
                 
         except Exception as e:
             logger.error(f"Error generating text: {str(e)}")
-            return f"Error: {str(e)}"
+            return f"Error: {str(e)}", False
     
     async def process_query(self, query: str, collection_name: str, n_results: int = 5) -> Dict[str, Any]:
         """
@@ -133,28 +195,417 @@ class RAGOrchestrator:
             n_results: Number of results to return from retrieval
             
         Returns:
-            A dictionary containing the generated answer and retrieved documents
+            A dictionary containing the generated answer and retrieved documents,
+            with "cached" set when the answer came from the answer cache
         """
         # Step 1: Retrieve relevant documents
-        documents = await self.retrieve_documents(query, collection_name, n_results)
+        retrieved = await self.retrieve(query, collection_name, n_results)
+        documents = retrieved["documents"]
         
         if not documents:
             return {
                 "answer": "I couldn't find any relevant information to answer your question.",
-                "documents": []
+                "documents": [],
+                "context_tokens": 0,
+                "documents_dropped": 0,
+                "chunks_merged": 0,
+                "cached": False
             }
         
-        # Step 2: Construct a prompt using the retrieved documents
-        prompt = self.construct_prompt(query, documents)
+        # The same question over the same chunks of an unchanged collection
+        # gets the answer it got before, without generating again
+        cache_key = self._answer_cache_key(query, collection_name, retrieved, "answer")
+        cached = await self.answer_cache.get(cache_key) if self.answer_cache is not None else None
+        if cached is not None:
+            logger.info(f"Answer cache hit for query: {query}")
+            return {**cached, "documents": documents, "cached": True}
         
-        # Step 3: Generate text using the constructed prompt
-        answer = await self.generate_text(prompt)
+        # Steps 2-4: Merge, pack and build the prompt
+        context = self.prepare_context(query, documents)
         
-        return {
+        # Step 5: Generate text using the constructed prompt
+        answer, generated = await self._generate(context["prompt"])
+        
+        result = {
             "answer": answer,
-            "documents": documents
+            "context_tokens": context["context_tokens"],
+            "documents_dropped": context["documents_dropped"],
+            "chunks_merged": context["chunks_merged"]
+        }
+        if generated and self.answer_cache is not None:
+            await self.answer_cache.set(cache_key, result)
+        
+        return {**result, "documents": documents, "cached": False}
+    
+    def _answer_cache_key(self, query: str, collection_name: str, retrieved: Dict[str, Any], variant: str) -> Optional[str]:
+        """
+        Build the answer cache key of a query from what retrieval returned.
+        """
+        if self.answer_cache is None:
+            return None
+        chunk_ids = [f"{doc.get('collection', collection_name)}/{doc['id']}" for doc in retrieved["documents"]]
+        return self.answer_cache.make_key(query, collection_name, retrieved["collection_version"], chunk_ids, variant)
+    
+    def prepare_context(self, query: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Turn retrieved documents into a prompt.
+        
+        Args:
+            query: The query text
+            documents: The retrieved documents
+        
+        Returns:
+            Dictionary with the "prompt" and the "context_tokens",
+            "documents_dropped" and "chunks_merged" statistics
+        """
+        # Stitch neighbouring chunks together so overlapping text isn't repeated
+        spans, chunks_merged = self.chunk_merger.merge(documents)
+        
+        # Fit the best spans into the context token budget
+        packed = self.context_packer.pack(spans)
+        
+        # Construct a prompt using the packed documents
+        return {
+            "prompt": self.construct_prompt(query, packed["documents"]),
+            "context_tokens": packed["context_tokens"],
+            "documents_dropped": packed["documents_dropped"],
+            "chunks_merged": chunks_merged
         }
     
+    async def stream_query(self, query: str, collection_name: str, n_results: int = 5) -> AsyncIterator[str]:
+        """
+        Process a query through the RAG pipeline, streaming the answer as server-sent events.
+        
+        A "documents" event with the retrieved documents comes first, followed
+        by a "token" event for each piece of the answer as text-gen produces it
+        and a final "done" event with the timings. Failures are reported as an
+        "error" event. When the answer cache has the answer, it is sent as a
+        single "token" event and the "done" event has "cached" set.
+        
+        Args:
+            query: The query text
+            collection_name: The name of the collection to query
+            n_results: Number of results to return from retrieval
+        
+        Yields:
+            Server-sent events
+        """
+        start_time = time.perf_counter()
+        
+        retrieved = await self.retrieve(query, collection_name, n_results)
+        documents = retrieved["documents"]
+        if not documents:
+            yield format_event("documents", {"documents": [], "context_tokens": 0, "documents_dropped": 0, "chunks_merged": 0})
+            yield format_event("token", {"text": "I couldn't find any relevant information to answer your question."})
+            yield format_event("done", {"ttft_ms": None, "total_ms": round((time.perf_counter() - start_time) * 1000, 1), "cached": False})
+            return
+        
+        # text-gen's streaming endpoint returns only the continuation, unlike
+        # /generate, so streamed answers are cached apart from the others
+        cache_key = self._answer_cache_key(query, collection_name, retrieved, "stream")
+        cached = await self.answer_cache.get(cache_key) if self.answer_cache is not None else None
+        if cached is not None:
+            logger.info(f"Answer cache hit for streamed query: {query}")
+            yield format_event("documents", {
+                "documents": documents,
+                "context_tokens": cached["context_tokens"],
+                "documents_dropped": cached["documents_dropped"],
+                "chunks_merged": cached["chunks_merged"]
+            })
+            ttft_ms = (time.perf_counter() - start_time) * 1000
+            yield format_event("token", {"text": cached["answer"]})
+            yield format_event("done", {
+                "ttft_ms": round(ttft_ms, 1),
+                "text_gen_ttft_ms": None,
+                "total_ms": round((time.perf_counter() - start_time) * 1000, 1),
+                "cached": True
+            })
+            return
+        
+        context = self.prepare_context(query, documents)
+        yield format_event("documents", {
+            "documents": documents,
+            "context_tokens": context["context_tokens"],
+            "documents_dropped": context["documents_dropped"],
+            "chunks_merged": context["chunks_merged"]
+        })
+        
+        ttft_ms = None
+        upstream = {}
+        pieces = []
+        try:
+            async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None)) as client:
+                async with client.stream("POST", f"{self.text_gen_url}/generate/stream", json={"text": context["prompt"]}) as response:
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        logger.error(f"Error streaming text: {body.decode(errors='replace')}")
+                        yield format_event("error", {"error": "Error generating response."})
+                        return
+                    
+                    async for event, data in iter_events(response.aiter_lines()):
+                        if event == "token":
+                            if ttft_ms is None:
+                                ttft_ms = (time.perf_counter() - start_time) * 1000
+                                self.ttft_tracker.record(ttft_ms)
+                            pieces.append(data.get("text", ""))
+                            yield format_event("token", data)
+                        elif event == "done":
+                            upstream = data
+                        elif event == "error":
+                            logger.error(f"Error streaming text: {data.get('error')}")
+                            yield format_event("error", data)
+                            return
+        
+        except Exception as e:
+            logger.error(f"Error streaming text: {str(e)}")
+            yield format_event("error", {"error": str(e)})
+            return
+        
+        if self.answer_cache is not None:
+            await self.answer_cache.set(cache_key, {
+                "answer": "".join(pieces),
+                "context_tokens": context["context_tokens"],
+                "documents_dropped": context["documents_dropped"],
+                "chunks_merged": context["chunks_merged"]
+            })
+        
+        yield format_event("done", {
+            "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+            "text_gen_ttft_ms": upstream.get("ttft_ms"),
+            "total_ms": round((time.perf_counter() - start_time) * 1000, 1),
+            "cached": False
+        })
+    
+    async def retrieve_batch(self, queries: List[str], collection_name: str, n_results: int = 5) -> List[Dict[str, Any]]:
+        """
+        Retrieve relevant documents for several queries in one call.
+        
+        Args:
+            queries: The query texts
+            collection_name: The name of the collection to query
+            n_results: Number of results to return per query
+        
+        Returns:
+            One dictionary per query with the retrieved "documents" and the
+            "collection_version", as returned by `retrieve`
+        """
+        async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None)) as client:
+            response = await client.post(
+                f"{self.retriever_url}/retrieve/batch",
+                json={
+                    "queries": queries,
+                    "collection_name": collection_name,
+                    "n_results": n_results
+                },
+                headers={"Accept": f"{COLUMNAR_CONTENT_TYPE}, application/json"}
+            )
+            
+            if response.status_code != 200:
+                raise RuntimeError(f"Error retrieving documents: {response.text}")
+            
+            if response.headers.get("content-type", "").startswith(COLUMNAR_CONTENT_TYPE):
+                columns = ColumnarResults.decode(response.content)
+                offsets = columns.extra["query_offsets"]
+                return [
+                    {
+                        "documents": columns.to_documents(range(offsets[i], offsets[i + 1])),
+                        "collection_version": result.get("collection_version")
+                    }
+                    for i, result in enumerate(columns.extra["results"])
+                ]
+            
+            return [
+                {"documents": result.get("documents", []), "collection_version": result.get("collection_version")}
+                for result in response.json()["results"]
+            ]
+    
+    async def generate_batch(self, prompts: List[str]) -> List[str]:
+        """
+        Generate text for several prompts with one text generation request.
+        
+        Requests text-gen turns away with 429 or 503 are retried up to
+        `generate_retries` times before the batch fails.
+        
+        Args:
+            prompts: The prompts
+        
+        Returns:
+            The generated texts, in the order of the prompts
+        """
+        async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None)) as client:
+            for attempt in range(self.generate_retries + 1):
+                response = await client.post(f"{self.text_gen_url}/generate/batch", json={"texts": prompts})
+                if response.status_code not in OVERLOADED_STATUSES or attempt == self.generate_retries:
+                    break
+                
+                delay = self._retry_delay(response, attempt)
+                logger.warning(f"Text-gen returned {response.status_code}, retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            
+            if response.status_code != 200:
+                raise RuntimeError(f"Error generating text: {response.text}")
+            
+            return response.json()["generated_texts"]
+    
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        """
+        Pick how long to wait before sending a request text-gen turned away again.
+        
+        Args:
+            response: The 429 or 503 response
+            attempt: Number of the attempt that failed, from 0
+        
+        Returns:
+            The seconds of Retry-After, or an exponential backoff if it is missing
+            or an HTTP date, capped at `generate_max_backoff`
+        """
+        try:
+            delay = float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            delay = 0.5 * 2 ** attempt
+        return min(max(delay, 0.0), self.generate_max_backoff)
+    
+    def _get_batch_semaphore(self) -> asyncio.Semaphore:
+        """
+        Get the semaphore limiting the batch groups in flight, creating it on first use.
+        
+        The orchestrator is built at import time, before the server's event loop
+        runs, and a semaphore is bound to the loop it is first waited on, so it
+        is created inside the running loop, and again for a new loop (e.g. one
+        per test).
+        
+        Returns:
+            The semaphore shared by every batch on the running loop
+        """
+        loop = asyncio.get_running_loop()
+        if self._batch_semaphore is None or self._batch_semaphore_loop is not loop:
+            self._batch_semaphore = asyncio.Semaphore(max(self.batch_concurrency, 1))
+            self._batch_semaphore_loop = loop
+        return self._batch_semaphore
+    
+    async def _process_group(self, start: int, queries: List[str], collection_name: str, n_results: int,
+                             emit: Callable[[Dict[str, Any]], None]):
+        """
+        Run one group of a batch through the RAG pipeline.
+        
+        Queries answered without generation, from the answer cache or for lack
+        of documents, are emitted as soon as the group is retrieved; the others
+        once text-gen answered them.
+        
+        Args:
+            start: Position of the group's first query in the batch
+            queries: The group's query texts
+            collection_name: The name of the collection to query
+            n_results: Number of results to return from retrieval
+            emit: Called with the result of each query, with its "index" in the
+                batch and the "query", or an "error" for every query left if the
+                group failed
+        """
+        emitted = set()
+        
+        def finish(i: int, result: Dict[str, Any]):
+            emitted.add(i)
+            emit({"index": start + i, "query": queries[i], **result})
+        
+        try:
+            async with self._get_batch_semaphore():
+                retrieved = await self.retrieve_batch(queries, collection_name, n_results)
+                
+                pending = []
+                for i, (query, found) in enumerate(zip(queries, retrieved)):
+                    if not found["documents"]:
+                        finish(i, {
+                            "answer": "I couldn't find any relevant information to answer your question.",
+                            "documents": [],
+                            "context_tokens": 0,
+                            "documents_dropped": 0,
+                            "chunks_merged": 0,
+                            "cached": False
+                        })
+                        continue
+                    
+                    cache_key = self._answer_cache_key(query, collection_name, found, "answer")
+                    cached = await self.answer_cache.get(cache_key) if self.answer_cache is not None else None
+                    if cached is not None:
+                        finish(i, {**cached, "documents": found["documents"], "cached": True})
+                        continue
+                    
+                    pending.append((i, cache_key, self.prepare_context(query, found["documents"])))
+                
+                # Every prompt that wasn't answered from the cache goes to text-gen in one request
+                if pending:
+                    answers = await self.generate_batch([context["prompt"] for _, _, context in pending])
+                    for (i, cache_key, context), answer in zip(pending, answers):
+                        result = {
+                            "answer": answer,
+                            "context_tokens": context["context_tokens"],
+                            "documents_dropped": context["documents_dropped"],
+                            "chunks_merged": context["chunks_merged"]
+                        }
+                        if self.answer_cache is not None:
+                            await self.answer_cache.set(cache_key, result)
+                        finish(i, {**result, "documents": retrieved[i]["documents"], "cached": False})
+        except Exception as e:
+            logger.error(f"Error processing batch group at {start}: {str(e)}")
+            for i in range(len(queries)):
+                if i not in emitted:
+                    finish(i, {"error": str(e)})
+    
+    async def process_batch(self, queries: List[str], collection_name: str, n_results: int = 5) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process many queries through the RAG pipeline, yielding results as they complete.
+        
+        Queries are split into groups of `batch_size`. Each group is retrieved
+        with one batched call and generated with one batched text-gen request,
+        and at most `RAG_BATCH_CONCURRENCY` groups, across all batches, are
+        processed at a time. A group is only started once one of the batch's
+        groups in flight finished, so a large batch doesn't queue up a task
+        per group.
+        
+        Args:
+            queries: The query texts
+            collection_name: The name of the collection to query
+            n_results: Number of results to return from retrieval for each query
+        
+        Yields:
+            One result per query, in completion order, with its "index" in `queries`
+        """
+        starts = iter(range(0, len(queries), self.batch_size))
+        # Results of queries, and None whenever a group finished
+        completed: asyncio.Queue = asyncio.Queue()
+        running = set()
+        
+        async def run_group(start: int):
+            try:
+                await self._process_group(start, queries[start:start + self.batch_size], collection_name,
+                                          n_results, completed.put_nowait)
+            finally:
+                completed.put_nowait(None)
+        
+        def start_next_group() -> bool:
+            start = next(starts, None)
+            if start is None:
+                return False
+            task = asyncio.create_task(run_group(start))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            return True
+        
+        in_flight = sum(start_next_group() for _ in range(max(self.batch_concurrency, 1)))
+        try:
+            while in_flight:
+                result = await completed.get()
+                if result is None:
+                    in_flight -= 1
+                    if start_next_group():
+                        in_flight += 1
+                    continue
+                yield result
+        finally:
+            # The client may have gone away; don't keep generating for it
+            for task in list(running):
+                task.cancel()
+    
     async def list_collections(self) -> List[str]:
         """
         List all available collections.
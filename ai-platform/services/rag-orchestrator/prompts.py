@@ -0,0 +1,84 @@
+import os
+import logging
+from typing import Dict, Optional
+
+import jinja2
+
+logger = logging.getLogger("ai_platform.rag_orchestrator")
+
+# Prompt used to answer a question from retrieved context
+RAG_TEMPLATE = """
+        Answer the following question based on the provided context.
+        
+        Context:
+        {% for doc in documents %}
+        {{ doc.text }}
+        {% endfor %}
+        
+        Question: {{ query }}
+        
+        Answer:
+        """
+
+DEFAULT_TEMPLATES = {
+    "rag": RAG_TEMPLATE
+}
+
+
+class PromptRegistry:
+    """
+    Holds the prompt templates, each compiled once when it is registered.
+    """
+    
+    def __init__(self, templates: Optional[Dict[str, str]] = None, template_dir: Optional[str] = None):
+        """
+        Initialize the registry and compile the templates.
+        
+        Args:
+            templates: Mapping of template name to Jinja source; defaults to the built-in templates
+            template_dir: Directory of `<name>.j2` files that add to or override the templates
+        """
+        self.env = jinja2.Environment(
+            autoescape=True,
+            trim_blocks=True,
+            lstrip_blocks=True
+        )
+        self.templates: Dict[str, jinja2.Template] = {}
+        
+        for name, source in (templates if templates is not None else DEFAULT_TEMPLATES).items():
+            self.register(name, source)
+        
+        template_dir = template_dir or os.getenv("PROMPT_TEMPLATE_DIR")
+        if template_dir and os.path.isdir(template_dir):
+            for filename in sorted(os.listdir(template_dir)):
+                if filename.endswith(".j2"):
+                    with open(os.path.join(template_dir, filename)) as f:
+                        self.register(filename[:-3], f.read())
+        
+        logger.info(f"PromptRegistry initialized with templates: {sorted(self.templates)}")
+    
+    def register(self, name: str, source: str):
+        """
+        Compile a template and make it available under a name.
+        
+        Args:
+            name: Name of the template
+            source: Jinja source of the template
+        """
+        self.templates[name] = self.env.from_string(source)
+    
+    def render(self, name: str, **context) -> str:
+        """
+        Render a template.
+        
+        Args:
+            name: Name of the template
+            **context: Variables available to the template
+        
+        Returns:
+            The rendered prompt, with surrounding whitespace removed
+        """
+        template = self.templates.get(name)
+        if template is None:
+            raise KeyError(f"Unknown prompt template: {name}")
+        return template.render(**context).strip()
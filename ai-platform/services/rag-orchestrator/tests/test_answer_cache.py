@@ -0,0 +1,52 @@
+import asyncio
+import os
+import sys
+
+# Add the parent directory to the path so we can import the orchestrator modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from answer_cache import AnswerCache
+
+
+def test_key_depends_on_version_and_retrieved_chunks():
+    cache = AnswerCache()
+    key = cache.make_key("What is RAG?", "docs", "1.3", ["a", "b"])
+
+    # Case, spacing and chunk order don't matter
+    assert cache.make_key("  what is   rag? ", "docs", "1.3", ["b", "a"]) == key
+    # A write to the collection or a different retrieved set does
+    assert cache.make_key("What is RAG?", "docs", "1.4", ["a", "b"]) != key
+    assert cache.make_key("What is RAG?", "docs", "1.3", ["a", "c"]) != key
+    # Without a version nothing is cached
+    assert cache.make_key("What is RAG?", "docs", None, ["a", "b"]) is None
+
+
+def test_memory_tier_hits_and_evicts_least_recently_used():
+    async def run():
+        cache = AnswerCache(capacity=2)
+        keys = [cache.make_key(f"question {i}", "docs", "1.1", ["a"]) for i in range(3)]
+
+        await cache.set(keys[0], {"answer": "zero"})
+        await cache.set(keys[1], {"answer": "one"})
+        assert (await cache.get(keys[0]))["answer"] == "zero"
+
+        # keys[1] is now the least recently used
+        await cache.set(keys[2], {"answer": "two"})
+        assert await cache.get(keys[1]) is None
+        assert (await cache.get(keys[2]))["answer"] == "two"
+        return cache.stats()
+
+    stats = asyncio.run(run())
+    assert stats["memory_hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["entries"] == 2
+
+
+def test_expired_answers_are_misses():
+    async def run():
+        cache = AnswerCache(ttl=0)
+        key = cache.make_key("question", "docs", "1.1", ["a"])
+        await cache.set(key, {"answer": "stale"})
+        return await cache.get(key)
+
+    assert asyncio.run(run()) is None
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+import sys
+import types
+
+import httpx
+
+# Add the parent directory to the path so we can import the orchestrator modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# and the platform root for the shared libraries
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from orchestrator import RAGOrchestrator
+
+
+class WordEncoding:
+    def encode_ordinary_batch(self, texts):
+        return [text.split() for text in texts]
+
+
+class StubOrchestrator(RAGOrchestrator):
+    """Answers retrieval and generation locally, recording the batches it was sent."""
+
+    def __init__(self):
+        super().__init__(retriever_url="http://retriever", text_gen_url="http://text-gen")
+        self.context_packer._encoding = WordEncoding()
+        self.batch_size = 2
+        self.retrieve_batches = []
+        self.generate_batches = []
+
+    async def retrieve_batch(self, queries, collection_name, n_results=5):
+        self.retrieve_batches.append(list(queries))
+        return [
+            {
+                "documents": [] if query == "nothing" else [{"id": f"{query}_chunk_0", "text": f"about {query}", "metadata": {}, "distance": 0.1}],
+                "collection_version": "1.1"
+            }
+            for query in queries
+        ]
+
+    async def generate_batch(self, prompts):
+        self.generate_batches.append(len(prompts))
+        return [f"answer {i}" for i in range(len(prompts))]
+
+
+async def collect(orchestrator, queries):
+    return [result async for result in orchestrator.process_batch(queries, "docs")]
+
+
+def test_batch_groups_queries_and_reuses_cached_answers():
+    orchestrator = StubOrchestrator()
+    queries = ["a", "b", "c", "nothing", "e"]
+
+    first = asyncio.run(collect(orchestrator, queries))
+
+    assert sorted(result["index"] for result in first) == [0, 1, 2, 3, 4]
+    assert sorted(orchestrator.retrieve_batches) == [["a", "b"], ["c", "nothing"], ["e"]]
+    # Queries without documents never reach text-gen
+    assert sorted(orchestrator.generate_batches) == [1, 1, 2]
+    assert not any(result["cached"] for result in first)
+
+    second = asyncio.run(collect(orchestrator, queries))
+
+    assert sorted(orchestrator.generate_batches) == [1, 1, 2]
+    assert all(result["cached"] for result in second if result["query"] != "nothing")
+
+
+def test_failed_group_reports_an_error_per_query():
+    orchestrator = StubOrchestrator()
+
+    async def fail(queries, collection_name, n_results=5):
+        raise RuntimeError("retriever down")
+    orchestrator.retrieve_batch = fail
+
+    results = asyncio.run(collect(orchestrator, ["a", "b", "c"]))
+
+    assert sorted((result["index"], result["error"]) for result in results) == [
+        (0, "retriever down"), (1, "retriever down"), (2, "retriever down")
+    ]
+
+
+def test_queries_are_yielded_as_they_complete_and_groups_started_on_demand():
+    orchestrator = StubOrchestrator()
+    orchestrator.batch_concurrency = 1
+    generate_batch = orchestrator.generate_batch
+
+    async def run():
+        release = asyncio.Event()
+
+        async def slow_generate_batch(prompts):
+            await release.wait()
+            return await generate_batch(prompts)
+        orchestrator.generate_batch = slow_generate_batch
+
+        results = orchestrator.process_batch(["nothing", "a", "b", "c", "d"], "docs")
+        # Answered without generation, so it doesn't wait for the rest of its group
+        first = await results.__anext__()
+        assert (first["index"], first["documents"]) == (0, [])
+        # The next group isn't started before this one is done
+        assert orchestrator.retrieve_batches == [["nothing", "a"]]
+
+        release.set()
+        rest = [result async for result in results]
+        assert [result["index"] for result in rest] == [1, 2, 3, 4]
+        assert orchestrator.retrieve_batches == [["nothing", "a"], ["b", "c"], ["d"]]
+
+    asyncio.run(run())
+
+
+def test_closing_the_stream_cancels_the_groups_in_flight():
+    orchestrator = StubOrchestrator()
+    started = []
+
+    async def never_generate(prompts):
+        started.append(len(prompts))
+        await asyncio.Event().wait()
+    orchestrator.generate_batch = never_generate
+
+    async def run():
+        results = orchestrator.process_batch(["nothing", "a", "b", "c", "d", "e"], "docs")
+        assert (await results.__anext__())["index"] == 0
+        await asyncio.sleep(0)
+        await results.aclose()
+        await asyncio.sleep(0)
+        # Two groups were in flight, the third was never started
+        assert started == [1, 2]
+        assert len(orchestrator.retrieve_batches) == 2
+        assert all(task.done() for task in asyncio.all_tasks() if task is not asyncio.current_task())
+
+    asyncio.run(run())
+
+
+def test_concurrent_batches_share_the_group_limit():
+    # Built outside the event loop, like the service's module-level orchestrator
+    orchestrator = StubOrchestrator()
+    orchestrator.batch_concurrency = 1
+    in_flight = []
+    most_in_flight = []
+    generate_batch = orchestrator.generate_batch
+
+    async def slow_generate_batch(prompts):
+        in_flight.append(len(prompts))
+        most_in_flight.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.pop()
+        return await generate_batch(prompts)
+    orchestrator.generate_batch = slow_generate_batch
+
+    async def run():
+        return await asyncio.gather(
+            collect(orchestrator, ["a", "b", "c", "d"]),
+            collect(orchestrator, ["e", "f", "g", "h"])
+        )
+
+    first, second = asyncio.run(run())
+
+    assert sorted(result["index"] for result in first) == [0, 1, 2, 3]
+    assert sorted(result["index"] for result in second) == [0, 1, 2, 3]
+    assert not any("error" in result for result in first + second)
+    # Four groups across both batches, never more than one generating at a time
+    assert orchestrator.generate_batches == [2, 2, 2, 2]
+    assert max(most_in_flight) == 1
+
+    # A later batch on a new event loop still gets through
+    assert not any("error" in result for result in asyncio.run(collect(orchestrator, ["i", "j", "k"])))
+
+
+def test_groups_text_gen_turns_away_are_retried(monkeypatch):
+    orchestrator = StubOrchestrator()
+    # The real text-gen client, talking to a text-gen that is overloaded at first
+    orchestrator.generate_batch = types.MethodType(RAGOrchestrator.generate_batch, orchestrator)
+    orchestrator.generate_max_backoff = 0.01
+    calls = []
+
+    def text_gen(request):
+        calls.append(json.loads(request.content)["texts"])
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "1"}, json={"detail": "Queue is full"})
+        return httpx.Response(200, json={"generated_texts": [f"answer {i}" for i in range(len(calls[-1]))]})
+
+    client = httpx.AsyncClient
+    monkeypatch.setattr(httpx, "AsyncClient", lambda **kwargs: client(transport=httpx.MockTransport(text_gen), **kwargs))
+
+    results = asyncio.run(collect(orchestrator, ["a", "b"]))
+
+    assert sorted((result["index"], result["answer"]) for result in results) == [(0, "answer 0"), (1, "answer 1")]
+    assert len(calls) == 2 and calls[0] == calls[1]
+
+    # A text-gen that stays overloaded fails the group once the retries are used up
+    calls.clear()
+    orchestrator.generate_retries = 0
+    orchestrator.answer_cache = None
+    results = asyncio.run(collect(orchestrator, ["a", "b"]))
+    assert len(calls) == 1
+    assert all("Queue is full" in result["error"] for result in results)
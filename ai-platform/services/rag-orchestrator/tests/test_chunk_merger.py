@@ -0,0 +1,70 @@
+import os
+import sys
+
+# Add the parent directory to the path so we can import the orchestrator modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunk_merger import ChunkMerger
+
+
+def chunk(doc_id, chunk_id, text, distance):
+    return {
+        "id": f"{doc_id}_chunk_{chunk_id}",
+        "text": text,
+        "metadata": {"id": doc_id, "chunk_id": chunk_id},
+        "distance": distance,
+    }
+
+
+def test_consecutive_chunks_are_stitched_without_overlap():
+    # Each chunk starts with the last 10 characters of the previous one
+    documents = [
+        chunk("doc", 1, "0123456789Second part.", 0.3),
+        chunk("doc", 0, "First part0123456789", 0.2),
+        chunk("doc", 2, "cond part.Third part.", 0.4),
+    ]
+
+    spans, merged = ChunkMerger(chunk_overlap=10).merge(documents)
+
+    assert merged == 2
+    assert len(spans) == 1
+    assert spans[0]["text"] == "First part0123456789Second part.Third part."
+    assert spans[0]["metadata"]["chunk_ids"] == [0, 1, 2]
+    assert spans[0]["distance"] == 0.2
+
+
+def test_truncated_previous_chunk_keeps_the_text_it_lost():
+    # The previous chunk was cut after "01234"; the next one repeats "0123456789"
+    spans, _ = ChunkMerger(chunk_overlap=10).merge([
+        chunk("doc", 0, "First part01234", 0.1),
+        chunk("doc", 1, "0123456789Second part.", 0.2),
+    ])
+
+    assert spans[0]["text"] == "First part0123456789Second part."
+
+
+def test_gaps_and_other_documents_stay_separate_and_are_ordered_by_distance():
+    documents = [
+        chunk("doc", 0, "Alpha.", 0.5),
+        chunk("doc", 2, "Gamma.", 0.1),
+        chunk("other", 0, "Other.", 0.3),
+        {"id": "loose", "text": "No source.", "metadata": {}, "distance": 0.2},
+    ]
+
+    spans, merged = ChunkMerger(chunk_overlap=10).merge(documents)
+
+    assert merged == 0
+    assert [span["text"] for span in spans] == ["Gamma.", "No source.", "Other.", "Alpha."]
+
+
+def test_recorded_overlap_and_offsets_are_used_when_present():
+    # Matching would take all of "abcabc" as repeated; only "abc" was
+    previous = chunk("doc", 0, "xyzabcabc", 0.2)
+    previous["metadata"].update(start_offset=0, end_offset=9, overlap_chars=0)
+    current = chunk("doc", 1, "abcabcdef", 0.1)
+    current["metadata"].update(start_offset=9, end_offset=15, overlap_chars=3)
+
+    spans, _ = ChunkMerger(chunk_overlap=10).merge([previous, current])
+
+    assert spans[0]["text"] == "xyzabcabcabcdef"
+    assert (spans[0]["metadata"]["start_offset"], spans[0]["metadata"]["end_offset"]) == (0, 15)
@@ -0,0 +1,57 @@
+import os
+import sys
+
+# Add the parent directory to the path so we can import the orchestrator modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_packer import ContextPacker
+from prompts import PromptRegistry
+
+
+class WordEncoding:
+    """Counts one token per whitespace-separated word, so budgets are easy to reason about."""
+
+    def encode_ordinary_batch(self, texts):
+        return [text.split() for text in texts]
+
+
+def test_documents_are_packed_best_first_within_budget():
+    packer = ContextPacker(token_budget=6, encoding=WordEncoding())
+    documents = [
+        {"id": "far", "text": "one two three", "distance": 0.9},
+        {"id": "near", "text": "alpha beta gamma", "distance": 0.1},
+        {"id": "mid", "text": "red green blue", "distance": 0.5},
+    ]
+
+    packed = packer.pack(documents)
+
+    assert [doc["id"] for doc in packed["documents"]] == ["near", "mid"]
+    assert packed["context_tokens"] == 6
+    assert packed["documents_dropped"] == 1
+
+
+def test_document_that_does_not_fit_is_trimmed_at_a_sentence_boundary():
+    packer = ContextPacker(token_budget=7, encoding=WordEncoding())
+    documents = [
+        {"id": "a", "text": "short intro here", "distance": 0.1},
+        {"id": "b", "text": "First sentence. Second one! Third sentence is long.", "distance": 0.2},
+        {"id": "c", "text": "never reached", "distance": 0.3},
+    ]
+
+    packed = packer.pack(documents)
+
+    assert [doc["id"] for doc in packed["documents"]] == ["a", "b"]
+    assert packed["documents"][1]["text"] == "First sentence. Second one!"
+    assert packed["documents"][1]["truncated"] is True
+    assert packed["context_tokens"] == 7
+    assert packed["documents_dropped"] == 1
+
+
+def test_rag_template_renders_packed_documents():
+    registry = PromptRegistry()
+
+    prompt = registry.render("rag", query="What is RAG?", documents=[{"text": "RAG retrieves context."}])
+
+    assert prompt.startswith("Answer the following question based on the provided context.")
+    assert "RAG retrieves context." in prompt
+    assert prompt.endswith("Question: What is RAG?\n        \n        Answer:")
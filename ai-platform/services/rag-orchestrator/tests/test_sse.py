@@ -0,0 +1,31 @@
+import asyncio
+import os
+import sys
+
+# Add the platform root to the path so we can import the shared libraries
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from shared.streaming.sse import format_event, iter_events
+
+
+async def lines_of(text):
+    for line in text.split("\n"):
+        yield line
+
+
+async def collect(text):
+    return [event async for event in iter_events(lines_of(text))]
+
+
+def test_formatted_events_parse_back():
+    stream = format_event("documents", {"documents": []}) + format_event("token", {"text": "Hi "}) + format_event("done", {"ttft_ms": 12.5})
+
+    events = asyncio.run(collect(stream))
+
+    assert events == [("documents", {"documents": []}), ("token", {"text": "Hi "}), ("done", {"ttft_ms": 12.5})]
+
+
+def test_unnamed_and_unterminated_events():
+    events = asyncio.run(collect('data: {"a": 1}\n\nevent: token\ndata: {"text": "x"}'))
+
+    assert events == [("message", {"a": 1}), ("token", {"text": "x"})]
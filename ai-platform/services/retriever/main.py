@@ -1,6 +1,9 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Literal
+import json
 import os
 import sys
 
@@ -16,42 +19,189 @@ except ImportError:
     logger.addHandler(handler)
 
 from retriever import Retriever
-
-app = FastAPI()
+from shared.codec.columnar import ColumnarResults, CONTENT_TYPE as COLUMNAR_CONTENT_TYPE, accepts_columnar
 
 # Initialize the retriever
 retriever = Retriever()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await retriever.aclose()
+
+app = FastAPI(lifespan=lifespan)
+
 # Define data models
 class RetrieveRequest(BaseModel):
     query: str
+    collection_name: Optional[str] = None
+    # Query several collections at once; results are merged into one ranking
+    collection_names: Optional[List[str]] = None
+    n_results: int = 5
+    mode: Literal["dense", "lexical", "hybrid"] = "dense"
+
+class RetrieveBatchRequest(BaseModel):
+    queries: List[str]
     collection_name: str
     n_results: int = 5
+    mode: Literal["dense", "lexical", "hybrid"] = "dense"
 
 class CollectionRequest(BaseModel):
     collection_name: str
 
+class DocumentInput(BaseModel):
+    text: str
+    metadata: Optional[Dict[str, Any]] = None
+    id: Optional[str] = None
+
+class DocumentsRequest(BaseModel):
+    documents: List[DocumentInput]
+    collection_name: str
+
+class DeleteDocumentsRequest(BaseModel):
+    ids: Optional[List[str]] = None
+    id_prefix: Optional[str] = None
+    where: Optional[Dict[str, Any]] = None
+
+class MetadataUpdate(BaseModel):
+    id: str
+    metadata: Dict[str, Any]
+
+class MetadataUpdateRequest(BaseModel):
+    updates: List[MetadataUpdate]
+
+class TTLRequest(BaseModel):
+    ttl_seconds: Optional[int] = None
+
 @app.get("/health")
 def read_health():
     """Health check endpoint"""
     return {"status": "ok"}
 
+def encode_result(result: Dict[str, Any], accept: Optional[str]):
+    """
+    Encode a retrieval result as columnar msgpack if the caller asked for it, JSON otherwise.
+    """
+    if not accepts_columnar(accept):
+        return result
+    extra = {key: value for key, value in result.items() if key != "documents"}
+    payload = ColumnarResults.from_documents(result["documents"], extra=extra).encode()
+    return Response(content=payload, media_type=COLUMNAR_CONTENT_TYPE)
+
 @app.post("/retrieve")
-async def retrieve_documents(request: RetrieveRequest):
+async def retrieve_documents(request: RetrieveRequest, http_request: Request):
     """
     Retrieve relevant documents for a query.
+    
+    Internal callers can ask for the columnar encoding with the Accept header.
+    """
+    accept = http_request.headers.get("accept")
+    collection_names = (request.collection_names or []) + ([request.collection_name] if request.collection_name else [])
+    if not collection_names:
+        raise HTTPException(status_code=422, detail="Either collection_name or collection_names is required")
+    
+    try:
+        if request.collection_names:
+            result = await retriever.search_collections(
+                query=request.query,
+                collection_names=collection_names,
+                n_results=request.n_results,
+                mode=request.mode
+            )
+        else:
+            result = await retriever.search(
+                query=request.query,
+                collection_name=request.collection_name,
+                n_results=request.n_results,
+                mode=request.mode
+            )
+        return encode_result(result, accept)
+    except Exception as e:
+        logger.error(f"Error retrieving documents: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/retrieve/batch")
+async def retrieve_documents_batch(request: RetrieveBatchRequest, http_request: Request):
+    """
+    Retrieve relevant documents for several queries with one vector database call per shard.
+    
+    The JSON response has one result per query under "results". In the
+    columnar encoding the documents of all queries are stacked; "query_offsets"
+    in the extras marks where each query's documents start and "results"
+    holds the rest of each result.
     """
     try:
-        documents = await retriever.retrieve(
-            query=request.query,
+        results = await retriever.search_batch(
+            queries=request.queries,
             collection_name=request.collection_name,
-            n_results=request.n_results
+            n_results=request.n_results,
+            mode=request.mode
         )
-        return {"documents": documents}
+        if not accepts_columnar(http_request.headers.get("accept")):
+            return {"results": results}
+        
+        query_offsets = [0]
+        for result in results:
+            query_offsets.append(query_offsets[-1] + len(result["documents"]))
+        extra = {
+            "query_offsets": query_offsets,
+            "results": [{key: value for key, value in result.items() if key != "documents"} for result in results]
+        }
+        documents = [doc for result in results for doc in result["documents"]]
+        payload = ColumnarResults.from_documents(documents, extra=extra).encode()
+        return Response(content=payload, media_type=COLUMNAR_CONTENT_TYPE)
     except Exception as e:
         logger.error(f"Error retrieving documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/collections")
+async def create_collection(request: CollectionRequest):
+    """
+    Create a collection on every vector database shard.
+    """
+    try:
+        result = await retriever.create_collection(request.collection_name)
+        if not result["success"]:
+            raise HTTPException(status_code=500, detail=result["error"])
+        return result["result"]
+    except Exception as e:
+        logger.error(f"Error creating collection: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/documents")
+async def add_documents(request: DocumentsRequest):
+    """
+    Add documents to a collection, routing each one to the shard that owns it.
+    """
+    try:
+        result = await retriever.add_documents(
+            collection_name=request.collection_name,
+            documents=[doc.dict() for doc in request.documents]
+        )
+        if not result["success"]:
+            raise HTTPException(status_code=500, detail=result["error"])
+        return result["result"]
+    except Exception as e:
+        logger.error(f"Error adding documents: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/cache/stats")
+def cache_stats():
+    """
+    Report the semantic cache hit rate and the vector DB latency it saved.
+    """
+    if retriever.semantic_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **retriever.semantic_cache.stats()}
+
+@app.post("/cache/invalidate")
+def invalidate_cache(request: CollectionRequest):
+    """
+    Drop the cached results of a collection that was written to without going through the retriever.
+    """
+    retriever.invalidate_cache(request.collection_name)
+    return {"message": f"Cache for collection '{request.collection_name}' invalidated"}
+
 @app.get("/collections")
 async def list_collections():
     """
@@ -64,6 +214,106 @@ async def list_collections():
         logger.error(f"Error listing collections: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def write_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Unwrap the result of a write sent to the shards, failing with the status the first failing shard returned.
+    """
+    if not result["success"]:
+        raise HTTPException(status_code=result.get("status_code", 500), detail=result["error"])
+    return result["result"]
+
+@app.get("/collections/{collection_name}/scan")
+async def scan_collection(
+    collection_name: str,
+    cursor: Optional[str] = None,
+    page_size: int = 500,
+    limit: Optional[int] = None,
+    where: Optional[str] = None,
+    where_document: Optional[str] = None,
+    include_embeddings: bool = False
+):
+    """
+    Stream the records of a collection from every shard as NDJSON.
+    
+    The lines are those of the vector database scan; the {"next_cursor": ...}
+    tokens resume across shards and are only valid with this service.
+    """
+    if page_size < 1 or page_size > 10000:
+        raise HTTPException(status_code=400, detail="page_size must be between 1 and 10000")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    try:
+        retriever.decode_scan_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    records = retriever.scan(
+        collection_name,
+        cursor=cursor,
+        limit=limit,
+        page_size=page_size,
+        where=where,
+        where_document=where_document,
+        include_embeddings=include_embeddings
+    )
+    
+    async def generate():
+        try:
+            async for item in records:
+                yield json.dumps(item) + "\n"
+        except Exception as e:
+            logger.error(f"Error scanning collection: {str(e)}")
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.delete("/collections/{collection_name}")
+async def delete_collection(collection_name: str):
+    """
+    Delete a collection from every shard.
+    """
+    return write_result(await retriever.delete_collection(collection_name))
+
+@app.post("/collections/{collection_name}/documents/delete")
+async def delete_documents(collection_name: str, request: DeleteDocumentsRequest):
+    """
+    Delete documents by ID, ID prefix and/or metadata match from the shards that may hold them.
+    """
+    if request.ids is None and request.id_prefix is None and request.where is None:
+        raise HTTPException(status_code=400, detail="At least one of ids, id_prefix or where is required")
+    return write_result(await retriever.delete_documents(
+        collection_name,
+        ids=request.ids,
+        id_prefix=request.id_prefix,
+        where=request.where
+    ))
+
+@app.post("/collections/{collection_name}/documents/metadata")
+async def update_documents_metadata(collection_name: str, request: MetadataUpdateRequest):
+    """
+    Merge metadata fields into documents, each on the shard that owns it.
+    """
+    return write_result(await retriever.update_metadata(
+        collection_name,
+        [update.dict() for update in request.updates]
+    ))
+
+@app.put("/collections/{collection_name}/ttl")
+async def set_collection_ttl(collection_name: str, request: TTLRequest):
+    """
+    Set the time-to-live of a collection's documents on every shard, or clear it with null.
+    """
+    if request.ttl_seconds is not None and request.ttl_seconds < 0:
+        raise HTTPException(status_code=400, detail="ttl_seconds must not be negative")
+    return write_result(await retriever.set_collection_ttl(collection_name, request.ttl_seconds))
+
+@app.post("/collections/{collection_name}/compact", status_code=202)
+async def compact_collection(collection_name: str):
+    """
+    Schedule the compaction of a collection on every shard.
+    """
+    return write_result(await retriever.compact_collection(collection_name))
+
 @app.get("/collections/{collection_name}")
 async def get_collection_info(collection_name: str):
     """
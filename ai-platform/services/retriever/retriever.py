@@ -1,26 +1,630 @@
 import httpx
+import asyncio
+import base64
+import heapq
+import json
 import logging
 import os
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from typing import List, Dict, Any, Optional, Callable, AsyncIterator, Tuple
+from shard_map import Shard, ShardMap
+from semantic_cache import SemanticCache
+from shared.codec.columnar import ColumnarResults, CONTENT_TYPE as COLUMNAR_CONTENT_TYPE
 
 logger = logging.getLogger("ai_platform.retriever")
 
+# Constant of the reciprocal rank fusion of sharded hybrid queries, the same
+# vector-db uses so scores don't depend on how a collection is sharded
+RRF_K = 60
+
 class Retriever:
     """
     A class to handle document retrieval from the vector database.
+    
+    Collections may be hash-partitioned by chunk ID across several vector
+    database shards. Reads fan out to every shard and are merged, writes are
+    routed to the primary of the shard that owns each chunk.
+    
+    When a semantic cache is enabled, queries whose embedding is close enough
+    to a recently answered one are served from the cache, as long as the
+    collection's version hasn't changed since, without running the query
+    on the vector database.
     """
     
-    def __init__(self, vector_db_url=None):
+    def __init__(self, vector_db_url=None, replica_urls=None, shard_map=None,
+                 semantic_cache: Optional[SemanticCache] = None,
+                 embed_query: Optional[Callable[[str], Any]] = None,
+                 version_ttl: Optional[float] = None):
         """
         Initialize the Retriever with the vector database URL.
         
         Args:
-            vector_db_url: URL of the vector database service
+            vector_db_url: URL of the primary vector database service, which takes all writes
+            replica_urls: URLs of read-only vector database replicas that serve reads
+            shard_map: ShardMap to use instead of the one configured in the environment
+            semantic_cache: SemanticCache to use instead of the one configured in the environment
+            embed_query: Function that embeds a query for the semantic cache; defaults to
+                a SentenceTransformer model loaded on first use
+            version_ttl: Seconds a collection's version is reused for semantic cache
+                lookups before it is fetched again; 0 fetches it on every lookup
+        """
+        self.shard_map = shard_map or ShardMap.from_env(vector_db_url, replica_urls)
+        self.vector_db_url = self.shard_map.shards[0].primary_url
+        # Multiple of n_results fetched from every shard for each ranking a sharded hybrid query fuses
+        self.hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", "4"))
+        
+        if semantic_cache is None and os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true":
+            semantic_cache = SemanticCache(
+                capacity=int(os.getenv("SEMANTIC_CACHE_SIZE", "256")),
+                threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+                ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "300")) or None
+            )
+        self.semantic_cache = semantic_cache
+        self.embedding_model_name = os.getenv("SEMANTIC_CACHE_MODEL", "all-MiniLM-L6-v2")
+        self._embed_query = embed_query
+        
+        # Versions checked by cache lookups, kept briefly so a hit doesn't cost
+        # a round trip to every shard; dropped on this service's own writes
+        if version_ttl is None:
+            version_ttl = float(os.getenv("SEMANTIC_CACHE_VERSION_TTL", "1"))
+        self.version_ttl = version_ttl
+        self._collection_versions: Dict[str, Tuple[str, float]] = {}
+        self._embedding_model = None
+        self._embedding_lock = threading.Lock()
+        
+        # One connection pool shared by every request to the vector database
+        self.max_connections = int(os.getenv("VECTOR_DB_MAX_CONNECTIONS", "100"))
+        self._client = None
+        self._client_loop = None
+        
+        logger.info(f"Retriever initialized with {len(self.shard_map)} vector DB shards: {self.shard_map.shards}")
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        Get the shared HTTP client, creating it on first use.
+        
+        The pool is bound to the event loop it was created on, so a new loop
+        (e.g. one per test) gets a fresh client.
+        
+        Returns:
+            The shared HTTP client
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+            self._client_loop = loop
+        return self._client
+    
+    async def aclose(self):
+        """
+        Close the shared HTTP client.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._client_loop = None
+    
+    def _embed(self, query: str):
+        """
+        Embed a query for the semantic cache, loading the model on first use.
+        
+        Args:
+            query: The query text
+        
+        Returns:
+            The query embedding
+        """
+        if self._embed_query is not None:
+            return self._embed_query(query)
+        
+        with self._embedding_lock:
+            if self._embedding_model is None:
+                from sentence_transformers import SentenceTransformer
+                self._embedding_model = SentenceTransformer(self.embedding_model_name)
+                logger.info(f"Loaded semantic cache embedding model {self.embedding_model_name}")
+        
+        return self._embedding_model.encode(query, normalize_embeddings=True)
+    
+    def invalidate_cache(self, collection_name: str):
+        """
+        Drop the cached results of a collection, e.g. after it was written to directly.
+        
+        Args:
+            collection_name: The name of the collection
+        """
+        self._collection_versions.pop(collection_name, None)
+        if self.semantic_cache is not None:
+            self.semantic_cache.invalidate(collection_name)
+    
+    async def _read(self, client: httpx.AsyncClient, shard: Shard, method: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Send a read request to one of a shard's replicas, falling back to its primary if the replica is unreachable.
+        
+        Args:
+            client: The HTTP client to use
+            shard: The shard to read from
+            method: HTTP method
+            path: Path on the vector database service
+            **kwargs: Extra arguments for the request
+        
+        Returns:
+            The HTTP response
+        """
+        url = shard.read_url()
+        
+        if url == shard.primary_url:
+            return await client.request(method, f"{url}{path}", **kwargs)
+        
+        try:
+            response = await client.request(method, f"{url}{path}", **kwargs)
+            if response.status_code < 500:
+                return response
+            logger.warning(f"Replica {url} returned {response.status_code}, falling back to primary")
+        except httpx.HTTPError as e:
+            logger.warning(f"Replica {url} unreachable ({str(e)}), falling back to primary")
+        
+        return await client.request(method, f"{shard.primary_url}{path}", **kwargs)
+    
+    async def _query_shard(self, client: httpx.AsyncClient, shard: Shard, query: str,
+                           collection_name: str, n_results: int, mode: str = "dense") -> ColumnarResults:
+        """
+        Query a single shard.
+        
+        The columnar encoding is requested so the results can be merged without
+        decoding every row; JSON answers from older shards are accepted too.
+        
+        Args:
+            client: The HTTP client to use
+            shard: The shard to query
+            query: The query text
+            collection_name: The name of the collection to query
+            n_results: Number of results to return
+            mode: "dense", "lexical" or "hybrid"
+        
+        Returns:
+            The shard's results in columnar form
+        """
+        response = await self._read(
+            client,
+            shard,
+            "POST",
+            "/query",
+            json={
+                "query_text": query,
+                "collection_name": collection_name,
+                "n_results": n_results,
+                "mode": mode
+            },
+            headers={"Accept": f"{COLUMNAR_CONTENT_TYPE}, application/json"}
+        )
+        
+        if response.status_code != 200:
+            raise RuntimeError(f"Shard {shard.name} returned {response.status_code}: {response.text}")
+        
+        if response.headers.get("content-type", "").startswith(COLUMNAR_CONTENT_TYPE):
+            return ColumnarResults.decode(response.content)
+        payload = response.json()
+        columns = ColumnarResults.from_chroma(payload)
+        if payload.get("collection_version") is not None:
+            columns.extra["collection_version"] = payload["collection_version"]
+        return columns
+    
+    async def _collection_version(self, client: httpx.AsyncClient, collection_name: str) -> Optional[str]:
+        """
+        Get the current version of a collection, combined across its shards like `search` does.
+        
+        Args:
+            client: The HTTP client to use
+            collection_name: The name of the collection
+        
+        Returns:
+            The collection version, or None if some shard didn't report one
+        """
+        async def shard_version(shard: Shard) -> Optional[str]:
+            response = await self._read(client, shard, "GET", f"/collections/{collection_name}")
+            if response.status_code != 200:
+                return None
+            return response.json().get("version")
+        
+        try:
+            versions = await asyncio.gather(*[shard_version(shard) for shard in self.shard_map.shards])
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not get the version of collection '{collection_name}': {str(e)}")
+            return None
+        if not all(version is not None for version in versions):
+            return None
+        return "|".join(versions)
+    
+    async def _current_version(self, client: httpx.AsyncClient, collection_name: str) -> Tuple[Optional[str], float]:
+        """
+        Get the version of a collection for a cache lookup, reusing it for `version_ttl` seconds.
+        
+        Writes that bypass this service can go unnoticed for that long.
+        
+        Args:
+            client: The HTTP client to use
+            collection_name: The name of the collection
+        
+        Returns:
+            The collection version (None if unknown) and the milliseconds spent
+            fetching it, 0 when it was reused
+        """
+        cached = self._collection_versions.get(collection_name)
+        if cached is not None and time.monotonic() - cached[1] < self.version_ttl:
+            return cached[0], 0.0
+        
+        start_time = time.perf_counter()
+        version = await self._collection_version(client, collection_name)
+        fetch_ms = (time.perf_counter() - start_time) * 1000
+        if version is not None:
+            self._collection_versions[collection_name] = (version, time.monotonic())
+        return version, fetch_ms
+    
+    def _shard_modes(self, mode: str, n_results: int) -> Tuple[List[str], int]:
         """
-        self.vector_db_url = vector_db_url or os.getenv("VECTOR_DB_SERVICE_URL", "http://vector-db:8000")
-        logger.info(f"Retriever initialized with vector DB URL: {self.vector_db_url}")
+        Choose what to ask every shard for a query in the given mode.
+        
+        A shard fuses hybrid results among its own documents only, so the fused
+        scores of different shards don't compare: every shard's best hit
+        scores 2/61. With several shards, hybrid queries fetch the dense and
+        lexical rankings of every shard instead and fuse them here.
+        
+        Args:
+            mode: "dense", "lexical" or "hybrid"
+            n_results: Number of results the query returns
+        
+        Returns:
+            The modes to query every shard with, and the number of results to
+            ask each of those queries for
+        """
+        if mode == "hybrid" and len(self.shard_map) > 1:
+            return ["dense", "lexical"], n_results * self.hybrid_candidates
+        return [mode], n_results
+    
+    def _is_approximate(self, mode: str) -> bool:
+        """
+        Check whether results of a query in the given mode compare BM25 scores of different shards.
+        
+        Each shard computes its IDF from its own documents, so the same match
+        can score differently depending on the shard that holds it.
+        """
+        return mode != "dense" and len(self.shard_map) > 1
+    
+    def _collect_shards(self, results: List[Any], modes: List[str]) -> Tuple[Dict[str, List[ColumnarResults]], List[str]]:
+        """
+        Sort the answers of a fan-out by mode, dropping the shards that failed.
+        
+        Args:
+            results: The answers or exceptions of every shard, with one entry per
+                mode for each shard, in the order of the shard map
+            modes: The modes every shard was queried with
+        
+        Returns:
+            The answers of the shards that succeeded by mode, and the names of
+            the shards that failed
+        """
+        candidates: Dict[str, List[ColumnarResults]] = {shard_mode: [] for shard_mode in modes}
+        failed_shards = []
+        for i, shard in enumerate(self.shard_map.shards):
+            answers = results[i * len(modes):(i + 1) * len(modes)]
+            errors = [answer for answer in answers if isinstance(answer, BaseException)]
+            if errors:
+                logger.error(f"Error querying shard {shard.name}: {str(errors[0])}")
+                failed_shards.append(shard.name)
+                continue
+            for shard_mode, answer in zip(modes, answers):
+                candidates[shard_mode].append(answer)
+        return candidates, failed_shards
+    
+    def _top_documents(self, merged: Dict[str, ColumnarResults], rows: Dict[str, Optional[List[int]]],
+                       n_results: int, mode: str) -> List[Dict[str, Any]]:
+        """
+        Rank the stacked answers of every shard into a global top-k.
+        
+        Every shard returns its own top-k, so the global top-k is among them.
+        Dense results rank by distance, lexical ones by score. The dense and
+        lexical rankings of a sharded hybrid query are each ranked globally
+        first, then fused with reciprocal rank fusion. Only the winning rows
+        are decoded into documents.
+        
+        Args:
+            merged: The stacked answers, by the mode the shards were queried with
+            rows: The rows of the current query in each of them; all rows if None
+            n_results: Number of results to return
+            mode: The mode of the query
+        
+        Returns:
+            The best documents, best first
+        """
+        if mode in merged:
+            results = merged[mode]
+            by = "distance" if mode == "dense" else "score"
+            return results.to_documents(results.top_k(n_results, by=by, rows=rows[mode]))
+        
+        scores, sources = {}, {}
+        for ranking_mode, by in (("dense", "distance"), ("lexical", "score")):
+            results = merged[ranking_mode]
+            ranked = results.top_k(n_results * self.hybrid_candidates, by=by, rows=rows[ranking_mode])
+            for rank, row in enumerate(ranked):
+                doc_id = results.ids[row]
+                scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+                # The dense ranking goes first, so chunks found by both keep their distance
+                sources.setdefault(doc_id, (results, row))
+        
+        documents = []
+        for doc_id in sorted(scores, key=scores.get, reverse=True)[:n_results]:
+            results, row = sources[doc_id]
+            document = results.to_documents([row])[0]
+            document["score"] = scores[doc_id]
+            documents.append(document)
+        return documents
+    
+    async def search(self, query: str, collection_name: str, n_results: int = 5, mode: str = "dense") -> Dict[str, Any]:
+        """
+        Query every shard concurrently and merge the results into a global top-k.
+        
+        Args:
+            query: The query text
+            collection_name: The name of the collection to query
+            n_results: Number of results to return
+            mode: "dense" for vector search, "lexical" for BM25, or "hybrid" to fuse both
+        
+        Returns:
+            Dictionary with the merged "documents", a "partial" flag that is set
+            when some shards failed, the names of the "failed_shards", an
+            "approximate" flag that is set when the ranking compared BM25
+            scores of different shards (see `_top_documents`), the
+            "collection_version" (None if not every shard reported one), and a
+            "cached" flag that is set when the semantic cache answered
+        """
+        client = self._get_client()
+        embedding = None
+        if self.semantic_cache is not None:
+            try:
+                # Only entries computed at the collection's current version are
+                # served, so writes that bypass this service are hidden for at
+                # most `version_ttl` seconds
+                embedding, (version, fetch_ms) = await asyncio.gather(
+                    asyncio.to_thread(self._embed, query),
+                    self._current_version(client, collection_name)
+                )
+                cached = None
+                if version is not None:
+                    cached = self.semantic_cache.lookup(collection_name, embedding, n_results, mode, version=version,
+                                                        overhead_ms=fetch_ms)
+                if cached is not None:
+                    logger.info(f"Semantic cache hit for query: {query}")
+                    return {**cached, "cached": True}
+            except Exception as e:
+                logger.warning(f"Semantic cache lookup failed, querying the vector DB: {str(e)}")
+                embedding = None
+        
+        start_time = time.perf_counter()
+        modes, shard_n_results = self._shard_modes(mode, n_results)
+        results = await asyncio.gather(
+            *[
+                self._query_shard(client, shard, query, collection_name, shard_n_results, shard_mode)
+                for shard in self.shard_map.shards
+                for shard_mode in modes
+            ],
+            return_exceptions=True
+        )
+        candidates, failed_shards = self._collect_shards(results, modes)
+        
+        merged = {shard_mode: ColumnarResults.concat(parts) for shard_mode, parts in candidates.items()}
+        documents = self._top_documents(merged, {shard_mode: None for shard_mode in modes}, n_results, mode)
+        
+        # The collection's version is the combination of its shards' versions
+        versions = [part.extra.get("collection_version") for part in candidates[modes[0]]]
+        collection_version = None
+        if not failed_shards and versions and all(version is not None for version in versions):
+            collection_version = "|".join(versions)
+        
+        logger.info(f"Retrieved {len(documents)} documents from {len(self.shard_map) - len(failed_shards)}/{len(self.shard_map)} shards for query: {query}")
+        result = {
+            "documents": documents,
+            "partial": len(failed_shards) > 0,
+            "failed_shards": failed_shards,
+            "approximate": self._is_approximate(mode),
+            "collection_version": collection_version
+        }
+        
+        # Partial results are not cached so a recovered shard is picked up right
+        # away, nor are results whose version can't be checked on a hit
+        if embedding is not None and collection_version is not None:
+            self._collection_versions[collection_name] = (collection_version, time.monotonic())
+            latency_ms = (time.perf_counter() - start_time) * 1000
+            self.semantic_cache.store(collection_name, embedding, n_results, result, mode, latency_ms,
+                                      version=collection_version)
+        
+        return {**result, "cached": False}
+    
+    async def _query_shard_batch(self, client: httpx.AsyncClient, shard: Shard, queries: List[str],
+                                 collection_name: str, n_results: int, mode: str = "dense") -> ColumnarResults:
+        """
+        Query a single shard with several texts in one request.
+        
+        Returns:
+            The shard's results in columnar form, with the rows of every query
+            stacked and marked by `query_rows`
+        """
+        response = await self._read(
+            client,
+            shard,
+            "POST",
+            "/query/batch",
+            json={
+                "query_texts": queries,
+                "collection_name": collection_name,
+                "n_results": n_results,
+                "mode": mode
+            },
+            headers={"Accept": f"{COLUMNAR_CONTENT_TYPE}, application/json"}
+        )
+        
+        if response.status_code != 200:
+            raise RuntimeError(f"Shard {shard.name} returned {response.status_code}: {response.text}")
+        
+        if response.headers.get("content-type", "").startswith(COLUMNAR_CONTENT_TYPE):
+            return ColumnarResults.decode(response.content)
+        payload = response.json()
+        columns = ColumnarResults.from_chroma_batch(payload)
+        if payload.get("collection_version") is not None:
+            columns.extra["collection_version"] = payload["collection_version"]
+        return columns
+    
+    async def search_batch(self, queries: List[str], collection_name: str, n_results: int = 5,
+                           mode: str = "dense") -> List[Dict[str, Any]]:
+        """
+        Run several queries against a collection with one request per shard.
+        
+        Dense queries are embedded and searched as one batch on every shard,
+        which costs far less than a request per query. The semantic cache is
+        not consulted: batches come from offline jobs that rarely repeat.
+        
+        Args:
+            queries: The query texts
+            collection_name: The name of the collection to query
+            n_results: Number of results to return per query
+            mode: "dense" for vector search, "lexical" for BM25, or "hybrid" to fuse both
+        
+        Returns:
+            One result per query, shaped like the result of `search`
+        """
+        if not queries:
+            return []
+        
+        client = self._get_client()
+        modes, shard_n_results = self._shard_modes(mode, n_results)
+        results = await asyncio.gather(
+            *[
+                self._query_shard_batch(client, shard, queries, collection_name, shard_n_results, shard_mode)
+                for shard in self.shard_map.shards
+                for shard_mode in modes
+            ],
+            return_exceptions=True
+        )
+        candidates, failed_shards = self._collect_shards(results, modes)
+        
+        versions = [part.extra.get("collection_version") for part in candidates[modes[0]]]
+        collection_version = None
+        if not failed_shards and versions and all(version is not None for version in versions):
+            collection_version = "|".join(versions)
+        
+        # Stack the shards, then rank each query among its own rows of every shard
+        merged = {shard_mode: ColumnarResults.concat(parts) for shard_mode, parts in candidates.items()}
+        bases = {}
+        for shard_mode, parts in candidates.items():
+            bases[shard_mode] = [0]
+            for part in parts:
+                bases[shard_mode].append(bases[shard_mode][-1] + len(part))
+        
+        batch = []
+        for query_index in range(len(queries)):
+            rows = {
+                shard_mode: [
+                    base + row
+                    for base, part in zip(bases[shard_mode], parts)
+                    for row in part.query_rows(query_index)
+                ]
+                for shard_mode, parts in candidates.items()
+            }
+            batch.append({
+                "documents": self._top_documents(merged, rows, n_results, mode),
+                "partial": len(failed_shards) > 0,
+                "failed_shards": failed_shards,
+                "approximate": self._is_approximate(mode),
+                "collection_version": collection_version,
+                "cached": False
+            })
+        
+        logger.info(f"Retrieved documents for a batch of {len(queries)} queries from {len(self.shard_map) - len(failed_shards)}/{len(self.shard_map)} shards")
+        return batch
+    
+    async def search_collections(self, query: str, collection_names: List[str], n_results: int = 5,
+                                 mode: str = "dense") -> Dict[str, Any]:
+        """
+        Query several collections concurrently and merge the results into one top-k.
+        
+        Chunks that appear in more than one collection are returned once, from
+        the collection that ranked them best.
+        
+        Args:
+            query: The query text
+            collection_names: The names of the collections to query
+            n_results: Number of results to return
+            mode: "dense" for vector search, "lexical" for BM25, or "hybrid" to fuse both
+        
+        Returns:
+            Dictionary with the merged "documents", each tagged with its
+            "collection", the "partial" and "approximate" flags and
+            "failed_shards" as in `search`, a "collection_version" combining
+            those of every collection, and per-collection "timings" in
+            milliseconds
+        """
+        collection_names = list(dict.fromkeys(collection_names))
+        
+        async def timed_search(collection_name):
+            start_time = time.perf_counter()
+            result = await self.search(query, collection_name, n_results, mode)
+            return result, (time.perf_counter() - start_time) * 1000
+        
+        results = await asyncio.gather(*[timed_search(name) for name in collection_names])
+        
+        if mode == "dense":
+            rank = lambda doc: doc["distance"] if doc["distance"] is not None else float("inf")
+        else:
+            rank = lambda doc: -doc.get("score", 0.0)
+        
+        # Each collection's results are already sorted, so a heap merge yields the
+        # global order and stops as soon as k distinct chunks have been seen
+        ranked = heapq.merge(
+            *[
+                [{**doc, "collection": name} for doc in result["documents"]]
+                for name, (result, _) in zip(collection_names, results)
+            ],
+            key=rank
+        )
+        documents, seen_ids = [], set()
+        for doc in ranked:
+            if doc["id"] in seen_ids:
+                continue
+            seen_ids.add(doc["id"])
+            documents.append(doc)
+            if len(documents) == n_results:
+                break
+        
+        failed_shards = sorted({shard for result, _ in results for shard in result["failed_shards"]})
+        versions = [result.get("collection_version") for result, _ in results]
+        collection_version = None
+        if all(version is not None for version in versions):
+            collection_version = ",".join(f"{name}={version}" for name, version in zip(collection_names, versions))
+        
+        return {
+            "documents": documents,
+            "partial": any(result["partial"] for result, _ in results),
+            "failed_shards": failed_shards,
+            "approximate": any(result.get("approximate", False) for result, _ in results),
+            "collection_version": collection_version,
+            "timings": {
+                name: {
+                    "time_ms": round(time_ms, 2),
+                    "documents": len(result["documents"]),
+                    "cached": result.get("cached", False),
+                    "partial": result["partial"],
+                    "collection_version": result.get("collection_version")
+                }
+                for name, (result, time_ms) in zip(collection_names, results)
+            }
+        }
     
-    async def retrieve(self, query: str, collection_name: str, n_results: int = 5) -> List[Dict[str, Any]]:
+    async def retrieve(self, query: str, collection_name: str, n_results: int = 5, mode: str = "dense") -> List[Dict[str, Any]]:
         """
         Retrieve relevant documents for a query from the vector database.
         
@@ -28,50 +632,381 @@ class Retriever:
             query: The query text
             collection_name: The name of the collection to query
             n_results: Number of results to return
-            
+            mode: "dense", "lexical" or "hybrid"
+        
         Returns:
             List of retrieved documents with their metadata
         """
         try:
-            async with httpx.AsyncClient() as client:
-                # Query the vector database
-                response = await client.post(
-                    f"{self.vector_db_url}/query",
-                    json={
-                        "query_text": query,
-                        "collection_name": collection_name,
-                        "n_results": n_results
-                    }
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Error querying vector DB: {response.text}")
-                    return []
-                
-                # Process the response
-                result = response.json()
-                
-                # Format the results into a more usable structure
-                documents = []
-                
-                # Check if we have results
-                if "ids" in result and len(result["ids"]) > 0:
-                    for i in range(len(result["ids"][0])):
-                        doc = {
-                            "id": result["ids"][0][i],
-                            "text": result["documents"][0][i],
-                            "metadata": result["metadatas"][0][i] if "metadatas" in result else {},
-                            "distance": result["distances"][0][i] if "distances" in result else None
-                        }
-                        documents.append(doc)
-                
-                logger.info(f"Retrieved {len(documents)} documents for query: {query}")
-                return documents
-                
+            result = await self.search(query, collection_name, n_results, mode)
+            return result["documents"]
         except Exception as e:
             logger.error(f"Error retrieving documents: {str(e)}")
             return []
     
+    async def create_collection(self, collection_name: str) -> Dict[str, Any]:
+        """
+        Create a collection on every shard.
+        
+        Args:
+            collection_name: The name of the collection
+        
+        Returns:
+            Result of the operation
+        """
+        try:
+            client = self._get_client()
+            responses = await asyncio.gather(
+                *[
+                    client.post(f"{shard.primary_url}/collections", json={"collection_name": collection_name})
+                    for shard in self.shard_map.shards
+                ]
+            )
+            
+            for shard, response in zip(self.shard_map.shards, responses):
+                if response.status_code != 200:
+                    logger.error(f"Error creating collection on shard {shard.name}: {response.text}")
+                    return {"success": False, "error": response.text}
+            
+            return {"success": True, "result": {"message": f"Collection '{collection_name}' created successfully"}}
+        
+        except Exception as e:
+            logger.error(f"Error creating collection: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def add_documents(self, collection_name: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Add documents to a collection. Each document is written to the primary of the shard that owns its ID.
+        
+        Args:
+            collection_name: The name of the collection
+            documents: List of documents with text, metadata, and ID
+        
+        Returns:
+            Result of the operation
+        """
+        try:
+            partitions = self.shard_map.partition(documents)
+            
+            try:
+                client = self._get_client()
+                responses = await asyncio.gather(
+                    *[
+                        client.post(
+                            f"{self.shard_map.get(name).primary_url}/documents",
+                            json={
+                                "documents": shard_documents,
+                                "collection_name": collection_name
+                            }
+                        )
+                        for name, shard_documents in partitions.items()
+                    ]
+                )
+            finally:
+                # Drop cached results even if some shards failed, since others may have accepted the write
+                self.invalidate_cache(collection_name)
+            
+            for name, response in zip(partitions, responses):
+                if response.status_code != 200:
+                    logger.error(f"Error adding documents to shard {name}: {response.text}")
+                    return {"success": False, "error": response.text}
+            
+            return {
+                "success": True,
+                "result": {"message": f"Added {len(documents)} documents to collection '{collection_name}'"}
+            }
+        
+        except Exception as e:
+            logger.error(f"Error adding documents: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def _write_primaries(self, method: str, path: str, bodies: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send a write to the primaries of several shards concurrently.
+        
+        Args:
+            method: HTTP method
+            path: Path on the vector database service
+            bodies: Mapping of shard name to the JSON body sent to it, or None for no body
+        
+        Returns:
+            {"success": True, "responses": {shard name: response}}, or
+            {"success": False, "status_code": ..., "error": ...} for the first
+            shard that didn't accept the write
+        """
+        client = self._get_client()
+        names = list(bodies)
+        responses = await asyncio.gather(
+            *[
+                client.request(
+                    method,
+                    f"{self.shard_map.get(name).primary_url}{path}",
+                    **({"json": bodies[name]} if bodies[name] is not None else {})
+                )
+                for name in names
+            ]
+        )
+        
+        for name, response in zip(names, responses):
+            if response.status_code >= 300:
+                logger.error(f"Error writing {path} to shard {name}: {response.text}")
+                return {"success": False, "status_code": response.status_code, "error": response.text}
+        
+        return {"success": True, "responses": dict(zip(names, responses))}
+    
+    def _all_shards(self, body: Any = None) -> Dict[str, Any]:
+        """The same request body for every shard."""
+        return {shard.name: body for shard in self.shard_map.shards}
+    
+    async def delete_collection(self, collection_name: str) -> Dict[str, Any]:
+        """
+        Delete a collection from every shard.
+        
+        Args:
+            collection_name: The name of the collection
+        
+        Returns:
+            Result of the operation
+        """
+        try:
+            try:
+                written = await self._write_primaries("DELETE", f"/collections/{collection_name}", self._all_shards())
+            finally:
+                self.invalidate_cache(collection_name)
+            if not written["success"]:
+                return written
+            return {"success": True, "result": {"message": f"Collection '{collection_name}' deleted successfully"}}
+        
+        except Exception as e:
+            logger.error(f"Error deleting collection: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def delete_documents(self, collection_name: str, ids: Optional[List[str]] = None,
+                               id_prefix: Optional[str] = None,
+                               where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Delete documents by ID, ID prefix and/or metadata match on every shard that may hold them.
+        
+        Criteria are combined with AND, so IDs only go to the shards that own
+        them; without IDs every shard is asked.
+        
+        Args:
+            collection_name: The name of the collection
+            ids: List of document IDs
+            id_prefix: Prefix that the IDs of the documents to delete start with
+            where: Metadata filter
+        
+        Returns:
+            Result of the operation, with the number of documents "deleted"
+        """
+        criteria = {"id_prefix": id_prefix, "where": where}
+        if ids is None:
+            bodies = self._all_shards({"ids": None, **criteria})
+        else:
+            bodies = {}
+            for doc_id in ids:
+                bodies.setdefault(self.shard_map.shard_for_id(doc_id).name, {"ids": [], **criteria})["ids"].append(doc_id)
+        if not bodies:
+            return {"success": True, "result": {"deleted": 0}}
+        
+        try:
+            try:
+                written = await self._write_primaries("POST", f"/collections/{collection_name}/documents/delete", bodies)
+            finally:
+                self.invalidate_cache(collection_name)
+            if not written["success"]:
+                return written
+            deleted = sum(response.json().get("deleted", 0) for response in written["responses"].values())
+            return {"success": True, "result": {"deleted": deleted}}
+        
+        except Exception as e:
+            logger.error(f"Error deleting documents: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def update_metadata(self, collection_name: str, updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Merge metadata fields into documents, each on the shard that owns it.
+        
+        Args:
+            collection_name: The name of the collection
+            updates: List of {"id", "metadata"}
+        
+        Returns:
+            Result of the operation, with the number of documents "updated" and
+            the IDs that are "missing"
+        """
+        bodies = {}
+        for update in updates:
+            bodies.setdefault(self.shard_map.shard_for_id(update["id"]).name, {"updates": []})["updates"].append(update)
+        if not bodies:
+            return {"success": True, "result": {"updated": 0, "missing": []}}
+        
+        try:
+            try:
+                written = await self._write_primaries("POST", f"/collections/{collection_name}/documents/metadata", bodies)
+            finally:
+                self.invalidate_cache(collection_name)
+            if not written["success"]:
+                return written
+            results = [response.json() for response in written["responses"].values()]
+            return {
+                "success": True,
+                "result": {
+                    "updated": sum(result.get("updated", 0) for result in results),
+                    "missing": [doc_id for result in results for doc_id in result.get("missing") or []]
+                }
+            }
+        
+        except Exception as e:
+            logger.error(f"Error updating document metadata: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def set_collection_ttl(self, collection_name: str, ttl_seconds: Optional[int]) -> Dict[str, Any]:
+        """
+        Set the time-to-live of a collection's documents on every shard, or clear it with None.
+        
+        Args:
+            collection_name: The name of the collection
+            ttl_seconds: The TTL in seconds, or None
+        
+        Returns:
+            Result of the operation
+        """
+        try:
+            written = await self._write_primaries(
+                "PUT", f"/collections/{collection_name}/ttl", self._all_shards({"ttl_seconds": ttl_seconds})
+            )
+            if not written["success"]:
+                return written
+            return {"success": True, "result": {"message": f"TTL of collection '{collection_name}' set to {ttl_seconds}"}}
+        
+        except Exception as e:
+            logger.error(f"Error setting collection TTL: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def compact_collection(self, collection_name: str) -> Dict[str, Any]:
+        """
+        Schedule the compaction of a collection on every shard.
+        
+        Args:
+            collection_name: The name of the collection
+        
+        Returns:
+            Result of the operation
+        """
+        try:
+            written = await self._write_primaries("POST", f"/collections/{collection_name}/compact", self._all_shards())
+            if not written["success"]:
+                return written
+            return {"success": True, "result": {"message": f"Compaction of collection '{collection_name}' scheduled"}}
+        
+        except Exception as e:
+            logger.error(f"Error scheduling compaction: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    @staticmethod
+    def encode_scan_cursor(shard_index: int, shard_cursor: Optional[str]) -> str:
+        """
+        Encode a position in a scan across shards as an opaque resume token.
+        
+        Args:
+            shard_index: Position of the shard being scanned in the shard map
+            shard_cursor: That shard's own resume token, or None for its start
+        
+        Returns:
+            The resume token
+        """
+        token = json.dumps({"shard": shard_index, "cursor": shard_cursor})
+        return base64.urlsafe_b64encode(token.encode("utf-8")).decode("ascii")
+    
+    def decode_scan_cursor(self, cursor: Optional[str]) -> Tuple[int, Optional[str]]:
+        """
+        Decode a resume token produced by `encode_scan_cursor`.
+        
+        Args:
+            cursor: The resume token, or None to start from the beginning
+        
+        Returns:
+            The shard index and that shard's own resume token
+        """
+        if not cursor:
+            return 0, None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            shard_index, shard_cursor = position["shard"], position["cursor"]
+        except Exception:
+            raise ValueError("Invalid scan cursor")
+        if not isinstance(shard_index, int) or not 0 <= shard_index < len(self.shard_map):
+            raise ValueError("Invalid scan cursor")
+        if shard_cursor is not None and not isinstance(shard_cursor, str):
+            raise ValueError("Invalid scan cursor")
+        return shard_index, shard_cursor
+    
+    async def scan(self, collection_name: str, cursor: Optional[str] = None, limit: Optional[int] = None,
+                   **params) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Iterate over the records of a collection, one shard after the other.
+        
+        Shards are scanned on their primaries: scan cursors are positional, and
+        replicas at different snapshots would resume at different records.
+        
+        Args:
+            collection_name: The name of the collection
+            cursor: Resume token from a previous scan, or None to start at the beginning
+            limit: Maximum number of records to return, or None for all
+            **params: Other query parameters of the vector database scan
+                (page_size, where, where_document, include_embeddings)
+        
+        Yields:
+            The lines of the vector database scan: each record, a
+            {"next_cursor": ...} after every page whose token resumes across
+            shards and is None once the last shard is exhausted, or an {"error": ...}
+        """
+        shard_index, shard_cursor = self.decode_scan_cursor(cursor)
+        client = self._get_client()
+        remaining = limit
+        
+        while shard_index < len(self.shard_map) and remaining != 0:
+            shard = self.shard_map.shards[shard_index]
+            shard_params = {key: value for key, value in params.items() if value is not None}
+            if shard_cursor is not None:
+                shard_params["cursor"] = shard_cursor
+            if remaining is not None:
+                shard_params["limit"] = remaining
+            
+            async with client.stream("GET", f"{shard.primary_url}/collections/{collection_name}/scan",
+                                     params=shard_params) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    raise RuntimeError(f"Shard {shard.name} returned {response.status_code}: {response.text}")
+                
+                next_shard_cursor = None
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    item = json.loads(line)
+                    if "error" in item:
+                        yield item
+                        return
+                    if "next_cursor" not in item:
+                        if remaining is not None:
+                            remaining -= 1
+                        yield item
+                        continue
+                    
+                    next_shard_cursor = item["next_cursor"]
+                    if next_shard_cursor is not None:
+                        yield {"next_cursor": self.encode_scan_cursor(shard_index, next_shard_cursor)}
+                    elif shard_index + 1 < len(self.shard_map):
+                        yield {"next_cursor": self.encode_scan_cursor(shard_index + 1, None)}
+                    else:
+                        yield {"next_cursor": None}
+            
+            # A shard stops before its end only when the limit was reached
+            if next_shard_cursor is not None:
+                return
+            shard_index, shard_cursor = shard_index + 1, None
+    
     async def list_collections(self) -> List[str]:
         """
         List all available collections in the vector database.
@@ -80,16 +1015,20 @@ class Retriever:
             List of collection names
         """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.vector_db_url}/collections")
-                
+            client = self._get_client()
+            responses = await asyncio.gather(
+                *[self._read(client, shard, "GET", "/collections") for shard in self.shard_map.shards]
+            )
+            
+            collections = set()
+            for shard, response in zip(self.shard_map.shards, responses):
                 if response.status_code != 200:
-                    logger.error(f"Error listing collections: {response.text}")
+                    logger.error(f"Error listing collections on shard {shard.name}: {response.text}")
                     return []
-                
-                result = response.json()
-                return result.get("collections", [])
-                
+                collections.update(response.json().get("collections", []))
+            
+            return sorted(collections)
+        
         except Exception as e:
             logger.error(f"Error listing collections: {str(e)}")
             return []
@@ -100,20 +1039,37 @@ class Retriever:
         
         Args:
             collection_name: The name of the collection
-            
+        
         Returns:
-            Collection information
+            Collection information, with the counts summed over all shards
         """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.vector_db_url}/collections/{collection_name}")
-                
+            client = self._get_client()
+            responses = await asyncio.gather(
+                *[
+                    self._read(client, shard, "GET", f"/collections/{collection_name}")
+                    for shard in self.shard_map.shards
+                ]
+            )
+            
+            infos = []
+            for shard, response in zip(self.shard_map.shards, responses):
                 if response.status_code != 200:
-                    logger.error(f"Error getting collection info: {response.text}")
+                    logger.error(f"Error getting collection info on shard {shard.name}: {response.text}")
                     return {}
-                
-                return response.json()
-                
+                infos.append(response.json())
+            
+            versions = [info.get("version") for info in infos]
+            return {
+                "name": collection_name,
+                "count": sum(info.get("count", 0) for info in infos),
+                # Combined like the versions `search` reports
+                "version": "|".join(versions) if all(version is not None for version in versions) else None,
+                # The TTL is set on every shard at once
+                "ttl_seconds": infos[0].get("ttl_seconds"),
+                "deleted_since_compaction": sum(info.get("deleted_since_compaction", 0) for info in infos)
+            }
+        
         except Exception as e:
             logger.error(f"Error getting collection info: {str(e)}")
             return {}
@@ -0,0 +1,187 @@
+import threading
+import time
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("ai_platform.retriever")
+
+
+class _CacheSlab:
+    """
+    Fixed-capacity store of cached query embeddings and their results.
+    """
+    
+    def __init__(self, capacity: int, dimension: int):
+        self.embeddings = np.zeros((capacity, dimension), dtype=np.float32)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.created_at = np.zeros(capacity, dtype=np.float64)
+        self.results = [None] * capacity
+        self.versions = [None] * capacity
+        self.size = 0
+
+
+class SemanticCache:
+    """
+    Per-collection cache of query results keyed by query embedding.
+    
+    A query is answered from the cache when the cosine similarity between its
+    embedding and a cached one reaches the threshold, so paraphrases of a
+    recent query hit the cache. The lookup is a single matrix-vector product
+    over the cached embeddings. The least recently used entry is evicted when
+    a collection's slab is full, and a collection's entries are dropped
+    whenever it is written to. Entries remember the collection version they
+    were computed at, so a lookup given the current version skips entries
+    made stale by writes that didn't go through this service.
+    """
+    
+    def __init__(self, capacity: int = 256, threshold: float = 0.95, ttl: Optional[float] = 300.0):
+        """
+        Initialize the cache.
+        
+        Args:
+            capacity: Maximum number of cached queries per collection and query shape
+            threshold: Minimum cosine similarity for a cache hit
+            ttl: Seconds after which an entry expires, bounding staleness for
+                writes that don't go through this service; None to disable
+        """
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        
+        self._slabs: Dict[Tuple[str, str, int], _CacheSlab] = {}
+        self._tick = 0
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.miss_latency_ms_total = 0.0
+        self.miss_latency_samples = 0
+        self.saved_ms_total = 0.0
+        
+        logger.info(f"SemanticCache initialized with capacity {capacity} and threshold {threshold}")
+    
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+    
+    def lookup(self, collection_name: str, embedding, n_results: int, mode: str = "dense",
+               version: Optional[str] = None, overhead_ms: float = 0.0) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached result for a query similar enough to this one.
+        
+        Args:
+            collection_name: The name of the collection
+            embedding: Embedding of the query
+            n_results: Number of results requested
+            mode: Retrieval mode of the query
+            version: Current version of the collection; entries computed at
+                another version are skipped. None to skip the check
+            overhead_ms: Time already spent on the vector DB to serve this
+                lookup (e.g. fetching `version`), not counted as saved on a hit
+        
+        Returns:
+            The cached result, or None on a miss
+        """
+        query = self._normalize(embedding)
+        
+        with self._lock:
+            slab = self._slabs.get((collection_name, mode, n_results))
+            if slab is None or slab.size == 0:
+                self.misses += 1
+                return None
+            
+            similarities = slab.embeddings[:slab.size] @ query
+            if self.ttl is not None:
+                similarities[slab.created_at[:slab.size] < time.time() - self.ttl] = -1.0
+            if version is not None:
+                similarities[[slot_version != version for slot_version in slab.versions[:slab.size]]] = -1.0
+            
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            
+            self._tick += 1
+            slab.last_used[best] = self._tick
+            self.hits += 1
+            if self.miss_latency_samples:
+                self.saved_ms_total += max(self.miss_latency_ms_total / self.miss_latency_samples - overhead_ms, 0.0)
+            return slab.results[best]
+    
+    def store(self, collection_name: str, embedding, n_results: int, result: Dict[str, Any],
+              mode: str = "dense", latency_ms: Optional[float] = None, version: Optional[str] = None):
+        """
+        Cache the result of a query.
+        
+        Args:
+            collection_name: The name of the collection
+            embedding: Embedding of the query
+            n_results: Number of results requested
+            result: The result to cache
+            mode: Retrieval mode of the query
+            latency_ms: How long the uncached query took, used to report saved latency
+            version: Version of the collection the result was computed at
+        """
+        query = self._normalize(embedding)
+        
+        with self._lock:
+            if latency_ms is not None:
+                self.miss_latency_ms_total += latency_ms
+                self.miss_latency_samples += 1
+            
+            key = (collection_name, mode, n_results)
+            slab = self._slabs.get(key)
+            if slab is None:
+                slab = _CacheSlab(self.capacity, len(query))
+                self._slabs[key] = slab
+            
+            if slab.size < self.capacity:
+                slot = slab.size
+                slab.size += 1
+            else:
+                slot = int(np.argmin(slab.last_used))
+            
+            self._tick += 1
+            slab.embeddings[slot] = query
+            slab.last_used[slot] = self._tick
+            slab.created_at[slot] = time.time()
+            slab.results[slot] = result
+            slab.versions[slot] = version
+    
+    def invalidate(self, collection_name: str):
+        """
+        Drop every cached result of a collection.
+        
+        Args:
+            collection_name: The name of the collection
+        """
+        with self._lock:
+            for key in [key for key in self._slabs if key[0] == collection_name]:
+                del self._slabs[key]
+        logger.info(f"Invalidated semantic cache for collection '{collection_name}'")
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report cache effectiveness.
+        
+        Returns:
+            Hit and miss counts, hit rate, and the vector DB latency saved by hits
+            (estimated from the average latency of misses, less the time hits
+            still spent on the vector DB)
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": sum(slab.size for slab in self._slabs.values()),
+                "avg_miss_latency_ms": (
+                    self.miss_latency_ms_total / self.miss_latency_samples if self.miss_latency_samples else 0.0
+                ),
+                "saved_latency_ms": self.saved_ms_total
+            }
@@ -0,0 +1,169 @@
+import hashlib
+import itertools
+import json
+import logging
+import os
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger("ai_platform.retriever")
+
+
+class Shard:
+    """
+    One vector database partition: a primary that takes writes and optional read replicas.
+    """
+    
+    def __init__(self, name: str, primary_url: str, replica_urls: Optional[List[str]] = None):
+        """
+        Initialize the shard.
+        
+        Args:
+            name: Name of the shard, reported when it fails
+            primary_url: URL of the shard's primary vector database
+            replica_urls: URLs of the shard's read-only replicas
+        """
+        self.name = name
+        self.primary_url = primary_url
+        self.replica_urls = replica_urls or []
+        
+        # Round-robin over the replicas, or always the primary if there are none
+        self._read_urls = itertools.cycle(self.replica_urls or [self.primary_url])
+    
+    def read_url(self) -> str:
+        """
+        Pick the instance to send the next read to.
+        
+        Returns:
+            Base URL of a replica, or of the primary if no replicas are configured
+        """
+        return next(self._read_urls)
+    
+    def __repr__(self):
+        return f"Shard(name={self.name!r}, primary_url={self.primary_url!r}, replicas={len(self.replica_urls)})"
+
+
+class ShardMap:
+    """
+    Hash-partitions chunks across vector database shards by chunk ID.
+    """
+    
+    def __init__(self, shards: List[Shard]):
+        """
+        Initialize the shard map.
+        
+        Args:
+            shards: The shards, in a fixed order shared by every writer and reader
+        """
+        if not shards:
+            raise ValueError("A shard map needs at least one shard")
+        self.shards = shards
+    
+    @classmethod
+    def from_env(cls, vector_db_url: Optional[str] = None, replica_urls: Optional[List[str]] = None) -> "ShardMap":
+        """
+        Build the shard map from the environment.
+        
+        VECTOR_DB_SHARD_MAP takes precedence and holds either a path to a JSON
+        registry file or the JSON itself, in the form
+        {"shards": [{"name": ..., "primary": ..., "replicas": [...]}]}.
+        Otherwise VECTOR_DB_SHARD_URLS lists one primary URL per shard. Without
+        either, a single shard is built from VECTOR_DB_SERVICE_URL and
+        VECTOR_DB_REPLICA_URLS.
+        
+        Args:
+            vector_db_url: Primary URL for the single-shard fallback
+            replica_urls: Replica URLs for the single-shard fallback
+        
+        Returns:
+            The shard map
+        """
+        registry = os.getenv("VECTOR_DB_SHARD_MAP")
+        if registry:
+            if os.path.isfile(registry):
+                with open(registry) as f:
+                    registry = f.read()
+            return cls.from_registry(json.loads(registry))
+        
+        shard_urls = [url.strip() for url in os.getenv("VECTOR_DB_SHARD_URLS", "").split(",") if url.strip()]
+        if shard_urls:
+            return cls([Shard(f"shard-{i}", url) for i, url in enumerate(shard_urls)])
+        
+        primary_url = vector_db_url or os.getenv("VECTOR_DB_SERVICE_URL", "http://vector-db:8000")
+        if replica_urls is None:
+            replica_urls = [url.strip() for url in os.getenv("VECTOR_DB_REPLICA_URLS", "").split(",") if url.strip()]
+        return cls([Shard("shard-0", primary_url, replica_urls)])
+    
+    @classmethod
+    def from_registry(cls, registry: Dict[str, Any]) -> "ShardMap":
+        """
+        Build the shard map from a registry document.
+        
+        Args:
+            registry: Dictionary with a "shards" list of {"name", "primary", "replicas"}
+        
+        Returns:
+            The shard map
+        """
+        shards = [
+            Shard(
+                name=entry.get("name", f"shard-{i}"),
+                primary_url=entry["primary"],
+                replica_urls=entry.get("replicas", [])
+            )
+            for i, entry in enumerate(registry["shards"])
+        ]
+        return cls(shards)
+    
+    def shard_for_id(self, chunk_id: str) -> Shard:
+        """
+        Find the shard that owns a chunk.
+        
+        Uses a stable hash so every process maps the same ID to the same shard.
+        
+        Args:
+            chunk_id: The chunk ID
+        
+        Returns:
+            The owning shard
+        """
+        if len(self.shards) == 1:
+            return self.shards[0]
+        
+        digest = hashlib.md5(chunk_id.encode("utf-8")).digest()
+        return self.shards[int.from_bytes(digest[:8], "big") % len(self.shards)]
+    
+    def partition(self, documents: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Group documents by owning shard.
+        
+        Documents without an ID are placed by a hash of their text.
+        
+        Args:
+            documents: List of documents with text, metadata, and ID
+        
+        Returns:
+            Mapping of shard name to the documents it owns
+        """
+        partitions: Dict[str, List[Dict[str, Any]]] = {}
+        for doc in documents:
+            shard = self.shard_for_id(doc.get("id") or doc["text"])
+            partitions.setdefault(shard.name, []).append(doc)
+        return partitions
+    
+    def get(self, name: str) -> Shard:
+        """
+        Look up a shard by name.
+        
+        Args:
+            name: Name of the shard
+        
+        Returns:
+            The shard
+        """
+        for shard in self.shards:
+            if shard.name == name:
+                return shard
+        raise KeyError(name)
+    
+    def __len__(self):
+        return len(self.shards)
@@ -0,0 +1,66 @@
+import os
+import sys
+
+# Add the platform root to the path so we can import the shared codec
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from shared.codec.columnar import ColumnarResults
+
+
+def chroma_result(ids, distances):
+    return {
+        "ids": [ids],
+        "documents": [[f"text of {doc_id} – ünïcode" for doc_id in ids]],
+        "metadatas": [[{"source": doc_id, "chunk_id": i} for i, doc_id in enumerate(ids)]],
+        "distances": [distances],
+    }
+
+
+def test_round_trip_preserves_documents():
+    original = ColumnarResults.from_chroma(chroma_result(["a", "b"], [0.25, 0.5]))
+
+    decoded = ColumnarResults.decode(original.encode())
+
+    assert decoded.to_documents() == original.to_documents() == [
+        {"id": "a", "text": "text of a – ünïcode", "metadata": {"source": "a", "chunk_id": 0}, "distance": 0.25},
+        {"id": "b", "text": "text of b – ünïcode", "metadata": {"source": "b", "chunk_id": 1}, "distance": 0.5},
+    ]
+
+
+def test_concat_and_top_k_merge_shards():
+    shard_a = ColumnarResults.decode(ColumnarResults.from_chroma(chroma_result(["a1", "a2"], [0.1, 0.4])).encode())
+    shard_b = ColumnarResults.from_chroma(chroma_result(["b1", "b2", "b3"], [0.05, 0.3, 0.35]))
+
+    merged = ColumnarResults.concat([shard_a, shard_b])
+    documents = merged.to_documents(merged.top_k(3))
+
+    assert [doc["id"] for doc in documents] == ["b1", "a1", "b2"]
+    assert documents[1]["metadata"] == {"source": "a1", "chunk_id": 0}
+    assert documents[2]["text"] == "text of b2 – ünïcode"
+
+
+def test_documents_with_scores_and_extra_fields():
+    documents = [
+        {"id": "x", "text": "x", "metadata": {}, "distance": None, "score": 2.5, "collection": "manuals"},
+        {"id": "y", "text": "y", "metadata": {}, "distance": None, "score": 4.0, "collection": "tickets"},
+    ]
+
+    decoded = ColumnarResults.decode(ColumnarResults.from_documents(documents, extra={"partial": False}).encode())
+
+    assert decoded.extra == {"partial": False}
+    assert [doc["id"] for doc in decoded.to_documents(decoded.top_k(2, by="score"))] == ["y", "x"]
+    assert decoded.to_documents()[0] == documents[0]
+
+
+def test_batch_rows_are_ranked_per_query():
+    batch = {
+        "ids": [["a", "b"], ["c"]],
+        "documents": [["text a", "text b"], ["text c"]],
+        "metadatas": [[{}, {}], [{}]],
+        "distances": [[0.3, 0.1], [0.2]],
+    }
+    columns = ColumnarResults.decode(ColumnarResults.from_chroma_batch(batch).encode())
+
+    assert list(columns.query_rows(0)) == [0, 1]
+    assert columns.top_k(5, rows=columns.query_rows(0)) == [1, 0]
+    assert [doc["id"] for doc in columns.to_documents(columns.top_k(5, rows=columns.query_rows(1)))] == ["c"]
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import numpy as np
+
+# Add the parent directory to the path so we can import the retriever
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# and the platform root for the shared libraries
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from retriever import Retriever
+from semantic_cache import SemanticCache
+from shard_map import Shard, ShardMap
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_similar_queries_hit_and_distant_ones_miss():
+    cache = SemanticCache(capacity=4, threshold=0.9)
+    cache.store("docs", unit([1, 0, 0]), 5, {"documents": ["a"]}, latency_ms=20.0)
+
+    assert cache.lookup("docs", unit([1, 0.1, 0]), 5) == {"documents": ["a"]}
+    assert cache.lookup("docs", unit([0, 1, 0]), 5) is None
+    # Different collection, result count or mode are separate entries
+    assert cache.lookup("other", unit([1, 0, 0]), 5) is None
+    assert cache.lookup("docs", unit([1, 0, 0]), 3) is None
+    assert cache.lookup("docs", unit([1, 0, 0]), 5, mode="hybrid") is None
+    # Entries computed at another version of the collection are skipped
+    cache.store("docs", unit([0, 1, 0]), 5, {"documents": ["b"]}, version="0.1")
+    assert cache.lookup("docs", unit([0, 1, 0]), 5, version="0.2") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 5
+    assert stats["saved_latency_ms"] == 20.0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(capacity=2, threshold=0.99)
+    cache.store("docs", unit([1, 0, 0]), 5, {"documents": ["x"]})
+    cache.store("docs", unit([0, 1, 0]), 5, {"documents": ["y"]})
+    assert cache.lookup("docs", unit([1, 0, 0]), 5) is not None
+
+    cache.store("docs", unit([0, 0, 1]), 5, {"documents": ["z"]})
+
+    assert cache.lookup("docs", unit([1, 0, 0]), 5) is not None
+    assert cache.lookup("docs", unit([0, 1, 0]), 5) is None
+    assert cache.lookup("docs", unit([0, 0, 1]), 5) is not None
+
+
+class FakeVectorDB:
+    """Answers /query with one document and reports a version that changes on every write."""
+
+    def __init__(self):
+        self.version = 1
+        self.queries = 0
+
+    def write(self):
+        self.version += 1
+
+    def handler(self, request):
+        if request.method == "GET":
+            return httpx.Response(200, json={"name": "docs", "version": f"0.{self.version}"})
+        if request.url.path == "/query":
+            self.queries += 1
+            return httpx.Response(200, json={
+                "ids": [["d1"]], "documents": [["text"]], "metadatas": [[{}]], "distances": [[0.1]],
+                "collection_version": f"0.{self.version}"
+            })
+        self.write()
+        return httpx.Response(200, json={"message": "ok"})
+
+
+def test_hits_are_only_served_at_the_current_collection_version():
+    embeddings = {"what is rag": [1, 0], "what's rag": [0.99, 0.05], "pricing": [0, 1]}
+    vector_db = FakeVectorDB()
+    cache = SemanticCache(threshold=0.95)
+    retriever = Retriever(shard_map=ShardMap([Shard("shard-0", "http://vector-db")]), semantic_cache=cache,
+                          embed_query=lambda q: embeddings[q], version_ttl=0)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(vector_db.handler))
+    retriever._get_client = lambda: client
+
+    assert asyncio.run(retriever.search("what is rag", "docs", 5))["cached"] is False
+    result = asyncio.run(retriever.search("what's rag", "docs", 5))
+    assert result["cached"] is True
+    assert result["collection_version"] == "0.1"
+    assert vector_db.queries == 1
+
+    # Written without going through the retriever, e.g. by data-ingestion
+    vector_db.write()
+    result = asyncio.run(retriever.search("what's rag", "docs", 5))
+    assert result["cached"] is False
+    assert result["collection_version"] == "0.2"
+    assert asyncio.run(retriever.search("what is rag", "docs", 5))["cached"] is True
+
+    # Writes through the retriever drop the collection's entries
+    asyncio.run(retriever.add_documents("docs", [{"text": "new", "metadata": {"source": "x"}, "id": "d2"}]))
+    assert cache.stats()["entries"] == 0
+
+
+def test_hits_reuse_the_collection_version_for_a_while():
+    embeddings = {"what is rag": [1, 0], "what's rag": [0.99, 0.05]}
+    vector_db = FakeVectorDB()
+    version_fetches = []
+    handler = vector_db.handler
+
+    def counting_handler(request):
+        if request.method == "GET":
+            version_fetches.append(request.url.path)
+        return handler(request)
+
+    cache = SemanticCache(threshold=0.95)
+    retriever = Retriever(shard_map=ShardMap([Shard("shard-0", "http://vector-db")]), semantic_cache=cache,
+                          embed_query=lambda q: embeddings[q], version_ttl=60)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(counting_handler))
+    retriever._get_client = lambda: client
+
+    assert asyncio.run(retriever.search("what is rag", "docs", 5))["cached"] is False
+    assert len(version_fetches) == 1
+    # The version the query returned is reused, so hits don't touch the vector DB
+    assert asyncio.run(retriever.search("what's rag", "docs", 5))["cached"] is True
+    assert asyncio.run(retriever.search("what is rag", "docs", 5))["cached"] is True
+    assert len(version_fetches) == 1
+    assert vector_db.queries == 1
+
+    # Writes through the retriever drop the version along with the entries
+    asyncio.run(retriever.add_documents("docs", [{"text": "new", "metadata": {}, "id": "d2"}]))
+    assert asyncio.run(retriever.search("what is rag", "docs", 5))["cached"] is False
+    assert len(version_fetches) == 2
+
+
+def test_saved_latency_excludes_the_version_fetch():
+    cache = SemanticCache(capacity=4, threshold=0.9)
+    cache.store("docs", unit([1, 0]), 5, {"documents": ["a"]}, latency_ms=20.0, version="0.1")
+
+    assert cache.lookup("docs", unit([1, 0]), 5, version="0.1", overhead_ms=5.0) is not None
+    assert cache.lookup("docs", unit([1, 0]), 5, version="0.1", overhead_ms=30.0) is not None
+
+    assert cache.stats()["saved_latency_ms"] == 15.0
+
+
+def test_results_are_not_cached_when_the_version_is_unknown():
+    cache = SemanticCache(threshold=0.95)
+    # Nothing listens on this port, so any vector DB call fails
+    shard_map = ShardMap([Shard("shard-0", "http://127.0.0.1:9")])
+    retriever = Retriever(shard_map=shard_map, semantic_cache=cache, embed_query=lambda q: [1, 0])
+    cache.store("docs", [1, 0], 5, {"documents": [{"id": "d1"}]}, version="0.1")
+
+    result = asyncio.run(retriever.search("what is rag", "docs", 5))
+    assert result["cached"] is False
+    assert result["failed_shards"] == ["shard-0"]
+    assert cache.stats()["entries"] == 1
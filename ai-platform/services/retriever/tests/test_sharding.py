@@ -0,0 +1,322 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+# Add the parent directory to the path so we can import the retriever
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# and the platform root for the shared libraries
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from retriever import Retriever
+from shard_map import Shard, ShardMap
+
+
+def serve_stub_shard(port, results):
+    """Run a stub vector-db shard that answers /query with fixed (id, distance) results.
+
+    `results` is either one list for every collection or a dict of lists keyed by collection
+    name or by query mode. Lexical and hybrid hits are (id, score) pairs instead.
+    /query/batch answers every query with the same hits, their IDs suffixed with "@<query>".
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            mode = body.get("mode", "dense")
+            hits = results
+            if isinstance(results, dict):
+                hits = results[mode] if mode in results else results.get(body["collection_name"], [])
+            hits = hits[:body["n_results"]]
+            queries = [None]
+            if self.path == "/query/batch":
+                queries = body["query_texts"]
+            suffixes = [f"@{query}" if query is not None else "" for query in queries]
+            answer = {
+                "ids": [[doc_id + suffix for doc_id, _ in hits] for suffix in suffixes],
+                "documents": [[f"text of {doc_id}" for doc_id, _ in hits] for _ in suffixes],
+                "metadatas": [[{"shard_port": port} for _ in hits] for _ in suffixes],
+                "distances": [[value for _, value in hits] for _ in suffixes]
+            }
+            if mode != "dense":
+                answer["scores"] = answer["distances"]
+                answer["distances"] = [[None for _ in hits] for _ in suffixes]
+            payload = json.dumps(answer).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    HTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Stub shard on port {port} did not start")
+
+
+def start_shards(shard_results):
+    processes, ports = [], []
+    for results in shard_results:
+        port = free_port()
+        process = multiprocessing.Process(target=serve_stub_shard, args=(port, results), daemon=True)
+        process.start()
+        wait_for_port(port)
+        processes.append(process)
+        ports.append(port)
+    return processes, ports
+
+
+def test_scatter_gather_merges_global_top_k():
+    processes, ports = start_shards([
+        [("a1", 0.10), ("a2", 0.40), ("a3", 0.90)],
+        [("b1", 0.05), ("b2", 0.30), ("b3", 0.35)],
+    ])
+    try:
+        shard_map = ShardMap([Shard(f"shard-{i}", f"http://127.0.0.1:{port}") for i, port in enumerate(ports)])
+        retriever = Retriever(shard_map=shard_map)
+
+        result = asyncio.run(retriever.search("query", "test", n_results=4))
+
+        assert [doc["id"] for doc in result["documents"]] == ["b1", "a1", "b2", "b3"]
+        assert result["partial"] is False
+        assert result["failed_shards"] == []
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+def test_partial_shard_failure_is_flagged():
+    processes, ports = start_shards([[("a1", 0.2), ("a2", 0.3)]])
+    try:
+        shard_map = ShardMap([
+            Shard("shard-0", f"http://127.0.0.1:{ports[0]}"),
+            Shard("shard-1", f"http://127.0.0.1:{free_port()}"),
+        ])
+        retriever = Retriever(shard_map=shard_map)
+
+        result = asyncio.run(retriever.search("query", "test", n_results=5))
+
+        assert [doc["id"] for doc in result["documents"]] == ["a1", "a2"]
+        assert result["partial"] is True
+        assert result["failed_shards"] == ["shard-1"]
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+def test_multi_collection_search_merges_and_dedupes():
+    processes, ports = start_shards([{
+        "manuals": [("m1", 0.20), ("shared", 0.25), ("m2", 0.60)],
+        "tickets": [("t1", 0.10), ("shared", 0.30), ("t2", 0.50)],
+    }])
+    try:
+        retriever = Retriever(shard_map=ShardMap([Shard("shard-0", f"http://127.0.0.1:{ports[0]}")]))
+
+        result = asyncio.run(retriever.search_collections("query", ["manuals", "tickets"], n_results=4))
+
+        assert [(doc["id"], doc["collection"]) for doc in result["documents"]] == [
+            ("t1", "tickets"), ("m1", "manuals"), ("shared", "manuals"), ("t2", "tickets")
+        ]
+        assert set(result["timings"]) == {"manuals", "tickets"}
+        assert result["timings"]["tickets"]["documents"] == 3
+        assert result["partial"] is False
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+def test_batch_search_ranks_each_query_across_shards():
+    processes, ports = start_shards([
+        [("a1", 0.10), ("a2", 0.40)],
+        [("b1", 0.05), ("b2", 0.30)],
+    ])
+    try:
+        shard_map = ShardMap([Shard(f"shard-{i}", f"http://127.0.0.1:{port}") for i, port in enumerate(ports)])
+        retriever = Retriever(shard_map=shard_map)
+
+        results = asyncio.run(retriever.search_batch(["x", "y"], "test", n_results=3))
+
+        assert [[doc["id"] for doc in result["documents"]] for result in results] == [
+            ["b1@x", "a1@x", "b2@x"],
+            ["b1@y", "a1@y", "b2@y"],
+        ]
+        assert all(result["partial"] is False for result in results)
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+def test_sharded_hybrid_search_fuses_the_global_rankings():
+    # Shard 0 holds every relevant chunk. Shard 1's chunks only match the query
+    # loosely, but its own BM25 statistics and RRF still score them like shard 0's
+    processes, ports = start_shards([
+        {
+            "dense": [("a1", 0.10), ("a2", 0.20), ("a3", 0.30), ("a4", 0.40)],
+            "lexical": [("a1", 9.0), ("a2", 8.0), ("a3", 7.0), ("a4", 6.0)],
+            "hybrid": [("a1", 2 / 61), ("a2", 2 / 62), ("a3", 2 / 63), ("a4", 2 / 64)],
+        },
+        {
+            "dense": [("b1", 0.80), ("b2", 0.85), ("b3", 0.90), ("b4", 0.95)],
+            "lexical": [("b1", 5.0), ("b2", 4.0), ("b3", 3.0), ("b4", 2.0)],
+            "hybrid": [("b1", 2 / 61), ("b2", 2 / 62), ("b3", 2 / 63), ("b4", 2 / 64)],
+        },
+    ])
+    try:
+        shard_map = ShardMap([Shard(f"shard-{i}", f"http://127.0.0.1:{port}") for i, port in enumerate(ports)])
+        retriever = Retriever(shard_map=shard_map)
+
+        result = asyncio.run(retriever.search("query", "test", n_results=4, mode="hybrid"))
+        batch = asyncio.run(retriever.search_batch(["x"], "test", n_results=4, mode="hybrid"))
+
+        assert [doc["id"] for doc in result["documents"]] == ["a1", "a2", "a3", "a4"]
+        assert [doc["id"] for doc in batch[0]["documents"]] == ["a1@x", "a2@x", "a3@x", "a4@x"]
+        assert result["documents"][0]["score"] == 2 / 61
+        assert result["documents"][0]["distance"] == pytest.approx(0.10)
+        # Lexical scores of different shards were compared
+        assert result["approximate"] is True and batch[0]["approximate"] is True
+        assert asyncio.run(retriever.search("query", "test", n_results=4))["approximate"] is False
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+def test_shard_for_id_is_stable_and_spreads_ids():
+    shard_map = ShardMap([Shard(f"shard-{i}", f"http://shard-{i}:8000") for i in range(4)])
+
+    owners = [shard_map.shard_for_id(f"doc_chunk_{i}").name for i in range(400)]
+
+    assert owners == [shard_map.shard_for_id(f"doc_chunk_{i}").name for i in range(400)]
+    assert len(set(owners)) == 4
+    partitions = shard_map.partition([{"id": f"doc_chunk_{i}", "text": "x"} for i in range(400)])
+    assert sum(len(docs) for docs in partitions.values()) == 400
+
+
+def serve_stub_writable_shard(port, ids):
+    """Run a stub vector-db shard holding `ids`, answering scans and writes addressed to them.
+
+    The scan cursor is the offset as a string; writes report the IDs the shard doesn't hold as missing.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def reply(self, payload):
+            payload = payload.encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            from urllib.parse import urlparse, parse_qs
+            params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+            offset = int(params.get("cursor", 0))
+            end = min(offset + int(params.get("limit", len(ids))), len(ids))
+            lines, page_size = [], int(params.get("page_size", 500))
+            for start in range(offset, end, page_size) if offset < end else [offset]:
+                page_end = min(start + page_size, end)
+                lines += [json.dumps({"id": doc_id, "text": doc_id}) for doc_id in ids[start:page_end]]
+                lines.append(json.dumps({"next_cursor": str(page_end) if page_end < len(ids) else None}))
+            self.reply("".join(line + "\n" for line in lines))
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if self.path.endswith("/documents/metadata"):
+                requested = [update["id"] for update in body["updates"]]
+                missing = [doc_id for doc_id in requested if doc_id not in ids]
+                self.reply(json.dumps({"updated": len(requested) - len(missing), "missing": missing}))
+            else:
+                requested = body["ids"] if body["ids"] is not None else [doc_id for doc_id in ids if doc_id.startswith(body["id_prefix"])]
+                self.reply(json.dumps({"deleted": len([doc_id for doc_id in requested if doc_id in ids])}))
+
+        def log_message(self, *args):
+            pass
+
+    HTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+def start_writable_shards(count, ids):
+    ports = [free_port() for _ in range(count)]
+    shard_map = ShardMap([Shard(f"shard-{i}", f"http://127.0.0.1:{port}") for i, port in enumerate(ports)])
+    owned = [[doc_id for doc_id in ids if shard_map.shard_for_id(doc_id) is shard] for shard in shard_map.shards]
+    processes = []
+    for port, shard_ids in zip(ports, owned):
+        process = multiprocessing.Process(target=serve_stub_writable_shard, args=(port, shard_ids), daemon=True)
+        process.start()
+        wait_for_port(port)
+        processes.append(process)
+    return processes, shard_map
+
+
+def test_writes_are_routed_to_the_shards_that_own_the_ids():
+    ids = [f"doc_chunk_{i}" for i in range(20)]
+    processes, shard_map = start_writable_shards(3, ids)
+    try:
+        retriever = Retriever(shard_map=shard_map)
+
+        async def run():
+            updated = await retriever.update_metadata("test", [{"id": doc_id, "metadata": {"x": 1}} for doc_id in ids + ["other_chunk_0"]])
+            deleted = await retriever.delete_documents("test", ids=ids[:5])
+            deleted_by_prefix = await retriever.delete_documents("test", id_prefix="doc_chunk_1")
+            return updated, deleted, deleted_by_prefix
+
+        updated, deleted, deleted_by_prefix = asyncio.run(run())
+
+        assert updated["result"] == {"updated": 20, "missing": ["other_chunk_0"]}
+        assert deleted["result"] == {"deleted": 5}
+        # Without IDs every shard is asked
+        assert deleted_by_prefix["result"] == {"deleted": 11}
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+def test_scan_resumes_across_shards():
+    ids = [f"doc_chunk_{i}" for i in range(20)]
+    processes, shard_map = start_writable_shards(3, ids)
+    try:
+        retriever = Retriever(shard_map=shard_map)
+
+        async def scan_page(cursor):
+            records, next_cursor = [], None
+            async for item in retriever.scan("test", cursor=cursor, limit=4, page_size=4):
+                if "next_cursor" in item:
+                    next_cursor = item["next_cursor"]
+                else:
+                    records.append(item["id"])
+            return records, next_cursor
+
+        async def run():
+            scanned, cursor = [], None
+            while True:
+                records, cursor = await scan_page(cursor)
+                assert len(records) <= 4
+                scanned += records
+                if cursor is None:
+                    return scanned
+
+        scanned = asyncio.run(run())
+
+        assert sorted(scanned) == sorted(ids)
+    finally:
+        for process in processes:
+            process.terminate()
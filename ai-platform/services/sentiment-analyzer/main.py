@@ -1,21 +1,137 @@
-from fastapi import FastAPI
-from transformers import pipeline
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager, nullcontext
+from typing import List, Optional
+import asyncio
+import logging
+import os
+import sys
+
+# Make the shared libraries importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+from shared.startup.profile import StartupProfile
+from shared.startup.warmup import parse_sequence_lengths, run_warmup
+
+logger = logging.getLogger("ai_platform.sentiment_analyzer")
+
+# Created before the heavy imports so the cold start report covers them
+startup_profile = StartupProfile()
+
+with startup_profile.phase("import"):
+    import torch
+    from transformers import pipeline
+    from shared.models.registry import ModelRegistry, UnknownModelError, local_model_path
 
 class TextInput(BaseModel):
     text: str
+    model: Optional[str] = None
+
+class TextsInput(BaseModel):
+    texts: List[str]
+    model: Optional[str] = None
+
+# Texts run through the model together by /analyze/batch
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "32"))
+
+# Input lengths in tokens a freshly loaded model is run on before it serves requests
+WARMUP_SEQUENCE_LENGTHS = os.getenv("WARMUP_SEQUENCE_LENGTHS", "16,128,512")
+
+def warm_up(analyzer, length: int):
+    input_ids = torch.full((1, length), analyzer.tokenizer.pad_token_id or 0, dtype=torch.long)
+    with torch.no_grad():
+        analyzer.model(input_ids=input_ids, attention_mask=torch.ones_like(input_ids))
+
+def load_model(name: str):
+    # Weights come from the local Hugging Face cache without reaching the Hub
+    # when they are there, and only from safetensors files, which are
+    # memory-mapped instead of unpickled.
+    # Loads during startup are recorded in the cold start report.
+    profile = startup_profile if not startup_profile.ready else None
+    with profile.phase(f"weight_load:{name}") if profile is not None else nullcontext():
+        analyzer = pipeline('sentiment-analysis', model=local_model_path(name), model_kwargs={"use_safetensors": True})
+
+    run_warmup(
+        lambda length: warm_up(analyzer, length),
+        parse_sequence_lengths(WARMUP_SEQUENCE_LENGTHS, getattr(analyzer.model.config, "max_position_embeddings", None)),
+        profile=profile,
+        label=name
+    )
+    return analyzer
 
-app = FastAPI()
+# Models requests may pick, the first being the default; they are loaded on
+# first use and the least recently used are unloaded past the memory budget
+registry = ModelRegistry(
+    load_model,
+    os.getenv("MODELS", "distilbert-base-uncased-finetuned-sst-2-english").split(","),
+    memory_budget=int(os.getenv("MODEL_MEMORY_BUDGET_MB", "0")) * 1024 * 1024
+)
 
-# Load the sentiment analysis model
-sentiment_analyzer = pipeline('sentiment-analysis', model='distilbert-base-uncased-finetuned-sst-2-english')
+# Models loaded before the service takes traffic, most popular first
+WARM_MODELS = [name for name in os.getenv("WARM_MODELS", registry.default_model).split(",") if name]
+
+def initialize():
+    """Load and warm up the warm set of models, run off the event loop"""
+    try:
+        registry.warm(WARM_MODELS)
+        startup_profile.mark_ready()
+        logger.info(f"sentiment-analyzer ready, cold start report: {startup_profile.report()}")
+    except Exception as e:
+        startup_profile.mark_failed(e)
+        logger.error(f"Error initializing sentiment-analyzer: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Don't block the server on loading models so /health answers immediately
+    startup_task = asyncio.get_running_loop().run_in_executor(None, initialize)
+
+    yield
+
+    await startup_task
+    registry.close()
+
+app = FastAPI(lifespan=lifespan)
 
 @app.post("/analyze")
 def analyze_sentiment(data: TextInput):
-    # Analyze sentiment using the model
-    result = sentiment_analyzer(data.text)
+    # Analyze sentiment using the requested model
+    try:
+        with registry.lease(data.model) as sentiment_analyzer:
+            result = sentiment_analyzer(data.text)
+    except UnknownModelError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     return result[0]
 
+@app.post("/analyze/batch")
+def analyze_sentiment_batch(data: TextsInput):
+    """
+    Analyze the sentiment of many texts in one call.
+
+    The texts are run through the model SENTIMENT_BATCH_SIZE at a time, and
+    texts longer than the model's input are truncated. Results come back in
+    the order of the texts.
+    """
+    try:
+        with registry.lease(data.model) as sentiment_analyzer:
+            results = sentiment_analyzer(data.texts, batch_size=SENTIMENT_BATCH_SIZE, truncation=True)
+    except UnknownModelError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"results": results}
+
+@app.get("/models")
+def read_models():
+    """Models that can be requested, which of them are loaded, their load time and memory, and evictions"""
+    return registry.stats()
+
 @app.get("/health")
 def read_root():
+    """Liveness check endpoint"""
     return {"status": "ok"}
+
+@app.get("/ready")
+def read_ready():
+    """Readiness check endpoint, with the cold start report; ready once the warm models are loaded"""
+    report = startup_profile.report()
+    if not startup_profile.ready:
+        return JSONResponse(status_code=503, content=report)
+    return report
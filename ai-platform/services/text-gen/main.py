@@ -1,17 +1,294 @@
-from fastapi import FastAPI
-from transformers import pipeline
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from contextlib import asynccontextmanager, nullcontext
+from typing import List, Optional
+import asyncio
+import logging
+import os
+import sys
+import time
 
-app = FastAPI()
+# Make the shared libraries importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+from shared.startup.profile import StartupProfile
+from shared.startup.warmup import parse_sequence_lengths, run_warmup
 
-# Load the text generation model
-generator = pipeline('text-generation', model='distilgpt2')
+logger = logging.getLogger("ai_platform.text_gen")
+
+# Created before the heavy imports so the cold start report covers them
+startup_profile = StartupProfile()
+
+with startup_profile.phase("import"):
+    import torch
+    from transformers import pipeline
+    from shared.streaming.sse import format_event
+    from shared.models.registry import ModelRegistry, UnknownModelError, local_model_path
+    from scheduler import BatchScheduler, QueueFullError, DeadlineExceededError
+    from prefix_cache import PrefixCache
+
+# Attention keys and values of prompt prefixes, such as the RAG preamble and
+# retrieved context that several questions share; 0 MB turns it off
+PREFIX_CACHE_MB = int(os.getenv("PREFIX_CACHE_MB", "256"))
+PREFIX_CACHE_BLOCK_SIZE = int(os.getenv("PREFIX_CACHE_BLOCK_SIZE", "16"))
+
+# Seconds a request may wait in the queue before generation has to start
+GENERATE_TIMEOUT = float(os.getenv("GENERATE_TIMEOUT", "30"))
+
+# Prompt lengths in tokens a freshly loaded model is run on before it serves requests
+WARMUP_SEQUENCE_LENGTHS = os.getenv("WARMUP_SEQUENCE_LENGTHS", "16,128,512")
+
+def warm_up(model, tokenizer, length: int):
+    """Prefill a prompt of `length` tokens and decode one token after it, like a request would."""
+    input_ids = torch.full((1, length), tokenizer.eos_token_id, dtype=torch.long)
+    with torch.no_grad():
+        output = model(input_ids=input_ids, use_cache=True)
+        model(input_ids=input_ids[:, -1:], past_key_values=output.past_key_values, use_cache=True)
+
+def load_model(name: str) -> BatchScheduler:
+    """
+    Load a text generation model, warm it up and start a scheduler for it.
+
+    Weights come from the local Hugging Face cache without reaching the Hub
+    when they are there (see `local_model_path`), and only from safetensors
+    files, which are memory-mapped instead of unpickled.
+    Every model gets its own scheduler and prefix cache. Loads during startup
+    are recorded in the cold start report.
+    """
+    profile = startup_profile if not startup_profile.ready else None
+    with profile.phase(f"weight_load:{name}") if profile is not None else nullcontext():
+        generator = pipeline('text-generation', model=local_model_path(name), model_kwargs={"use_safetensors": True})
+
+    max_length = getattr(generator.model.config, "max_position_embeddings", None)
+    run_warmup(
+        lambda length: warm_up(generator.model, generator.tokenizer, length),
+        parse_sequence_lengths(WARMUP_SEQUENCE_LENGTHS, max_length - 1 if max_length else None),
+        profile=profile,
+        label=name
+    )
+
+    prefix_cache = None
+    if PREFIX_CACHE_MB > 0:
+        prefix_cache = PrefixCache(max_bytes=PREFIX_CACHE_MB * 1024 * 1024, block_size=PREFIX_CACHE_BLOCK_SIZE)
+
+    # Concurrent requests for the model are decoded together by one scheduler thread
+    scheduler = BatchScheduler(
+        generator.model,
+        generator.tokenizer,
+        max_batch_size=int(os.getenv("MAX_BATCH_SIZE", "8")),
+        max_queue_size=int(os.getenv("MAX_QUEUE_SIZE", "64")),
+        prefix_cache=prefix_cache
+    )
+    scheduler.start()
+    return scheduler
+
+# Models requests may pick, the first being the default; they are loaded on
+# first use and the least recently used are unloaded past the memory budget
+registry = ModelRegistry(
+    load_model,
+    os.getenv("MODELS", "distilgpt2").split(","),
+    memory_budget=int(os.getenv("MODEL_MEMORY_BUDGET_MB", "0")) * 1024 * 1024,
+    unloader=lambda scheduler: scheduler.stop()
+)
+
+# Models loaded before the service takes traffic, most popular first
+WARM_MODELS = [name for name in os.getenv("WARM_MODELS", registry.default_model).split(",") if name]
+
+def initialize():
+    """Load and warm up the warm set of models, run off the event loop"""
+    try:
+        registry.warm(WARM_MODELS)
+        startup_profile.mark_ready()
+        logger.info(f"text-gen ready, cold start report: {startup_profile.report()}")
+    except Exception as e:
+        startup_profile.mark_failed(e)
+        logger.error(f"Error initializing text-gen: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Don't block the server on loading models so /health answers immediately
+    startup_task = asyncio.get_running_loop().run_in_executor(None, initialize)
+
+    yield
+
+    await startup_task
+    registry.close()
+
+app = FastAPI(lifespan=lifespan)
+
+class GenerateRequest(BaseModel):
+    text: str
+    model: Optional[str] = None
+    max_new_tokens: int = 50
+    temperature: float = 1.0
+    timeout: Optional[float] = None
+
+class GenerateBatchRequest(BaseModel):
+    texts: List[str]
+    model: Optional[str] = None
+    max_new_tokens: int = 50
+    temperature: float = 1.0
+    timeout: Optional[float] = None
+
+async def acquire(model: Optional[str]):
+    """
+    Take a model from the registry, loading it if needed.
+
+    If the request is cancelled while the model loads, e.g. because the
+    client went away, the loading thread still takes the model, so it is
+    released as soon as that thread is done.
+
+    Returns:
+        The model name and its scheduler; the model must be released with
+        `registry.release` once the request is done with it
+    """
+    acquiring = asyncio.ensure_future(asyncio.to_thread(registry.acquire, model))
+    try:
+        return await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        acquiring.add_done_callback(lambda done: done.cancelled() or done.exception() or registry.release(done.result()[0]))
+        raise
+    except UnknownModelError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+def submit(scheduler: BatchScheduler, text: str, max_new_tokens: int, temperature: float, timeout: Optional[float]):
+    """
+    Queue a prompt with a model's scheduler, turning a refused admission into an HTTP error.
+
+    A full queue is answered with 429 and a deadline that can't be met with 503,
+    both with a Retry-After header.
+    """
+    try:
+        return scheduler.submit(
+            text,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            timeout=timeout if timeout is not None else GENERATE_TIMEOUT
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+async def complete(model: Optional[str], texts: List[str], max_new_tokens: int, temperature: float,
+                   timeout: Optional[float]) -> List[str]:
+    """
+    Queue prompts together for a model and wait for their completions.
+
+    Returns:
+        Each prompt followed by its completion
+    """
+    name, scheduler = await acquire(model)
+    requests = []
+    try:
+        for text in texts:
+            requests.append(submit(scheduler, text, max_new_tokens, temperature, timeout))
+        completions = await asyncio.gather(*[request.result() for request in requests])
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    finally:
+        # Frees the slots of the other prompts if one of them was refused
+        for request in requests:
+            request.cancel()
+        registry.release(name)
+    return [text + completion for text, completion in zip(texts, completions)]
+
+async def stream_events(request, model: str, start_time: float):
+    """
+    Relay the text of a scheduled request as server-sent events, releasing its model at the end.
+
+    Emits a "token" event for every piece of text the scheduler releases and a
+    final "done" event with the timings, or an "error" event if generation fails.
+    """
+    ttft_ms = None
+    pieces = 0
+    try:
+        async for piece in request.stream():
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - start_time) * 1000
+            pieces += 1
+            yield format_event("token", {"text": piece})
+    except Exception as e:
+        yield format_event("error", {"error": str(e)})
+        return
+    finally:
+        # Stops generation if the client went away mid-stream
+        request.cancel()
+        registry.release(model)
+
+    yield format_event("done", {
+        "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+        "total_ms": round((time.perf_counter() - start_time) * 1000, 1),
+        "pieces": pieces
+    })
+
+async def start_stream(model: Optional[str], text: str, max_new_tokens: int, temperature: float,
+                       timeout: Optional[float]) -> StreamingResponse:
+    """Queue a prompt and answer with its text as server-sent events."""
+    start_time = time.perf_counter()
+    name, scheduler = await acquire(model)
+    try:
+        request = submit(scheduler, text, max_new_tokens, temperature, timeout)
+    except HTTPException:
+        registry.release(name)
+        raise
+    return StreamingResponse(stream_events(request, name, start_time), media_type="text/event-stream")
 
 @app.get("/generate")
-def generate_text(text: str):
-    # Generate text using the model
-    result = generator(text, max_length=50, num_return_sequences=1)
-    return {"generated_text": result[0]['generated_text']}
+async def generate_text(text: str, model: Optional[str] = None):
+    """Generate a continuation of a prompt with the default settings; the response includes the prompt."""
+    return {"generated_text": (await complete(model, [text], 50, 1.0, None))[0]}
+
+@app.post("/generate")
+async def generate_text_post(request: GenerateRequest):
+    """Generate a continuation of a prompt with per-request settings; the response includes the prompt."""
+    texts = await complete(request.model, [request.text], request.max_new_tokens, request.temperature, request.timeout)
+    return {"generated_text": texts[0]}
+
+@app.post("/generate/batch")
+async def generate_text_batch(request: GenerateBatchRequest):
+    """
+    Generate text for several prompts.
+
+    The prompts are queued together so the scheduler decodes them in the same
+    batch, and the texts come back in the order of the prompts.
+    """
+    texts = await complete(request.model, request.texts, request.max_new_tokens, request.temperature, request.timeout)
+    return {"generated_texts": texts}
+
+@app.get("/generate/stream")
+async def generate_text_stream(text: str, max_new_tokens: int = 50, model: Optional[str] = None):
+    """Stream generated text as server-sent events."""
+    return await start_stream(model, text, max_new_tokens, 1.0, None)
+
+@app.post("/generate/stream")
+async def generate_text_stream_post(request: GenerateRequest):
+    """Stream generated text as server-sent events, for prompts too long for a query string."""
+    return await start_stream(request.model, request.text, request.max_new_tokens, request.temperature, request.timeout)
+
+@app.get("/models")
+def read_models():
+    """Models that can be requested, which of them are loaded, their load time and memory, and evictions"""
+    return registry.stats()
+
+@app.get("/stats")
+def read_stats():
+    """Per loaded model scheduler statistics, including queue wait, time to first token and prefix cache hits"""
+    schedulers = {}
+    for name, scheduler in registry.loaded().items():
+        stats = scheduler.stats()
+        schedulers[name] = {"ttft": stats.pop("ttft"), "scheduler": stats}
+    return {"models": registry.stats(), "schedulers": schedulers}
 
 @app.get("/health")
 def read_root():
+    """Liveness check endpoint"""
     return {"status": "ok"}
+
+@app.get("/ready")
+def read_ready():
+    """Readiness check endpoint, with the cold start report; ready once the warm models are loaded"""
+    report = startup_profile.report()
+    if not startup_profile.ready:
+        return JSONResponse(status_code=503, content=report)
+    return report
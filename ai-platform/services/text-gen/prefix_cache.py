@@ -0,0 +1,169 @@
+import logging
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+import torch
+
+logger = logging.getLogger("ai_platform.text_gen")
+
+
+class _Block:
+    """Keys and values of one block of prompt tokens, for every layer."""
+    
+    __slots__ = ("tokens", "keys", "values", "nbytes")
+    
+    def __init__(self, tokens: Tuple[int, ...], keys: List[torch.Tensor], values: List[torch.Tensor]):
+        self.tokens = tokens
+        self.keys = keys
+        self.values = values
+        self.nbytes = sum(tensor.numel() * tensor.element_size() for tensor in keys + values)
+
+
+class PrefixCache:
+    """
+    Keeps the attention keys and values of prompt prefixes for reuse.
+    
+    Prompts are cut into blocks of `block_size` tokens and every block is
+    stored once, keyed by the chain of blocks before it, so prompts that
+    share a beginning, like the RAG instruction preamble, share its blocks. A
+    generation resumes from the longest run of cached blocks and only runs
+    the model over the rest of its prompt.
+    
+    Blocks are evicted least recently used first when the cache outgrows its
+    memory budget. A lookup refreshes a prefix's blocks from the last to the
+    first, so a block is never evicted before the blocks that extend it.
+    """
+    
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, block_size: int = 16):
+        """
+        Initialize the cache.
+        
+        Args:
+            max_bytes: Memory budget for the cached keys and values
+            block_size: Number of tokens per block; prefixes are reused in whole blocks
+        """
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        
+        self._blocks: "OrderedDict[int, _Block]" = OrderedDict()
+        self.nbytes = 0
+        
+        self.lookups = 0
+        self.hits = 0
+        self.prompt_tokens = 0
+        self.reused_tokens = 0
+        self.evictions = 0
+        
+        logger.info(f"PrefixCache initialized with {max_bytes / 2**20:.0f} MiB budget and {block_size}-token blocks")
+    
+    def _chain(self, input_ids: Sequence[int], count: int):
+        """
+        Yield the key and tokens of the first `count` blocks of a prompt.
+        """
+        key = 0
+        for start in range(0, count * self.block_size, self.block_size):
+            tokens = tuple(input_ids[start:start + self.block_size])
+            key = hash((key, tokens))
+            yield key, tokens
+    
+    def lookup(self, input_ids: Sequence[int]) -> Tuple[int, Optional[List[torch.Tensor]], Optional[List[torch.Tensor]]]:
+        """
+        Find the longest cached prefix of a prompt.
+        
+        At least the last token of the prompt is always left over, since the
+        model has to run on it to predict the first new token.
+        
+        Args:
+            input_ids: Token IDs of the prompt
+        
+        Returns:
+            The number of cached tokens and, if any, the keys and values of
+            every layer for them, shaped [1, heads, tokens, head dim]
+        """
+        self.lookups += 1
+        self.prompt_tokens += len(input_ids)
+        
+        path = []
+        for key, tokens in self._chain(input_ids, (len(input_ids) - 1) // self.block_size):
+            block = self._blocks.get(key)
+            if block is None or block.tokens != tokens:
+                break
+            path.append(key)
+        
+        if not path:
+            return 0, None, None
+        
+        for key in reversed(path):
+            self._blocks.move_to_end(key)
+        
+        blocks = [self._blocks[key] for key in path]
+        keys = [torch.cat([block.keys[layer] for block in blocks], dim=2) for layer in range(len(blocks[0].keys))]
+        values = [torch.cat([block.values[layer] for block in blocks], dim=2) for layer in range(len(blocks[0].values))]
+        
+        cached_tokens = len(path) * self.block_size
+        self.hits += 1
+        self.reused_tokens += cached_tokens
+        return cached_tokens, keys, values
+    
+    def insert(self, input_ids: Sequence[int], keys: List[torch.Tensor], values: List[torch.Tensor]):
+        """
+        Store the whole blocks of a prompt that aren't cached yet.
+        
+        Args:
+            input_ids: Token IDs of the prompt
+            keys: Keys of every layer for the prompt, shaped [heads, tokens, head dim]
+            values: Values of every layer, shaped like `keys`
+        """
+        path = []
+        for index, (key, tokens) in enumerate(self._chain(input_ids, len(input_ids) // self.block_size)):
+            path.append(key)
+            block = self._blocks.get(key)
+            if block is not None and block.tokens == tokens:
+                self._blocks.move_to_end(key)
+                continue
+            
+            start, end = index * self.block_size, (index + 1) * self.block_size
+            block = _Block(
+                tokens,
+                [layer[:, start:end].unsqueeze(0).clone() for layer in keys],
+                [layer[:, start:end].unsqueeze(0).clone() for layer in values]
+            )
+            if block.nbytes > self.max_bytes:
+                break
+            
+            previous = self._blocks.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._blocks[key] = block
+            self.nbytes += block.nbytes
+            
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._blocks.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+        
+        # Leave every block more recently used than the ones that extend it
+        for key in reversed(path):
+            if key in self._blocks:
+                self._blocks.move_to_end(key)
+    
+    def stats(self):
+        """
+        Get cache statistics.
+        
+        Returns:
+            Dictionary with the lookups, hits, share of prompt tokens served
+            from the cache, blocks, memory use and evictions
+        """
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "token_hit_rate": round(self.reused_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+            "reused_tokens": self.reused_tokens,
+            "blocks": len(self._blocks),
+            "block_size": self.block_size,
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions
+        }
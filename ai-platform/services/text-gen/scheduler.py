@@ -0,0 +1,524 @@
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+import threading
+from typing import List, Optional, AsyncIterator
+
+import torch
+from transformers import DynamicCache
+
+from shared.metrics.latency import LatencyTracker
+from prefix_cache import PrefixCache
+
+logger = logging.getLogger("ai_platform.text_gen")
+
+
+class QueueFullError(Exception):
+    """The admission queue is full; the caller should retry later."""
+
+
+class DeadlineExceededError(Exception):
+    """The request can't start, or couldn't start, before its deadline."""
+
+
+class GenerationRequest:
+    """
+    One sequence submitted to the scheduler.
+    
+    The scheduler thread appends tokens and hands the decoded text to the
+    event loop that submitted the request, where it is read with `stream` or
+    `result`.
+    """
+    
+    def __init__(self, input_ids: List[int], max_new_tokens: int, temperature: float, deadline: float,
+                 loop: asyncio.AbstractEventLoop):
+        self.input_ids = input_ids
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.deadline = deadline
+        
+        self.enqueued_at = time.monotonic()
+        self.admitted_at = None
+        self.first_token_at = None
+        self.finished_at = None
+        
+        self.generated: List[int] = []
+        self.text = ""
+        self.cancelled = False
+        self.finished = False
+        
+        self._loop = loop
+        self._events: asyncio.Queue = asyncio.Queue()
+    
+    def _emit(self, kind: str, value=None):
+        # Called from the scheduler thread
+        try:
+            self._loop.call_soon_threadsafe(self._events.put_nowait, (kind, value))
+        except RuntimeError:
+            # The event loop is gone, nobody is listening any more
+            self.cancelled = True
+    
+    def cancel(self):
+        """Stop generating for this request, e.g. because the client went away."""
+        self.cancelled = True
+    
+    async def stream(self) -> AsyncIterator[str]:
+        """
+        Yield the generated text piece by piece as the scheduler produces it.
+        
+        Raises:
+            DeadlineExceededError: If the request expired in the queue
+            Exception: Whatever made generation fail
+        """
+        while True:
+            kind, value = await self._events.get()
+            if kind == "token":
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                return
+    
+    async def result(self) -> str:
+        """
+        Wait for the whole generated text.
+        
+        Returns:
+            The generated continuation, without the prompt
+        """
+        return "".join([piece async for piece in self.stream()])
+
+
+class BatchScheduler:
+    """
+    Runs concurrent generation requests as one batch with continuous batching.
+    
+    A background thread owns the model. Running sequences share a left-padded
+    key/value cache and advance together, one token per forward pass. Between
+    decode steps, finished sequences leave the batch and queued ones join it
+    after a batched prefill of their prompts, so a long generation never holds
+    up a short one that arrives later.
+    
+    Requests wait in a bounded queue ordered by deadline. Submitting to a full
+    queue fails right away, as does a request whose deadline can't be met at
+    the current backlog; a request whose deadline passes while it waits is
+    dropped when it would have been admitted.
+    """
+    
+    def __init__(self, model, tokenizer, max_batch_size: int = 8, max_queue_size: int = 64,
+                 max_context: Optional[int] = None, prefix_cache: Optional[PrefixCache] = None):
+        """
+        Initialize the scheduler.
+        
+        Args:
+            model: Causal language model
+            tokenizer: Its tokenizer
+            max_batch_size: Maximum number of sequences decoded together
+            max_queue_size: Maximum number of requests waiting for a slot
+            max_context: Maximum prompt plus generated tokens; defaults to the model's position limit
+            prefix_cache: Cache of prompt prefix keys and values to resume prefills from
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_queue_size = max_queue_size
+        self.max_context = max_context or getattr(model.config, "max_position_embeddings", None) or 1024
+        self.prefix_cache = prefix_cache
+        
+        self.eos_token_id = tokenizer.eos_token_id
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else self.eos_token_id
+        
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        
+        # The running batch: one row per sequence in `_active`
+        self._active: List[GenerationRequest] = []
+        self._keys: Optional[List[torch.Tensor]] = None
+        self._values: Optional[List[torch.Tensor]] = None
+        self._attention_mask: Optional[torch.Tensor] = None
+        self._positions: Optional[torch.Tensor] = None
+        self._next_tokens: Optional[torch.Tensor] = None
+        
+        # Seconds a sequence spends in the batch, to estimate queue waits
+        self._sequence_seconds = 0.0
+        
+        self.queue_wait_tracker = LatencyTracker()
+        self.ttft_tracker = LatencyTracker()
+        self.decode_steps = 0
+        self.batched_rows = 0
+        self.tokens_generated = 0
+        self.completed = 0
+        self.rejected_full = 0
+        self.rejected_deadline = 0
+        self.expired = 0
+        
+        logger.info(f"BatchScheduler initialized with batch size {max_batch_size}, queue size {max_queue_size}, context {self.max_context}")
+    
+    def start(self):
+        """
+        Start the scheduler thread.
+        """
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="text-gen-scheduler", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """
+        Stop the scheduler thread and fail whatever is still queued or running.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        
+        for request in self._active + [entry[2] for entry in self._queue]:
+            request._emit("error", RuntimeError("Text generation is shutting down"))
+        self._queue = []
+        self._reset_batch()
+    
+    def submit(self, text: str, max_new_tokens: int = 50, temperature: float = 1.0,
+               timeout: float = 30.0) -> GenerationRequest:
+        """
+        Queue a prompt for generation. Must be called from a running event loop.
+        
+        Args:
+            text: The prompt
+            max_new_tokens: Maximum number of tokens to generate
+            temperature: Sampling temperature; 0 for greedy decoding
+            timeout: Seconds from now by which generation must have started
+        
+        Returns:
+            The request, to read the generated text from
+        
+        Raises:
+            QueueFullError: If the queue is full
+            DeadlineExceededError: If the backlog is too long to start before the deadline
+        """
+        max_new_tokens = max(1, min(max_new_tokens, self.max_context - 1))
+        input_ids = self.tokenizer(text)["input_ids"]
+        # Keep the end of prompts that leave no room to generate
+        input_ids = input_ids[-(self.max_context - max_new_tokens):] or [self.eos_token_id]
+        
+        request = GenerationRequest(
+            input_ids=input_ids,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            deadline=time.monotonic() + timeout,
+            loop=asyncio.get_running_loop()
+        )
+        
+        with self._condition:
+            if len(self._queue) >= self.max_queue_size:
+                self.rejected_full += 1
+                raise QueueFullError(f"Generation queue is full ({self.max_queue_size} requests waiting)")
+            if request.enqueued_at + self._estimate_wait() > request.deadline:
+                self.rejected_deadline += 1
+                raise DeadlineExceededError(f"Generation can't start within {timeout}s at the current load")
+            
+            heapq.heappush(self._queue, (request.deadline, next(self._counter), request))
+            self._condition.notify()
+        
+        return request
+    
+    def _estimate_wait(self) -> float:
+        """
+        Estimate how long a request submitted now waits for a slot in the batch.
+        """
+        waiting = len(self._active) + len(self._queue) - self.max_batch_size
+        if waiting < 0:
+            return 0.0
+        # Slots free up at roughly a batch-full per sequence duration
+        return (waiting // self.max_batch_size + 1) * self._sequence_seconds
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._queue and not self._active:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                admitted = self._pop_admissible()
+            
+            try:
+                with torch.no_grad():
+                    if admitted:
+                        self._prefill(admitted)
+                    if self._active:
+                        self._decode_step()
+            except Exception as e:
+                logger.error(f"Error in generation step, failing {len(self._active)} sequences: {str(e)}")
+                for request in self._active + [r for r in admitted if r not in self._active]:
+                    request._emit("error", e)
+                self._reset_batch()
+    
+    def _pop_admissible(self) -> List[GenerationRequest]:
+        """
+        Take queued requests into free batch slots, earliest deadline first.
+        """
+        admitted = []
+        now = time.monotonic()
+        while self._queue and len(self._active) + len(admitted) < self.max_batch_size:
+            _, _, request = heapq.heappop(self._queue)
+            if request.cancelled:
+                continue
+            if request.deadline < now:
+                self.expired += 1
+                request._emit("error", DeadlineExceededError("Generation didn't start before the deadline"))
+                continue
+            request.admitted_at = now
+            self.queue_wait_tracker.record((now - request.enqueued_at) * 1000)
+            admitted.append(request)
+        return admitted
+    
+    def _prefill(self, requests: List[GenerationRequest]):
+        """
+        Run the prompts of newly admitted requests and add them to the batch.
+        
+        Prompts that start with a cached prefix resume from it one by one;
+        the others are run together in one padded forward pass.
+        """
+        fresh = []
+        for request in requests:
+            if self.prefix_cache is not None:
+                cached_tokens, keys, values = self.prefix_cache.lookup(request.input_ids)
+                if cached_tokens:
+                    self._prefill_from_prefix(request, cached_tokens, keys, values)
+                    continue
+            fresh.append(request)
+        
+        if not fresh:
+            return
+        
+        length = max(len(request.input_ids) for request in fresh)
+        input_ids = torch.full((len(fresh), length), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(fresh), length), dtype=torch.long)
+        for row, request in enumerate(fresh):
+            input_ids[row, length - len(request.input_ids):] = torch.tensor(request.input_ids)
+            attention_mask[row, length - len(request.input_ids):] = 1
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+        
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            use_cache=True
+        )
+        keys = [layer.keys for layer in outputs.past_key_values.layers]
+        values = [layer.values for layer in outputs.past_key_values.layers]
+        
+        if self.prefix_cache is not None:
+            for row, request in enumerate(fresh):
+                padding = length - len(request.input_ids)
+                self.prefix_cache.insert(
+                    request.input_ids,
+                    [layer[row, :, padding:] for layer in keys],
+                    [layer[row, :, padding:] for layer in values]
+                )
+        
+        self._append_rows(
+            fresh,
+            keys,
+            values,
+            attention_mask,
+            torch.tensor([len(request.input_ids) for request in fresh], dtype=torch.long)
+        )
+        self._sample_and_emit(outputs.logits[:, -1, :], rows=range(len(self._active) - len(fresh), len(self._active)))
+    
+    def _prefill_from_prefix(self, request: GenerationRequest, cached_tokens: int, keys, values):
+        """
+        Run the part of a prompt after its cached prefix and add it to the batch.
+        """
+        length = len(request.input_ids)
+        outputs = self.model(
+            input_ids=torch.tensor([request.input_ids[cached_tokens:]], dtype=torch.long),
+            attention_mask=torch.ones((1, length), dtype=torch.long),
+            position_ids=torch.arange(cached_tokens, length, dtype=torch.long).unsqueeze(0),
+            past_key_values=DynamicCache(ddp_cache_data=list(zip(keys, values))),
+            use_cache=True
+        )
+        keys = [layer.keys for layer in outputs.past_key_values.layers]
+        values = [layer.values for layer in outputs.past_key_values.layers]
+        
+        # Blocks past the cached prefix become available to later prompts
+        self.prefix_cache.insert(request.input_ids, [layer[0] for layer in keys], [layer[0] for layer in values])
+        
+        self._append_rows(
+            [request],
+            keys,
+            values,
+            torch.ones((1, length), dtype=torch.long),
+            torch.tensor([length], dtype=torch.long)
+        )
+        self._sample_and_emit(outputs.logits[:, -1, :], rows=[len(self._active) - 1])
+    
+    def _append_rows(self, requests, keys, values, attention_mask, positions):
+        """
+        Concatenate new sequences to the batch, left-padding whichever side is shorter.
+        """
+        if not self._active:
+            self._active = list(requests)
+            self._keys, self._values = keys, values
+            self._attention_mask = attention_mask
+            self._positions = positions
+            self._next_tokens = torch.zeros(len(requests), dtype=torch.long)
+            return
+        
+        def left_pad(tensor, length, dim):
+            missing = length - tensor.shape[dim]
+            if missing == 0:
+                return tensor
+            shape = list(tensor.shape)
+            shape[dim] = missing
+            return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+        
+        length = max(self._attention_mask.shape[1], attention_mask.shape[1])
+        self._keys = [torch.cat([left_pad(old, length, 2), left_pad(new, length, 2)]) for old, new in zip(self._keys, keys)]
+        self._values = [torch.cat([left_pad(old, length, 2), left_pad(new, length, 2)]) for old, new in zip(self._values, values)]
+        self._attention_mask = torch.cat([left_pad(self._attention_mask, length, 1), left_pad(attention_mask, length, 1)])
+        self._positions = torch.cat([self._positions, positions])
+        self._next_tokens = torch.cat([self._next_tokens, torch.zeros(len(requests), dtype=torch.long)])
+        self._active.extend(requests)
+    
+    def _decode_step(self):
+        """
+        Advance every running sequence by one token.
+        """
+        self._attention_mask = torch.cat(
+            [self._attention_mask, torch.ones((len(self._active), 1), dtype=torch.long)], dim=1
+        )
+        outputs = self.model(
+            input_ids=self._next_tokens.unsqueeze(1),
+            attention_mask=self._attention_mask,
+            position_ids=self._positions.unsqueeze(1),
+            past_key_values=DynamicCache(ddp_cache_data=list(zip(self._keys, self._values))),
+            use_cache=True
+        )
+        cache = outputs.past_key_values
+        self._keys = [layer.keys for layer in cache.layers]
+        self._values = [layer.values for layer in cache.layers]
+        self._positions = self._positions + 1
+        
+        self.decode_steps += 1
+        self.batched_rows += len(self._active)
+        self._sample_and_emit(outputs.logits[:, -1, :], rows=range(len(self._active)))
+    
+    def _sample_and_emit(self, logits: torch.Tensor, rows):
+        """
+        Pick the next token of some rows, hand out the new text and retire finished sequences.
+        
+        Args:
+            logits: Next-token logits, one row per entry of `rows`
+            rows: Batch rows the logits belong to
+        """
+        rows = list(rows)
+        temperatures = torch.tensor([self._active[row].temperature for row in rows], dtype=torch.float32)
+        greedy = logits.argmax(dim=-1)
+        probabilities = torch.softmax(logits.float() / temperatures.clamp(min=1e-5).unsqueeze(1), dim=-1)
+        sampled = torch.multinomial(probabilities, 1).squeeze(1)
+        tokens = torch.where(temperatures > 0, sampled, greedy)
+        
+        now = time.monotonic()
+        finished_rows = []
+        for row, token in zip(rows, tokens.tolist()):
+            request = self._active[row]
+            self._next_tokens[row] = token
+            
+            if token != self.eos_token_id:
+                request.generated.append(token)
+                self.tokens_generated += 1
+                text = self.tokenizer.decode(request.generated, skip_special_tokens=True)
+                # Hold back incomplete multi-byte characters until the next token completes them
+                if text.startswith(request.text) and not text.endswith("\ufffd"):
+                    piece = text[len(request.text):]
+                    request.text = text
+                    if piece:
+                        if request.first_token_at is None:
+                            request.first_token_at = now
+                            self.ttft_tracker.record((now - request.enqueued_at) * 1000)
+                        request._emit("token", piece)
+            
+            done = (
+                token == self.eos_token_id
+                or len(request.generated) >= request.max_new_tokens
+                or int(self._positions[row]) + 1 >= self.max_context
+                or request.cancelled
+            )
+            if done:
+                finished_rows.append(row)
+        
+        if finished_rows:
+            self._retire(finished_rows, now)
+    
+    def _retire(self, rows: List[int], now: float):
+        """
+        Remove finished sequences from the batch.
+        """
+        for row in rows:
+            request = self._active[row]
+            request.finished = True
+            request.finished_at = now
+            request._emit("done")
+            self.completed += 1
+            
+            # Exponential moving average of the time sequences spend in the batch
+            duration = now - request.admitted_at
+            self._sequence_seconds = 0.8 * self._sequence_seconds + 0.2 * duration if self._sequence_seconds else duration
+        
+        finished = set(rows)
+        keep = [row for row in range(len(self._active)) if row not in finished]
+        if not keep:
+            self._reset_batch()
+            return
+        
+        index = torch.tensor(keep, dtype=torch.long)
+        self._active = [self._active[row] for row in keep]
+        self._attention_mask = self._attention_mask.index_select(0, index)
+        self._positions = self._positions.index_select(0, index)
+        self._next_tokens = self._next_tokens.index_select(0, index)
+        
+        # Drop the padding columns no remaining sequence needs
+        start = int((self._attention_mask.sum(dim=0) > 0).nonzero()[0])
+        self._attention_mask = self._attention_mask[:, start:]
+        self._keys = [keys.index_select(0, index)[:, :, start:] for keys in self._keys]
+        self._values = [values.index_select(0, index)[:, :, start:] for values in self._values]
+    
+    def _reset_batch(self):
+        self._active = []
+        self._keys = self._values = None
+        self._attention_mask = self._positions = self._next_tokens = None
+    
+    def stats(self):
+        """
+        Get scheduler statistics.
+        
+        Returns:
+            Dictionary with the queue and batch occupancy, throughput counters,
+            rejections and the queue wait and time-to-first-token summaries
+        """
+        with self._condition:
+            queued = len(self._queue)
+        return {
+            "queued": queued,
+            "running": len(self._active),
+            "max_batch_size": self.max_batch_size,
+            "max_queue_size": self.max_queue_size,
+            "decode_steps": self.decode_steps,
+            "mean_batch_size": round(self.batched_rows / self.decode_steps, 2) if self.decode_steps else 0.0,
+            "tokens_generated": self.tokens_generated,
+            "completed": self.completed,
+            "rejected_queue_full": self.rejected_full,
+            "rejected_deadline": self.rejected_deadline,
+            "expired_in_queue": self.expired,
+            "prefix_cache": self.prefix_cache.stats() if self.prefix_cache is not None else None,
+            "queue_wait": self.queue_wait_tracker.summary(),
+            "ttft": self.ttft_tracker.summary()
+        }
@@ -0,0 +1,99 @@
+import os
+import sys
+
+import pytest
+import torch
+
+# Add the platform root to the path so we can import the shared libraries
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from shared.models.registry import ModelRegistry, UnknownModelError, local_model_path
+
+# Bytes of weights of a Linear(256, 256) model: 256 * 256 + 256 floats
+MODEL_BYTES = (256 * 256 + 256) * 4
+
+
+def make_registry(budget_models, unloaded):
+    loads = []
+
+    def loader(name):
+        loads.append(name)
+        return torch.nn.Linear(256, 256)
+
+    registry = ModelRegistry(
+        loader,
+        ["small", "medium", "large"],
+        memory_budget=budget_models * MODEL_BYTES,
+        unloader=lambda model: unloaded.append(model)
+    )
+    return registry, loads
+
+
+def test_models_load_once_and_unknown_models_are_refused():
+    registry, loads = make_registry(3, [])
+
+    with registry.lease() as first:
+        pass
+    with registry.lease("small") as second:
+        pass
+
+    assert first is second
+    assert loads == ["small"]
+    assert registry.stats()["loaded"]["small"]["tensor_bytes"] == MODEL_BYTES
+    with pytest.raises(UnknownModelError):
+        registry.acquire("huge")
+
+
+def test_least_recently_used_idle_model_is_evicted_over_budget():
+    unloaded = []
+    registry, loads = make_registry(2, unloaded)
+    registry.warm(["small", "medium"])
+
+    # "medium" is held by a request, so "small" has to go even though it was used earlier
+    name, _ = registry.acquire("medium")
+    with registry.lease("small"):
+        pass
+    with registry.lease("large"):
+        pass
+
+    assert set(registry.loaded()) == {"medium", "large"}
+    assert len(unloaded) == 1
+    stats = registry.stats()
+    assert stats["evictions"] == 1
+    assert stats["recent_evictions"][0]["model"] == "small"
+    assert stats["loaded_bytes"] <= stats["memory_budget"]
+
+    registry.release(name)
+    with registry.lease("small"):
+        pass
+    assert set(registry.loaded()) == {"large", "small"}
+    assert loads == ["small", "medium", "large", "small"]
+
+
+def cache_model(cache_dir, name, files):
+    """Lay out a model in a Hugging Face cache the way the Hub client does."""
+    repo = cache_dir / f"models--{name.replace('/', '--')}"
+    (repo / "refs").mkdir(parents=True)
+    (repo / "refs" / "main").write_text("abc123")
+    snapshot = repo / "snapshots" / "abc123"
+    snapshot.mkdir(parents=True)
+    for filename in files:
+        (snapshot / filename).write_text("{}")
+    return str(snapshot)
+
+
+def test_cached_models_load_from_their_snapshot_without_the_hub(tmp_path, monkeypatch):
+    import huggingface_hub.constants
+    monkeypatch.setattr(huggingface_hub.constants, "HF_HUB_CACHE", str(tmp_path))
+    snapshot = cache_model(tmp_path, "org/cached", ["config.json", "model.safetensors"])
+    cache_model(tmp_path, "org/no-weights", ["config.json"])
+
+    assert local_model_path("org/cached") == snapshot
+    assert local_model_path(snapshot) == snapshot
+    # Without its safetensors weights in the cache, a model is downloaded
+    assert local_model_path("org/no-weights") == "org/no-weights"
+
+    monkeypatch.setenv("MODEL_LOCAL_FILES_ONLY", "true")
+    assert local_model_path("org/cached") == snapshot
+    with pytest.raises(FileNotFoundError):
+        local_model_path("org/missing")
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import sys
+
+import pytest
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers, decoders
+from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+# Add the parent directory to the path so we can import the scheduler
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# and the platform root for the shared libraries
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from scheduler import BatchScheduler, QueueFullError
+from prefix_cache import PrefixCache
+
+WORDS = "<eos> <unk> the a of and to in is it that was for on are as with his they at be this from have or by one had not but".split()
+
+
+@pytest.fixture(scope="module")
+def tiny_model():
+    """A small random GPT-2 with a word-level tokenizer, so no model has to be downloaded."""
+    tokenizer = Tokenizer(models.WordLevel(vocab={word: i for i, word in enumerate(WORDS)}, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.decoder = decoders.WordPiece(prefix="##")
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<eos>", unk_token="<unk>", pad_token="<eos>")
+
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=len(WORDS), n_positions=128, n_embd=32, n_layer=2, n_head=2, bos_token_id=0, eos_token_id=0)
+    return GPT2LMHeadModel(config).eval(), tokenizer
+
+
+def reference_completion(model, tokenizer, prompt, max_new_tokens):
+    input_ids = tokenizer(prompt, return_tensors="pt").input_ids
+    output = model.generate(
+        input_ids,
+        attention_mask=torch.ones_like(input_ids),
+        max_new_tokens=max_new_tokens,
+        do_sample=False,
+        pad_token_id=tokenizer.pad_token_id
+    )
+    return tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True)
+
+
+def test_continuous_batching_matches_sequential_greedy_decoding(tiny_model):
+    model, tokenizer = tiny_model
+    prompts = ["the a of and to in is it", "was for", "on are as with his they at be this from have", "one had not"]
+    scheduler = BatchScheduler(model, tokenizer, max_batch_size=3)
+    scheduler.start()
+
+    async def run():
+        requests = []
+        # Stagger the prompts so they join a batch that is already decoding
+        for i, prompt in enumerate(prompts):
+            requests.append(scheduler.submit(prompt, max_new_tokens=4 + 3 * i, temperature=0))
+            await asyncio.sleep(0.005)
+        return await asyncio.gather(*[request.result() for request in requests])
+
+    try:
+        completions = asyncio.run(run())
+    finally:
+        scheduler.stop()
+
+    assert completions == [reference_completion(model, tokenizer, prompt, 4 + 3 * i) for i, prompt in enumerate(prompts)]
+    assert scheduler.stats()["completed"] == len(prompts)
+
+
+def test_full_queue_rejects_new_requests(tiny_model):
+    model, tokenizer = tiny_model
+    # Not started, so nothing leaves the queue
+    scheduler = BatchScheduler(model, tokenizer, max_batch_size=1, max_queue_size=2)
+
+    async def run():
+        scheduler.submit("the a", max_new_tokens=4)
+        scheduler.submit("of and", max_new_tokens=4)
+        with pytest.raises(QueueFullError):
+            scheduler.submit("to in", max_new_tokens=4)
+
+    asyncio.run(run())
+    assert scheduler.stats()["rejected_queue_full"] == 1
+
+
+def test_prefix_cache_resumes_shared_prompts_without_changing_output(tiny_model):
+    model, tokenizer = tiny_model
+    context = " ".join(WORDS[2:] * 2)
+    prompts = [f"{context} is {word}" for word in ("the", "of", "the")]
+    prefix_cache = PrefixCache(block_size=8)
+    scheduler = BatchScheduler(model, tokenizer, prefix_cache=prefix_cache)
+    scheduler.start()
+
+    async def run():
+        return [await scheduler.submit(prompt, max_new_tokens=5, temperature=0).result() for prompt in prompts]
+
+    try:
+        completions = asyncio.run(run())
+    finally:
+        scheduler.stop()
+
+    assert completions == [reference_completion(model, tokenizer, prompt, 5) for prompt in prompts]
+    stats = prefix_cache.stats()
+    # The shared context is reused by the second and third prompt
+    assert stats["hits"] == 2
+    assert stats["reused_tokens"] >= 2 * (len(context.split()) // 8) * 8
+
+
+def test_prefix_cache_evicts_within_its_budget():
+    layer = torch.zeros(2, 32, 4)
+    block_bytes = 2 * 2 * 8 * 4 * layer.element_size()
+    cache = PrefixCache(max_bytes=3 * block_bytes, block_size=8)
+
+    cache.insert(list(range(32)), [layer], [layer])
+
+    assert cache.stats()["blocks"] == 3
+    assert cache.stats()["evictions"] == 1
+    # The first block went, so nothing of this prompt can be resumed any more
+    assert cache.lookup(list(range(33)))[0] == 0
@@ -0,0 +1,24 @@
+import os
+import sys
+
+# Add the platform root to the path so we can import the shared libraries
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from shared.startup.profile import StartupProfile
+from shared.startup.warmup import parse_sequence_lengths, run_warmup
+
+
+def test_sequence_lengths_are_clamped_deduplicated_and_sorted():
+    assert parse_sequence_lengths("512, 16,128,,2048", max_length=1023) == [16, 128, 512, 1023]
+    assert parse_sequence_lengths("") == []
+
+
+def test_first_inference_is_reported_apart_from_the_rest_of_the_warmup():
+    profile = StartupProfile()
+    seen = []
+
+    timings = run_warmup(seen.append, [16, 128, 512], profile=profile, label="distilgpt2")
+
+    assert seen == [16, 128, 512]
+    assert set(timings) == {16, 128, 512}
+    assert set(profile.report()["phases_ms"]) == {"first_inference:distilgpt2", "warmup:distilgpt2"}
@@ -0,0 +1,342 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import logging
+from array import array
+from collections import Counter
+from typing import List, Tuple, Iterable, Optional, Callable
+
+import numpy as np
+
+logger = logging.getLogger("ai_platform.vector_db")
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Checksums are sums of 64-bit document hashes, wrapped around
+CHECKSUM_MASK = (1 << 64) - 1
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase word tokens.
+    
+    Args:
+        text: The text to tokenize
+    
+    Returns:
+        List of tokens
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def document_hash(doc_id: str, text: Optional[str]) -> int:
+    """
+    Hash the ID and text of one document into 64 bits.
+    """
+    digest = hashlib.blake2b(f"{doc_id}\0{text or ''}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def content_checksum(ids: Iterable[str], texts: Iterable[Optional[str]]) -> int:
+    """
+    Checksum the IDs and texts of a set of documents.
+    
+    The checksum is a sum, so it doesn't depend on the order of the documents
+    and the checksums of pages of a collection can be added up.
+    
+    Args:
+        ids: Document IDs
+        texts: Document texts
+    
+    Returns:
+        The checksum
+    """
+    return sum(document_hash(doc_id, text) for doc_id, text in zip(ids, texts)) & CHECKSUM_MASK
+
+
+class BM25Index:
+    """
+    A compact, incrementally built BM25 inverted index for one collection.
+    
+    Documents are numbered in insertion order. Each term maps to two parallel
+    arrays of document numbers and term frequencies, so posting lists can be
+    scored as NumPy views without copying. Deletes only set a tombstone;
+    `compact` drops them for good.
+    
+    A checksum of the IDs and texts of the live documents is kept up to date,
+    so a saved index can be checked against its collection on load.
+    """
+    
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        """
+        Initialize an empty index.
+        
+        Args:
+            path: File the index is saved to and loaded from
+            k1: BM25 term frequency saturation
+            b: BM25 document length normalization
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        
+        self.doc_ids: List[str] = []
+        self.doc_numbers = {}
+        self.doc_lengths = array("I")
+        self.doc_hashes = array("Q")
+        self.deleted = bytearray()
+        self.postings = {}
+        
+        self.live_count = 0
+        self.live_length = 0
+        self.checksum = 0
+        self.dirty = False
+        
+        self._lock = threading.RLock()
+    
+    def add(self, ids: List[str], texts: List[str]):
+        """
+        Index documents. Re-adding an existing ID replaces the old version.
+        
+        Args:
+            ids: Document IDs
+            texts: Document texts
+        """
+        with self._lock:
+            self.remove([doc_id for doc_id in ids if doc_id in self.doc_numbers])
+            
+            for doc_id, text in zip(ids, texts):
+                doc_number = len(self.doc_ids)
+                term_counts = Counter(tokenize(text or ""))
+                length = sum(term_counts.values())
+                
+                self.doc_ids.append(doc_id)
+                self.doc_numbers[doc_id] = doc_number
+                self.doc_lengths.append(length)
+                self.doc_hashes.append(document_hash(doc_id, text))
+                self.deleted.append(0)
+                
+                for term, count in term_counts.items():
+                    posting = self.postings.get(term)
+                    if posting is None:
+                        posting = (array("I"), array("I"))
+                        self.postings[term] = posting
+                    posting[0].append(doc_number)
+                    posting[1].append(count)
+                
+                self.live_count += 1
+                self.live_length += length
+                self.checksum = (self.checksum + self.doc_hashes[doc_number]) & CHECKSUM_MASK
+            
+            self.dirty = True
+    
+    def remove(self, ids: Iterable[str]):
+        """
+        Remove documents from the index.
+        
+        Args:
+            ids: IDs of the documents to remove; unknown IDs are ignored
+        """
+        with self._lock:
+            for doc_id in ids:
+                doc_number = self.doc_numbers.pop(doc_id, None)
+                if doc_number is None:
+                    continue
+                self.deleted[doc_number] = 1
+                self.live_count -= 1
+                self.live_length -= self.doc_lengths[doc_number]
+                self.checksum = (self.checksum - self.doc_hashes[doc_number]) & CHECKSUM_MASK
+                self.dirty = True
+    
+    def search(self, query: str, n_results: int = 5) -> List[Tuple[str, float]]:
+        """
+        Find the documents that best match a query.
+        
+        Args:
+            query: The query text
+            n_results: Number of results to return
+        
+        Returns:
+            List of (document ID, BM25 score), best first
+        """
+        terms = set(tokenize(query))
+        
+        with self._lock:
+            if self.live_count == 0 or not terms:
+                return []
+            
+            doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)
+            deleted = np.frombuffer(self.deleted, dtype=np.uint8).astype(bool)
+            average_length = self.live_length / self.live_count
+            length_norm = self.k1 * (1 - self.b + self.b * doc_lengths / average_length)
+            scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+            
+            for term in terms:
+                posting = self.postings.get(term)
+                if posting is None:
+                    continue
+                
+                doc_numbers = np.frombuffer(posting[0], dtype=np.uint32)
+                frequencies = np.frombuffer(posting[1], dtype=np.uint32).astype(np.float32)
+                live = ~deleted[doc_numbers]
+                document_frequency = int(live.sum())
+                if document_frequency == 0:
+                    continue
+                
+                idf = math.log(1 + (self.live_count - document_frequency + 0.5) / (document_frequency + 0.5))
+                # Each document appears at most once per posting list, so plain fancy indexing is safe
+                scores[doc_numbers] += idf * frequencies * (self.k1 + 1) / (frequencies + length_norm[doc_numbers])
+            
+            scores[deleted] = 0
+            candidates = np.flatnonzero(scores)
+            if len(candidates) > n_results:
+                candidates = candidates[np.argpartition(-scores[candidates], n_results - 1)[:n_results]]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            
+            return [(self.doc_ids[i], float(scores[i])) for i in candidates]
+    
+    def compact(self):
+        """
+        Rebuild the posting lists without the deleted documents.
+        """
+        with self._lock:
+            if not any(self.deleted):
+                return
+            
+            remap = array("i")
+            doc_ids, doc_lengths, doc_hashes = [], array("I"), array("Q")
+            for doc_number, doc_id in enumerate(self.doc_ids):
+                if self.deleted[doc_number]:
+                    remap.append(-1)
+                else:
+                    remap.append(len(doc_ids))
+                    doc_ids.append(doc_id)
+                    doc_lengths.append(self.doc_lengths[doc_number])
+                    doc_hashes.append(self.doc_hashes[doc_number])
+            
+            postings = {}
+            for term, (doc_numbers, frequencies) in self.postings.items():
+                new_numbers, new_frequencies = array("I"), array("I")
+                for doc_number, frequency in zip(doc_numbers, frequencies):
+                    if remap[doc_number] >= 0:
+                        new_numbers.append(remap[doc_number])
+                        new_frequencies.append(frequency)
+                if new_numbers:
+                    postings[term] = (new_numbers, new_frequencies)
+            
+            self.doc_ids = doc_ids
+            self.doc_numbers = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+            self.doc_lengths = doc_lengths
+            self.doc_hashes = doc_hashes
+            self.deleted = bytearray(len(doc_ids))
+            self.postings = postings
+            self.dirty = True
+    
+    def save(self, document_count: Optional[int] = None):
+        """
+        Write the index to its file if it changed since it was last saved.
+        
+        The file is written next to the target and then renamed, so readers
+        never see a partial index.
+        
+        The checksum of the indexed documents is recorded along with the
+        document count, so a stale index can be detected on load.
+        
+        Args:
+            document_count: Number of documents in the collection
+        """
+        if self.path is None:
+            return
+        
+        with self._lock:
+            if not self.dirty and os.path.exists(self.path):
+                return
+            
+            self.compact()
+            
+            terms = list(self.postings)
+            offsets = array("Q", [0])
+            for term in terms:
+                offsets.append(offsets[-1] + len(self.postings[term][0]))
+            
+            header = json.dumps({
+                "doc_ids": self.doc_ids,
+                "terms": terms,
+                "document_count": document_count,
+                "checksum": self.checksum
+            }).encode("utf-8")
+            
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    header=np.frombuffer(header, dtype=np.uint8),
+                    doc_lengths=np.frombuffer(self.doc_lengths, dtype=np.uint32),
+                    doc_hashes=np.frombuffer(self.doc_hashes, dtype=np.uint64),
+                    offsets=np.frombuffer(offsets, dtype=np.uint64),
+                    doc_numbers=np.frombuffer(b"".join(self.postings[t][0].tobytes() for t in terms), dtype=np.uint32),
+                    frequencies=np.frombuffer(b"".join(self.postings[t][1].tobytes() for t in terms), dtype=np.uint32)
+                )
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        
+        logger.info(f"Saved BM25 index with {len(self.doc_ids)} documents and {len(terms)} terms to {self.path}")
+    
+    @classmethod
+    def load(cls, path: str, document_count: Optional[int] = None,
+             checksum: Optional[Callable[[], int]] = None) -> Optional["BM25Index"]:
+        """
+        Load an index from disk.
+        
+        A document that was replaced keeps the count unchanged, so when the
+        count matches, the saved checksum is compared with the collection's too.
+        
+        Args:
+            path: File the index was saved to
+            document_count: Current number of documents in the collection; if it
+                doesn't match the saved index, the index is considered stale
+            checksum: Computes the `content_checksum` of the collection's
+                documents; only called if the count matched. If its result
+                doesn't match the saved index, the index is considered stale
+        
+        Returns:
+            The index, or None if the file is missing or stale
+        """
+        if not os.path.exists(path):
+            return None
+        
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(data["header"].tobytes().decode("utf-8"))
+            if document_count is not None and header["document_count"] != document_count:
+                logger.warning(f"BM25 index at {path} is stale, it needs to be rebuilt")
+                return None
+            # Indexes saved without a checksum can't be checked, and are rebuilt too
+            if checksum is not None and header.get("checksum") != checksum():
+                logger.warning(f"BM25 index at {path} doesn't match its collection's documents, it needs to be rebuilt")
+                return None
+            
+            index = cls(path=path)
+            index.doc_ids = header["doc_ids"]
+            index.doc_numbers = {doc_id: i for i, doc_id in enumerate(index.doc_ids)}
+            index.doc_lengths = array("I", data["doc_lengths"].tobytes())
+            if "doc_hashes" in data:
+                index.doc_hashes = array("Q", data["doc_hashes"].tobytes())
+            else:
+                index.doc_hashes = array("Q", [0] * len(index.doc_ids))
+            index.deleted = bytearray(len(index.doc_ids))
+            
+            offsets = data["offsets"]
+            doc_numbers = data["doc_numbers"].tobytes()
+            frequencies = data["frequencies"].tobytes()
+            for i, term in enumerate(header["terms"]):
+                start, end = int(offsets[i]) * 4, int(offsets[i + 1]) * 4
+                index.postings[term] = (array("I", doc_numbers[start:end]), array("I", frequencies[start:end]))
+        
+        index.live_count = len(index.doc_ids)
+        index.live_length = sum(index.doc_lengths)
+        index.checksum = header.get("checksum") or 0
+        return index
@@ -1,37 +1,207 @@
 import os
+import re
+import json
+import time
+import base64
+import threading
+import contextlib
 import chromadb
 from chromadb.config import Settings
 from chromadb.utils import embedding_functions
 import logging
+from bm25_index import BM25Index, CHECKSUM_MASK, content_checksum
 
 logger = logging.getLogger("ai_platform.vector_db")
 
+# Constant of reciprocal rank fusion; higher values flatten the contribution of top ranks
+RRF_K = 60
+
+QUERY_MODES = ("dense", "lexical", "hybrid")
+
+# Names of the collections a compaction copies into and swaps out; reserved, and
+# never listed, so nothing opens or expires them halfway through a swap
+TRANSIENT_COLLECTION_NAME = re.compile(r"-(compact|retired)-\d+$")
+
+def is_transient_collection(collection_name):
+    """Whether a name is one a compaction uses for its temporary collections."""
+    return TRANSIENT_COLLECTION_NAME.search(collection_name) is not None
+
+# File in the persist directory that carries the collection versions to replicas
+VERSIONS_FILE = "collection_versions.json"
+
+# Seconds `reopen` waits for reads on the previous ChromaDB client to finish before giving up on closing it
+READER_DRAIN_TIMEOUT = 30.0
+
 class ChromaClient:
     """
     A wrapper around ChromaDB client to handle vector database operations.
     """
     
-    def __init__(self, persist_directory="./chroma_db"):
+    def __init__(self, persist_directory="./chroma_db", lexical_index=True, hybrid_candidates=4):
         """
         Initialize the ChromaDB client.
         
+        Nothing heavy happens here: the persistent client and the embedding
+        model are opened on first use or by `initialize`, and collections are
+        opened lazily and cached.
+        
         Args:
             persist_directory: Directory to persist the database
+            lexical_index: Whether to maintain a BM25 index per collection for lexical and hybrid queries
+            hybrid_candidates: Multiple of n_results fetched from each retriever before fusing hybrid results
         """
         self.persist_directory = persist_directory
+        self.lexical_index = lexical_index
+        self.hybrid_candidates = hybrid_candidates
         
         # Create the directory if it doesn't exist
         os.makedirs(persist_directory, exist_ok=True)
         
-        # Initialize the client
-        self.client = chromadb.PersistentClient(path=persist_directory)
+        self._client = None
+        self._embedding_function = None
+        self._collections = {}
+        self._lexical_indexes = {}
+        self._init_lock = threading.Lock()
         
-        # Use sentence-transformers for embedding
-        self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
+        # Reads in progress per ChromaDB client, so `reopen` closes the previous one only once they are done
+        self._readers = {}
+        self._readers_changed = threading.Condition()
         
-        logger.info(f"ChromaDB client initialized with persist directory: {persist_directory}")
+        # Deletes per collection since it was last compacted
+        self.deleted_since_compaction = {}
+        
+        # IDs written to each collection being compacted, while it is copied
+        self._compacting = {}
+        
+        # Writes hold this lock so snapshots of the persist directory are consistent
+        self.write_lock = threading.RLock()
+        self.write_count = 0
+        
+        # Per-collection counters bumped by every change to a collection's
+        # documents. The epoch keeps versions unique across restarts, since
+        # the counters themselves start from zero again.
+        self.version_epoch = str(time.time_ns())
+        self._versions = {}
+        
+        logger.info(f"ChromaDB client created with persist directory: {persist_directory}")
+    
+    @property
+    def client(self):
+        """
+        The ChromaDB persistent client, opened on first access.
+        """
+        if self._client is None:
+            with self._init_lock:
+                if self._client is None:
+                    self._client = chromadb.PersistentClient(path=self.persist_directory)
+                    logger.info(f"ChromaDB client opened on persist directory: {self.persist_directory}")
+        return self._client
+    
+    @property
+    def embedding_function(self):
+        """
+        The sentence-transformers embedding function, loaded on first access.
+        """
+        if self._embedding_function is None:
+            with self._init_lock:
+                if self._embedding_function is None:
+                    self._embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
+                        model_name="all-MiniLM-L6-v2"
+                    )
+                    logger.info("Embedding model loaded")
+        return self._embedding_function
+    
+    def initialize(self, preload_collections=None, profile=None):
+        """
+        Open the client, load the embedding model and warm up a hot set of collections.
+        
+        Meant to run in the background at startup so the service can answer
+        liveness checks while this is in progress.
+        
+        Args:
+            preload_collections: Names of collections to open and warm up
+            profile: Optional StartupProfile to record the duration of each step
+        """
+        def phase(name):
+            return profile.phase(name) if profile is not None else contextlib.nullcontext()
+        
+        with phase("client_open"):
+            self.client
+        
+        with phase("embedding_model_load"):
+            self.embedding_function
+        
+        existing = set(self.list_collections())
+        for collection_name in preload_collections or []:
+            if collection_name not in existing:
+                logger.warning(f"Preload collection '{collection_name}' does not exist, skipping")
+                continue
+            
+            with phase(f"preload:{collection_name}"):
+                collection = self._get_collection(collection_name)
+                # A first query loads the collection's index into memory
+                if collection.count() > 0:
+                    collection.query(query_texts=["warmup"], n_results=1)
+        
+        logger.info(f"ChromaDB client initialized, preloaded {len(preload_collections or [])} collections")
+    
+    def reopen(self, persist_directory):
+        """
+        Point the client at a different persist directory.
+        
+        Used by read replicas to swap in a freshly published snapshot. Reads
+        started from now on use the new client; the previous one is closed
+        once the reads still using it are done.
+        
+        Args:
+            persist_directory: Directory holding the database to open
+        """
+        new_client = chromadb.PersistentClient(path=persist_directory)
+        
+        with self.write_lock, self._readers_changed:
+            old_client = self._client
+            self._client = new_client
+            self._collections = {}
+            self._lexical_indexes = {}
+            self.persist_directory = persist_directory
+            self._load_versions()
+        
+        with self._readers_changed:
+            drained = self._readers_changed.wait_for(
+                lambda: id(old_client) not in self._readers,
+                timeout=READER_DRAIN_TIMEOUT
+            )
+        
+        close = getattr(old_client, "close", None)
+        if not drained:
+            logger.warning(f"Previous ChromaDB client still in use after {READER_DRAIN_TIMEOUT}s, leaving it open")
+        elif close is not None:
+            try:
+                close()
+            except Exception as e:
+                logger.warning(f"Error closing previous ChromaDB client: {str(e)}")
+        
+        logger.info(f"ChromaDB client reopened on persist directory: {persist_directory}")
+    
+    @contextlib.contextmanager
+    def _reading(self):
+        """
+        Register a read of the current ChromaDB client for the duration of the block.
+        
+        Reads must open collections inside the block, so they come from the
+        client that `reopen` waits on before closing it.
+        """
+        with self._readers_changed:
+            key = id(self.client)
+            self._readers[key] = self._readers.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._readers_changed:
+                self._readers[key] -= 1
+                if not self._readers[key]:
+                    del self._readers[key]
+                    self._readers_changed.notify_all()
     
     def create_collection(self, collection_name):
         """
@@ -43,21 +213,172 @@ class ChromaClient:
         Returns:
             The collection object
         """
+        with self.write_lock:
+            collection = self._get_collection(collection_name)
+            self.write_count += 1
+            return collection
+    
+    def _get_collection(self, collection_name):
+        """
+        Get a collection, creating it if it doesn't exist yet.
+        
+        Opened collections are cached so later calls don't go back to ChromaDB.
+        Names reserved for compaction are refused.
+        
+        Args:
+            collection_name: Name of the collection
+            
+        Returns:
+            The collection object
+        """
+        collection = self._collections.get(collection_name)
+        if collection is not None:
+            return collection
+        
+        if is_transient_collection(collection_name):
+            raise ValueError(f"Collection name '{collection_name}' is reserved for compaction")
+        
         try:
-            collection = self.client.get_or_create_collection(
+            client = self.client
+            collection = client.get_or_create_collection(
                 name=collection_name,
                 embedding_function=self.embedding_function
             )
+            # Not cached if `reopen` swapped the client meanwhile
+            if client is self._client:
+                self._collections[collection_name] = collection
             logger.info(f"Collection '{collection_name}' created or retrieved")
             return collection
         except Exception as e:
             logger.error(f"Error creating collection '{collection_name}': {str(e)}")
             raise
     
+    def _lexical_index_path(self, collection_name):
+        return os.path.join(self.persist_directory, "bm25", f"{collection_name}.npz")
+    
+    def _get_lexical_index(self, collection_name):
+        """
+        Get the BM25 index of a collection, loading it from disk or rebuilding it if needed.
+        
+        Args:
+            collection_name: Name of the collection
+            
+        Returns:
+            The BM25Index
+        """
+        index = self._lexical_indexes.get(collection_name)
+        if index is not None:
+            return index
+        
+        with self.write_lock:
+            index = self._lexical_indexes.get(collection_name)
+            if index is not None:
+                return index
+            
+            collection = self._get_collection(collection_name)
+            path = self._lexical_index_path(collection_name)
+            count = collection.count()
+            
+            index = BM25Index.load(path, document_count=count, checksum=lambda: self._content_checksum(collection, count))
+            if index is None:
+                # Missing or out of date: rebuild from the stored documents
+                index = BM25Index(path=path)
+                for offset in range(0, count, 1000):
+                    page = collection.get(limit=1000, offset=offset, include=["documents"])
+                    index.add(page["ids"], page["documents"])
+                logger.info(f"Rebuilt BM25 index for collection '{collection_name}' from {count} documents")
+            
+            self._lexical_indexes[collection_name] = index
+            return index
+    
+    @staticmethod
+    def _content_checksum(collection, count):
+        """
+        Checksum the IDs and texts of a collection's documents, a page at a time.
+        
+        Args:
+            collection: The collection object
+            count: Number of documents in the collection
+            
+        Returns:
+            The collection's `content_checksum`
+        """
+        checksum = 0
+        for offset in range(0, count, 1000):
+            page = collection.get(limit=1000, offset=offset, include=["documents"])
+            checksum = (checksum + content_checksum(page["ids"], page["documents"])) & CHECKSUM_MASK
+        return checksum
+    
+    def collection_version(self, collection_name):
+        """
+        Get the current version of a collection.
+        
+        The version changes whenever documents are added to or deleted from
+        the collection, so anything derived from its contents can be cached
+        under it.
+        
+        Args:
+            collection_name: Name of the collection
+            
+        Returns:
+            The version string
+        """
+        return f"{self.version_epoch}.{self._versions.get(collection_name, 0)}"
+    
+    def _bump_version(self, collection_name):
+        # Callers hold the write lock
+        self._versions[collection_name] = self._versions.get(collection_name, 0) + 1
+    
+    def _touch(self, collection_name, ids):
+        # Callers hold the write lock; a compaction copies these again before its swap
+        written = self._compacting.get(collection_name)
+        if written is not None:
+            written.update(ids)
+    
+    def save_versions(self):
+        """
+        Write the collection versions to the persist directory so snapshots carry them.
+        """
+        with self.write_lock:
+            path = os.path.join(self.persist_directory, VERSIONS_FILE)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"epoch": self.version_epoch, "versions": self._versions}, f)
+            os.replace(tmp_path, path)
+    
+    def _load_versions(self):
+        """
+        Load the collection versions saved with the persist directory, if any.
+        """
+        path = os.path.join(self.persist_directory, VERSIONS_FILE)
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+            self.version_epoch = saved["epoch"]
+            self._versions = saved["versions"]
+        except Exception as e:
+            logger.warning(f"Error loading collection versions: {str(e)}")
+    
+    def flush_lexical_indexes(self):
+        """
+        Save every BM25 index that changed since it was last saved.
+        """
+        with self.write_lock:
+            for collection_name, index in list(self._lexical_indexes.items()):
+                try:
+                    index.save(document_count=self._get_collection(collection_name).count())
+                except Exception as e:
+                    logger.error(f"Error saving BM25 index for collection '{collection_name}': {str(e)}")
+    
     def add_documents(self, collection_name, documents, metadatas=None, ids=None):
         """
         Add documents to a collection.
         
+        Documents whose ID is already in the collection replace the stored
+        ones, in the vector store and the lexical index alike.
+        
         Args:
             collection_name: Name of the collection
             documents: List of document texts
@@ -67,8 +388,6 @@ class ChromaClient:
         Returns:
             Result of the add operation
         """
-        collection = self.create_collection(collection_name)
-        
         if ids is None:
             # Generate IDs if not provided
             ids = [f"doc_{i}" for i in range(len(documents))]
@@ -77,19 +396,31 @@ class ChromaClient:
             # Create empty metadata if not provided
             metadatas = [{} for _ in range(len(documents))]
         
+        # Stamp the ingestion time, used for TTL expiry
+        ingested_at = time.time()
+        metadatas = [{"ingested_at": ingested_at, **(metadata or {})} for metadata in metadatas]
+        
         try:
-            result = collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
+            with self.write_lock:
+                collection = self._get_collection(collection_name)
+                lexical_index = self._get_lexical_index(collection_name) if self.lexical_index else None
+                result = collection.upsert(
+                    documents=documents,
+                    metadatas=metadatas,
+                    ids=ids
+                )
+                if lexical_index is not None:
+                    lexical_index.add(ids, documents)
+                self._touch(collection_name, ids)
+                self._bump_version(collection_name)
+                self.write_count += 1
             logger.info(f"Added {len(documents)} documents to collection '{collection_name}'")
             return result
         except Exception as e:
             logger.error(f"Error adding documents to collection '{collection_name}': {str(e)}")
             raise
     
-    def query(self, collection_name, query_text, n_results=5):
+    def query(self, collection_name, query_text, n_results=5, mode="dense"):
         """
         Query the collection for similar documents.
         
@@ -97,22 +428,234 @@ class ChromaClient:
             collection_name: Name of the collection
             query_text: Text to query
             n_results: Number of results to return
+            mode: "dense" for vector search, "lexical" for BM25, or "hybrid"
+                to fuse both with reciprocal rank fusion
+            
+        Returns:
+            Query results. Lexical and hybrid results carry a "scores" list
+            (higher is better) next to the usual "distances".
+        """
+        if mode not in QUERY_MODES:
+            raise ValueError(f"Invalid query mode '{mode}', expected one of {QUERY_MODES}")
+        if mode != "dense" and not self.lexical_index:
+            raise ValueError("Lexical and hybrid queries need the lexical index to be enabled")
+        
+        with self._reading():
+            collection = self._get_collection(collection_name)
+            
+            try:
+                if mode == "dense":
+                    results = collection.query(
+                        query_texts=[query_text],
+                        n_results=n_results
+                    )
+                else:
+                    results = self._query_lexical(collection, collection_name, query_text, n_results, mode)
+                logger.info(f"{mode.capitalize()} query executed on collection '{collection_name}' with {n_results} results")
+                return results
+            except Exception as e:
+                logger.error(f"Error querying collection '{collection_name}': {str(e)}")
+                raise
+    
+    def query_batch(self, collection_name, query_texts, n_results=5, mode="dense"):
+        """
+        Query the collection with several texts at once.
+        
+        Dense queries embed all texts in one batch and search the index in a
+        single call; lexical and hybrid queries run one after the other.
+        
+        Args:
+            collection_name: Name of the collection
+            query_texts: Texts to query
+            n_results: Number of results to return per query
+            mode: "dense", "lexical" or "hybrid", as in `query`
+            
+        Returns:
+            Query results with one entry per query text in every list, like a
+            multi-query ChromaDB result
+        """
+        if mode not in QUERY_MODES:
+            raise ValueError(f"Invalid query mode '{mode}', expected one of {QUERY_MODES}")
+        if mode != "dense" and not self.lexical_index:
+            raise ValueError("Lexical and hybrid queries need the lexical index to be enabled")
+        
+        with self._reading():
+            collection = self._get_collection(collection_name)
+            
+            try:
+                if mode == "dense":
+                    results = collection.query(
+                        query_texts=list(query_texts),
+                        n_results=n_results
+                    )
+                else:
+                    results = {"ids": [], "documents": [], "metadatas": [], "distances": [], "scores": []}
+                    for query_text in query_texts:
+                        single = self._query_lexical(collection, collection_name, query_text, n_results, mode)
+                        for key in results:
+                            results[key].extend(single[key])
+                logger.info(f"{mode.capitalize()} batch of {len(query_texts)} queries executed on collection '{collection_name}' with {n_results} results each")
+                return results
+            except Exception as e:
+                logger.error(f"Error querying collection '{collection_name}': {str(e)}")
+                raise
+    
+    def _query_lexical(self, collection, collection_name, query_text, n_results, mode):
+        """
+        Run a lexical or hybrid query.
+        
+        Args:
+            collection: The collection object
+            collection_name: Name of the collection
+            query_text: Text to query
+            n_results: Number of results to return
+            mode: "lexical" or "hybrid"
             
         Returns:
-            Query results
+            Query results in the same shape as a ChromaDB query
+        """
+        lexical_index = self._get_lexical_index(collection_name)
+        
+        if mode == "lexical":
+            hits = lexical_index.search(query_text, n_results)
+            ranked = [doc_id for doc_id, _ in hits]
+            scores = {doc_id: score for doc_id, score in hits}
+            dense = {}
+        else:
+            candidates = n_results * self.hybrid_candidates
+            lexical_hits = lexical_index.search(query_text, candidates)
+            dense_results = collection.query(query_texts=[query_text], n_results=candidates)
+            
+            dense = {
+                doc_id: (document, metadata, distance)
+                for doc_id, document, metadata, distance in zip(
+                    dense_results["ids"][0],
+                    dense_results["documents"][0],
+                    dense_results["metadatas"][0],
+                    dense_results["distances"][0]
+                )
+            }
+            
+            # Reciprocal rank fusion
+            scores = {}
+            for rank, doc_id in enumerate(dense_results["ids"][0]):
+                scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+            for rank, (doc_id, _) in enumerate(lexical_hits):
+                scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+            
+            ranked = sorted(scores, key=scores.get, reverse=True)[:n_results]
+        
+        # Fetch the text and metadata of hits the dense query didn't return
+        missing = [doc_id for doc_id in ranked if doc_id not in dense]
+        if missing:
+            fetched = collection.get(ids=missing, include=["documents", "metadatas"])
+            for doc_id, document, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                dense[doc_id] = (document, metadata, None)
+        
+        ranked = [doc_id for doc_id in ranked if doc_id in dense]
+        return {
+            "ids": [ranked],
+            "documents": [[dense[doc_id][0] for doc_id in ranked]],
+            "metadatas": [[dense[doc_id][1] for doc_id in ranked]],
+            "distances": [[dense[doc_id][2] for doc_id in ranked]],
+            "scores": [[scores[doc_id] for doc_id in ranked]]
+        }
+    
+    @staticmethod
+    def encode_cursor(offset):
         """
-        collection = self.create_collection(collection_name)
+        Encode a scan position as an opaque resume token.
         
+        Args:
+            offset: Number of records already returned
+            
+        Returns:
+            The resume token
+        """
+        return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode("utf-8")).decode("ascii")
+    
+    @staticmethod
+    def decode_cursor(cursor):
+        """
+        Decode a resume token produced by `encode_cursor`.
+        
+        Args:
+            cursor: The resume token, or None to start from the beginning
+            
+        Returns:
+            The scan offset
+        """
+        if not cursor:
+            return 0
         try:
-            results = collection.query(
-                query_texts=[query_text],
-                n_results=n_results
-            )
-            logger.info(f"Query executed on collection '{collection_name}' with {n_results} results")
-            return results
-        except Exception as e:
-            logger.error(f"Error querying collection '{collection_name}': {str(e)}")
-            raise
+            offset = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["offset"]
+        except Exception:
+            raise ValueError("Invalid scan cursor")
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError("Invalid scan cursor")
+        return offset
+    
+    def scan(self, collection_name, cursor=None, page_size=500, limit=None,
+             where=None, where_document=None, include_embeddings=False):
+        """
+        Iterate over the records of a collection page by page.
+        
+        Only one page is held in memory at a time. The cursor is positional, so
+        records deleted concurrently with a scan can cause others to be skipped.
+        
+        Args:
+            collection_name: Name of the collection
+            cursor: Resume token from a previous scan, or None to start at the beginning
+            page_size: Number of records fetched from ChromaDB per page
+            limit: Maximum number of records to return, or None for all
+            where: Metadata filter
+            where_document: Document content filter
+            include_embeddings: Whether to return the embeddings
+            
+        Yields:
+            ("record", dict) for each record and ("cursor", token) after each
+            page; the token is None once the collection is exhausted
+        """
+        with self._reading():
+            collection = self._get_collection(collection_name)
+            offset = self.decode_cursor(cursor)
+            include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+            returned = 0
+            
+            while limit is None or returned < limit:
+                batch_size = page_size if limit is None else min(page_size, limit - returned)
+                
+                try:
+                    page = collection.get(
+                        where=where,
+                        where_document=where_document,
+                        limit=batch_size,
+                        offset=offset,
+                        include=include
+                    )
+                except Exception as e:
+                    logger.error(f"Error scanning collection '{collection_name}': {str(e)}")
+                    raise
+                
+                ids = page["ids"]
+                for i, record_id in enumerate(ids):
+                    record = {
+                        "id": record_id,
+                        "text": page["documents"][i] if page.get("documents") is not None else None,
+                        "metadata": page["metadatas"][i] if page.get("metadatas") is not None else None
+                    }
+                    if include_embeddings and page.get("embeddings") is not None:
+                        record["embedding"] = [float(value) for value in page["embeddings"][i]]
+                    yield "record", record
+                
+                offset += len(ids)
+                returned += len(ids)
+                
+                if len(ids) < batch_size:
+                    yield "cursor", None
+                    return
+                
+                yield "cursor", self.encode_cursor(offset)
     
     def get_collection_info(self, collection_name):
         """
@@ -124,31 +667,38 @@ class ChromaClient:
         Returns:
             Collection information
         """
-        collection = self.create_collection(collection_name)
-        
-        try:
-            count = collection.count()
-            return {
-                "name": collection_name,
-                "count": count
-            }
-        except Exception as e:
-            logger.error(f"Error getting collection info for '{collection_name}': {str(e)}")
-            raise
+        with self._reading():
+            collection = self._get_collection(collection_name)
+            
+            try:
+                count = collection.count()
+                return {
+                    "name": collection_name,
+                    "count": count,
+                    "version": self.collection_version(collection_name),
+                    "ttl_seconds": (collection.metadata or {}).get("ttl_seconds") or None,
+                    "deleted_since_compaction": self.deleted_since_compaction.get(collection_name, 0)
+                }
+            except Exception as e:
+                logger.error(f"Error getting collection info for '{collection_name}': {str(e)}")
+                raise
     
     def list_collections(self):
         """
         List all collections in the database.
         
+        The temporary collections of compactions in progress are left out.
+        
         Returns:
             List of collection names
         """
-        try:
-            collections = self.client.list_collections()
-            return [collection.name for collection in collections]
-        except Exception as e:
-            logger.error(f"Error listing collections: {str(e)}")
-            raise
+        with self._reading():
+            try:
+                collections = self.client.list_collections()
+                return [collection.name for collection in collections if not is_transient_collection(collection.name)]
+            except Exception as e:
+                logger.error(f"Error listing collections: {str(e)}")
+                raise
     
     def delete_collection(self, collection_name):
         """
@@ -158,9 +708,313 @@ class ChromaClient:
             collection_name: Name of the collection
         """
         try:
-            self.client.delete_collection(collection_name)
+            with self.write_lock:
+                self.client.delete_collection(collection_name)
+                self._collections.pop(collection_name, None)
+                self._compacting.pop(collection_name, None)
+                self.deleted_since_compaction.pop(collection_name, None)
+                self._lexical_indexes.pop(collection_name, None)
+                if os.path.exists(self._lexical_index_path(collection_name)):
+                    os.remove(self._lexical_index_path(collection_name))
+                self._bump_version(collection_name)
+                self.write_count += 1
             logger.info(f"Collection '{collection_name}' deleted")
             return True
         except Exception as e:
             logger.error(f"Error deleting collection '{collection_name}': {str(e)}")
             raise
+    
+    def delete_documents(self, collection_name, ids=None, id_prefix=None, where=None, page_size=1000):
+        """
+        Delete documents from a collection by ID, ID prefix and/or metadata match.
+        
+        Chunks created by the data-ingestion service have IDs of the form
+        `<document id>_chunk_<n>`, or `<document id>_chunk_<text hash>` for
+        documents re-ingested incrementally, so an ID prefix deletes every
+        chunk of a source document. Criteria are combined with AND.
+        
+        ChromaDB can't match ID prefixes, so the matching IDs are collected
+        without the write lock, which would otherwise hold up every write for
+        a scan of the whole collection. If the collection changed meanwhile,
+        they are collected again under the lock.
+        
+        Args:
+            collection_name: Name of the collection
+            ids: List of document IDs
+            id_prefix: Prefix that the IDs of the documents to delete start with
+            where: Metadata filter
+            page_size: Number of IDs fetched and deleted per batch
+            
+        Returns:
+            Number of documents deleted
+        """
+        if ids is None and id_prefix is None and where is None:
+            raise ValueError("At least one of ids, id_prefix or where is required")
+        
+        try:
+            # The lexical index needs to know what went away, so the matching
+            # IDs are collected before anything is deleted
+            try:
+                with self._reading():
+                    version = self.collection_version(collection_name)
+                    collection = self._get_collection(collection_name)
+                    matching_ids = self._matching_ids(collection, ids, id_prefix, where, page_size)
+            except Exception as e:
+                # E.g. a compaction retired the collection mid-scan
+                logger.warning(f"Error collecting the documents to delete from collection '{collection_name}', retrying under the write lock: {str(e)}")
+                collection = None
+            
+            with self.write_lock:
+                # Writes made during the scan may have added matches, or moved
+                # records past its pages; a compaction swaps the collection
+                if (collection is None or self.collection_version(collection_name) != version
+                        or self._get_collection(collection_name) is not collection):
+                    collection = self._get_collection(collection_name)
+                    matching_ids = self._matching_ids(collection, ids, id_prefix, where, page_size)
+                count_before = collection.count()
+                
+                for start in range(0, len(matching_ids), page_size):
+                    collection.delete(ids=matching_ids[start:start + page_size])
+                
+                if self.lexical_index and matching_ids:
+                    self._get_lexical_index(collection_name).remove(matching_ids)
+                self._touch(collection_name, matching_ids)
+                
+                deleted = count_before - collection.count()
+                if deleted > 0:
+                    self.deleted_since_compaction[collection_name] = self.deleted_since_compaction.get(collection_name, 0) + deleted
+                    self._bump_version(collection_name)
+                    self.write_count += 1
+            
+            logger.info(f"Deleted {deleted} documents from collection '{collection_name}'")
+            return deleted
+        except Exception as e:
+            logger.error(f"Error deleting documents from collection '{collection_name}': {str(e)}")
+            raise
+    
+    @staticmethod
+    def _matching_ids(collection, ids, id_prefix, where, page_size):
+        """The IDs of a collection's records that match the criteria of `delete_documents`."""
+        matching_ids = []
+        offset = 0
+        while True:
+            page = collection.get(ids=ids, where=where, limit=page_size, offset=offset, include=[])
+            matching_ids.extend(
+                doc_id for doc_id in page["ids"]
+                if id_prefix is None or doc_id.startswith(id_prefix)
+            )
+            offset += len(page["ids"])
+            if len(page["ids"]) < page_size:
+                break
+        return matching_ids
+    
+    def update_metadata(self, collection_name, ids, metadatas, page_size=1000):
+        """
+        Merge new metadata fields into existing documents.
+        
+        Fields that aren't given keep their values, so enrichments such as
+        sentiment scores can be written without touching the ingestion
+        metadata. Text and embeddings are left as they are. Documents given
+        no fields are only checked for, so callers can find out which
+        documents are missing without writing anything.
+        
+        Args:
+            collection_name: Name of the collection
+            ids: IDs of the documents to update
+            metadatas: Fields to set on each document, in the order of `ids`
+            page_size: Number of documents updated per ChromaDB call
+            
+        Returns:
+            The IDs that were updated and those that don't exist
+        """
+        if len(ids) != len(metadatas):
+            raise ValueError("ids and metadatas must have the same length")
+        
+        try:
+            with self.write_lock:
+                collection = self._get_collection(collection_name)
+                existing = set()
+                for start in range(0, len(ids), page_size):
+                    existing.update(collection.get(ids=ids[start:start + page_size], include=[])["ids"])
+                
+                updates = [(doc_id, metadata) for doc_id, metadata in zip(ids, metadatas) if doc_id in existing and metadata]
+                for start in range(0, len(updates), page_size):
+                    page = updates[start:start + page_size]
+                    collection.update(ids=[doc_id for doc_id, _ in page], metadatas=[metadata for _, metadata in page])
+                
+                if updates:
+                    self._touch(collection_name, [doc_id for doc_id, _ in updates])
+                    self._bump_version(collection_name)
+                    self.write_count += 1
+            
+            updated = [doc_id for doc_id, _ in updates]
+            missing = [doc_id for doc_id in ids if doc_id not in existing]
+            logger.info(f"Updated metadata of {len(updated)} documents in collection '{collection_name}'")
+            return updated, missing
+        except Exception as e:
+            logger.error(f"Error updating metadata in collection '{collection_name}': {str(e)}")
+            raise
+    
+    def set_collection_ttl(self, collection_name, ttl_seconds):
+        """
+        Set or clear the time-to-live of the documents in a collection.
+        
+        Args:
+            collection_name: Name of the collection
+            ttl_seconds: Seconds after ingestion at which documents expire, or None to keep them forever
+        """
+        try:
+            with self.write_lock:
+                collection = self._get_collection(collection_name)
+                # ChromaDB can't remove a metadata key, so a cleared TTL is stored as 0
+                collection.modify(metadata={**(collection.metadata or {}), "ttl_seconds": ttl_seconds or 0})
+                self.write_count += 1
+            logger.info(f"Set TTL of collection '{collection_name}' to {ttl_seconds}")
+        except Exception as e:
+            logger.error(f"Error setting TTL of collection '{collection_name}': {str(e)}")
+            raise
+    
+    def expire_documents(self, collection_name):
+        """
+        Delete the documents of a collection that are older than its TTL.
+        
+        Args:
+            collection_name: Name of the collection
+            
+        Returns:
+            Number of documents deleted
+        """
+        collection = self._get_collection(collection_name)
+        ttl_seconds = (collection.metadata or {}).get("ttl_seconds")
+        if not ttl_seconds:
+            return 0
+        
+        cutoff = time.time() - ttl_seconds
+        return self.delete_documents(collection_name, where={"ingested_at": {"$lt": cutoff}})
+    
+    def compact_collection(self, collection_name, page_size=500, page_delay=0.05):
+        """
+        Rebuild a collection's index by copying its live records into a fresh collection.
+        
+        ChromaDB only marks deleted vectors in the HNSW index, so after heavy
+        deletes the index keeps growing and search gets slower. Embeddings are
+        copied as-is, so nothing is re-embedded. The copy sleeps between pages
+        to leave CPU for queries, and runs without the write lock, so writes
+        and snapshots carry on; records written in the meantime, and any the
+        copy missed because deletes moved them, are copied again under the
+        lock just before the compacted collection is swapped in.
+        
+        Args:
+            collection_name: Name of the collection
+            page_size: Number of records copied per page
+            page_delay: Seconds to sleep between pages
+            
+        Returns:
+            Number of records in the compacted collection
+        """
+        start_time = time.perf_counter()
+        with self.write_lock:
+            if collection_name in self._compacting:
+                raise ValueError(f"Collection '{collection_name}' is already being compacted")
+            collection = self._get_collection(collection_name)
+            self._compacting[collection_name] = set()
+        
+        compacted_name = f"{collection_name}-compact-{int(time.time())}"
+        compacted = None
+        try:
+            compacted = self.client.create_collection(
+                name=compacted_name,
+                metadata=collection.metadata or None,
+                embedding_function=self.embedding_function
+            )
+            
+            offset = 0
+            while True:
+                page = collection.get(
+                    limit=page_size,
+                    offset=offset,
+                    include=["documents", "metadatas", "embeddings"]
+                )
+                if len(page["ids"]) == 0:
+                    break
+                self._copy(compacted, page)
+                offset += len(page["ids"])
+                
+                if len(page["ids"]) < page_size:
+                    break
+                time.sleep(page_delay)
+            
+            with self.write_lock:
+                written = self._compacting.get(collection_name)
+                if written is None:
+                    raise ValueError(f"Collection '{collection_name}' was deleted while being compacted")
+                
+                # Bring the copy up to date with the writes made since it started
+                live_ids = self._all_ids(collection, page_size)
+                copied_ids = self._all_ids(compacted, page_size)
+                stale = [doc_id for doc_id in copied_ids if doc_id not in live_ids or doc_id in written]
+                for start in range(0, len(stale), page_size):
+                    compacted.delete(ids=stale[start:start + page_size])
+                missing = list(live_ids - (copied_ids - set(stale)))
+                for start in range(0, len(missing), page_size):
+                    self._copy(compacted, collection.get(
+                        ids=missing[start:start + page_size],
+                        include=["documents", "metadatas", "embeddings"]
+                    ))
+                if collection.metadata:
+                    compacted.modify(metadata=collection.metadata)
+                
+                # Swap the compacted collection in under the original name. The
+                # cache always holds a live collection, so readers never open
+                # (and create) an empty one halfway through.
+                retired_name = f"{collection_name}-retired-{int(time.time())}"
+                collection.modify(name=retired_name)
+                compacted.modify(name=collection_name)
+                self._collections[collection_name] = compacted
+                self.client.delete_collection(retired_name)
+                compacted = None
+                self.deleted_since_compaction[collection_name] = 0
+                
+                lexical_index = self._lexical_indexes.get(collection_name)
+                if lexical_index is not None:
+                    lexical_index.compact()
+                self.write_count += 1
+            
+            logger.info(f"Compacted collection '{collection_name}' ({len(live_ids)} records) in {time.perf_counter() - start_time:.1f}s")
+            return len(live_ids)
+        except Exception as e:
+            logger.error(f"Error compacting collection '{collection_name}': {str(e)}")
+            if compacted is not None:
+                # Leave the original collection untouched
+                try:
+                    self.client.delete_collection(compacted_name)
+                except Exception:
+                    pass
+            raise
+        finally:
+            with self.write_lock:
+                self._compacting.pop(collection_name, None)
+    
+    @staticmethod
+    def _copy(target, page):
+        """Add records fetched with their embeddings to another collection."""
+        if len(page["ids"]) == 0:
+            return
+        target.add(
+            ids=page["ids"],
+            embeddings=page["embeddings"],
+            documents=page["documents"],
+            metadatas=page["metadatas"]
+        )
+    
+    @staticmethod
+    def _all_ids(collection, page_size):
+        """The IDs of every record of a collection."""
+        ids = set()
+        offset = 0
+        while True:
+            page = collection.get(limit=page_size, offset=offset, include=[])
+            ids.update(page["ids"])
+            offset += len(page["ids"])
+            if len(page["ids"]) < page_size:
+                return ids
@@ -0,0 +1,114 @@
+import threading
+import logging
+
+logger = logging.getLogger("ai_platform.vector_db")
+
+
+class LifecycleManager:
+    """
+    Background job that expires documents past their collection's TTL,
+    compacts collections after heavy deletes and periodically saves the
+    BM25 indexes.
+    """
+    
+    def __init__(self, chroma_client, interval=300.0, compaction_delete_ratio=0.2,
+                 compaction_min_deletes=1000, compaction_page_size=500, compaction_page_delay=0.05):
+        """
+        Initialize the lifecycle manager.
+        
+        Args:
+            chroma_client: The primary's ChromaClient
+            interval: Seconds between lifecycle passes
+            compaction_delete_ratio: Fraction of a collection that must have been deleted since the last compaction to trigger one
+            compaction_min_deletes: Minimum number of deletes since the last compaction to trigger one
+            compaction_page_size: Records copied per page while compacting
+            compaction_page_delay: Seconds slept between pages while compacting, to protect query latency
+        """
+        self.chroma_client = chroma_client
+        self.interval = interval
+        self.compaction_delete_ratio = compaction_delete_ratio
+        self.compaction_min_deletes = compaction_min_deletes
+        self.compaction_page_size = compaction_page_size
+        self.compaction_page_delay = compaction_page_delay
+        
+        # Compactions are serialized, whether scheduled or requested through the API
+        self._compaction_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        
+        logger.info(f"LifecycleManager initialized with interval: {interval}s")
+    
+    def needs_compaction(self, collection_name):
+        """
+        Check whether enough of a collection was deleted to be worth compacting.
+        
+        Args:
+            collection_name: Name of the collection
+        
+        Returns:
+            True if the collection should be compacted
+        """
+        deleted = self.chroma_client.deleted_since_compaction.get(collection_name, 0)
+        if deleted < self.compaction_min_deletes:
+            return False
+        
+        count = self.chroma_client.get_collection_info(collection_name)["count"]
+        return deleted / (count + deleted) >= self.compaction_delete_ratio
+    
+    def compact(self, collection_name):
+        """
+        Compact a collection with the configured throttling.
+        
+        Args:
+            collection_name: Name of the collection
+        
+        Returns:
+            Number of records copied
+        """
+        with self._compaction_lock:
+            return self.chroma_client.compact_collection(
+                collection_name,
+                page_size=self.compaction_page_size,
+                page_delay=self.compaction_page_delay
+            )
+    
+    def run_once(self):
+        """
+        Expire and compact every collection once, then save the lexical indexes.
+        """
+        for collection_name in self.chroma_client.list_collections():
+            try:
+                expired = self.chroma_client.expire_documents(collection_name)
+                if expired:
+                    logger.info(f"Expired {expired} documents from collection '{collection_name}'")
+                
+                if self.needs_compaction(collection_name):
+                    self.compact(collection_name)
+            except Exception as e:
+                logger.error(f"Error running lifecycle on collection '{collection_name}': {str(e)}")
+        
+        self.chroma_client.flush_lexical_indexes()
+    
+    def start(self):
+        """
+        Start the lifecycle job in a background thread.
+        """
+        if self._thread is not None:
+            return
+        
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="lifecycle-manager", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """
+        Stop the background thread.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+    
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.run_once()
@@ -1,6 +1,10 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from contextlib import asynccontextmanager
+from typing import List, Dict, Optional, Any, Literal
+import asyncio
+import json
 import os
 import sys
 
@@ -15,13 +19,121 @@ except ImportError:
     handler = logging.StreamHandler()
     logger.addHandler(handler)
 
-from chroma_client import ChromaClient
+from shared.startup.profile import StartupProfile
+from shared.codec.columnar import ColumnarResults, CONTENT_TYPE as COLUMNAR_CONTENT_TYPE, accepts_columnar
 
-app = FastAPI()
+# Created before the heavy imports so the cold start report covers them
+startup_profile = StartupProfile()
 
-# Initialize the ChromaDB client
+with startup_profile.phase("import"):
+    from chroma_client import ChromaClient
+    from replication import SnapshotPublisher, SnapshotFollower
+    from lifecycle import LifecycleManager
+
+# Initialize the ChromaDB client. Opening the database and loading the
+# embedding model happen in the background once the server is up.
 PERSIST_DIRECTORY = os.getenv("PERSIST_DIRECTORY", "./chroma_db")
-chroma_client = ChromaClient(persist_directory=PERSIST_DIRECTORY)
+chroma_client = ChromaClient(
+    persist_directory=PERSIST_DIRECTORY,
+    lexical_index=os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true",
+    hybrid_candidates=int(os.getenv("HYBRID_CANDIDATES", "4"))
+)
+
+# Collections to open and warm up at startup instead of on first use
+PRELOAD_COLLECTIONS = [name.strip() for name in os.getenv("VECTOR_DB_PRELOAD_COLLECTIONS", "").split(",") if name.strip()]
+
+# Replication settings: a primary takes writes and publishes snapshots to
+# SNAPSHOT_DIRECTORY, read-only replicas load them and serve queries
+VECTOR_DB_ROLE = os.getenv("VECTOR_DB_ROLE", "primary")
+SNAPSHOT_DIRECTORY = os.getenv("SNAPSHOT_DIRECTORY")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "60"))
+REPLICA_POLL_INTERVAL = float(os.getenv("REPLICA_POLL_INTERVAL", "10"))
+
+if VECTOR_DB_ROLE not in ("primary", "replica"):
+    raise ValueError(f"Invalid VECTOR_DB_ROLE '{VECTOR_DB_ROLE}', expected 'primary' or 'replica'")
+
+snapshot_publisher = None
+snapshot_follower = None
+
+if VECTOR_DB_ROLE == "replica":
+    if not SNAPSHOT_DIRECTORY:
+        raise ValueError("SNAPSHOT_DIRECTORY must be set when VECTOR_DB_ROLE is 'replica'")
+    snapshot_follower = SnapshotFollower(
+        chroma_client,
+        snapshot_directory=SNAPSHOT_DIRECTORY,
+        local_directory=os.path.join(PERSIST_DIRECTORY, "snapshots"),
+        interval=REPLICA_POLL_INTERVAL
+    )
+elif SNAPSHOT_DIRECTORY:
+    snapshot_publisher = SnapshotPublisher(
+        chroma_client,
+        snapshot_directory=SNAPSHOT_DIRECTORY,
+        interval=SNAPSHOT_INTERVAL
+    )
+
+def initialize():
+    """Heavy startup work, run off the event loop"""
+    try:
+        if snapshot_follower is not None:
+            # Serve the latest snapshot from the start rather than an empty database
+            with startup_profile.phase("snapshot_load"):
+                try:
+                    snapshot_follower.poll()
+                except Exception as e:
+                    logger.error(f"Error loading initial snapshot: {str(e)}")
+        
+        chroma_client.initialize(preload_collections=PRELOAD_COLLECTIONS, profile=startup_profile)
+        
+        if snapshot_follower is not None:
+            snapshot_follower.start()
+        if snapshot_publisher is not None:
+            snapshot_publisher.start()
+        if lifecycle_manager is not None:
+            lifecycle_manager.start()
+        
+        startup_profile.mark_ready()
+        logger.info(f"vector-db ready, cold start report: {startup_profile.report()}")
+    except Exception as e:
+        startup_profile.mark_failed(e)
+        logger.error(f"Error initializing vector-db: {str(e)}")
+
+# Lifecycle settings: TTL expiry and compaction run on the primary only
+lifecycle_manager = None
+
+if VECTOR_DB_ROLE == "primary":
+    lifecycle_manager = LifecycleManager(
+        chroma_client,
+        interval=float(os.getenv("LIFECYCLE_INTERVAL", "300")),
+        compaction_delete_ratio=float(os.getenv("COMPACTION_DELETE_RATIO", "0.2")),
+        compaction_min_deletes=int(os.getenv("COMPACTION_MIN_DELETES", "1000")),
+        compaction_page_size=int(os.getenv("COMPACTION_PAGE_SIZE", "500")),
+        compaction_page_delay=float(os.getenv("COMPACTION_PAGE_DELAY", "0.05"))
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Don't block the server on initialization so /health answers immediately
+    startup_task = asyncio.get_running_loop().run_in_executor(None, initialize)
+    
+    yield
+    
+    await startup_task
+    if snapshot_follower is not None:
+        snapshot_follower.stop()
+    if snapshot_publisher is not None:
+        snapshot_publisher.stop()
+    if lifecycle_manager is not None:
+        lifecycle_manager.stop()
+    if VECTOR_DB_ROLE == "primary":
+        chroma_client.flush_lexical_indexes()
+        chroma_client.save_versions()
+
+app = FastAPI(lifespan=lifespan)
+
+def require_primary():
+    """Reject writes on read-only replicas"""
+    if VECTOR_DB_ROLE != "primary":
+        raise HTTPException(status_code=403, detail="This vector-db instance is a read-only replica")
 
 # Define data models
 class DocumentInput(BaseModel):
@@ -37,16 +149,73 @@ class QueryInput(BaseModel):
     query_text: str
     collection_name: str
     n_results: int = 5
+    mode: Literal["dense", "lexical", "hybrid"] = "dense"
+
+class QueryBatchInput(BaseModel):
+    query_texts: List[str]
+    collection_name: str
+    n_results: int = 5
+    mode: Literal["dense", "lexical", "hybrid"] = "dense"
 
 class CollectionInput(BaseModel):
     collection_name: str
 
+class DeleteDocumentsInput(BaseModel):
+    ids: Optional[List[str]] = None
+    id_prefix: Optional[str] = None
+    where: Optional[Dict[str, Any]] = None
+
+class MetadataUpdate(BaseModel):
+    id: str
+    metadata: Dict[str, Any]
+
+class MetadataUpdateInput(BaseModel):
+    updates: List[MetadataUpdate]
+
+class TTLInput(BaseModel):
+    ttl_seconds: Optional[int] = None
+
 @app.get("/health")
 def read_health():
-    """Health check endpoint"""
+    """Liveness check endpoint"""
     return {"status": "ok"}
 
-@app.post("/collections")
+@app.get("/ready")
+def read_ready():
+    """Readiness check endpoint, with the cold start report"""
+    report = startup_profile.report()
+    if not startup_profile.ready:
+        return JSONResponse(status_code=503, content=report)
+    return report
+
+@app.get("/replication")
+def read_replication_status():
+    """Replication role and snapshot status"""
+    if snapshot_follower is not None:
+        return {
+            "role": VECTOR_DB_ROLE,
+            "snapshot_version": snapshot_follower.current_version,
+            "loaded_at": snapshot_follower.loaded_at
+        }
+    return {
+        "role": VECTOR_DB_ROLE,
+        "snapshot_version": snapshot_publisher.latest_version if snapshot_publisher else None,
+        "write_count": chroma_client.write_count
+    }
+
+@app.post("/replication/snapshot", dependencies=[Depends(require_primary)])
+def publish_snapshot():
+    """Publish a snapshot immediately"""
+    if snapshot_publisher is None:
+        raise HTTPException(status_code=400, detail="SNAPSHOT_DIRECTORY is not configured")
+    try:
+        version = snapshot_publisher.publish(force=True)
+        return {"snapshot_version": version}
+    except Exception as e:
+        logger.error(f"Error publishing snapshot: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/collections", dependencies=[Depends(require_primary)])
 def create_collection(collection_input: CollectionInput):
     """Create a new collection"""
     try:
@@ -76,7 +245,59 @@ def get_collection_info(collection_name: str):
         logger.error(f"Error getting collection info: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.delete("/collections/{collection_name}")
+@app.get("/collections/{collection_name}/scan")
+def scan_collection(
+    collection_name: str,
+    cursor: Optional[str] = None,
+    page_size: int = 500,
+    limit: Optional[int] = None,
+    where: Optional[str] = None,
+    where_document: Optional[str] = None,
+    include_embeddings: bool = False
+):
+    """
+    Stream the records of a collection as NDJSON.
+    
+    Each record is a line with its id, text and metadata (and embedding if
+    requested). After every page a {"next_cursor": ...} line is emitted that
+    can be passed back as `cursor` to resume; it is null once the collection
+    is exhausted. `where` and `where_document` are JSON-encoded ChromaDB filters.
+    """
+    if page_size < 1 or page_size > 10000:
+        raise HTTPException(status_code=400, detail="page_size must be between 1 and 10000")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    try:
+        chroma_client.decode_cursor(cursor)
+        where_filter = json.loads(where) if where else None
+        where_document_filter = json.loads(where_document) if where_document else None
+    except (ValueError, json.JSONDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    records = chroma_client.scan(
+        collection_name,
+        cursor=cursor,
+        page_size=page_size,
+        limit=limit,
+        where=where_filter,
+        where_document=where_document_filter,
+        include_embeddings=include_embeddings
+    )
+    
+    def generate():
+        try:
+            for kind, value in records:
+                if kind == "record":
+                    yield json.dumps(value) + "\n"
+                else:
+                    yield json.dumps({"next_cursor": value}) + "\n"
+        except Exception as e:
+            logger.error(f"Error scanning collection: {str(e)}")
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.delete("/collections/{collection_name}", dependencies=[Depends(require_primary)])
 def delete_collection(collection_name: str):
     """Delete a collection"""
     try:
@@ -86,7 +307,58 @@ def delete_collection(collection_name: str):
         logger.error(f"Error deleting collection: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/documents")
+@app.post("/collections/{collection_name}/documents/delete", dependencies=[Depends(require_primary)])
+def delete_documents(collection_name: str, delete_input: DeleteDocumentsInput):
+    """Delete documents by ID, ID prefix (e.g. all chunks of a source document) and/or metadata match"""
+    if delete_input.ids is None and delete_input.id_prefix is None and delete_input.where is None:
+        raise HTTPException(status_code=400, detail="At least one of ids, id_prefix or where is required")
+    try:
+        deleted = chroma_client.delete_documents(
+            collection_name,
+            ids=delete_input.ids,
+            id_prefix=delete_input.id_prefix,
+            where=delete_input.where
+        )
+        return {"deleted": deleted}
+    except Exception as e:
+        logger.error(f"Error deleting documents: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/collections/{collection_name}/documents/metadata", dependencies=[Depends(require_primary)])
+def update_documents_metadata(collection_name: str, update_input: MetadataUpdateInput):
+    """Merge metadata fields into many documents at once; fields not given are kept, and documents given none are only checked for"""
+    try:
+        updated, missing = chroma_client.update_metadata(
+            collection_name,
+            [update.id for update in update_input.updates],
+            [update.metadata for update in update_input.updates]
+        )
+        return {"updated": len(updated), "missing": missing}
+    except Exception as e:
+        logger.error(f"Error updating document metadata: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/collections/{collection_name}/ttl", dependencies=[Depends(require_primary)])
+def set_collection_ttl(collection_name: str, ttl_input: TTLInput):
+    """Set the time-to-live of a collection's documents, or clear it with null"""
+    if ttl_input.ttl_seconds is not None and ttl_input.ttl_seconds < 0:
+        raise HTTPException(status_code=400, detail="ttl_seconds must not be negative")
+    try:
+        chroma_client.set_collection_ttl(collection_name, ttl_input.ttl_seconds)
+        return {"message": f"TTL of collection '{collection_name}' set to {ttl_input.ttl_seconds}"}
+    except Exception as e:
+        logger.error(f"Error setting collection TTL: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/collections/{collection_name}/compact", status_code=202, dependencies=[Depends(require_primary)])
+def compact_collection(collection_name: str, background_tasks: BackgroundTasks):
+    """Rebuild a collection's index in the background"""
+    if collection_name not in chroma_client.list_collections():
+        raise HTTPException(status_code=404, detail=f"Collection '{collection_name}' not found")
+    background_tasks.add_task(lifecycle_manager.compact, collection_name)
+    return {"message": f"Compaction of collection '{collection_name}' scheduled"}
+
+@app.post("/documents", dependencies=[Depends(require_primary)])
 def add_documents(documents_input: DocumentsInput):
     """Add documents to a collection"""
     try:
@@ -111,15 +383,53 @@ def add_documents(documents_input: DocumentsInput):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/query")
-def query_collection(query_input: QueryInput):
-    """Query a collection for similar documents"""
+def query_collection(query_input: QueryInput, request: Request):
+    """
+    Query a collection with dense, lexical (BM25) or hybrid search.
+    
+    Internal callers can ask for the columnar encoding with the Accept header;
+    everyone else gets Chroma's JSON result.
+    """
     try:
         results = chroma_client.query(
             collection_name=query_input.collection_name,
             query_text=query_input.query_text,
-            n_results=query_input.n_results
+            n_results=query_input.n_results,
+            mode=query_input.mode
+        )
+        # Lets callers cache anything derived from the results until the collection changes
+        version = chroma_client.collection_version(query_input.collection_name)
+        if accepts_columnar(request.headers.get("accept")):
+            columns = ColumnarResults.from_chroma(results)
+            columns.extra["collection_version"] = version
+            return Response(content=columns.encode(), media_type=COLUMNAR_CONTENT_TYPE)
+        return {**results, "collection_version": version}
+    except Exception as e:
+        logger.error(f"Error querying collection: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/query/batch")
+def query_collection_batch(query_input: QueryBatchInput, request: Request):
+    """
+    Query a collection with several texts in one call.
+    
+    The JSON result has one entry per query in every list, as ChromaDB returns
+    for multiple query texts. In the columnar encoding the rows of all queries
+    are stacked and "query_offsets" in the extras marks where each one starts.
+    """
+    try:
+        results = chroma_client.query_batch(
+            collection_name=query_input.collection_name,
+            query_texts=query_input.query_texts,
+            n_results=query_input.n_results,
+            mode=query_input.mode
         )
-        return results
+        version = chroma_client.collection_version(query_input.collection_name)
+        if accepts_columnar(request.headers.get("accept")):
+            columns = ColumnarResults.from_chroma_batch(results)
+            columns.extra["collection_version"] = version
+            return Response(content=columns.encode(), media_type=COLUMNAR_CONTENT_TYPE)
+        return {**results, "collection_version": version}
     except Exception as e:
         logger.error(f"Error querying collection: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
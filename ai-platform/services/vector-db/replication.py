@@ -0,0 +1,296 @@
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import logging
+from typing import Optional, List
+
+logger = logging.getLogger("ai_platform.vector_db")
+
+# Name of the pointer file that records the most recently published snapshot
+LATEST_FILE = "LATEST"
+
+# ChromaDB keeps its metadata and write-ahead log in this SQLite database
+SQLITE_FILE = "chroma.sqlite3"
+
+
+def _list_versions(directory: str) -> List[str]:
+    """
+    List the snapshot versions present in a directory, oldest first.
+    
+    Args:
+        directory: Directory containing one sub-directory per snapshot
+    
+    Returns:
+        Sorted list of snapshot version names
+    """
+    if not os.path.isdir(directory):
+        return []
+    
+    return sorted(
+        name for name in os.listdir(directory)
+        if name.isdigit() and os.path.isdir(os.path.join(directory, name))
+    )
+
+
+def _prune_versions(directory: str, retain: int, keep: Optional[str] = None):
+    """
+    Remove all but the newest `retain` snapshot versions from a directory.
+    
+    Args:
+        directory: Directory containing one sub-directory per snapshot
+        retain: Number of versions to keep
+        keep: A version that must never be removed (e.g. the one in use)
+    """
+    versions = _list_versions(directory)
+    for version in versions[:-retain] if retain > 0 else versions:
+        if version == keep:
+            continue
+        shutil.rmtree(os.path.join(directory, version), ignore_errors=True)
+        logger.info(f"Pruned snapshot version {version} from {directory}")
+
+
+def read_latest_version(snapshot_directory: str) -> Optional[str]:
+    """
+    Read the version name of the most recently published snapshot.
+    
+    Args:
+        snapshot_directory: Directory the primary publishes snapshots to
+    
+    Returns:
+        The version name, or None if nothing has been published yet
+    """
+    try:
+        with open(os.path.join(snapshot_directory, LATEST_FILE)) as f:
+            version = f.read().strip()
+            return version or None
+    except FileNotFoundError:
+        return None
+
+
+class SnapshotPublisher:
+    """
+    Periodically publishes consistent snapshots of a primary's persist directory.
+    
+    Each snapshot is written to `<snapshot_directory>/<version>` and made visible
+    to replicas by atomically rewriting the `LATEST` pointer file once the copy
+    is complete, so replicas never observe a partially written snapshot.
+    """
+    
+    def __init__(self, chroma_client, snapshot_directory: str, interval: float = 60.0, retain: int = 3):
+        """
+        Initialize the snapshot publisher.
+        
+        Args:
+            chroma_client: The primary's ChromaClient
+            snapshot_directory: Directory shared with the replicas
+            interval: Seconds between snapshot attempts
+            retain: Number of published snapshots to keep around
+        """
+        self.chroma_client = chroma_client
+        self.snapshot_directory = snapshot_directory
+        self.interval = interval
+        self.retain = max(retain, 2)
+        self.published_write_count = None
+        self.latest_version = read_latest_version(snapshot_directory)
+        
+        self._stop_event = threading.Event()
+        self._thread = None
+        
+        os.makedirs(snapshot_directory, exist_ok=True)
+        logger.info(f"SnapshotPublisher initialized with snapshot directory: {snapshot_directory}")
+    
+    def publish(self, force: bool = False) -> Optional[str]:
+        """
+        Publish a snapshot of the persist directory if it changed since the last one.
+        
+        Writes are blocked while the files are copied so that the snapshot is
+        consistent; queries keep being served.
+        
+        Args:
+            force: Publish even if no writes happened since the last snapshot
+        
+        Returns:
+            The new version name, or None if nothing was published
+        """
+        with self.chroma_client.write_lock:
+            write_count = self.chroma_client.write_count
+            if not force and write_count == self.published_write_count:
+                return None
+            
+            # Replicas load the lexical indexes and collection versions from the snapshot as well
+            self.chroma_client.flush_lexical_indexes()
+            self.chroma_client.save_versions()
+            
+            version = str(time.time_ns())
+            staging_directory = os.path.join(self.snapshot_directory, f".staging-{version}")
+            start_time = time.perf_counter()
+            
+            self._copy_persist_directory(self.chroma_client.persist_directory, staging_directory)
+            
+            copy_ms = (time.perf_counter() - start_time) * 1000
+        
+        os.replace(staging_directory, os.path.join(self.snapshot_directory, version))
+        
+        # Atomically move the pointer to the new snapshot
+        pointer_tmp = os.path.join(self.snapshot_directory, f".{LATEST_FILE}.tmp")
+        with open(pointer_tmp, "w") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, os.path.join(self.snapshot_directory, LATEST_FILE))
+        
+        self.published_write_count = write_count
+        self.latest_version = version
+        _prune_versions(self.snapshot_directory, self.retain, keep=version)
+        
+        logger.info(f"Published snapshot {version} in {copy_ms:.1f} ms (writes blocked for the copy)")
+        return version
+    
+    def _copy_persist_directory(self, source: str, destination: str):
+        """
+        Copy a ChromaDB persist directory.
+        
+        The SQLite database is copied with the online backup API so that its
+        write-ahead log is folded in; everything else is a plain file copy.
+        
+        Args:
+            source: The live persist directory
+            destination: Where to write the copy
+        """
+        def ignore_sqlite(directory, names):
+            if os.path.abspath(directory) != os.path.abspath(source):
+                return []
+            return [name for name in names if name.startswith(SQLITE_FILE)]
+        
+        shutil.copytree(source, destination, ignore=ignore_sqlite)
+        
+        sqlite_path = os.path.join(source, SQLITE_FILE)
+        if os.path.exists(sqlite_path):
+            src = sqlite3.connect(sqlite_path)
+            dst = sqlite3.connect(os.path.join(destination, SQLITE_FILE))
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+                src.close()
+    
+    def start(self):
+        """
+        Start publishing snapshots in a background thread.
+        """
+        if self._thread is not None:
+            return
+        
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="snapshot-publisher", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """
+        Stop the background thread.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+    
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"Error publishing snapshot: {str(e)}")
+
+
+class SnapshotFollower:
+    """
+    Keeps a read-only replica in sync with the snapshots published by a primary.
+    
+    New snapshots are copied into a replica-local directory and the ChromaClient
+    is reopened on the copy, so the shared snapshot directory is never written to
+    by replicas.
+    """
+    
+    def __init__(self, chroma_client, snapshot_directory: str, local_directory: str,
+                 interval: float = 10.0, retain: int = 2):
+        """
+        Initialize the snapshot follower.
+        
+        Args:
+            chroma_client: The replica's ChromaClient
+            snapshot_directory: Directory the primary publishes snapshots to
+            local_directory: Replica-local directory to load snapshots into
+            interval: Seconds between checks for a new snapshot
+            retain: Number of loaded snapshots to keep on local disk
+        """
+        self.chroma_client = chroma_client
+        self.snapshot_directory = snapshot_directory
+        self.local_directory = local_directory
+        self.interval = interval
+        self.retain = max(retain, 2)
+        self.current_version = None
+        self.loaded_at = None
+        
+        self._stop_event = threading.Event()
+        self._thread = None
+        
+        os.makedirs(local_directory, exist_ok=True)
+        logger.info(f"SnapshotFollower initialized with snapshot directory: {snapshot_directory}")
+    
+    def poll(self) -> bool:
+        """
+        Load the latest published snapshot if it is newer than the current one.
+        
+        Returns:
+            True if a new snapshot was loaded
+        """
+        version = read_latest_version(self.snapshot_directory)
+        if version is None or version == self.current_version:
+            return False
+        
+        source = os.path.join(self.snapshot_directory, version)
+        destination = os.path.join(self.local_directory, version)
+        start_time = time.perf_counter()
+        
+        if not os.path.isdir(destination):
+            staging_directory = os.path.join(self.local_directory, f".staging-{version}")
+            shutil.rmtree(staging_directory, ignore_errors=True)
+            shutil.copytree(source, staging_directory)
+            os.replace(staging_directory, destination)
+        
+        self.chroma_client.reopen(destination)
+        self.current_version = version
+        self.loaded_at = time.time()
+        _prune_versions(self.local_directory, self.retain, keep=version)
+        
+        logger.info(f"Loaded snapshot {version} in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+        return True
+    
+    def start(self):
+        """
+        Start following snapshots in a background thread.
+        """
+        if self._thread is not None:
+            return
+        
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="snapshot-follower", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """
+        Stop the background thread.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+    
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error loading snapshot: {str(e)}")
@@ -0,0 +1,68 @@
+import os
+import sys
+
+# Add the parent directory to the path so we can import the index
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bm25_index import BM25Index, content_checksum
+
+DOCUMENTS = {
+    "d1": "The retriever fans out queries to every shard",
+    "d2": "Error ERR-40213 is raised when the shard map is empty",
+    "d3": "Compaction rebuilds the index after heavy deletes",
+    "d4": "Queries to the retriever are merged with a heap",
+}
+
+
+def build_index(path=None):
+    index = BM25Index(path=path)
+    index.add(list(DOCUMENTS), list(DOCUMENTS.values()))
+    return index
+
+
+def test_rare_identifier_ranks_first():
+    index = build_index()
+
+    hits = index.search("what does ERR-40213 mean", n_results=2)
+
+    assert hits[0][0] == "d2"
+    assert len(hits) == 1
+
+
+def test_remove_and_readd_replaces_document():
+    index = build_index()
+
+    index.remove(["d3"])
+    assert index.search("compaction", n_results=5) == []
+
+    index.add(["d1"], ["compaction of shards"])
+    assert [doc_id for doc_id, _ in index.search("compaction", n_results=5)] == ["d1"]
+    assert "d1" not in [doc_id for doc_id, _ in index.search("fans", n_results=5)]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "bm25" / "test.npz")
+    index = build_index(path)
+    index.remove(["d4"])
+    index.save(document_count=3)
+
+    loaded = BM25Index.load(path, document_count=3)
+
+    assert loaded.search("retriever shard", n_results=5) == index.search("retriever shard", n_results=5)
+    assert BM25Index.load(path, document_count=4) is None
+
+
+def test_index_whose_documents_changed_is_stale_on_load(tmp_path):
+    path = str(tmp_path / "bm25" / "test.npz")
+    index = build_index(path)
+    index.add(["d1"], ["compaction of shards"])
+    index.save(document_count=4)
+    current = {**DOCUMENTS, "d1": "compaction of shards"}
+
+    # The checksum doesn't depend on the order of the documents
+    reordered = list(reversed(list(current.items())))
+    loaded = BM25Index.load(path, document_count=4, checksum=lambda: content_checksum(*zip(*reordered)))
+    assert loaded is not None and loaded.checksum == index.checksum
+
+    # Same IDs and count, but a text that changed behind the index's back
+    assert BM25Index.load(path, document_count=4, checksum=lambda: content_checksum(DOCUMENTS, DOCUMENTS.values())) is None
@@ -0,0 +1,279 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+from chromadb.api.types import EmbeddingFunction
+
+# Add the parent directory to the path so we can import the client
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chroma_client as chroma_client_module
+from chroma_client import ChromaClient
+from lifecycle import LifecycleManager
+
+
+class LetterEmbedding(EmbeddingFunction):
+    """Embeds a text by its letter counts, so no model has to be downloaded."""
+
+    def __init__(self):
+        self.calls = 0
+        # An Event calls wait on when set, to keep a read in progress
+        self.hold = None
+
+    def __call__(self, input):
+        self.calls += 1
+        if self.hold is not None:
+            self.hold.wait()
+        return [[float(text.lower().count(letter)) + 0.1 for letter in "aeiourst"] for text in input]
+
+    @staticmethod
+    def name():
+        return "letter-counts"
+
+    def get_config(self):
+        return {}
+
+    @staticmethod
+    def build_from_config(config):
+        return LetterEmbedding()
+
+
+def make_client(path):
+    client = ChromaClient(persist_directory=str(path))
+    client._embedding_function = LetterEmbedding()
+    return client
+
+
+def add_chunks(client, document_ids, chunks=3, **metadata):
+    ids = [f"{document_id}_chunk_{i}" for document_id in document_ids for i in range(chunks)]
+    client.add_documents(
+        "docs",
+        [f"Chunk {doc_id} about retrieval and storage" for doc_id in ids],
+        [{"id": doc_id.split("_chunk_")[0], **metadata} for doc_id in ids],
+        ids
+    )
+    return ids
+
+
+def stored_ids(client):
+    return sorted(client._get_collection("docs").get(include=[])["ids"])
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_reopen_closes_the_previous_client_once_its_reads_are_done(tmp_path):
+    client = make_client(tmp_path / "old")
+    add_chunks(client, ["a"])
+    newer = make_client(tmp_path / "new")
+    add_chunks(newer, ["a", "b"])
+
+    closed = threading.Event()
+    client.client.close = closed.set
+    # A query kept waiting in the middle of a read of the previous client
+    hold = threading.Event()
+    client.embedding_function.hold = hold
+    results = []
+    reader = threading.Thread(target=lambda: results.append(client.query("docs", "a_chunk_1", n_results=1)))
+    reader.start()
+    wait_for(lambda: client._readers)
+
+    reopener = threading.Thread(target=client.reopen, args=(str(tmp_path / "new"),))
+    reopener.start()
+    assert not closed.wait(0.2)
+    # Reads started after the swap see the new database
+    wait_for(lambda: len(stored_ids(client)) == 6)
+
+    hold.set()
+    reader.join(timeout=5)
+    assert len(results[0]["ids"][0]) == 1
+    reopener.join(timeout=5)
+    assert closed.is_set()
+
+
+def test_documents_are_deleted_by_id_prefix_and_metadata(tmp_path):
+    client = make_client(tmp_path)
+    add_chunks(client, ["a", "b", "c", "ab"])
+    version = client.collection_version("docs")
+
+    assert client.delete_documents("docs", ids=["a_chunk_0", "missing"]) == 1
+    assert client.delete_documents("docs", id_prefix="a_chunk_") == 2
+    assert client.delete_documents("docs", where={"id": "b"}) == 3
+    # Criteria are combined
+    assert client.delete_documents("docs", id_prefix="c_", where={"id": "ab"}) == 0
+
+    assert stored_ids(client) == [f"{document_id}_chunk_{i}" for document_id in ("ab", "c") for i in range(3)]
+    assert client.collection_version("docs") != version
+    assert client.deleted_since_compaction["docs"] == 6
+    # The lexical index forgets them too
+    assert not any(doc_id.startswith(("a_", "b_")) for doc_id in client.query("docs", "a_chunk_1 b_chunk_1", mode="lexical")["ids"][0])
+
+
+def test_prefix_deletes_scan_without_the_write_lock_and_catch_writes_made_meanwhile(tmp_path, monkeypatch):
+    client = make_client(tmp_path)
+    add_chunks(client, ["a", "b"])
+    writes = []
+    matching_ids = ChromaClient._matching_ids
+
+    def write_during_scan(*args):
+        if not writes:
+            def add():
+                if client.write_lock.acquire(timeout=1):
+                    client.add_documents("docs", ["A late chunk"], [{"id": "a"}], ["a_chunk_9"])
+                    writes.append(True)
+                    client.write_lock.release()
+            writer = threading.Thread(target=add)
+            writer.start()
+            writer.join()
+            assert writes == [True]
+        return matching_ids(*args)
+    monkeypatch.setattr(ChromaClient, "_matching_ids", staticmethod(write_during_scan))
+
+    assert client.delete_documents("docs", id_prefix="a_") == 4
+    assert stored_ids(client) == ["b_chunk_0", "b_chunk_1", "b_chunk_2"]
+
+
+def test_metadata_updates_without_fields_only_report_missing_documents(tmp_path):
+    client = make_client(tmp_path)
+    add_chunks(client, ["a"])
+    version = client.collection_version("docs")
+
+    updated, missing = client.update_metadata("docs", ["a_chunk_0", "gone_chunk_0"], [{}, {}])
+
+    assert (updated, missing) == ([], ["gone_chunk_0"])
+    assert client.collection_version("docs") == version
+
+
+def test_readding_an_id_replaces_it_in_dense_and_lexical_results(tmp_path):
+    client = make_client(tmp_path)
+    client.add_documents("docs", ["Old text about turbines"], [{"id": "a"}], ["a_chunk_0"])
+
+    client.add_documents("docs", ["New text about glaciers"], [{"id": "a", "edition": 2}], ["a_chunk_0"])
+
+    stored = client._get_collection("docs").get(ids=["a_chunk_0"])
+    assert stored["documents"] == ["New text about glaciers"]
+    assert stored["metadatas"][0]["edition"] == 2
+    assert client.query("docs", "glaciers", mode="lexical")["ids"][0] == ["a_chunk_0"]
+    assert client.query("docs", "turbines", mode="lexical")["ids"][0] == []
+    assert client.query("docs", "glaciers", mode="hybrid")["documents"][0] == ["New text about glaciers"]
+
+
+def test_saved_lexical_index_is_rebuilt_when_a_text_changed_without_it(tmp_path):
+    client = make_client(tmp_path)
+    add_chunks(client, ["a", "b"])
+    client.query("docs", "retrieval", mode="lexical")
+    client.flush_lexical_indexes()
+
+    # Replaced in the store only, as a crash before the index was saved would leave it
+    client._get_collection("docs").upsert(ids=["a_chunk_0"], documents=["Notes about glaciers"], metadatas=[{"id": "a"}])
+    client._lexical_indexes.clear()
+
+    assert client.query("docs", "glaciers", mode="lexical")["ids"][0] == ["a_chunk_0"]
+
+
+def test_documents_expire_after_the_ttl_until_it_is_cleared(tmp_path):
+    client = make_client(tmp_path)
+    add_chunks(client, ["old"])
+    time.sleep(0.05)
+    add_chunks(client, ["new"])
+    cutoff = client._get_collection("docs").get(ids=["new_chunk_0"])["metadatas"][0]["ingested_at"]
+
+    client.set_collection_ttl("docs", 3600)
+    assert client.expire_documents("docs") == 0
+    assert client.get_collection_info("docs")["ttl_seconds"] == 3600
+
+    # Clearing the TTL must stick, even though ChromaDB can't remove the key
+    client.set_collection_ttl("docs", None)
+    assert client.get_collection_info("docs")["ttl_seconds"] is None
+    client._collections.clear()
+    assert client.get_collection_info("docs")["ttl_seconds"] is None
+    assert client.expire_documents("docs") == 0
+
+    client.set_collection_ttl("docs", 1)
+    original_time = time.time
+    try:
+        # Only the documents ingested before "new" are past the TTL
+        chroma_client_module.time.time = lambda: cutoff + 1 - 0.001
+        assert client.expire_documents("docs") == 3
+    finally:
+        chroma_client_module.time.time = original_time
+    assert stored_ids(client) == ["new_chunk_0", "new_chunk_1", "new_chunk_2"]
+
+
+def test_compaction_keeps_writes_made_while_it_copies(tmp_path, monkeypatch):
+    client = make_client(tmp_path)
+    ids = add_chunks(client, [f"doc{i}" for i in range(10)], topic="x")
+    client.delete_documents("docs", where={"id": "doc9"})
+    client.set_collection_ttl("docs", 3600)
+    embedded = client._embedding_function.calls
+
+    writes = []
+
+    def write_between_pages(seconds):
+        # The copy doesn't hold the write lock, so other threads' writes go through meanwhile
+        if not writes:
+            def acquire():
+                if client.write_lock.acquire(timeout=1):
+                    writes.append(True)
+                    client.write_lock.release()
+            writer = threading.Thread(target=acquire)
+            writer.start()
+            writer.join()
+            assert writes == [True]
+            client.delete_documents("docs", ids=["doc0_chunk_0"])
+            client.update_metadata("docs", ["doc0_chunk_1"], [{"topic": "y"}])
+            client.add_documents("docs", ["A late chunk"], [{"id": "late"}], ["late_chunk_0"])
+
+    monkeypatch.setattr(chroma_client_module.time, "sleep", write_between_pages)
+    copied = client.compact_collection("docs", page_size=4, page_delay=0.01)
+
+    expected = sorted(set(ids[:27]) - {"doc0_chunk_0"} | {"late_chunk_0"})
+    assert copied == len(expected)
+    assert stored_ids(client) == expected
+    collection = client._get_collection("docs")
+    assert collection.get(ids=["doc0_chunk_1"])["metadatas"][0]["topic"] == "y"
+    assert client.get_collection_info("docs")["ttl_seconds"] == 3600
+    assert client.deleted_since_compaction["docs"] == 0
+    # The cached collection is the compacted one, and no leftovers remain
+    assert client.list_collections() == ["docs"]
+    assert client.query("docs", "late chunk", n_results=1)["ids"][0] == ["late_chunk_0"]
+    # Only the chunk added meanwhile and the query were embedded
+    assert client._embedding_function.calls == embedded + 2
+
+
+def test_collections_being_compacted_are_hidden_from_listing_and_lifecycle(tmp_path, monkeypatch):
+    client = make_client(tmp_path)
+    add_chunks(client, [f"doc{i}" for i in range(4)])
+    client.create_collection("other")
+    lifecycle = LifecycleManager(client)
+    seen_during_copy = []
+    expired = []
+    expire_documents = client.expire_documents
+
+    def record_expire(collection_name):
+        expired.append(collection_name)
+        return expire_documents(collection_name)
+    monkeypatch.setattr(client, "expire_documents", record_expire)
+
+    def pass_between_pages(seconds):
+        if not seen_during_copy:
+            assert any("-compact-" in collection.name for collection in client.client.list_collections())
+            seen_during_copy.append(sorted(client.list_collections()))
+            lifecycle.run_once()
+
+    monkeypatch.setattr(chroma_client_module.time, "sleep", pass_between_pages)
+    client.compact_collection("docs", page_size=4, page_delay=0.01)
+
+    assert seen_during_copy == [["docs", "other"]]
+    assert sorted(expired) == ["docs", "other"]
+    # Nobody can create or open a collection under a reserved name
+    with pytest.raises(ValueError):
+        client.create_collection("docs-compact-1700000000")
+    with pytest.raises(ValueError):
+        client.create_collection("docs-retired-1700000000")
@@ -0,0 +1,36 @@
+import os
+import sys
+
+# Add the parent directory to the path so we can import the replication module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replication import SnapshotPublisher, SnapshotFollower, read_latest_version
+from test_chroma_client import make_client, add_chunks, stored_ids
+
+
+def test_replica_loads_the_published_snapshot_with_its_collection_versions(tmp_path):
+    primary = make_client(tmp_path / "primary")
+    replica = make_client(tmp_path / "replica")
+    publisher = SnapshotPublisher(primary, str(tmp_path / "snapshots"))
+    follower = SnapshotFollower(replica, str(tmp_path / "snapshots"), str(tmp_path / "loaded"))
+
+    assert follower.poll() is False
+    ids = add_chunks(primary, ["a", "b"])
+    version = publisher.publish()
+    assert read_latest_version(str(tmp_path / "snapshots")) == version
+    # Nothing was written since, so there is nothing to publish
+    assert publisher.publish() is None
+
+    assert follower.poll() is True
+    assert follower.current_version == version
+    assert stored_ids(replica) == sorted(ids)
+    assert replica.collection_version("docs") == primary.collection_version("docs")
+    assert replica.query("docs", "b_chunk_1", n_results=1, mode="lexical")["ids"][0] == ["b_chunk_1"]
+    assert follower.poll() is False
+
+    primary.delete_documents("docs", id_prefix="a_")
+    publisher.publish()
+    assert follower.poll() is True
+    assert stored_ids(replica) == sorted(ids[3:])
+    assert replica.collection_version("docs") == primary.collection_version("docs")
+
@@ -0,0 +1,87 @@
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the parent directory to the path so we can import the service
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep the service's default database out of the working directory
+os.environ.setdefault("PERSIST_DIRECTORY", tempfile.mkdtemp())
+
+import main
+from chroma_client import ChromaClient
+from test_chroma_client import make_client, add_chunks
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    client = make_client(tmp_path)
+    monkeypatch.setattr(main, "chroma_client", client)
+    return client, TestClient(main.app)
+
+
+def scan(http, **params):
+    response = http.get("/collections/docs/scan", params=params)
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    records = [line for line in lines if "next_cursor" not in line]
+    cursors = [line["next_cursor"] for line in lines if "next_cursor" in line]
+    return records, cursors
+
+
+def test_cursors_round_trip_and_reject_malformed_tokens():
+    assert ChromaClient.decode_cursor(None) == 0
+    assert ChromaClient.decode_cursor(ChromaClient.encode_cursor(1234)) == 1234
+
+    for cursor in ["not-base64!", ChromaClient.encode_cursor(-1), ChromaClient.encode_cursor("12")]:
+        with pytest.raises(ValueError):
+            ChromaClient.decode_cursor(cursor)
+
+
+def test_scan_resumes_from_each_cursor_until_the_end(api):
+    client, http = api
+    ids = add_chunks(client, ["a", "b", "c"])
+
+    records, cursors = scan(http, page_size=4)
+    assert sorted(record["id"] for record in records) == sorted(ids)
+    assert cursors[-1] is None and len(cursors) == 3
+    assert all(set(record) == {"id", "text", "metadata"} for record in records)
+
+    # Resuming from a page's cursor returns the rest
+    resumed, _ = scan(http, page_size=4, cursor=cursors[0])
+    assert resumed == records[4:]
+
+    # A collection ending on a page boundary needs one more, empty page to tell
+    records, cursors = scan(http, page_size=3)
+    assert len(records) == 9 and cursors[-1] is None
+    records, cursors = scan(http, cursor=cursors[-2])
+    assert records == [] and cursors == [None]
+
+
+def test_scan_limit_and_filters(api):
+    client, http = api
+    add_chunks(client, ["a", "b"], topic="x")
+    add_chunks(client, ["c"], topic="y")
+
+    records, cursors = scan(http, page_size=2, limit=5)
+    assert len(records) == 5
+    # The limit stops the scan, the cursor resumes it
+    rest, _ = scan(http, cursor=cursors[-1])
+    assert len(rest) == 4
+
+    records, _ = scan(http, where=json.dumps({"topic": "y"}))
+    assert sorted(record["id"] for record in records) == ["c_chunk_0", "c_chunk_1", "c_chunk_2"]
+    records, _ = scan(http, where_document=json.dumps({"$contains": "a_chunk_1"}), include_embeddings=True)
+    assert [record["id"] for record in records] == ["a_chunk_1"]
+    assert len(records[0]["embedding"]) == 8
+
+
+def test_malformed_scan_parameters_are_rejected(api):
+    _, http = api
+
+    for params in [{"cursor": "not-a-cursor"}, {"where": "{not json"}, {"page_size": 0}, {"limit": 0}]:
+        response = http.get("/collections/docs/scan", params=params)
+        assert response.status_code == 400, params
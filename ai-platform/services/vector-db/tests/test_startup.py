@@ -0,0 +1,89 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+# Add the parent directory to the path so we can import the service
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep the service's default database out of the working directory
+os.environ.setdefault("PERSIST_DIRECTORY", tempfile.mkdtemp())
+
+import main
+from shared.startup.profile import StartupProfile
+from test_chroma_client import make_client, add_chunks
+
+
+def wait_until_ready(http, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = http.get("/ready")
+        if response.status_code == 200:
+            return response.json()
+        time.sleep(0.02)
+    raise TimeoutError("vector-db did not become ready")
+
+
+def test_health_answers_while_starting_and_ready_once_initialized(tmp_path, monkeypatch):
+    seed = make_client(tmp_path)
+    add_chunks(seed, ["a"])
+    seed.add_documents("notes", ["A note about storage"], [{"id": "n"}], ["n_chunk_0"])
+
+    client = make_client(tmp_path)
+    # Nothing is opened until the client is used
+    assert client._client is None and client._collections == {}
+
+    release = threading.Event()
+    initialize = client.initialize
+
+    def slow_initialize(*args, **kwargs):
+        assert release.wait(10)
+        initialize(*args, **kwargs)
+
+    monkeypatch.setattr(client, "initialize", slow_initialize)
+    monkeypatch.setattr(main, "chroma_client", client)
+    monkeypatch.setattr(main, "startup_profile", StartupProfile())
+    monkeypatch.setattr(main, "lifecycle_manager", None)
+    monkeypatch.setattr(main, "PRELOAD_COLLECTIONS", ["docs", "missing"])
+
+    with TestClient(main.app) as http:
+        assert http.get("/health").json() == {"status": "ok"}
+        response = http.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["ready"] is False
+
+        release.set()
+        report = wait_until_ready(http)
+        assert report["ready"] is True and report["error"] is None
+        assert {"client_open", "embedding_model_load", "preload:docs"} <= set(report["phases_ms"])
+        # Only the preloaded collection was opened at startup
+        assert list(client._collections) == ["docs"]
+
+        response = http.post("/query", json={"query_text": "storage", "collection_name": "notes", "n_results": 1})
+        assert response.status_code == 200
+        assert response.json()["ids"] == [["n_chunk_0"]]
+        # Opened on first use and kept open
+        assert sorted(client._collections) == ["docs", "notes"]
+
+
+def test_failed_startup_stays_unready(tmp_path, monkeypatch):
+    client = make_client(tmp_path)
+
+    def failing_initialize(*args, **kwargs):
+        raise RuntimeError("model download failed")
+
+    monkeypatch.setattr(client, "initialize", failing_initialize)
+    monkeypatch.setattr(main, "chroma_client", client)
+    monkeypatch.setattr(main, "startup_profile", StartupProfile())
+    monkeypatch.setattr(main, "lifecycle_manager", None)
+
+    with TestClient(main.app) as http:
+        deadline = time.time() + 10
+        while main.startup_profile.error is None and time.time() < deadline:
+            time.sleep(0.02)
+        response = http.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["error"] == "model download failed"
+        assert http.get("/health").status_code == 200
@@ -0,0 +1,324 @@
+from typing import List, Dict, Any, Optional, Sequence
+
+import msgpack
+import numpy as np
+
+# Media type of the columnar result encoding, negotiated with the Accept header
+CONTENT_TYPE = "application/vnd.ai-platform.columnar+msgpack"
+
+FORMAT_VERSION = 1
+
+
+def accepts_columnar(accept_header: Optional[str]) -> bool:
+    """
+    Check whether a client asked for the columnar encoding.
+    
+    Args:
+        accept_header: Value of the request's Accept header
+    
+    Returns:
+        True if the columnar media type is listed
+    """
+    return bool(accept_header) and CONTENT_TYPE in accept_header
+
+
+def _pack_blobs(blobs: Sequence[bytes]):
+    """
+    Concatenate byte strings into one buffer plus a uint32 offset array.
+    """
+    offsets = np.zeros(len(blobs) + 1, dtype=np.uint32)
+    if blobs:
+        np.cumsum([len(blob) for blob in blobs], out=offsets[1:])
+    return b"".join(blobs), offsets.tobytes()
+
+
+def _unpack_strings(data: bytes, offsets: np.ndarray) -> List[str]:
+    """
+    Split a concatenated UTF-8 buffer back into strings.
+    """
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+class ColumnarResults:
+    """
+    Query results stored column by column.
+    
+    IDs are decoded eagerly because merging needs them. Texts and metadata
+    stay in their length-prefixed buffers until a row is materialized, so rows
+    that are ranked out never pay for decoding.
+    """
+    
+    def __init__(self, ids: List[str], distances: np.ndarray, scores: Optional[np.ndarray],
+                 texts: bytes, text_offsets: np.ndarray, metadatas: bytes, metadata_offsets: np.ndarray,
+                 collections: Optional[List[str]] = None, extra: Optional[Dict[str, Any]] = None):
+        self.ids = ids
+        self.distances = distances
+        self.scores = scores
+        self.texts = texts
+        self.text_offsets = text_offsets
+        self.metadatas = metadatas
+        self.metadata_offsets = metadata_offsets
+        self.collections = collections
+        self.extra = extra or {}
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    @classmethod
+    def from_documents(cls, documents: List[Dict[str, Any]], extra: Optional[Dict[str, Any]] = None) -> "ColumnarResults":
+        """
+        Build columns from a list of document dictionaries.
+        
+        Args:
+            documents: Documents with id, text, metadata, distance and optionally score and collection
+            extra: Response-level fields to carry along (e.g. partial, failed_shards)
+        
+        Returns:
+            The columnar results
+        """
+        texts, text_offsets = _pack_blobs([(doc.get("text") or "").encode("utf-8") for doc in documents])
+        metadatas, metadata_offsets = _pack_blobs([msgpack.packb(doc.get("metadata") or {}) for doc in documents])
+        has_scores = any("score" in doc for doc in documents)
+        has_collections = any("collection" in doc for doc in documents)
+        
+        return cls(
+            ids=[doc["id"] for doc in documents],
+            distances=np.array(
+                [doc["distance"] if doc.get("distance") is not None else np.nan for doc in documents],
+                dtype=np.float32
+            ),
+            scores=np.array([doc.get("score", 0.0) for doc in documents], dtype=np.float32) if has_scores else None,
+            texts=texts,
+            text_offsets=np.frombuffer(text_offsets, dtype=np.uint32),
+            metadatas=metadatas,
+            metadata_offsets=np.frombuffer(metadata_offsets, dtype=np.uint32),
+            collections=[doc.get("collection", "") for doc in documents] if has_collections else None,
+            extra=extra
+        )
+    
+    @classmethod
+    def from_chroma(cls, result: Dict[str, Any]) -> "ColumnarResults":
+        """
+        Build columns from a Chroma-shaped query result for a single query.
+        
+        Args:
+            result: Dictionary of nested lists as returned by a Chroma query
+        
+        Returns:
+            The columnar results
+        """
+        ids = result["ids"][0] if result.get("ids") else []
+        documents = result["documents"][0] if result.get("documents") else [""] * len(ids)
+        metadatas = result["metadatas"][0] if result.get("metadatas") else [None] * len(ids)
+        
+        texts, text_offsets = _pack_blobs([(text or "").encode("utf-8") for text in documents])
+        packed_metadatas, metadata_offsets = _pack_blobs([msgpack.packb(metadata or {}) for metadata in metadatas])
+        
+        return cls(
+            ids=list(ids),
+            distances=(
+                np.asarray(result["distances"][0], dtype=np.float32) if result.get("distances")
+                else np.full(len(ids), np.nan, dtype=np.float32)
+            ),
+            scores=np.asarray(result["scores"][0], dtype=np.float32) if result.get("scores") else None,
+            texts=texts,
+            text_offsets=np.frombuffer(text_offsets, dtype=np.uint32),
+            metadatas=packed_metadatas,
+            metadata_offsets=np.frombuffer(metadata_offsets, dtype=np.uint32)
+        )
+    
+    @classmethod
+    def from_chroma_batch(cls, result: Dict[str, Any]) -> "ColumnarResults":
+        """
+        Build columns from a Chroma-shaped query result for several queries.
+        
+        The rows of all queries are stacked in order and `extra["query_offsets"]`
+        records where each query's rows start, see `query_rows`.
+        
+        Args:
+            result: Dictionary of nested lists, one inner list per query
+        
+        Returns:
+            The columnar results
+        """
+        query_offsets = [0]
+        for query_ids in result.get("ids") or []:
+            query_offsets.append(query_offsets[-1] + len(query_ids))
+        
+        flattened = {
+            key: [[item for query in result[key] for item in query]]
+            for key in ("ids", "documents", "metadatas", "distances", "scores")
+            if result.get(key)
+        }
+        columns = cls.from_chroma(flattened)
+        columns.extra["query_offsets"] = query_offsets
+        return columns
+    
+    def query_rows(self, query_index: int) -> range:
+        """
+        Get the rows of one query of a batch built with `from_chroma_batch`.
+        
+        Args:
+            query_index: Position of the query in the batch
+        
+        Returns:
+            The row indices of that query
+        """
+        offsets = self.extra["query_offsets"]
+        return range(offsets[query_index], offsets[query_index + 1])
+    
+    @classmethod
+    def concat(cls, parts: List["ColumnarResults"]) -> "ColumnarResults":
+        """
+        Stack several results, e.g. the answers of every shard.
+        
+        Args:
+            parts: The results to stack
+        
+        Returns:
+            The combined results
+        """
+        if len(parts) == 1:
+            return parts[0]
+        
+        def shift(offsets_list):
+            shifted, base = [np.zeros(1, dtype=np.uint32)], 0
+            for offsets in offsets_list:
+                shifted.append(offsets[1:] + base)
+                base += int(offsets[-1])
+            return np.concatenate(shifted)
+        
+        has_scores = any(part.scores is not None for part in parts)
+        return cls(
+            ids=[doc_id for part in parts for doc_id in part.ids],
+            distances=np.concatenate([part.distances for part in parts]) if parts else np.zeros(0, dtype=np.float32),
+            scores=np.concatenate([
+                part.scores if part.scores is not None else np.zeros(len(part), dtype=np.float32) for part in parts
+            ]) if has_scores else None,
+            texts=b"".join(part.texts for part in parts),
+            text_offsets=shift([part.text_offsets for part in parts]),
+            metadatas=b"".join(part.metadatas for part in parts),
+            metadata_offsets=shift([part.metadata_offsets for part in parts])
+        )
+    
+    def top_k(self, k: int, by: str = "distance", rows: Optional[Sequence[int]] = None) -> List[int]:
+        """
+        Find the best rows without materializing any of them.
+        
+        Args:
+            k: Number of rows to return
+            by: "distance" to rank ascending by distance, "score" to rank descending by score
+            rows: Rows to choose from, e.g. those of one query of a batch; all rows if None
+        
+        Returns:
+            Row indices, best first
+        """
+        if by == "score" and self.scores is not None:
+            keys = -self.scores
+        else:
+            keys = np.where(np.isnan(self.distances), np.inf, self.distances)
+        
+        row_indices = np.arange(len(keys)) if rows is None else np.asarray(rows, dtype=np.int64)
+        keys = keys[row_indices]
+        
+        if len(keys) > k:
+            candidates = np.argpartition(keys, k - 1)[:k] if k > 0 else np.zeros(0, dtype=np.int64)
+        else:
+            candidates = np.arange(len(keys))
+        return row_indices[candidates[np.argsort(keys[candidates], kind="stable")]].tolist()
+    
+    def text(self, i: int) -> str:
+        """Decode the text of one row."""
+        return self.texts[self.text_offsets[i]:self.text_offsets[i + 1]].decode("utf-8")
+    
+    def metadata(self, i: int) -> Dict[str, Any]:
+        """Decode the metadata of one row."""
+        return msgpack.unpackb(self.metadatas[self.metadata_offsets[i]:self.metadata_offsets[i + 1]])
+    
+    def to_documents(self, rows: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """
+        Materialize rows as document dictionaries.
+        
+        Args:
+            rows: Row indices to materialize, in order; all rows if None
+        
+        Returns:
+            List of documents with id, text, metadata, distance and, when
+            present, score and collection
+        """
+        if rows is None:
+            rows = range(len(self))
+        
+        documents = []
+        for i in rows:
+            distance = float(self.distances[i])
+            doc = {
+                "id": self.ids[i],
+                "text": self.text(i),
+                "metadata": self.metadata(i),
+                "distance": None if distance != distance else distance
+            }
+            if self.scores is not None:
+                doc["score"] = float(self.scores[i])
+            if self.collections is not None:
+                doc["collection"] = self.collections[i]
+            documents.append(doc)
+        return documents
+    
+    def encode(self) -> bytes:
+        """
+        Serialize the results.
+        
+        Returns:
+            The msgpack-encoded columnar payload
+        """
+        ids, id_offsets = _pack_blobs([doc_id.encode("utf-8") for doc_id in self.ids])
+        payload = {
+            "version": FORMAT_VERSION,
+            "count": len(self),
+            "ids": ids,
+            "id_offsets": id_offsets,
+            "distances": self.distances.astype(np.float32).tobytes(),
+            "scores": self.scores.astype(np.float32).tobytes() if self.scores is not None else None,
+            "texts": self.texts,
+            "text_offsets": self.text_offsets.astype(np.uint32).tobytes(),
+            "metadatas": self.metadatas,
+            "metadata_offsets": self.metadata_offsets.astype(np.uint32).tobytes(),
+            "extra": self.extra
+        }
+        if self.collections is not None:
+            collections, collection_offsets = _pack_blobs([name.encode("utf-8") for name in self.collections])
+            payload["collections"] = collections
+            payload["collection_offsets"] = collection_offsets
+        return msgpack.packb(payload, use_bin_type=True)
+    
+    @classmethod
+    def decode(cls, data: bytes) -> "ColumnarResults":
+        """
+        Deserialize results produced by `encode`.
+        
+        Args:
+            data: The msgpack-encoded columnar payload
+        
+        Returns:
+            The columnar results
+        """
+        payload = msgpack.unpackb(data, raw=False)
+        if payload.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar format version: {payload.get('version')}")
+        
+        collections = None
+        if "collections" in payload:
+            collections = _unpack_strings(payload["collections"], np.frombuffer(payload["collection_offsets"], dtype=np.uint32))
+        
+        return cls(
+            ids=_unpack_strings(payload["ids"], np.frombuffer(payload["id_offsets"], dtype=np.uint32)),
+            distances=np.frombuffer(payload["distances"], dtype=np.float32),
+            scores=np.frombuffer(payload["scores"], dtype=np.float32) if payload["scores"] is not None else None,
+            texts=payload["texts"],
+            text_offsets=np.frombuffer(payload["text_offsets"], dtype=np.uint32),
+            metadatas=payload["metadatas"],
+            metadata_offsets=np.frombuffer(payload["metadata_offsets"], dtype=np.uint32),
+            collections=collections,
+            extra=payload.get("extra")
+        )
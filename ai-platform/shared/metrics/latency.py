@@ -0,0 +1,60 @@
+import threading
+from collections import deque
+from typing import Dict, Any
+
+
+class LatencyTracker:
+    """
+    Keeps a sliding window of latency samples and summarizes them.
+    
+    Used for metrics such as time to first token, where the recent
+    distribution matters more than an all-time average.
+    """
+    
+    def __init__(self, window: int = 1000):
+        """
+        Initialize the tracker.
+        
+        Args:
+            window: Number of most recent samples the summary is computed over
+        """
+        self.samples = deque(maxlen=window)
+        self.total_count = 0
+        self._lock = threading.Lock()
+    
+    def record(self, value_ms: float):
+        """
+        Record one sample.
+        
+        Args:
+            value_ms: The latency in milliseconds
+        """
+        with self._lock:
+            self.samples.append(value_ms)
+            self.total_count += 1
+    
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize the samples in the window.
+        
+        Returns:
+            Total sample count and the mean, p50, p95, p99 and max of the window, in milliseconds
+        """
+        with self._lock:
+            samples = sorted(self.samples)
+            total_count = self.total_count
+        
+        if not samples:
+            return {"count": total_count}
+        
+        def percentile(fraction):
+            return round(samples[min(len(samples) - 1, int(fraction * len(samples)))], 1)
+        
+        return {
+            "count": total_count,
+            "mean_ms": round(sum(samples) / len(samples), 1),
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(samples[-1], 1)
+        }
@@ -0,0 +1,408 @@
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger("ai_platform.models")
+
+
+class UnknownModelError(ValueError):
+    """Raised when a request asks for a model the service isn't configured to serve."""
+
+
+def tensor_bytes(model: Any) -> int:
+    """
+    Count the bytes held by the parameters and buffers of a model.
+    
+    Pipelines and other wrappers are unwrapped through their `model`
+    attribute. Tensors that share storage, like tied embeddings, are counted
+    once.
+    
+    Args:
+        model: A torch module, or an object with one in its `model` attribute
+    
+    Returns:
+        Number of bytes, or 0 if no module was found
+    """
+    while not hasattr(model, "parameters") and hasattr(model, "model"):
+        model = model.model
+    if not hasattr(model, "parameters"):
+        return 0
+    
+    seen = set()
+    total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        storage = tensor.untyped_storage()
+        if storage.data_ptr() in seen:
+            continue
+        seen.add(storage.data_ptr())
+        total += storage.nbytes()
+    return total
+
+
+def local_model_path(name: str) -> str:
+    """
+    Find where to load a Hugging Face model from without reaching the Hub.
+    
+    A model whose config and safetensors weights are in the local Hugging
+    Face cache is loaded from its snapshot directory there, so a container
+    restarted with the cache never goes to the network for it, whatever the
+    transformers version. Local directories are used as they are. Other
+    models are downloaded, with a warning, unless MODEL_LOCAL_FILES_ONLY is
+    "true", in which case they fail to load instead.
+    
+    Args:
+        name: Model name on the Hub, or path to a local model directory
+    
+    Returns:
+        Local directory of the model, or `name` if it has to be downloaded
+    
+    Raises:
+        FileNotFoundError: If the model isn't cached and downloads are disabled
+    """
+    if os.path.isdir(name):
+        return name
+    
+    try:
+        from huggingface_hub import snapshot_download, try_to_load_from_cache
+        if isinstance(try_to_load_from_cache(name, "config.json"), str) and any(
+            isinstance(try_to_load_from_cache(name, filename), str)
+            for filename in ("model.safetensors", "model.safetensors.index.json")
+        ):
+            return snapshot_download(name, local_files_only=True)
+    except Exception as e:
+        logger.warning(f"Could not look up model {name} in the Hugging Face cache: {str(e)}")
+    
+    if os.getenv("MODEL_LOCAL_FILES_ONLY", "false").lower() == "true":
+        raise FileNotFoundError(f"Model {name} is not in the local Hugging Face cache and MODEL_LOCAL_FILES_ONLY is set")
+    logger.warning(f"Model {name} is not in the local Hugging Face cache, downloading it from the Hub")
+    return name
+
+
+def resident_set_bytes() -> int:
+    """
+    Get the resident memory of this process.
+    
+    Returns:
+        Resident set size in bytes, or 0 where /proc isn't available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class _Entry:
+    """A loaded model and its bookkeeping."""
+    
+    __slots__ = ("model", "tensor_bytes", "rss_growth_bytes", "load_seconds", "loaded_at", "last_used", "in_use", "uses")
+    
+    def __init__(self, model: Any, tensor_bytes: int, rss_growth_bytes: int, load_seconds: float):
+        self.model = model
+        self.tensor_bytes = tensor_bytes
+        self.rss_growth_bytes = rss_growth_bytes
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.last_used = time.monotonic()
+        self.in_use = 0
+        self.uses = 0
+
+
+class ModelRegistry:
+    """
+    Serves several models from one process, loading them when first asked for.
+    
+    Models are loaded by a service-specific `loader` and kept until the
+    memory they hold exceeds `memory_budget`, at which point the least
+    recently used models that no request is holding are unloaded. Before a
+    model that was evicted earlier is loaded again, room is made for its
+    known size, so the budget isn't overshot by two models at once.
+    
+    Requests take a model with `acquire` (or the `lease` context manager) and
+    give it back with `release`; a model is never unloaded while it is held.
+    Loads are serialized, so concurrent requests for a cold model wait for one
+    load instead of each loading a copy.
+    """
+    
+    def __init__(self, loader: Callable[[str], Any], models: Iterable[str], default_model: Optional[str] = None,
+                 memory_budget: int = 0, unloader: Optional[Callable[[Any], None]] = None,
+                 max_events: int = 100):
+        """
+        Initialize the registry.
+        
+        Args:
+            loader: Loads a model by name and returns the object requests use
+            models: Names of the models that may be requested
+            default_model: Model used when a request doesn't name one; defaults to the first
+            memory_budget: Bytes of model weights to keep loaded; 0 for no limit
+            unloader: Called with a model when it is evicted, to stop anything it runs
+            max_events: Number of recent evictions kept for the stats
+        """
+        self.loader = loader
+        self.unloader = unloader
+        self.models = [name for name in models if name]
+        if not self.models:
+            raise ValueError("At least one model must be configured")
+        self.default_model = default_model or self.models[0]
+        if self.default_model not in self.models:
+            self.models.insert(0, self.default_model)
+        self.memory_budget = memory_budget
+        
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._known_sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        
+        self.loads = 0
+        self.load_failures = 0
+        self.evictions = 0
+        self.eviction_events: deque = deque(maxlen=max_events)
+        
+        budget = f"{memory_budget / 2**20:.0f} MiB" if memory_budget else "no limit"
+        logger.info(f"ModelRegistry initialized with models {self.models}, default {self.default_model}, budget {budget}")
+    
+    def resolve(self, name: Optional[str] = None) -> str:
+        """
+        Resolve the model a request asked for.
+        
+        Args:
+            name: Requested model, or None for the default
+        
+        Returns:
+            The model name
+        
+        Raises:
+            UnknownModelError: If the model isn't one of the configured models
+        """
+        if not name:
+            return self.default_model
+        if name not in self.models:
+            raise UnknownModelError(f"Unknown model '{name}', available models: {', '.join(self.models)}")
+        return name
+    
+    def _take(self, name: str) -> Optional[Any]:
+        """Mark a loaded model as used and held; must be called with the lock held."""
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        self._entries.move_to_end(name)
+        entry.last_used = time.monotonic()
+        entry.in_use += 1
+        entry.uses += 1
+        return entry.model
+    
+    def acquire(self, name: Optional[str] = None) -> Tuple[str, Any]:
+        """
+        Get a model, loading it if needed, and hold it until `release`.
+        
+        Blocks while the model loads, so async services should call it in a
+        worker thread.
+        
+        Args:
+            name: Requested model, or None for the default
+        
+        Returns:
+            The resolved model name and the loaded model
+        """
+        name = self.resolve(name)
+        with self._lock:
+            model = self._take(name)
+            if model is not None:
+                return name, model
+        
+        with self._load_lock:
+            # Another request may have loaded it while this one waited
+            with self._lock:
+                model = self._take(name)
+                if model is not None:
+                    return name, model
+            
+            self._make_room(self._known_sizes.get(name, 0), keep=name)
+            entry = self._load(name)
+            with self._lock:
+                self._entries[name] = entry
+                model = self._take(name)
+            self._make_room(0, keep=name)
+            return name, model
+    
+    def release(self, name: str):
+        """
+        Give back a model taken with `acquire`.
+        
+        Args:
+            name: The resolved model name returned by `acquire`
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry.in_use > 0:
+                entry.in_use -= 1
+    
+    @contextmanager
+    def lease(self, name: Optional[str] = None):
+        """
+        Hold a model for the duration of a block.
+        
+        Args:
+            name: Requested model, or None for the default
+        
+        Yields:
+            The loaded model
+        """
+        name, model = self.acquire(name)
+        try:
+            yield model
+        finally:
+            self.release(name)
+    
+    def _load(self, name: str) -> _Entry:
+        """Load a model and measure what it costs."""
+        rss_before = resident_set_bytes()
+        start_time = time.perf_counter()
+        try:
+            model = self.loader(name)
+        except Exception:
+            self.load_failures += 1
+            logger.exception(f"Loading model {name} failed")
+            raise
+        load_seconds = time.perf_counter() - start_time
+        
+        entry = _Entry(model, tensor_bytes(model), max(0, resident_set_bytes() - rss_before), load_seconds)
+        self._known_sizes[name] = entry.tensor_bytes
+        self.loads += 1
+        logger.info(f"Loaded model {name} in {load_seconds:.2f}s ({entry.tensor_bytes / 2**20:.1f} MiB of weights)")
+        return entry
+    
+    def _make_room(self, incoming: int, keep: str):
+        """
+        Evict least recently used models until `incoming` more bytes fit in the budget.
+        
+        Models that are held, and `keep`, are skipped; if they alone exceed
+        the budget the registry stays over it until they are released and
+        another model is loaded.
+        """
+        if not self.memory_budget:
+            return
+        
+        victims = []
+        with self._lock:
+            total = sum(entry.tensor_bytes for entry in self._entries.values())
+            for name, entry in list(self._entries.items()):
+                if total + incoming <= self.memory_budget:
+                    break
+                if name == keep or entry.in_use:
+                    continue
+                del self._entries[name]
+                total -= entry.tensor_bytes
+                victims.append((name, entry))
+            over_budget = total + incoming > self.memory_budget
+        
+        for name, entry in victims:
+            self._unload(name, entry)
+        if over_budget:
+            logger.warning(f"Models in use hold {total / 2**20:.1f} MiB, over the {self.memory_budget / 2**20:.0f} MiB budget")
+    
+    def _unload(self, name: str, entry: _Entry):
+        """Stop an evicted model and record the eviction."""
+        if self.unloader is not None:
+            try:
+                self.unloader(entry.model)
+            except Exception as e:
+                logger.warning(f"Unloading model {name} failed: {str(e)}")
+        entry.model = None
+        gc.collect()
+        
+        self.evictions += 1
+        self.eviction_events.append({
+            "model": name,
+            "evicted_at": time.time(),
+            "tensor_bytes": entry.tensor_bytes,
+            "idle_seconds": round(time.monotonic() - entry.last_used, 1),
+            "uses": entry.uses
+        })
+        logger.info(f"Evicted model {name} ({entry.tensor_bytes / 2**20:.1f} MiB) after {entry.uses} uses")
+    
+    def warm(self, names: Iterable[str]):
+        """
+        Load models ahead of traffic, most popular first.
+        
+        Loading stops at the first model that doesn't fit next to the ones
+        already warmed, so warming never evicts a warmed model.
+        
+        Args:
+            names: Models to load
+        """
+        for name in names:
+            if not name:
+                continue
+            name = self.resolve(name)
+            size = self._known_sizes.get(name, 0)
+            with self._lock:
+                total = sum(entry.tensor_bytes for entry in self._entries.values())
+            if self.memory_budget and total and total + size > self.memory_budget:
+                logger.warning(f"Not warming model {name}, the budget is taken by the models warmed before it")
+                break
+            evictions = self.evictions
+            self.acquire(name)
+            self.release(name)
+            if self.evictions > evictions:
+                logger.warning(f"Warming model {name} evicted another model; the warm set exceeds the budget")
+    
+    def loaded(self) -> Dict[str, Any]:
+        """
+        Get the loaded models.
+        
+        Returns:
+            Mapping of model name to model, least recently used first
+        """
+        with self._lock:
+            return {name: entry.model for name, entry in self._entries.items()}
+    
+    def close(self):
+        """
+        Unload every model, for shutdown.
+        """
+        with self._lock:
+            entries = list(self._entries.items())
+            self._entries.clear()
+        for name, entry in entries:
+            if self.unloader is not None:
+                self.unloader(entry.model)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get registry statistics.
+        
+        Returns:
+            Dictionary with the configured and loaded models, the load time
+            and memory of each, the memory budget and recent evictions
+        """
+        with self._lock:
+            loaded = {
+                name: {
+                    "load_seconds": round(entry.load_seconds, 3),
+                    "tensor_bytes": entry.tensor_bytes,
+                    "rss_growth_bytes": entry.rss_growth_bytes,
+                    "loaded_at": entry.loaded_at,
+                    "idle_seconds": round(time.monotonic() - entry.last_used, 1),
+                    "in_use": entry.in_use,
+                    "uses": entry.uses
+                }
+                for name, entry in self._entries.items()
+            }
+        return {
+            "models": list(self.models),
+            "default_model": self.default_model,
+            "loaded": loaded,
+            "loaded_bytes": sum(model["tensor_bytes"] for model in loaded.values()),
+            "memory_budget": self.memory_budget,
+            "process_rss_bytes": resident_set_bytes(),
+            "loads": self.loads,
+            "load_failures": self.load_failures,
+            "evictions": self.evictions,
+            "recent_evictions": list(self.eviction_events)
+        }
@@ -0,0 +1,62 @@
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """
+    Records how long each phase of a service's cold start takes.
+
+    Create it as early as possible in the service's main module so that the
+    time spent importing heavy libraries is included in the report.
+    """
+    
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases = {}
+        self.ready = False
+        self.ready_after_ms = None
+        self.error = None
+    
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Time a startup phase.
+        
+        Args:
+            name: Name of the phase as it should appear in the report
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - start_time) * 1000, 1)
+    
+    def mark_ready(self):
+        """
+        Record that the service finished starting up and can take traffic.
+        """
+        self.ready = True
+        self.ready_after_ms = round((time.perf_counter() - self.started_at) * 1000, 1)
+    
+    def mark_failed(self, error: Exception):
+        """
+        Record that startup failed.
+        
+        Args:
+            error: The exception that stopped startup
+        """
+        self.error = str(error)
+    
+    def report(self) -> dict:
+        """
+        Build the cold start report.
+        
+        Returns:
+            Dictionary with the readiness state and the duration of each phase
+        """
+        return {
+            "ready": self.ready,
+            "ready_after_ms": self.ready_after_ms,
+            "phases_ms": dict(self.phases),
+            "error": self.error
+        }
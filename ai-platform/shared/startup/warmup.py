@@ -0,0 +1,75 @@
+import contextlib
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from shared.startup.profile import StartupProfile
+
+logger = logging.getLogger("ai_platform.startup")
+
+
+def parse_sequence_lengths(value: str, max_length: Optional[int] = None) -> List[int]:
+    """
+    Parse a comma-separated list of warmup sequence lengths.
+    
+    Args:
+        value: Lengths in tokens, e.g. "16,128,512"
+        max_length: Longest sequence the model takes; longer lengths are clamped to it
+    
+    Returns:
+        The distinct positive lengths, shortest first
+    """
+    lengths = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        length = int(part)
+        if max_length is not None:
+            length = min(length, max_length)
+        if length > 0:
+            lengths.add(length)
+    return sorted(lengths)
+
+
+def run_warmup(infer: Callable[[int], Any], sequence_lengths: List[int], profile: Optional[StartupProfile] = None,
+               label: str = "") -> Dict[int, float]:
+    """
+    Run warmup inferences so the first real request doesn't pay for lazy initialization.
+    
+    The first inference allocates the model's working memory and initializes
+    its kernels, so it is recorded as its own phase, "first_inference"; the
+    remaining lengths go into "warmup". Both are suffixed with `label`.
+    
+    Args:
+        infer: Runs one inference on an input of the given length in tokens
+        sequence_lengths: Lengths to run, shortest first
+        profile: Optional StartupProfile to record the phases in
+        label: Suffix of the phase names, such as the model name
+    
+    Returns:
+        Milliseconds taken by each length
+    """
+    def phase(name):
+        name = f"{name}:{label}" if label else name
+        return profile.phase(name) if profile is not None else contextlib.nullcontext()
+    
+    timings = {}
+    
+    def timed_inference(length):
+        start_time = time.perf_counter()
+        infer(length)
+        timings[length] = round((time.perf_counter() - start_time) * 1000, 1)
+    
+    if not sequence_lengths:
+        return timings
+    
+    with phase("first_inference"):
+        timed_inference(sequence_lengths[0])
+    if len(sequence_lengths) > 1:
+        with phase("warmup"):
+            for length in sequence_lengths[1:]:
+                timed_inference(length)
+    
+    logger.info(f"Warmup{' of ' + label if label else ''} took {timings} ms per sequence length")
+    return timings
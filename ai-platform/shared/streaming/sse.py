@@ -0,0 +1,41 @@
+import json
+from typing import Any, AsyncIterator, Tuple
+
+
+def format_event(event: str, data: Any) -> str:
+    """
+    Format one server-sent event with a JSON payload.
+    
+    Args:
+        event: Name of the event
+        data: JSON-serializable payload
+    
+    Returns:
+        The event, terminated by a blank line
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def iter_events(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Parse server-sent events with JSON payloads from a stream of lines.
+    
+    Args:
+        lines: The lines of the stream without their line breaks, e.g. httpx's `aiter_lines()`
+    
+    Yields:
+        (event name, decoded payload) for every complete event
+    """
+    event, data = "message", []
+    async for line in lines:
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].lstrip())
+    
+    if data:
+        yield event, json.loads("\n".join(data))